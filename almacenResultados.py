@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from columnarCache import combinar_manifiesto, escribir_manifiesto, leer_manifiesto
+
+# Se incrementa cuando cambia la forma de calcular o guardar los resultados, para invalidar los anteriores
+VERSION_ALMACEN = '1'
+
+
+class AlmacenResultados:
+    def __init__(self, directorio: str, limite_mb: float = 256, entradas_memoria: int = 1024):
+        """
+        Inicializa el almacén de resultados por estrato (curvas de Kaplan-Meier, incidencias, ...).
+
+        Cada resultado se identifica por la huella de las filas de su estrato (los valores que usa el
+        cálculo, no las etiquetas) y por la función y los parámetros que lo calcularon, de modo que un
+        estrato cuyos datos no cambiaron se reutiliza aunque cambien los demás o la selección de estratos.
+        Los resultados se guardan como Feather en `directorio`, con un manifiesto (manifiesto.json) que
+        registra su tamaño y su último uso; si el total supera `limite_mb` se borran los menos usados
+        recientemente. Además se conservan en memoria hasta `entradas_memoria` resultados.
+        """
+        self.directorio = directorio
+        self.ruta_manifiesto = os.path.join(directorio, 'manifiesto.json')
+        self.limite_bytes = limite_mb * 2 ** 20
+        self.entradas_memoria = entradas_memoria
+        os.makedirs(directorio, exist_ok=True)
+        self.manifiesto = leer_manifiesto(self.ruta_manifiesto)
+        self.modificadas = set()
+        self.memoria = OrderedDict()
+        self.estadisticas = {'memoria': 0, 'disco': 0, 'calculados': 0}
+
+    def _escribir_manifiesto(self):
+        """
+        Escribe el manifiesto con las entradas que esta instancia agregó, usó o borró (ver
+        escribir_manifiesto), sin sangría porque se reescribe en cada consulta.
+        """
+        self.manifiesto = escribir_manifiesto(self.ruta_manifiesto, self.manifiesto, self.modificadas, sangria=None)
+        self.modificadas.clear()
+
+    def _recordar(self, clave: str, resultado: pd.DataFrame):
+        self.memoria[clave] = resultado
+        self.memoria.move_to_end(clave)
+        while len(self.memoria) > self.entradas_memoria:
+            self.memoria.popitem(last=False)
+
+    def obtener(self, clave: str):
+        """
+        Devuelve el resultado guardado con esa clave (desde memoria o desde disco), o None.
+        """
+        if clave in self.memoria:
+            self.memoria.move_to_end(clave)
+            self.estadisticas['memoria'] += 1
+            if clave in self.manifiesto:
+                self.manifiesto[clave]['ultimo_uso'] = time.time()
+                self.modificadas.add(clave)
+            return self.memoria[clave]
+
+        entrada = self.manifiesto.get(clave)
+        if entrada is None:
+            return None
+        try:
+            resultado = pd.read_feather(os.path.join(self.directorio, entrada['archivo']))
+        except (OSError, ValueError):
+            # Archivo borrado o dañado: se descarta la entrada y el resultado se vuelve a calcular
+            del self.manifiesto[clave]
+            self.modificadas.add(clave)
+            return None
+        entrada['ultimo_uso'] = time.time()
+        self.modificadas.add(clave)
+        self.estadisticas['disco'] += 1
+        self._recordar(clave, resultado)
+        return resultado
+
+    def guardar(self, clave: str, resultado: pd.DataFrame):
+        """
+        Guarda un resultado en memoria y en disco (sin escribir el manifiesto; ver `confirmar`).
+        """
+        archivo = f'{clave}.feather'
+        ruta = os.path.join(self.directorio, archivo)
+        resultado.reset_index(drop=True).to_feather(ruta)
+        self.manifiesto[clave] = {'archivo': archivo, 'tamano': os.path.getsize(ruta), 'ultimo_uso': time.time()}
+        self.modificadas.add(clave)
+        self._recordar(clave, resultado)
+
+    def confirmar(self):
+        """
+        Borra los resultados menos usados recientemente hasta respetar el límite de tamaño y escribe el
+        manifiesto. El límite se aplica sobre todo el directorio, incluidas las entradas de otras instancias.
+        """
+        self.manifiesto = combinar_manifiesto(self.ruta_manifiesto, self.manifiesto, self.modificadas)
+        total = sum(entrada['tamano'] for entrada in self.manifiesto.values())
+        for clave, entrada in sorted(self.manifiesto.items(), key=lambda item: item[1]['ultimo_uso']):
+            if total <= self.limite_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directorio, entrada['archivo']))
+            except FileNotFoundError:
+                pass
+            total -= entrada['tamano']
+            del self.manifiesto[clave]
+            self.modificadas.add(clave)
+            self.memoria.pop(clave, None)
+        self._escribir_manifiesto()
+
+    def limpiar(self):
+        """
+        Borra todos los resultados guardados, también los que guardaron otras instancias.
+        """
+        self.manifiesto = combinar_manifiesto(self.ruta_manifiesto, self.manifiesto, self.modificadas)
+        self.modificadas.update(self.manifiesto)
+        for entrada in self.manifiesto.values():
+            try:
+                os.remove(os.path.join(self.directorio, entrada['archivo']))
+            except FileNotFoundError:
+                pass
+        self.manifiesto = {}
+        self.memoria.clear()
+        self._escribir_manifiesto()
+
+    def por_estrato(self, funcion, df: pd.DataFrame, columnas_estrato: list, columnas_datos: list, **parametros):
+        """
+        Calcula `funcion(df, columnas_estrato, **parametros)` (una tabla larga con las columnas de estrato
+        seguidas del resultado de cada estrato, como kaplan_meier_por_estrato) reutilizando los estratos
+        ya calculados.
+
+        La huella de cada estrato se obtiene de sus valores en `columnas_datos` (p. ej. duración y evento),
+        ordenados, de modo que no depende del orden de las filas. Solo los estratos sin resultado guardado
+        se calculan, con una sola llamada a `funcion`. El resultado es el mismo que el de la llamada directa.
+        """
+        # Incorporar los resultados que otras instancias guardaron después de que se leyó el manifiesto
+        self.manifiesto = combinar_manifiesto(self.ruta_manifiesto, self.manifiesto, self.modificadas)
+        columnas_estrato = list(columnas_estrato)
+        if columnas_estrato:
+            codigos = df.groupby(columnas_estrato, observed=True, sort=True).ngroup().to_numpy()
+        else:
+            codigos = np.zeros(len(df), dtype=np.int64)
+        valores = [pd.to_numeric(df[columna], errors='coerce').to_numpy(dtype=np.float64) for columna in columnas_datos]
+
+        # Filas ordenadas por estrato y por sus valores: cada estrato es un tramo contiguo
+        posiciones = np.flatnonzero(codigos >= 0)
+        posiciones = posiciones[np.lexsort([v[posiciones] for v in reversed(valores)] + [codigos[posiciones]])]
+        _, inicios = np.unique(codigos[posiciones], return_index=True)
+        limites = np.append(inicios, len(posiciones))
+
+        contexto = json.dumps([VERSION_ALMACEN, funcion.__module__, funcion.__qualname__, columnas_datos,
+                               sorted(parametros.items())], default=str).encode()
+        claves = []
+        for inicio, fin in zip(limites[:-1], limites[1:]):
+            huella = hashlib.blake2b(contexto, digest_size=16)
+            for v in valores:
+                huella.update(np.ascontiguousarray(v[posiciones[inicio:fin]]).tobytes())
+            claves.append(huella.hexdigest())
+
+        resultados = [self.obtener(clave) for clave in claves]
+        faltantes = [k for k, resultado in enumerate(resultados) if resultado is None]
+        if faltantes:
+            filas = np.concatenate([posiciones[limites[k]:limites[k + 1]] for k in faltantes])
+            calculado = funcion(df.iloc[np.sort(filas)], columnas_estrato, **parametros)
+            columnas_resultado = [c for c in calculado.columns if c not in columnas_estrato]
+            if columnas_estrato:
+                grupos = calculado.groupby(columnas_estrato, observed=True, sort=False).indices
+            else:
+                grupos = {(): np.arange(len(calculado))}
+            for k in faltantes:
+                etiqueta = df[columnas_estrato].iloc[posiciones[limites[k]]].tolist() if columnas_estrato else []
+                filas_estrato = grupos.get(etiqueta[0] if len(etiqueta) == 1 else tuple(etiqueta))
+                if filas_estrato is None:
+                    # La función no devolvió el estrato (p. ej. sin filas válidas): no se guarda nada
+                    resultados[k] = calculado[columnas_resultado].iloc[:0]
+                    continue
+                resultados[k] = calculado[columnas_resultado].iloc[filas_estrato].reset_index(drop=True)
+                self.guardar(claves[k], resultados[k])
+            self.estadisticas['calculados'] += len(faltantes)
+        self.confirmar()
+
+        if not resultados:
+            return funcion(df.iloc[:0], columnas_estrato, **parametros)
+        tabla = pd.concat(resultados, ignore_index=True)
+        if columnas_estrato:
+            # Etiquetas del estrato tomadas de la primera fila de cada uno
+            primeras = np.repeat(posiciones[limites[:-1]], [len(resultado) for resultado in resultados])
+            etiquetas = df[columnas_estrato].iloc[primeras].reset_index(drop=True)
+            tabla = pd.concat([etiquetas, tabla], axis=1)
+        return tabla
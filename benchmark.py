@@ -0,0 +1,245 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from instrumentacion import memoria_proc, pico_rss_mb, reiniciar_pico
+
+# Etapas medidas por defecto, en el orden del pipeline
+ETAPAS = ['registro', 'defunciones', 'cruce', 'estadisticas', 'curvas', 'incidencia', 'cubo', 'bootstrap', 'cox',
+          'graficos']
+
+# Un cambio se marca como regresión si supera la tolerancia relativa y además estas diferencias absolutas
+MINIMO_SEGUNDOS = 0.1
+MINIMO_MEMORIA_MB = 10
+
+
+def _cpu_hijos():
+    """
+    Tiempo de CPU de los procesos hijos ya terminados (p. ej. los pools de las etapas).
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    uso = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return uso.ru_utime + uso.ru_stime
+
+
+def _ejecutar_etapa(nombre: str, parametros: dict, directorio_trabajo: str, cola):
+    """
+    Ejecuta una etapa del pipeline en un proceso nuevo y envía sus mediciones por `cola`.
+
+    Las entradas se leen desde los Feather que dejaron las etapas anteriores y la salida se guarda
+    igual; solo se mide la función de la etapa. El pico de memoria es el del proceso completo
+    (incluye las entradas cargadas), por lo que se informa también la memoria al empezar la etapa.
+    """
+    from pipeline import construir_pipeline
+
+    etapa = construir_pipeline(parametros, directorio_cache=os.path.join(directorio_trabajo, 'cache')).etapas[nombre]
+    entradas = {}
+    for dependencia in etapa.dependencias:
+        prefijo = os.path.join(directorio_trabajo, f'{dependencia}-')
+        entradas[dependencia] = {ruta[len(prefijo):-len('.feather')]: pd.read_feather(ruta)
+                                 for ruta in glob.glob(f'{prefijo}*.feather')}
+
+    base_rss = memoria_proc('VmRSS') or pico_rss_mb()
+    reiniciar_pico()
+    inicio, inicio_cpu, inicio_cpu_hijos = time.perf_counter(), time.process_time(), _cpu_hijos()
+    resultado = etapa.funcion(entradas, **etapa.parametros) or {}
+    segundos = time.perf_counter() - inicio
+    cpu = time.process_time() - inicio_cpu + _cpu_hijos() - inicio_cpu_hijos
+    pico_rss = pico_rss_mb()
+
+    tablas = {tabla: df for tabla, df in resultado.items() if tabla != 'archivos'}
+    for tabla, df in tablas.items():
+        df.reset_index(drop=True).to_feather(os.path.join(directorio_trabajo, f'{nombre}-{tabla}.feather'))
+
+    cola.put({
+        'segundos': segundos,
+        'cpu_segundos': cpu,
+        'base_rss_mb': base_rss,
+        'pico_rss_mb': pico_rss,
+        'filas_entrada': sum(len(df) for tablas_dependencia in entradas.values() for df in tablas_dependencia.values()),
+        'filas_salida': sum(len(df) for df in tablas.values()),
+    })
+
+
+def medir_etapa(nombre: str, parametros: dict, directorio_trabajo: str):
+    """
+    Mide una etapa en un proceso aislado (spawn), para que la memoria de una etapa no se mezcle con la
+    de las anteriores. Devuelve el diccionario de mediciones.
+    """
+    contexto = multiprocessing.get_context('spawn')
+    cola = contexto.Queue()
+    proceso = contexto.Process(target=_ejecutar_etapa, args=(nombre, parametros, directorio_trabajo, cola))
+    proceso.start()
+    proceso.join()
+    if proceso.exitcode != 0:
+        raise RuntimeError(f"La etapa '{nombre}' terminó con código {proceso.exitcode}")
+    return cola.get()
+
+
+def ejecutar_benchmark(filas: int, etapas: list = None, repeticiones: int = 3, directorio_datos: str = 'data/sintetico',
+                       semilla: int = 20241112, parametros: dict = None):
+    """
+    Mide cada etapa del pipeline sobre un registro sintético de `filas` tumores (que se genera si no
+    existe) y devuelve los resultados.
+
+    Cada etapa se ejecuta `repeticiones` veces; se informa el menor tiempo y el mayor pico de memoria.
+    La caché de defunciones y el almacén de curvas se borran antes de cada medición, para medir la lectura
+    de los Excel y el ajuste de las curvas y no lecturas de resultados ya guardados.
+    """
+    from datosSinteticos import escribir_datos_sinteticos
+
+    directorio = os.path.join(directorio_datos, str(filas))
+    ruta_registro = os.path.join(directorio, 'rpcdata_sintetico.csv')
+    directorio_defunciones = os.path.join(directorio, 'defunciones')
+    if not os.path.exists(ruta_registro) or not glob.glob(os.path.join(directorio_defunciones, '*.xlsx')):
+        escribir_datos_sinteticos(directorio, filas, semilla)
+
+    directorio_trabajo = os.path.join(directorio, 'benchmark')
+    shutil.rmtree(directorio_trabajo, ignore_errors=True)
+    os.makedirs(directorio_trabajo)
+    parametros = {
+        'ruta_registro': ruta_registro,
+        'directorio_defunciones': directorio_defunciones,
+        'comunas': ['2101', '2201'],
+        'replicas_bootstrap': 200,
+        'ruta_horizontes': os.path.join(directorio_trabajo, 'sobrevida_horizontes.xlsx'),
+        'ruta_estadisticas': os.path.join(directorio_trabajo, 'estadisticas_descriptivas.xlsx'),
+        'ruta_imagenes': os.path.join(directorio_trabajo, 'images') + os.sep,
+        'directorio_resultados': os.path.join(directorio_trabajo, 'resultados'),
+        'ruta_cubo': os.path.join(directorio_trabajo, 'cubo_sobrevida.feather'),
+        **(parametros or {}),
+    }
+
+    resultados = {}
+    for nombre in etapas or ETAPAS:
+        mediciones = []
+        for _ in range(repeticiones):
+            shutil.rmtree(os.path.join(directorio_defunciones, '.cache'), ignore_errors=True)
+            shutil.rmtree(parametros['directorio_resultados'], ignore_errors=True)
+            mediciones.append(medir_etapa(nombre, parametros, directorio_trabajo))
+        resultados[nombre] = {
+            **mediciones[0],
+            'segundos': min(m['segundos'] for m in mediciones),
+            'cpu_segundos': min(m['cpu_segundos'] for m in mediciones),
+            'pico_rss_mb': max(m['pico_rss_mb'] or 0 for m in mediciones),
+            'segundos_repeticiones': [m['segundos'] for m in mediciones],
+        }
+        print(f"{nombre}: {resultados[nombre]['segundos']:.2f} s, pico {resultados[nombre]['pico_rss_mb']:.0f} MB, "
+              f"{resultados[nombre]['filas_entrada']} -> {resultados[nombre]['filas_salida']} filas")
+
+    return {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'filas': filas,
+        'semilla': semilla,
+        'repeticiones': repeticiones,
+        'commit': _commit_actual(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'procesadores': os.cpu_count(),
+        'etapas': resultados,
+    }
+
+
+def _commit_actual():
+    """
+    Commit de git del código medido, si está disponible.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar_resultados(actual: dict, referencia: dict, tolerancia: float = 0.2):
+    """
+    Compara cada etapa con una medición de referencia. Una etapa es una regresión si su tiempo o su pico
+    de memoria crecen más que `tolerancia` (relativo) y más que un mínimo absoluto, para no marcar ruido
+    en etapas muy cortas. Devuelve una tabla con una fila por etapa presente en ambas mediciones.
+    """
+    filas = []
+    for nombre, medicion in actual['etapas'].items():
+        anterior = referencia['etapas'].get(nombre)
+        if anterior is None:
+            continue
+        cambio_tiempo = medicion['segundos'] / anterior['segundos'] - 1 if anterior['segundos'] else 0.0
+        cambio_memoria = medicion['pico_rss_mb'] / anterior['pico_rss_mb'] - 1 if anterior['pico_rss_mb'] else 0.0
+        regresion_tiempo = (cambio_tiempo > tolerancia
+                            and medicion['segundos'] - anterior['segundos'] > MINIMO_SEGUNDOS)
+        regresion_memoria = (cambio_memoria > tolerancia
+                             and medicion['pico_rss_mb'] - anterior['pico_rss_mb'] > MINIMO_MEMORIA_MB)
+        filas.append({'etapa': nombre, 'segundos_referencia': anterior['segundos'], 'segundos': medicion['segundos'],
+                      'cambio_tiempo': cambio_tiempo, 'pico_referencia_mb': anterior['pico_rss_mb'],
+                      'pico_rss_mb': medicion['pico_rss_mb'], 'cambio_memoria': cambio_memoria,
+                      'regresion': regresion_tiempo or regresion_memoria})
+    return pd.DataFrame(filas, columns=['etapa', 'segundos_referencia', 'segundos', 'cambio_tiempo',
+                                        'pico_referencia_mb', 'pico_rss_mb', 'cambio_memoria', 'regresion'])
+
+
+def ultimo_resultado(directorio_resultados: str, filas: int):
+    """
+    Ruta de la medición más reciente guardada para la misma cantidad de filas, o None.
+    """
+    rutas = sorted(glob.glob(os.path.join(directorio_resultados, f'benchmark_{filas}_*.json')))
+    return rutas[-1] if rutas else None
+
+
+def guardar_resultado(resultado: dict, directorio_resultados: str):
+    """
+    Guarda la medición como JSON con la cantidad de filas y la fecha en el nombre.
+    """
+    os.makedirs(directorio_resultados, exist_ok=True)
+    marca = datetime.fromisoformat(resultado['fecha']).strftime('%Y%m%d-%H%M%S')
+    ruta = os.path.join(directorio_resultados, f"benchmark_{resultado['filas']}_{marca}.json")
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+    return ruta
+
+
+if __name__ == "__main__":
+    argumentos = argparse.ArgumentParser(description="Mide cada etapa del análisis sobre registros sintéticos.")
+    argumentos.add_argument('--filas', type=int, nargs='+', default=[10_000],
+                            help="tamaños del registro sintético (p. ej. 10000 1000000 10000000)")
+    argumentos.add_argument('--etapas', nargs='+', default=None, help=f"etapas a medir (por defecto {ETAPAS})")
+    argumentos.add_argument('--repeticiones', type=int, default=3)
+    argumentos.add_argument('--semilla', type=int, default=20241112)
+    argumentos.add_argument('--directorio-datos', default='data/sintetico')
+    argumentos.add_argument('--directorio-resultados', default='benchmarks')
+    argumentos.add_argument('--referencia', default=None,
+                            help="JSON con el que comparar (por defecto, la última medición del mismo tamaño)")
+    argumentos.add_argument('--tolerancia', type=float, default=0.2)
+    opciones = argumentos.parse_args()
+
+    hay_regresiones = False
+    for filas in opciones.filas:
+        ruta_referencia = opciones.referencia or ultimo_resultado(opciones.directorio_resultados, filas)
+        resultado = ejecutar_benchmark(filas, opciones.etapas, opciones.repeticiones, opciones.directorio_datos,
+                                       opciones.semilla)
+
+        if ruta_referencia:
+            with open(ruta_referencia, encoding='utf-8') as f:
+                comparacion = comparar_resultados(resultado, json.load(f), opciones.tolerancia)
+            resultado['referencia'] = os.path.basename(ruta_referencia)
+            resultado['regresiones'] = comparacion.loc[comparacion['regresion'], 'etapa'].tolist()
+            print(f"\nComparación con {ruta_referencia}:")
+            print(comparacion.to_string(index=False))
+            if resultado['regresiones']:
+                hay_regresiones = True
+                print(f"Regresiones en {filas} filas: {resultado['regresiones']}")
+
+        print(f"Resultados guardados en {guardar_resultado(resultado, opciones.directorio_resultados)}")
+
+    sys.exit(1 if hay_regresiones else 0)
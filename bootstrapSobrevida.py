@@ -0,0 +1,183 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from dataExporter import exportar
+from instrumentacion import informar
+
+# Elementos (réplicas x pacientes) de la matriz de pesos de un bloque, para acotar la memoria por tarea
+ELEMENTOS_POR_BLOQUE = 2_000_000
+
+# Réplicas que se generan con una misma semilla. Los bloques se arman con grupos completos, de modo que las
+# réplicas no dependen del tamaño de los bloques (un bloque tiene al menos un grupo)
+REPLICAS_POR_SEMILLA = 25
+
+# Estratificaciones de la tabla de sobrevida en horizontes fijos
+ESTRATIFICACIONES = {
+    'tumor': ['TUMOR_GRUPO'],
+    'comuna': ['TUMOR_GRUPO', 'REGCOM'],
+    'sexo': ['TUMOR_GRUPO', 'SEXO'],
+}
+
+# Arreglos de la cohorte ordenados por estrato; en los procesos se fijan una sola vez al iniciarlos
+_TIEMPOS = None
+_EVENTOS = None
+
+
+def _inicializar_trabajador(tiempos, eventos):
+    """
+    Fija en el proceso los arreglos de solo lectura de la cohorte, para no enviarlos en cada tarea.
+    """
+    global _TIEMPOS, _EVENTOS
+    _TIEMPOS = tiempos
+    _EVENTOS = eventos
+
+
+def sobrevida_ponderada(tiempos, eventos, pesos, horizontes):
+    """
+    Kaplan-Meier de un estrato para varias réplicas a la vez y sobrevida en cada horizonte.
+
+    `pesos` es una matriz (réplicas x pacientes) con las veces que cada paciente aparece en cada
+    réplica; con una fila de unos se obtiene la estimación puntual. Como en lifelines, un horizonte
+    posterior al último tiempo observado toma el último valor de la curva.
+    Devuelve una matriz (réplicas x horizontes).
+    """
+    orden = np.argsort(tiempos, kind='stable')
+    t = tiempos[orden]
+    e = eventos[orden]
+    w = pesos[:, orden]
+
+    tiempos_unicos, inicios = np.unique(t, return_index=True)
+    salidas = np.add.reduceat(w, inicios, axis=1)
+    muertes = np.add.reduceat(w * e, inicios, axis=1)
+    en_riesgo = w.sum(axis=1, keepdims=True) - np.cumsum(salidas, axis=1) + salidas
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factor = np.where(en_riesgo > 0, 1 - muertes / en_riesgo, 1.0)
+    sobrevida = np.cumprod(factor, axis=1)
+
+    posiciones = np.searchsorted(tiempos_unicos, horizontes, side='right') - 1
+    return np.where(posiciones >= 0, sobrevida[:, np.maximum(posiciones, 0)], 1.0)
+
+
+def _replicas_bloque(inicio: int, fin: int, cantidades: list, semillas: list, horizontes):
+    """
+    Calcula un bloque de réplicas bootstrap del estrato que ocupa las filas [inicio, fin): `cantidades[k]`
+    réplicas generadas con `semillas[k]`.
+
+    Los remuestreos se generan como una matriz de índices (réplicas x pacientes) y se convierten en
+    una matriz de pesos con un solo bincount.
+    """
+    tiempos = _TIEMPOS[inicio:fin]
+    eventos = _EVENTOS[inicio:fin]
+    n = fin - inicio
+
+    indices = np.vstack([np.random.default_rng(semilla).integers(0, n, size=(cantidad, n))
+                         for cantidad, semilla in zip(cantidades, semillas)])
+    replicas = len(indices)
+    desplazados = indices + n * np.arange(replicas)[:, None]
+    pesos = np.bincount(desplazados.ravel(), minlength=replicas * n).reshape(replicas, n)
+    return sobrevida_ponderada(tiempos, eventos, pesos.astype(np.float64), horizontes)
+
+
+def bootstrap_por_estrato(df: pd.DataFrame, columnas_estrato: list, horizontes=(1, 3, 5), replicas: int = 1000,
+                          alpha: float = 0.05, semilla: int = None, procesos: int = None,
+                          duracion: str = 'tiempo_sobrevida_anios', evento: str = 'evento'):
+    """
+    Sobrevida de Kaplan-Meier en horizontes fijos (en años) por estrato, con intervalos de confianza
+    bootstrap por percentiles.
+
+    Los pacientes se remuestrean dentro de cada estrato. Las réplicas se dividen en bloques que se
+    reparten en un pool de `procesos` procesos; cada grupo de REPLICAS_POR_SEMILLA réplicas recibe su
+    propia semilla derivada de `semilla`, de modo que el resultado es reproducible y no depende de la
+    cantidad de procesos ni del tamaño de los bloques.
+    Devuelve una tabla con las columnas de estrato, el horizonte, los casos, la sobrevida puntual y
+    los límites del intervalo.
+    """
+    horizontes = np.asarray(horizontes, dtype=np.float64)
+    valido = df[duracion].notna().to_numpy()
+    if columnas_estrato:
+        codigos = df.groupby(columnas_estrato, observed=True, sort=True).ngroup().to_numpy()
+        valido &= codigos >= 0
+    else:
+        codigos = np.zeros(len(df), dtype=np.int64)
+
+    # Cohorte ordenada por estrato: cada estrato es un tramo contiguo de los arreglos compartidos
+    posiciones = np.flatnonzero(valido)
+    posiciones = posiciones[np.argsort(codigos[posiciones], kind='stable')]
+    tiempos = df[duracion].to_numpy(dtype=np.float64)[posiciones]
+    eventos = df[evento].to_numpy(dtype=np.float64)[posiciones]
+    codigos_ordenados = codigos[posiciones]
+    codigos_unicos, inicios = np.unique(codigos_ordenados, return_index=True)
+    limites = np.append(inicios, len(posiciones))
+
+    # Bloques de réplicas por estrato, con grupos completos de réplicas de semillas independientes
+    semillas_estrato = np.random.SeedSequence(semilla).spawn(len(codigos_unicos))
+    cantidades = [min(REPLICAS_POR_SEMILLA, replicas - r) for r in range(0, replicas, REPLICAS_POR_SEMILLA)]
+    tareas = []
+    for i in range(len(codigos_unicos)):
+        inicio, fin = int(limites[i]), int(limites[i + 1])
+        semillas = semillas_estrato[i].spawn(len(cantidades))
+        grupos = max(1, ELEMENTOS_POR_BLOQUE // ((fin - inicio) * REPLICAS_POR_SEMILLA))
+        for g in range(0, len(cantidades), grupos):
+            tareas.append((i, inicio, fin, cantidades[g:g + grupos], semillas[g:g + grupos]))
+
+    if procesos is None:
+        procesos = os.cpu_count() or 1
+    procesos = min(procesos, len(tareas))
+
+    if procesos <= 1:
+        _inicializar_trabajador(tiempos, eventos)
+        bloques = [_replicas_bloque(inicio, fin, cantidades_bloque, semillas_bloque, horizontes)
+                   for _, inicio, fin, cantidades_bloque, semillas_bloque in tareas]
+    else:
+        with ProcessPoolExecutor(max_workers=procesos, initializer=_inicializar_trabajador,
+                                 initargs=(tiempos, eventos)) as pool:
+            futuros = [pool.submit(_replicas_bloque, inicio, fin, cantidades_bloque, semillas_bloque, horizontes)
+                       for _, inicio, fin, cantidades_bloque, semillas_bloque in tareas]
+            bloques = [futuro.result() for futuro in futuros]
+
+    # Percentiles por estrato, juntando sus bloques en el orden en que se generaron
+    filas = []
+    for i in range(len(codigos_unicos)):
+        inicio, fin = int(limites[i]), int(limites[i + 1])
+        muestras = np.vstack([bloque for (j, *_), bloque in zip(tareas, bloques) if j == i])
+        puntual = sobrevida_ponderada(tiempos[inicio:fin], eventos[inicio:fin], np.ones((1, fin - inicio)),
+                                      horizontes)[0]
+        inferior, superior = np.percentile(muestras, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+        for h, horizonte in enumerate(horizontes):
+            filas.append((i, horizonte, fin - inicio, puntual[h], inferior[h], superior[h]))
+
+    resultado = pd.DataFrame(filas, columns=['estrato', 'horizonte', 'casos', 'sobrevida', 'ic_inferior',
+                                             'ic_superior'])
+    resultado['replicas'] = replicas
+    if columnas_estrato:
+        # Etiquetas del estrato tomadas de la primera fila de cada código
+        etiquetas = df[columnas_estrato].iloc[posiciones[inicios]].reset_index(drop=True)
+        etiquetas = etiquetas.iloc[resultado['estrato']].reset_index(drop=True)
+        resultado = pd.concat([etiquetas, resultado.drop(columns='estrato')], axis=1)
+    else:
+        resultado = resultado.drop(columns='estrato')
+    return resultado
+
+
+def tablas_horizontes(df: pd.DataFrame, horizontes=(1, 3, 5), replicas: int = 1000, semilla: int = None,
+                      procesos: int = None):
+    """
+    Calcula la sobrevida en horizontes fijos con intervalos bootstrap para cada estratificación
+    (grupo de tumor, comuna y sexo).
+    """
+    return {nombre: bootstrap_por_estrato(df, columnas, horizontes, replicas, semilla=semilla, procesos=procesos)
+            for nombre, columnas in ESTRATIFICACIONES.items()}
+
+
+def exportar_horizontes(tablas: dict, ruta_salida: str):
+    """
+    Exporta las tablas de sobrevida en horizontes fijos: una hoja por estratificación en Excel, o un archivo
+    por estratificación en Parquet o CSV (según la extensión de `ruta_salida`). Devuelve las rutas escritas.
+    """
+    rutas = exportar(tablas, ruta_salida)
+    informar(f"Sobrevida en horizontes exportada a {', '.join(rutas)}")
+    return rutas
@@ -0,0 +1,260 @@
+import argparse
+import os
+import sys
+
+# Rutas por defecto de cada paso (las mismas que usan los scripts de cada módulo)
+RUTA_REGISTRO = 'data/rpcdata_13082024.csv'
+DIRECTORIO_DEFUNCIONES = 'data/defunciones'
+RUTA_COHORTE = 'data/datos_ajustados.xlsx'
+RUTA_DEFUNCIONES = 'data/defunciones_combinadas.csv'
+RUTA_COHORTE_ACTUALIZADA = 'data/datos_ajustados_actualizados.xlsx'
+RUTA_ESTADISTICAS = 'data/estadisticas_descriptivas.xlsx'
+RUTA_CURVAS = 'data/curvas_km.xlsx'
+RUTA_IMAGENES = 'data/images/'
+RUTA_RESULTADOS = 'data/.cache/resultados'
+RUTA_INSTRUMENTACION = 'data/instrumentacion.jsonl'
+DIRECTORIO_PARTICIONES = 'data/particiones'
+RUTA_CUBO = 'data/cubo_sobrevida.feather'
+
+
+def preparar(args):
+    """
+    Selecciona y filtra los casos del registro y los exporta.
+    """
+    from concordDataProcessor import procesar_registro
+
+    procesador = procesar_registro(args.registro, anio_inicio=args.anio_inicio, anio_fin=args.anio_fin)
+    procesador.exportar_a_excel(args.salida)
+
+
+def defunciones(args):
+    """
+    Combina los archivos de defunciones del DEIS y los exporta.
+    """
+    from dataExporter import exportar
+    from deathDataProcessor import DefuncionesProcessor
+
+    procesador = DefuncionesProcessor(args.directorio, procesos=args.procesos)
+    procesador.cargar_y_combinar_archivos()
+    exportar(procesador.obtener_datos(), args.salida)
+    print(f"Defunciones exportadas a {args.salida}")
+
+
+def cruzar(args):
+    """
+    Cruza la cohorte con las defunciones y exporta la cohorte actualizada.
+    """
+    from dataMerger import DataMerger
+
+    procesador = DataMerger(args.cohorte, args.defunciones)
+    procesador.cruzar_datos(args.fecha_fin, vinculacion=args.vinculacion, ruta_revision=args.revision,
+                            procesos=args.procesos)
+    procesador.exportar_resultado(args.salida)
+
+
+def actualizar(args):
+    """
+    Extiende el seguimiento de la cohorte cruzada con un nuevo año de defunciones y actualiza solo lo que
+    depende de los pacientes que cambiaron: el cubo de sobrevida (si existe) y las curvas guardadas.
+    """
+    from cohortLoader import cargar_cohorte
+    from dataMerger import DataMerger
+    from deathDataProcessor import leer_archivo_defunciones
+
+    defunciones, _ = leer_archivo_defunciones(args.defunciones)
+    procesador = DataMerger.desde_datos(cargar_cohorte(args.cohorte), defunciones)
+    anteriores = procesador.actualizar_seguimiento(args.fecha_fin)
+    procesador.exportar_resultado(args.salida)
+    if not (os.path.exists(args.cubo) or args.curvas):
+        return
+
+    from kaplanMeierSimplificado import preparar_cohorte
+
+    cohorte = procesador.obtener_datos()
+    if os.path.exists(args.cubo):
+        from cuboSobrevida import CuboSobrevida
+
+        cubo = CuboSobrevida.desde_archivo(args.cubo)
+        cubo = cubo.actualizar(preparar_cohorte(anteriores), preparar_cohorte(cohorte.loc[anteriores.index]))
+        cubo.guardar(args.cubo)
+    if args.curvas:
+        from almacenResultados import AlmacenResultados
+        from dataExporter import exportar
+        from kaplanMeierSimplificado import calcular_curvas
+
+        # Los estratos sin pacientes modificados se toman del almacén de resultados sin volver a ajustarlos
+        tablas = calcular_curvas(preparar_cohorte(cohorte), almacen=AlmacenResultados(args.resultados))
+        print(f"Curvas exportadas a {', '.join(exportar(tablas, args.curvas))}")
+
+
+def estadisticas(args):
+    """
+    Exporta las estadísticas descriptivas de la cohorte.
+    """
+    from descriptiveStatistics import DescriptiveStatistics
+    from tumorGroups import TUMOR_GRUPOS
+
+    DescriptiveStatistics(args.cohorte).exportar_a_excel(args.salida, TUMOR_GRUPOS)
+
+
+def kaplan_meier(args):
+    """
+    Calcula las curvas de Kaplan-Meier (y la incidencia acumulada por causa) y las exporta como tablas,
+    sin graficar.
+    """
+    from almacenResultados import AlmacenResultados
+    from dataExporter import exportar
+    from kaplanMeierSimplificado import calcular_curvas, calcular_incidencias, preparar_datos
+
+    df = preparar_datos(args.cohorte)
+    almacen = AlmacenResultados(args.resultados)
+    tablas = calcular_curvas(df, args.comunas, almacen=almacen)
+    if args.incidencia:
+        tablas.update({f'incidencia_{nombre}': tabla
+                       for nombre, tabla in calcular_incidencias(df, args.comunas, almacen=almacen).items()})
+    rutas = exportar(tablas, args.salida)
+    print(f"Curvas exportadas a {', '.join(rutas)}")
+
+
+def graficos(args):
+    """
+    Calcula las curvas, las grafica y exporta las pruebas de comparación junto a las imágenes.
+    """
+    from almacenResultados import AlmacenResultados
+    from kaplanMeierSimplificado import analizar
+
+    # Las rutas de las figuras se arman concatenando el directorio, que debe terminar en '/'
+    directorio = os.path.join(args.imagenes, '')
+    archivos = analizar(args.cohorte, args.comunas, directorio, almacen=AlmacenResultados(args.resultados))
+    print(f"{len(archivos)} archivos generados en {args.imagenes}")
+
+
+def regiones(args):
+    """
+    Procesa el registro por regiones (particiones en Parquet) y exporta el cubo de sobrevida y las
+    estadísticas descriptivas combinadas.
+    """
+    from dataExporter import exportar
+    from procesamientoParticionado import procesar_particionado
+
+    resultado = procesar_particionado(args.registro, args.defunciones, args.directorio, args.fecha_fin,
+                                      args.anio_inicio, args.anio_fin, procesos=args.procesos)
+    resultado['cubo'].guardar(args.cubo)
+    rutas = exportar(resultado['estadisticas'], args.estadisticas)
+    print(f"Cohortes por región en {os.path.join(args.directorio, 'cohorte')}; "
+          f"cubo en {args.cubo}; estadísticas en {', '.join(rutas)}")
+
+
+def grupos(args):
+    """
+    Lista los grupos de tumor y sus códigos CIE-O.
+    """
+    from tumorGroups import TUMOR_GRUPOS
+
+    for nombre, codigos in TUMOR_GRUPOS.items():
+        print(f"{nombre}: {', '.join(codigos)}")
+
+
+def crear_parser():
+    """
+    Parser con un subcomando por paso del análisis.
+    """
+    parser = argparse.ArgumentParser(prog='cli.py', description='Análisis de sobrevida del registro de cáncer. '
+                                     'Cada subcomando importa solo los módulos que usa.')
+    parser.add_argument('--instrumentacion', action='store_true',
+                        help='registra tiempo, memoria y filas de cada paso')
+    parser.add_argument('--ruta-instrumentacion', default=RUTA_INSTRUMENTACION, metavar='JSONL',
+                        help='archivo JSON-lines de la instrumentación (por defecto %(default)s)')
+    subcomandos = parser.add_subparsers(dest='comando', required=True, metavar='comando')
+
+    sub = subcomandos.add_parser('prepare', help='prepara la cohorte desde el CSV del registro')
+    sub.add_argument('--registro', default=RUTA_REGISTRO)
+    sub.add_argument('--salida', default=RUTA_COHORTE)
+    sub.add_argument('--anio-inicio', type=int, default=2011)
+    sub.add_argument('--anio-fin', type=int, default=2019)
+    sub.set_defaults(funcion=preparar)
+
+    sub = subcomandos.add_parser('deaths', help='combina los archivos de defunciones del DEIS')
+    sub.add_argument('--directorio', default=DIRECTORIO_DEFUNCIONES)
+    sub.add_argument('--salida', default=RUTA_DEFUNCIONES)
+    sub.add_argument('--procesos', type=int, default=None)
+    sub.set_defaults(funcion=defunciones)
+
+    sub = subcomandos.add_parser('merge', help='cruza la cohorte con las defunciones')
+    sub.add_argument('--cohorte', default=RUTA_COHORTE)
+    sub.add_argument('--defunciones', default=RUTA_DEFUNCIONES)
+    sub.add_argument('--salida', default=RUTA_COHORTE_ACTUALIZADA)
+    sub.add_argument('--fecha-fin', default='2019-12-31', help='fin del seguimiento (AAAA-MM-DD)')
+    sub.add_argument('--vinculacion', choices=['exacta', 'probabilistica'], default='exacta')
+    sub.add_argument('--revision', default=None,
+                     help='archivo con los pares dudosos de la vinculación probabilística')
+    sub.add_argument('--procesos', type=int, default=None)
+    sub.set_defaults(funcion=cruzar)
+
+    sub = subcomandos.add_parser('update', help='extiende el seguimiento con un nuevo año de defunciones del DEIS')
+    sub.add_argument('--cohorte', default=RUTA_COHORTE_ACTUALIZADA, help='cohorte ya cruzada con defunciones')
+    sub.add_argument('--defunciones', required=True, help='archivo Excel del DEIS con el año nuevo')
+    sub.add_argument('--salida', default=RUTA_COHORTE_ACTUALIZADA)
+    sub.add_argument('--fecha-fin', default=None,
+                     help='nuevo fin del seguimiento (AAAA-MM-DD); por defecto, fin del último año de defunciones')
+    sub.add_argument('--cubo', default=RUTA_CUBO, help='cubo de sobrevida a actualizar, si existe')
+    sub.add_argument('--curvas', default=None, help='exporta además las curvas de Kaplan-Meier actualizadas')
+    sub.add_argument('--resultados', default=RUTA_RESULTADOS, help='directorio de las curvas ya calculadas')
+    sub.set_defaults(funcion=actualizar)
+
+    sub = subcomandos.add_parser('stats', help='exporta las estadísticas descriptivas')
+    sub.add_argument('--cohorte', default=RUTA_COHORTE)
+    sub.add_argument('--salida', default=RUTA_ESTADISTICAS)
+    sub.set_defaults(funcion=estadisticas)
+
+    for nombre, funcion, ayuda in [('km', kaplan_meier, 'calcula y exporta las curvas de Kaplan-Meier'),
+                                   ('plots', graficos, 'grafica las curvas y exporta las pruebas log-rank')]:
+        sub = subcomandos.add_parser(nombre, help=ayuda)
+        sub.add_argument('--cohorte', default=RUTA_COHORTE)
+        sub.add_argument('--comunas', nargs='+', default=['2201'] if nombre == 'plots' else None,
+                         help='comunas (REGCOM) a analizar' + ('' if nombre == 'plots' else '; por defecto todas'))
+        sub.add_argument('--resultados', default=RUTA_RESULTADOS, help='directorio de las curvas ya calculadas')
+        if nombre == 'km':
+            sub.add_argument('--salida', default=RUTA_CURVAS)
+            sub.add_argument('--incidencia', action='store_true', help='incluye la incidencia acumulada por causa')
+        else:
+            sub.add_argument('--imagenes', default=RUTA_IMAGENES)
+        sub.set_defaults(funcion=funcion)
+
+    sub = subcomandos.add_parser('regions', help='prepara, cruza y resume el registro por regiones, sin cargarlo '
+                                 'completo en memoria')
+    sub.add_argument('--registro', default=RUTA_REGISTRO)
+    sub.add_argument('--defunciones', default=DIRECTORIO_DEFUNCIONES, help='directorio de los archivos del DEIS')
+    sub.add_argument('--directorio', default=DIRECTORIO_PARTICIONES, help='directorio de las particiones')
+    sub.add_argument('--fecha-fin', default='2019-12-31', help='fin del seguimiento (AAAA-MM-DD)')
+    sub.add_argument('--anio-inicio', type=int, default=2011)
+    sub.add_argument('--anio-fin', type=int, default=2019)
+    sub.add_argument('--cubo', default=RUTA_CUBO)
+    sub.add_argument('--estadisticas', default=RUTA_ESTADISTICAS)
+    sub.add_argument('--procesos', type=int, default=None)
+    sub.set_defaults(funcion=regiones)
+
+    sub = subcomandos.add_parser('grupos', help='lista los grupos de tumor')
+    sub.set_defaults(funcion=grupos)
+    return parser
+
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+
+    # Backend sin ventanas también para los procesos que renderizan (lo heredan por el entorno)
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+
+    if args.instrumentacion:
+        from instrumentacion import activar, imprimir_resumen
+
+        activar(ruta_jsonl=args.ruta_instrumentacion)
+        args.funcion(args)
+        imprimir_resumen()
+    else:
+        args.funcion(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
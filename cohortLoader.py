@@ -0,0 +1,46 @@
+import os
+
+from cohortSchema import aplicar_esquema
+from columnarCache import ColumnarCache
+from dataExporter import leer_tabla
+from instrumentacion import informar
+from tumorGroups import TablaTopografia
+
+# Se incrementa cuando cambia la forma en que se tipan las columnas, para invalidar snapshots antiguos
+VERSION_SNAPSHOT = '3'
+
+def leer_cohorte(ruta_datos: str):
+    """
+    Lee la cohorte desde el archivo exportado (Excel, Parquet o CSV, según la extensión) y le aplica el
+    esquema compacto de la cohorte (fechas como datetime64, códigos como categóricas, indicadores como
+    enteros pequeños y RUT como entero, con el dígito verificador en CODRUT).
+    También asigna el grupo de tumor (TUMOR_GRUPO) de cada caso.
+    """
+    df = leer_tabla(ruta_datos, dtype={'RUT': str})
+    df = aplicar_esquema(df)
+
+    if 'TOP' in df.columns:
+        df['TUMOR_GRUPO'] = TablaTopografia().asignar_grupos(df['TOP'])
+
+    return df
+
+
+def cargar_cohorte(ruta_datos: str, directorio_cache: str = None):
+    """
+    Carga la cohorte ajustada. En la primera ejecución se lee el archivo (Excel, Parquet o CSV) y se
+    guarda un snapshot Feather tipado; las siguientes ejecuciones leen el snapshot mientras el
+    archivo no cambie.
+    """
+    if directorio_cache is None:
+        directorio_cache = os.path.join(os.path.dirname(ruta_datos) or '.', '.cache')
+
+    cache = ColumnarCache(directorio_cache)
+    df = cache.leer(ruta_datos, VERSION_SNAPSHOT)
+    if df is not None:
+        informar(f"Cohorte cargada desde caché: {ruta_datos}")
+        return df
+
+    df = leer_cohorte(ruta_datos)
+    cache.guardar(ruta_datos, df, VERSION_SNAPSHOT)
+    informar(f"Cohorte leída y guardada en caché: {ruta_datos}")
+    return df
@@ -0,0 +1,217 @@
+import numpy as np
+import pandas as pd
+
+from instrumentacion import informar
+from rutUtils import descomponer_rut, formatear_rut, normalizar_rut
+
+# Esquema declarado de la cohorte y de las defunciones. Los códigos de baja cardinalidad se guardan
+# como categóricas, los indicadores como enteros de 8/16 bits (con su versión nullable si hay valores
+# faltantes) y el RUT/RUN como el entero del cuerpo del RUT (Int32), con el dígito verificador aparte.
+ESQUEMA_COHORTE = {
+    # Códigos
+    'REGCOM': 'category',
+    'TOP': 'category',
+    'MORF': 'category',
+    'C10': 'category',
+    'CODRUT': 'category',
+    'CODRUN': 'category',
+    'DIAG1': 'category',
+    'COMUNA': 'category',
+    'VINCULACION': 'category',
+    'TUMOR_GRUPO': 'category',
+    # Indicadores y códigos numéricos pequeños
+    'SEXO': 'int8',
+    'COMP': 'int8',
+    'BASE': 'int8',
+    'VM': 'int8',
+    'CAUSA': 'int8',
+    'CODPRI': 'int8',
+    'PMSEC': 'int8',
+    'PMTOT': 'int8',
+    'GRA': 'int8',
+    'EXT': 'int8',
+    'LAT': 'int8',
+    'DIA_DEF': 'int8',
+    'MES_DEF': 'int8',
+    'ANO_DEF': 'int16',
+    'EDAD': 'int16',
+    'EDAD_TIPO': 'int8',
+    'EDAD_CANT': 'int16',
+    'edad_diagnostico': 'int16',
+    'tiempo_sobrevida': 'int32',
+    # Identificadores
+    'RUT': 'rut',
+    'RUN': 'rut',
+    # Fechas
+    'FECDIAG': 'fecha',
+    'FECCON': 'fecha',
+    'FECNAC': 'fecha',
+    'FECHA_DEF': 'fecha',
+}
+
+# Columna del dígito verificador de cada identificador: CODRUT ya viene en el registro; el de los RUN del DEIS
+# ('12345678-5') se guarda en CODRUN
+DIGITOS_VERIFICADORES = {'RUT': 'CODRUT', 'RUN': 'CODRUN'}
+
+# Sufijo de la columna con el texto original de los RUT/RUN inválidos, que se vuelve a escribir al exportar
+SUFIJO_ORIGINAL = '_ORIGINAL'
+
+
+def _a_categoria(serie: pd.Series):
+    """
+    Convierte una columna de códigos a categórica. Si ya es categórica solo elimina las categorías
+    que quedaron sin uso después de filtrar.
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.cat.remove_unused_categories()
+    # Las columnas con tipos mezclados (p. ej. 339 y '33.9' en TOP) se unifican como texto
+    if serie.dtype == object:
+        serie = serie.where(serie.isna(), serie.astype(str))
+    return serie.astype('category')
+
+
+def _a_entero(serie: pd.Series, tipo: str):
+    """
+    Convierte una columna a un entero pequeño ('int8', 'int16', ...). Si tiene valores faltantes se usa
+    el tipo nullable equivalente ('Int8', ...). Si algún valor no es entero o no cabe en el tipo, la
+    columna se deja sin cambios.
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        serie = serie.astype(object)
+    numeros = pd.to_numeric(serie, errors='coerce')
+    presentes = numeros.dropna()
+    limites = np.iinfo(tipo)
+    if (numeros.isna().sum() > serie.isna().sum() or (presentes % 1 != 0).any()
+            or (presentes < limites.min).any() or (presentes > limites.max).any()):
+        return serie
+    if numeros.isna().any():
+        return numeros.astype(tipo.capitalize())
+    return numeros.astype(tipo)
+
+
+def _a_rut(serie: pd.Series):
+    """
+    Codifica el RUT/RUN como el entero del cuerpo del RUT (Int32). Los valores vacíos o inválidos
+    quedan como faltantes.
+
+    Devuelve además el dígito verificador (categórica '0'-'9'/'K'), si algún valor lo trae, y el texto
+    original de los valores inválidos, si los hay (None en ambos casos si no).
+    """
+    claves, digitos = descomponer_rut(serie)
+    validos = (claves >= 0) & (claves <= np.iinfo(np.int32).max)
+    valores = pd.arrays.IntegerArray(np.where(validos, claves, 0).astype(np.int32), ~validos)
+    cuerpo = pd.Series(valores, index=serie.index, name=serie.name)
+
+    digito = None
+    con_digito = validos & pd.notna(digitos)
+    if con_digito.any():
+        digito = pd.Series(pd.Categorical(np.where(con_digito, digitos, None)), index=serie.index)
+
+    original = None
+    texto = serie.astype(object).where(serie.notna().to_numpy() & ~validos)
+    texto = texto.where(texto.isna(), texto.astype(str).str.strip())
+    texto = texto.where(texto != '')
+    if texto.notna().any():
+        original = texto
+    return cuerpo, digito, original
+
+
+def _a_fecha(serie: pd.Series):
+    """
+    Convierte a datetime las fechas guardadas como texto. Las fechas numéricas yyyymmdd del registro
+    se dejan como están: las decodifica ConcordDataProcessor al ajustar las variables de tiempo.
+    """
+    if serie.dtype == object or pd.api.types.is_string_dtype(serie.dtype):
+        return pd.to_datetime(serie, errors='coerce')
+    return serie
+
+
+def con_columnas_rut(variables: list, columnas):
+    """
+    Variables de una selección más el texto original de los RUT/RUN inválidos (<col>_ORIGINAL) que haya en
+    `columnas`, a continuación del RUT/RUN y de su dígito verificador, donde las deja aplicar_esquema.
+    """
+    seleccion = list(variables)
+    for columna in list(seleccion):
+        if ESQUEMA_COHORTE.get(columna) != 'rut' or columna + SUFIJO_ORIGINAL not in columnas \
+                or columna + SUFIJO_ORIGINAL in seleccion:
+            continue
+        posicion = seleccion.index(columna) + 1
+        if seleccion[posicion:posicion + 1] == [DIGITOS_VERIFICADORES[columna]]:
+            posicion += 1
+        seleccion.insert(posicion, columna + SUFIJO_ORIGINAL)
+    return seleccion
+
+
+def memoria_mb(df: pd.DataFrame):
+    """
+    Memoria ocupada por el DataFrame en MB, incluyendo el contenido de las columnas de texto.
+    """
+    return df.memory_usage(index=True, deep=True).sum() / 2 ** 20
+
+
+def reporte_memoria(df: pd.DataFrame):
+    """
+    Detalle por columna del tipo y la memoria ocupada (en MB), ordenado de mayor a menor.
+    """
+    memoria = df.memory_usage(index=False, deep=True) / 2 ** 20
+    return pd.DataFrame({'tipo': df.dtypes.astype(str), 'memoria_mb': memoria}).sort_values('memoria_mb', ascending=False)
+
+
+def aplicar_esquema(df: pd.DataFrame, etiqueta: str = 'Cohorte', reportar: bool = True):
+    """
+    Aplica el esquema compacto a las columnas presentes del DataFrame y devuelve el resultado.
+
+    Las columnas enteras que no están en el esquema se reducen al entero más pequeño que las contiene.
+    Con `reportar=True` se imprime la memoria antes y después de la conversión.
+    """
+    antes = memoria_mb(df) if reportar else None
+    df = df.copy(deep=False)
+
+    for columna in df.columns:
+        tipo = ESQUEMA_COHORTE.get(columna)
+        if tipo == 'category':
+            df[columna] = _a_categoria(df[columna])
+        elif tipo == 'rut':
+            df[columna], digito, original = _a_rut(df[columna])
+            # El dígito verificador y el texto original van a continuación del RUT/RUN
+            posicion = df.columns.get_loc(columna) + 1
+            verificador = DIGITOS_VERIFICADORES[columna]
+            if digito is not None and verificador not in df.columns:
+                df.insert(posicion, verificador, digito)
+            if verificador in df.columns and df.columns.get_loc(verificador) == posicion:
+                posicion += 1
+            if original is not None and columna + SUFIJO_ORIGINAL not in df.columns:
+                df.insert(posicion, columna + SUFIJO_ORIGINAL, original)
+        elif tipo == 'fecha':
+            df[columna] = _a_fecha(df[columna])
+        elif tipo is not None:
+            df[columna] = _a_entero(df[columna], tipo)
+        elif df[columna].dtype == np.int64:
+            df[columna] = pd.to_numeric(df[columna], downcast='integer')
+
+    if reportar:
+        despues = memoria_mb(df)
+        reduccion = 100 * (1 - despues / antes) if antes else 0.0
+        informar(f"{etiqueta}: memoria {antes:.1f} MB -> {despues:.1f} MB ({reduccion:.0f}% menos)")
+    return df
+
+
+def rut_como_texto(df: pd.DataFrame):
+    """
+    Columnas RUT/RUN codificadas por el esquema (Int32) de vuelta a texto 'NNNNNNNN-D' para exportarlas,
+    con su dígito verificador (calculado si no se conservó) y con el texto original de los inválidos.
+    Devuelve el mismo DataFrame si no tiene esas columnas.
+    """
+    columnas = [columna for columna, tipo in ESQUEMA_COHORTE.items()
+                if tipo == 'rut' and columna in df.columns and df[columna].dtype == 'Int32']
+    if not columnas:
+        return df
+    df = df.copy(deep=False)
+    for columna in columnas:
+        digitos = df[DIGITOS_VERIFICADORES[columna]] if DIGITOS_VERIFICADORES[columna] in df.columns else None
+        texto = pd.Series(formatear_rut(normalizar_rut(df[columna]), digitos), index=df.index, dtype=object)
+        if columna + SUFIJO_ORIGINAL in df.columns:
+            texto = texto.where(texto.notna(), df.pop(columna + SUFIJO_ORIGINAL))
+        df[columna] = texto
+    return df
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from instrumentacion import informar
+
+
+class ColumnarCache:
+    def __init__(self, directorio: str):
+        """
+        Inicializa la caché columnar en el directorio indicado.
+
+        Cada archivo fuente se guarda como un snapshot Feather (Arrow IPC) tipado, que conserva
+        fechas datetime64 y categóricas tal cual. El manifiesto (manifiesto.json) registra, por
+        archivo fuente y versión, su tamaño, mtime y hash SHA-256, de modo que un snapshot solo se
+        sirve mientras el archivo fuente no haya cambiado. Varias instancias pueden compartir el
+        directorio: cada una escribe en el manifiesto solo las entradas que modificó.
+        """
+        self.directorio = directorio
+        self.ruta_manifiesto = os.path.join(directorio, 'manifiesto.json')
+        os.makedirs(directorio, exist_ok=True)
+        self.manifiesto = leer_manifiesto(self.ruta_manifiesto)
+        self.modificadas = set()
+
+    def _escribir_manifiesto(self):
+        """
+        Escribe el manifiesto con las entradas modificadas por esta instancia (ver escribir_manifiesto).
+        """
+        self.manifiesto = escribir_manifiesto(self.ruta_manifiesto, self.manifiesto, self.modificadas)
+        self.modificadas.clear()
+
+    @staticmethod
+    def _clave(ruta_fuente: str, version: str):
+        return f"{os.path.abspath(ruta_fuente)}::{version}"
+
+    def vigente(self, ruta_fuente: str, version: str = ''):
+        """
+        Indica si existe un snapshot válido para el archivo fuente.
+
+        Si tamaño y mtime coinciden con el manifiesto no se lee el archivo fuente. Si solo
+        cambió el mtime (p. ej. el archivo fue copiado), se compara el hash del contenido.
+        """
+        clave = self._clave(ruta_fuente, version)
+        if clave not in self.manifiesto:
+            # Otra instancia pudo haberla guardado después de que se leyó el manifiesto
+            self.manifiesto = combinar_manifiesto(self.ruta_manifiesto, self.manifiesto, self.modificadas)
+        entrada = self.manifiesto.get(clave)
+        if entrada is None:
+            return False
+        if not os.path.exists(os.path.join(self.directorio, entrada['snapshot'])):
+            return False
+
+        estado = os.stat(ruta_fuente)
+        if estado.st_size != entrada['tamano']:
+            return False
+        if estado.st_mtime_ns == entrada['mtime_ns']:
+            return True
+
+        if calcular_hash_archivo(ruta_fuente) != entrada['sha256']:
+            return False
+        entrada['mtime_ns'] = estado.st_mtime_ns
+        self.modificadas.add(clave)
+        self._escribir_manifiesto()
+        return True
+
+    def leer(self, ruta_fuente: str, version: str = ''):
+        """
+        Devuelve el snapshot del archivo fuente, o None si no está vigente.
+        """
+        if not self.vigente(ruta_fuente, version):
+            return None
+        entrada = self.manifiesto[self._clave(ruta_fuente, version)]
+        return pd.read_feather(os.path.join(self.directorio, entrada['snapshot']))
+
+    def guardar(self, ruta_fuente: str, df: pd.DataFrame, version: str = ''):
+        """
+        Guarda el DataFrame como snapshot del archivo fuente y actualiza el manifiesto.
+        """
+        clave = self._clave(ruta_fuente, version)
+        estado = os.stat(ruta_fuente)
+        sha256 = calcular_hash_archivo(ruta_fuente)
+        nombre_base = os.path.splitext(os.path.basename(ruta_fuente))[0]
+        # La versión va en el nombre: distintas versiones del mismo archivo tienen snapshots distintos
+        huella_version = hashlib.sha256(version.encode('utf-8')).hexdigest()[:8]
+        snapshot = f"{nombre_base}-{sha256[:16]}-{huella_version}.feather"
+        ruta_snapshot = os.path.join(self.directorio, snapshot)
+
+        try:
+            ruta_tmp = ruta_snapshot + '.tmp'
+            df.reset_index(drop=True).to_feather(ruta_tmp)
+            os.replace(ruta_tmp, ruta_snapshot)
+        except Exception as e:
+            informar(f"No se pudo guardar el snapshot de {ruta_fuente}: {e}")
+            return
+
+        # El snapshot anterior se borra solo si ninguna otra entrada (de esta u otra instancia) lo usa
+        self.manifiesto = combinar_manifiesto(self.ruta_manifiesto, self.manifiesto, self.modificadas)
+        anterior = self.manifiesto.get(clave)
+        en_uso = {entrada['snapshot'] for otra, entrada in self.manifiesto.items() if otra != clave}
+        if anterior is not None and anterior['snapshot'] != snapshot and anterior['snapshot'] not in en_uso:
+            try:
+                os.remove(os.path.join(self.directorio, anterior['snapshot']))
+            except FileNotFoundError:
+                pass
+
+        self.manifiesto[clave] = {
+            'tamano': estado.st_size,
+            'mtime_ns': estado.st_mtime_ns,
+            'sha256': sha256,
+            'snapshot': snapshot,
+        }
+        self.modificadas.add(clave)
+        self._escribir_manifiesto()
+
+    def obtener(self, ruta_fuente: str, lector, version: str = ''):
+        """
+        Devuelve el snapshot vigente o, si no existe, lee el archivo con `lector(ruta_fuente)`
+        y guarda el resultado para las siguientes ejecuciones.
+        """
+        df = self.leer(ruta_fuente, version)
+        if df is not None:
+            return df
+
+        df = lector(ruta_fuente)
+        self.guardar(ruta_fuente, df, version)
+        return df
+
+
+def calcular_hash_archivo(ruta: str, tamano_bloque: int = 1 << 20):
+    """
+    Calcula el hash SHA-256 del contenido de un archivo leyéndolo por bloques.
+    """
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(tamano_bloque), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def leer_manifiesto(ruta: str):
+    """
+    Lee un manifiesto JSON desde disco; si no existe o está corrupto devuelve uno vacío.
+    """
+    try:
+        with open(ruta, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def combinar_manifiesto(ruta: str, manifiesto: dict, cambios):
+    """
+    Manifiesto en disco con los cambios de una instancia aplicados encima: para cada clave de `cambios`
+    se toma la entrada de `manifiesto`, o se borra si `manifiesto` ya no la tiene. Una clave puede ser
+    una tupla con la ruta dentro de un manifiesto anidado (p. ej. ('etapas', nombre)).
+
+    Así varias instancias que comparten el directorio (p. ej. dos comandos ejecutados a la vez) no
+    pisan ni pierden las entradas que escribieron las otras.
+    """
+    combinado = leer_manifiesto(ruta)
+    for clave in cambios:
+        *padres, ultima = clave if isinstance(clave, tuple) else (clave,)
+        origen, destino = manifiesto, combinado
+        for padre in padres:
+            origen = origen.get(padre, {})
+            destino = destino.setdefault(padre, {})
+        if ultima in origen:
+            destino[ultima] = origen[ultima]
+        else:
+            destino.pop(ultima, None)
+    return combinado
+
+
+def escribir_manifiesto(ruta: str, manifiesto: dict, cambios, sangria: int = 2):
+    """
+    Escribe de forma atómica (archivo temporal + reemplazo) el manifiesto en disco con los `cambios` de
+    esta instancia aplicados (ver combinar_manifiesto) y devuelve el manifiesto combinado.
+    """
+    combinado = combinar_manifiesto(ruta, manifiesto, cambios)
+    ruta_tmp = ruta + '.tmp'
+    with open(ruta_tmp, 'w', encoding='utf-8') as f:
+        json.dump(combinado, f, indent=sangria, ensure_ascii=False)
+    os.replace(ruta_tmp, ruta)
+    return combinado
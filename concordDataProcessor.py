@@ -1,125 +1,353 @@
+import time
 import pandas as pd
-from datetime import datetime
+
+from cohortSchema import aplicar_esquema, con_columnas_rut
+from dateUtils import convertir_yyyymmdd, edad_cumplida
+from dataExporter import exportar
+from instrumentacion import activar, esta_activa, imprimir_resumen, informar, instrumentar, medir, registrar
+
 
 class ConcordDataProcessor:
     def __init__(self, data: pd.DataFrame):
         """
-        Inicializa la clase con un DataFrame.
+        Inicializa la clase con un DataFrame, al que se aplica el esquema compacto de la cohorte.
+        """
+        self.data = aplicar_esquema(data) if data is not None else None
+        self.ruta_csv = None
+        self.plan = []
+
+    @classmethod
+    def desde_csv(cls, ruta_csv: str, tamano_bloque: int = 200_000, dtype: dict = None):
+        """
+        Crea el procesador en modo diferido sobre un archivo CSV.
+
+        En este modo los métodos de selección, filtrado y ajuste solo registran la operación;
+        `ejecutar()` lee el archivo por bloques leyendo solo las columnas necesarias, aplica
+        todos los filtros con una única máscara por bloque y conserva solo las filas que pasan.
         """
-        self.data = data
+        procesador = cls(None)
+        procesador.ruta_csv = ruta_csv
+        procesador.tamano_bloque = tamano_bloque
+        procesador.dtype = dtype
+        return procesador
 
+    @property
+    def diferido(self):
+        return self.data is None and self.ruta_csv is not None
+
+    @instrumentar(filas='data')
     def seleccionar_variables(self, variables: list):
         """
-        Selecciona solo las variables especificadas.
+        Selecciona solo las variables especificadas (con el texto original de los RUT inválidos, que el
+        esquema guarda aparte).
         """
-        self.data = self.data[variables]
-        print(f"Variables seleccionadas: {variables}")
+        if self.diferido:
+            self.plan.append(('seleccion', list(variables)))
+        else:
+            self.data = self.data[con_columnas_rut(variables, self.data.columns)]
+        informar(f"Variables seleccionadas: {variables}")
 
+    @instrumentar(filas='data')
     def filtrar_tumores_por_comportamiento(self):
         """
         Filtra los tumores por comportamiento maligno, variable COMP = 3
         """
         comportamiento = [3]
-        self.data = self.data[self.data['COMP'].isin(comportamiento)]
-        print(f"Tumores filtrados por comportamiento: {comportamiento}")
+        self._filtrar(_mascara_comportamiento, comportamiento)
+        informar(f"Tumores filtrados por comportamiento: {comportamiento}")
 
+    @instrumentar(filas='data')
     def filtrar_tumores_por_cieo(self, cieo_codigos: list):
         """
         Filtra los tumores por códigos CIE-O (códigos de la Clasificación Internacional de Enfermedades para Oncología).
         """
-        self.data = self.data[self.data['TOP'].isin(cieo_codigos)]
-        print(f"Tumores filtrados por CIE-O: {cieo_codigos}")
+        self._filtrar(_mascara_cieo, cieo_codigos)
+        informar(f"Tumores filtrados por CIE-O: {cieo_codigos}")
 
+    @instrumentar(filas='data')
     def ajustar_variables_tiempo(self):
         """
         Ajusta las variables de tiempo (convierte fechas y calcula tiempo de sobrevida).
         """
-        # Convertir fechas desde el formato yyyymmdd a datetime
-        self.data['FECDIAG'] = pd.to_datetime(self.data['FECDIAG'], format='%Y%m%d', errors='coerce')
-        self.data['FECCON'] = pd.to_datetime(self.data['FECCON'], format='%Y%m%d', errors='coerce')
-        self.data['FECNAC'] = pd.to_datetime(self.data['FECNAC'], format='%Y%m%d', errors='coerce')
-
-        # Calcular tiempo de sobrevida en días
-        self.data['tiempo_sobrevida'] = (self.data['FECCON'] - self.data['FECDIAG']).dt.days
-        print("Variables de tiempo ajustadas")
+        self._transformar(_ajustar_variables_tiempo)
+        informar("Variables de tiempo ajustadas")
 
+    @instrumentar(filas='data')
     def calcular_edad_diagnostico(self):
         """
         Calcula la edad al momento del diagnóstico (FECDIAG - FECNAC).
         """
-        # Asegurarse de que las fechas estén en el formato correcto
-        if not pd.api.types.is_datetime64_any_dtype(self.data['FECDIAG']):
-            self.data['FECDIAG'] = pd.to_datetime(self.data['FECDIAG'], format='%Y%m%d', errors='coerce')
-        if not pd.api.types.is_datetime64_any_dtype(self.data['FECNAC']):
-            self.data['FECNAC'] = pd.to_datetime(self.data['FECNAC'], format='%Y%m%d', errors='coerce')
-
-        # Calcular la edad al diagnóstico
-        self.data['edad_diagnostico'] = self.data.apply(
-            lambda row: row['FECDIAG'].year - row['FECNAC'].year - (
-                        (row['FECDIAG'].month, row['FECDIAG'].day) < (row['FECNAC'].month, row['FECNAC'].day)),
-            axis=1
-        )
-        print("Edad al diagnóstico calculada")
+        self._transformar(_calcular_edad_diagnostico)
+        informar("Edad al diagnóstico calculada")
 
+    @instrumentar(filas='data')
     def filtrar_por_anios(self, anio_inicio: int, anio_fin: int):
         """
         Filtra los datos por rango de años de diagnóstico.
         """
-        self.data = self.data[(self.data['FECDIAG'].dt.year >= anio_inicio) & (self.data['FECDIAG'].dt.year <= anio_fin)]
-        print(f"Datos filtrados para los años {anio_inicio}-{anio_fin}")
+        self._filtrar(_mascara_anios, anio_inicio, anio_fin)
+        informar(f"Datos filtrados para los años {anio_inicio}-{anio_fin}")
+
+    def _filtrar(self, mascara, *argumentos):
+        """
+        Aplica un filtro de filas, o lo registra en el plan en modo diferido.
+        """
+        if self.diferido:
+            self.plan.append(('filtro', mascara, argumentos))
+        else:
+            self.data = self.data[mascara(self.data, *argumentos)]
 
-    def exportar_a_excel(self, nombre_archivo: str):
+    def _transformar(self, transformacion):
         """
-        Exporta el DataFrame procesado a un archivo Excel (.xlsx).
+        Aplica una transformación fila a fila, o la registra en el plan en modo diferido.
+        """
+        if self.diferido:
+            self.plan.append(('transformacion', transformacion))
+        else:
+            self.data = transformacion(self.data)
+
+    def ejecutar(self):
+        """
+        Ejecuta el plan registrado en modo diferido y devuelve el DataFrame resultante, con el esquema
+        compacto de la cohorte aplicado (también en modo inmediato, para tipar las columnas creadas).
+
+        Las columnas se proyectan en la lectura (`usecols`) y el archivo se procesa por bloques.
+        Los filtros consecutivos del plan se combinan en una sola máscara por bloque, y cada
+        transformación se aplica solo a las filas que pasaron los filtros anteriores. Se respeta
+        el orden del plan, por lo que el resultado es idéntico al del modo inmediato.
         """
+        if not self.diferido:
+            self.data = aplicar_esquema(self.data, reportar=False)
+            return self.data
+
+        filtros = [(paso[1], paso[2]) for paso in self.plan if paso[0] == 'filtro']
+        transformaciones = [paso[1] for paso in self.plan if paso[0] == 'transformacion']
+
+        # Etapas de ejecución: grupos de filtros consecutivos (una máscara) y transformaciones
+        etapas = []
+        for paso in self.plan:
+            if paso[0] == 'filtro':
+                if etapas and etapas[-1][0] == 'mascara':
+                    etapas[-1][1].append((paso[1], paso[2]))
+                else:
+                    etapas.append(('mascara', [(paso[1], paso[2])]))
+            elif paso[0] == 'transformacion':
+                etapas.append(('transformacion', paso[1]))
+
+        # Columnas finales: la última selección más las columnas que agregan las transformaciones posteriores.
+        # Un paso que usa una columna descartada por una selección anterior falla como en el modo inmediato,
+        # aunque la lectura proyectada (usecols) pueda leerla
+        columnas_finales = None
+        for paso in self.plan:
+            if paso[0] == 'seleccion':
+                _verificar_columnas(columnas_finales, paso[1], 'seleccionar_variables')
+                columnas_finales = list(paso[1])
+            elif columnas_finales is not None:
+                _verificar_columnas(columnas_finales, COLUMNAS_REQUERIDAS[paso[1]], paso[1].__name__.lstrip('_'))
+                if paso[0] == 'transformacion':
+                    columnas_finales += [c for c in COLUMNAS_CREADAS[paso[1]] if c not in columnas_finales]
+
+        usecols = None
+        if columnas_finales is not None:
+            necesarias = set(columnas_finales)
+            for mascara, _ in filtros:
+                necesarias |= set(COLUMNAS_REQUERIDAS[mascara])
+            for transformacion in transformaciones:
+                necesarias |= set(COLUMNAS_REQUERIDAS[transformacion])
+            creadas = {c for t in transformaciones for c in COLUMNAS_CREADAS[t]}
+            usecols = sorted(necesarias - creadas)
+
+        # Con la instrumentación activa se acumulan, por paso del plan, el tiempo y las filas de todos los bloques
+        activa = esta_activa()
+        pasos = {}
+
+        with medir('ConcordDataProcessor.ejecutar') as medicion:
+            bloques = []
+            filas_leidas = 0
+            lector = pd.read_csv(self.ruta_csv, usecols=usecols, dtype=self.dtype, chunksize=self.tamano_bloque)
+            for bloque in lector:
+                filas_leidas += len(bloque)
+                for tipo, contenido in etapas:
+                    if bloque.empty:
+                        break
+                    if tipo == 'mascara':
+                        mascara_total = pd.Series(True, index=bloque.index)
+                        for mascara, argumentos in contenido:
+                            if activa:
+                                inicio, antes = time.perf_counter(), int(mascara_total.sum())
+                            mascara_total &= mascara(bloque, *argumentos)
+                            if activa:
+                                _acumular(pasos, mascara, time.perf_counter() - inicio, antes, int(mascara_total.sum()))
+                        bloque = bloque[mascara_total]
+                    else:
+                        if activa:
+                            inicio, antes = time.perf_counter(), len(bloque)
+                        bloque = contenido(bloque)
+                        if activa:
+                            _acumular(pasos, contenido, time.perf_counter() - inicio, antes, len(bloque))
+                if bloque.empty:
+                    continue
+
+                if columnas_finales is not None:
+                    bloque = bloque[columnas_finales]
+                bloques.append(bloque)
+
+            datos = pd.concat(bloques) if bloques else pd.DataFrame(columns=columnas_finales)
+            self.ruta_csv = None
+            self.plan = []
+            informar(f"Plan ejecutado: {len(datos)} de {filas_leidas} filas conservadas")
+            self.data = aplicar_esquema(datos)
+
+            medicion.filas_entrada, medicion.filas_salida = filas_leidas, len(self.data)
+            for paso, (segundos, entrada, salida) in pasos.items():
+                registrar(paso, segundos, entrada, salida)
+        return self.data
+
+    @instrumentar(filas='data')
+    def exportar_a_excel(self, nombre_archivo: str, formato: str = None):
+        """
+        Exporta el DataFrame procesado. El formato se deduce de la extensión (.xlsx, .parquet, .csv,
+        .csv.gz) o se indica con `formato`; los datos se escriben por bloques (ver dataExporter).
+        """
+        self.ejecutar()
         try:
-            self.data.to_excel(nombre_archivo, index=False)
-            print(f"Datos exportados exitosamente a {nombre_archivo}")
+            exportar(self.data, nombre_archivo, formato)
+            informar(f"Datos exportados exitosamente a {nombre_archivo}")
         except Exception as e:
-            print(f"Error al exportar a Excel: {e}")
+            informar(f"Error al exportar a {nombre_archivo}: {e}")
 
     def obtener_datos(self):
         """
         Devuelve el DataFrame procesado.
         """
-        return self.data
+        return self.ejecutar()
 
 
-# Ejemplo de uso:
-if __name__ == "__main__":
-    # Cargar los datos desde un archivo CSV (ajusta la ruta según tu archivo)
-    df = pd.read_csv('data/rpcdata_13082024.csv')
+def _acumular(pasos: dict, funcion, segundos: float, filas_entrada: int, filas_salida: int):
+    """
+    Suma el tiempo y las filas de un paso del plan en un bloque a los de los bloques anteriores.
+    """
+    paso = pasos.setdefault(f"ConcordDataProcessor.{funcion.__name__.lstrip('_')}", [0.0, 0, 0])
+    paso[0] += segundos
+    paso[1] += filas_entrada
+    paso[2] += filas_salida
 
-    # Crear una instancia de la clase y procesar los datos
-    procesador = ConcordDataProcessor(df)
 
-    # 1. Seleccionar variables relevantes
-    variables = ['REGCOM', 'FECDIAG', 'TOP', 'MORF', 'COMP',
-                 'BASE', 'C10', 'CODPRI', 'PMSEC', 'PMTOT', 'GRA', 'EXT', 'LAT', 'TUMOURID', 'NOCASO',
-                 'RUT', 'CODRUT', 'SEXO', 'FECNAC', 'FECCON', 'VM', 'CAUSA']
-    procesador.seleccionar_variables(variables)
+def _verificar_columnas(disponibles: list, requeridas: list, paso: str):
+    """
+    Falla si el paso usa columnas que no quedan después de la última selección (`disponibles` es None
+    si aún no hay selección).
+    """
+    if disponibles is None:
+        return
+    faltantes = [columna for columna in requeridas if columna not in disponibles]
+    if faltantes:
+        raise KeyError(f"{paso} usa columnas descartadas por la selección de variables: {faltantes}")
 
-    # 2. Filtrar por códigos CIE-O y comportamiento (ejemplo: cáncer de mama y colon)
-    procesador.filtrar_tumores_por_comportamiento()
-    cieo_codigos = [339, 340, 341, 342, 343, 348, 349, 619, 160, 161, 162, 163, 164, 165, 166, 168, 169,
-                    180, 181, 182, 183, 184, 185, 186, 187, 188, 189, 209, 500, 501, 502, 503, 504, 505,
-                    506, 508, 509, 239, 530, 531, 538, 539, 220, 221, 239]
-    procesador.filtrar_tumores_por_cieo(cieo_codigos)
 
+def _como_fecha(serie: pd.Series):
+    """
+    Convierte una columna yyyymmdd a datetime si aún no lo es.
+    """
+    return convertir_yyyymmdd(serie)[0]
 
-    # 3. Ajustar variables de tiempo
-    procesador.ajustar_variables_tiempo()
 
-    # 4. Calcular la edad al diagnostico
+def _mascara_comportamiento(df: pd.DataFrame, comportamiento: list):
+    return df['COMP'].isin(comportamiento)
+
+
+def _mascara_cieo(df: pd.DataFrame, cieo_codigos: list):
+    return df['TOP'].isin(cieo_codigos)
+
+
+def _mascara_anios(df: pd.DataFrame, anio_inicio: int, anio_fin: int):
+    anios = _como_fecha(df['FECDIAG']).dt.year
+    return (anios >= anio_inicio) & (anios <= anio_fin)
+
+
+def _ajustar_variables_tiempo(df: pd.DataFrame):
+    # Convertir fechas desde el formato yyyymmdd a datetime (decodificación aritmética)
+    rechazos = {}
+    for columna in ['FECDIAG', 'FECCON', 'FECNAC']:
+        df[columna], rechazos[columna] = convertir_yyyymmdd(df[columna])
+    if any(rechazos.values()):
+        informar(f"Fechas inválidas convertidas a NaT: {rechazos}")
+
+    # Calcular tiempo de sobrevida en días
+    df['tiempo_sobrevida'] = (df['FECCON'] - df['FECDIAG']).dt.days
+    return df
+
+
+def _calcular_edad_diagnostico(df: pd.DataFrame):
+    # Asegurarse de que las fechas estén en el formato correcto
+    df['FECDIAG'] = _como_fecha(df['FECDIAG'])
+    df['FECNAC'] = _como_fecha(df['FECNAC'])
+
+    # Calcular la edad al diagnóstico en años cumplidos
+    df['edad_diagnostico'] = edad_cumplida(df['FECNAC'], df['FECDIAG'])
+    return df
+
+
+# Columnas que lee y que crea cada paso, usadas para proyectar la lectura del CSV en modo diferido
+COLUMNAS_REQUERIDAS = {
+    _mascara_comportamiento: ['COMP'],
+    _mascara_cieo: ['TOP'],
+    _mascara_anios: ['FECDIAG'],
+    _ajustar_variables_tiempo: ['FECDIAG', 'FECCON', 'FECNAC'],
+    _calcular_edad_diagnostico: ['FECDIAG', 'FECNAC'],
+}
+COLUMNAS_CREADAS = {
+    _ajustar_variables_tiempo: ['tiempo_sobrevida'],
+    _calcular_edad_diagnostico: ['edad_diagnostico'],
+}
+
+
+# Variables del registro usadas en el análisis y códigos CIE-O (sin la letra 'C') de los tumores estudiados
+VARIABLES = ['REGCOM', 'FECDIAG', 'TOP', 'MORF', 'COMP',
+             'BASE', 'C10', 'CODPRI', 'PMSEC', 'PMTOT', 'GRA', 'EXT', 'LAT', 'TUMOURID', 'NOCASO',
+             'RUT', 'CODRUT', 'SEXO', 'FECNAC', 'FECCON', 'VM', 'CAUSA']
+CIEO_CODIGOS = [339, 340, 341, 342, 343, 348, 349, 619, 160, 161, 162, 163, 164, 165, 166, 168, 169,
+                180, 181, 182, 183, 184, 185, 186, 187, 188, 189, 209, 500, 501, 502, 503, 504, 505,
+                506, 508, 509, 239, 530, 531, 538, 539, 220, 221, 239]
+
+
+def procesar_registro(ruta_csv, variables: list = VARIABLES, cieo_codigos: list = CIEO_CODIGOS,
+                      anio_inicio: int = 2011, anio_fin: int = 2019):
+    """
+    Registra sobre el CSV del registro los pasos habituales de preparación: selección de variables,
+    tumores malignos de los códigos CIE-O indicados, variables de tiempo, edad al diagnóstico y años de
+    diagnóstico. Devuelve el procesador en modo diferido; el plan se ejecuta al obtener o exportar los datos.
+
+    `ruta_csv` también puede ser un DataFrame ya leído (p. ej. una partición del registro); en ese caso
+    los pasos se aplican en modo inmediato.
+    """
+    if isinstance(ruta_csv, pd.DataFrame):
+        procesador = ConcordDataProcessor(ruta_csv)
+    else:
+        procesador = ConcordDataProcessor.desde_csv(ruta_csv)
+    procesador.seleccionar_variables(variables)
+    procesador.filtrar_tumores_por_comportamiento()
+    procesador.filtrar_tumores_por_cieo(cieo_codigos)
+    procesador.ajustar_variables_tiempo()
     procesador.calcular_edad_diagnostico()
+    procesador.filtrar_por_anios(anio_inicio, anio_fin)
+    return procesador
+
+
+# Ejemplo de uso:
+if __name__ == "__main__":
+    # Registrar tiempo, memoria y filas de cada paso (JSON-lines y tabla resumen al final)
+    activar(ruta_jsonl='data/instrumentacion.jsonl')
 
-    # 5. Filtrar por años de diagnóstico (2000-2019)
-    procesador.filtrar_por_anios(2011, 2019)
+    # Preparar el registro en modo diferido sobre el CSV (ajusta la ruta según tu archivo): variables
+    # relevantes, tumores malignos de los códigos CIE-O estudiados y diagnósticos 2011-2019
+    procesador = procesar_registro('data/rpcdata_13082024.csv')
 
-    # 6. Exportar los datos procesados a un archivo Excel
+    # Exportar los datos procesados a un archivo Excel (ejecuta el plan)
     nombre_archivo = 'data/datos_ajustados.xlsx'
     procesador.exportar_a_excel(nombre_archivo)
 
     # Obtener los datos procesados
     datos_ajustados = procesador.obtener_datos()
     print(datos_ajustados.head())
+    imprimir_resumen()
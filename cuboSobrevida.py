@@ -0,0 +1,232 @@
+import numpy as np
+import pandas as pd
+
+from instrumentacion import informar
+from kaplanMeierEstratos import COLUMNAS_CURVA, kaplan_meier_desde_conteos
+
+# Dimensiones del cubo; cada celda es una combinación observada de ellas (los faltantes son una categoría más)
+DIMENSIONES = ['TUMOR_GRUPO', 'REGCOM', 'SEXO', 'BANDA_EDAD', 'ANIO_DIAG']
+
+# Límites inferiores de las bandas quinquenales de edad al diagnóstico; la última banda queda abierta
+LIMITES_EDAD = list(range(15, 90, 5))
+
+
+def bandas_edad(edades):
+    """
+    Banda quinquenal de edad ('15-19', '20-24', ..., '85+') como categoría ordenada.
+    """
+    etiquetas = [f'{inicio}-{fin - 1}' for inicio, fin in zip(LIMITES_EDAD[:-1], LIMITES_EDAD[1:])]
+    etiquetas.append(f'{LIMITES_EDAD[-1]}+')
+    return pd.cut(edades, LIMITES_EDAD + [np.inf], right=False, labels=etiquetas)
+
+
+def _limites_banda(etiqueta: str):
+    """
+    Edades mínima y máxima de una banda ('50-54' -> (50, 54), '85+' -> (85, inf)).
+    """
+    if etiqueta.endswith('+'):
+        return int(etiqueta[:-1]), np.inf
+    inicio, fin = etiqueta.split('-')
+    return int(inicio), int(fin)
+
+
+def contar(df: pd.DataFrame, duracion: str = 'tiempo_sobrevida_anios', evento: str = 'evento'):
+    """
+    Tabla de conteos del cubo para una cohorte preparada: salidas y eventos por (celda, tiempo).
+    """
+    datos = pd.DataFrame({
+        'TUMOR_GRUPO': df['TUMOR_GRUPO'],
+        'REGCOM': df['REGCOM'],
+        'SEXO': df['SEXO'],
+        'BANDA_EDAD': bandas_edad(df['edad_diagnostico']),
+        'ANIO_DIAG': df['FECDIAG'].dt.year.astype('Int16'),
+        'tiempo': df[duracion],
+        'eventos': df[evento].astype(np.int64),
+    })
+    datos = datos[datos['tiempo'].notna()]
+    return (datos.groupby(DIMENSIONES + ['tiempo'], observed=True, dropna=False, sort=False)
+            .agg(salidas=('eventos', 'size'), eventos=('eventos', 'sum')).reset_index())
+
+
+class CuboSobrevida:
+    def __init__(self, conteos: pd.DataFrame):
+        """
+        Inicializa el cubo a partir de una tabla de conteos con una fila por (celda, tiempo): las
+        DIMENSIONES, el tiempo y las salidas (muertes más censurados) y eventos en ese tiempo. Las filas
+        repetidas se suman y las que quedan sin salidas se descartan.
+
+        Los conteos se guardan como arreglos (códigos de cada dimensión, índice del tiempo, salidas y
+        eventos), de modo que cualquier combinación más gruesa de celdas se obtiene sumando conteos, sin
+        volver a recorrer la cohorte.
+        """
+        conteos = (conteos.groupby(DIMENSIONES + ['tiempo'], observed=True, dropna=False, sort=False)
+                   [['salidas', 'eventos']].sum().reset_index())
+        self.conteos = conteos[conteos['salidas'] > 0].reset_index(drop=True)
+
+        self.categorias = {}
+        self.codigos = {}
+        for dimension in DIMENSIONES:
+            codigos, categorias = pd.factorize(self.conteos[dimension], sort=True, use_na_sentinel=False)
+            self.codigos[dimension] = codigos
+            self.categorias[dimension] = pd.Index(categorias)
+        self.tiempos, self.indice_tiempo = np.unique(self.conteos['tiempo'].to_numpy(dtype=np.float64),
+                                                     return_inverse=True)
+        self.salidas = self.conteos['salidas'].to_numpy(dtype=np.int64)
+        self.eventos = self.conteos['eventos'].to_numpy(dtype=np.int64)
+
+    @classmethod
+    def desde_datos(cls, df: pd.DataFrame, duracion: str = 'tiempo_sobrevida_anios', evento: str = 'evento'):
+        """
+        Construye el cubo desde una cohorte preparada (ver kaplanMeierSimplificado.preparar_cohorte), con
+        la estratificación más fina: grupo de tumor, comuna, sexo, banda de edad y año de diagnóstico.
+        """
+        conteos = contar(df, duracion, evento)
+        cubo = cls(conteos)
+        informar(f"Cubo de sobrevida: {int(conteos['salidas'].sum())} pacientes en {len(cubo.conteos)} filas "
+                 f"(celda, tiempo)")
+        return cubo
+
+    @classmethod
+    def combinar(cls, conteos: list):
+        """
+        Une cubos construidos por separado (p. ej. uno por región) a partir de sus tablas de conteos o de
+        los cubos mismos; las filas de una misma (celda, tiempo) se suman.
+        """
+        tablas = [tabla.conteos if isinstance(tabla, cls) else tabla for tabla in conteos]
+        # Las categorías de cada parte pueden diferir: se unen como valores antes de sumar
+        categoricas = [d for d in DIMENSIONES if any(isinstance(t[d].dtype, pd.CategoricalDtype) for t in tablas)]
+        unidas = pd.concat([tabla.astype({d: object for d in categoricas}) for tabla in tablas], ignore_index=True)
+        cubo = cls(unidas.astype({d: 'category' for d in categoricas}))
+        informar(f"Cubo de sobrevida: {len(tablas)} partes combinadas en {len(cubo.conteos)} filas (celda, tiempo)")
+        return cubo
+
+    def actualizar(self, antes: pd.DataFrame, despues: pd.DataFrame, duracion: str = 'tiempo_sobrevida_anios',
+                   evento: str = 'evento'):
+        """
+        Cubo con las filas de la cohorte que cambiaron (p. ej. al extender el seguimiento): se restan los
+        conteos de sus versiones anteriores (`antes`) y se suman los de las nuevas (`despues`), ambas
+        preparadas como en `desde_datos`. El costo depende de las filas cambiadas, no de la cohorte.
+        """
+        anteriores = contar(antes, duracion, evento)
+        anteriores[['salidas', 'eventos']] *= -1
+        cubo = CuboSobrevida.combinar([self, anteriores, contar(despues, duracion, evento)])
+        informar(f"Cubo de sobrevida actualizado: {len(antes)} filas retiradas y {len(despues)} agregadas")
+        return cubo
+
+    @classmethod
+    def desde_archivo(cls, ruta: str):
+        """
+        Carga un cubo guardado con `guardar`.
+        """
+        return cls(pd.read_feather(ruta))
+
+    def guardar(self, ruta: str):
+        """
+        Guarda la tabla de conteos en Feather (las dimensiones quedan como categorías).
+        """
+        self.conteos.to_feather(ruta)
+        informar(f"Cubo de sobrevida guardado en {ruta}")
+        return ruta
+
+    def bandas_en_rango(self, edad_minima: int, edad_maxima: int = None):
+        """
+        Bandas de edad que forman exactamente el rango [edad_minima, edad_maxima] (sin máximo, hasta la
+        última banda). Un rango que corta una banda no puede responderse sumando celdas: se rechaza.
+        """
+        edad_maxima = np.inf if edad_maxima is None else edad_maxima
+        limites = [_limites_banda(etiqueta) for etiqueta in bandas_edad([LIMITES_EDAD[0]]).categories]
+        inicios = {inicio for inicio, _ in limites}
+        finales = {fin for _, fin in limites}
+        if edad_minima not in inicios or edad_maxima not in finales:
+            raise ValueError(f"El rango de edad {edad_minima}-{edad_maxima} no coincide con las bandas del cubo "
+                             f"(comienzan en {sorted(inicios)})")
+        return [f'{inicio}-{fin}' if np.isfinite(fin) else f'{inicio}+' for inicio, fin in limites
+                if inicio >= edad_minima and fin <= edad_maxima]
+
+    def _mascara(self, filtros: dict, edad=None, anio_diagnostico=None):
+        """
+        Filas de conteos que cumplen los filtros: {dimensión: valor o lista de valores} (comparados como
+        texto, para aceptar '2201' o 2201), un rango de edad (mínima, máxima) y un rango de años de
+        diagnóstico (desde, hasta).
+        """
+        filtros = dict(filtros)
+        if edad is not None:
+            filtros['BANDA_EDAD'] = self.bandas_en_rango(*edad)
+        mascara = np.ones(len(self.salidas), dtype=bool)
+        for dimension, valores in filtros.items():
+            if dimension not in DIMENSIONES:
+                raise ValueError(f"Dimensión desconocida: {dimension}. Use una de {DIMENSIONES}")
+            if not isinstance(valores, (list, tuple, set, np.ndarray, pd.Index)):
+                valores = [valores]
+            permitidas = self.categorias[dimension].astype(str).isin([str(valor) for valor in valores])
+            mascara &= np.asarray(permitidas)[self.codigos[dimension]]
+        if anio_diagnostico is not None:
+            desde, hasta = anio_diagnostico
+            anios = self.categorias['ANIO_DIAG'].to_numpy(dtype=np.float64, na_value=np.nan)
+            mascara &= ((anios >= desde) & (anios <= hasta))[self.codigos['ANIO_DIAG']]
+        return mascara
+
+    def _sumar(self, columnas_estrato: list, filtros: dict, edad, anio_diagnostico, por_tiempo: bool):
+        """
+        Suma los conteos de las filas seleccionadas por estrato (y por tiempo si `por_tiempo`). Devuelve
+        las claves ordenadas, las salidas y los eventos de cada clave.
+        """
+        for dimension in columnas_estrato:
+            if dimension not in DIMENSIONES:
+                raise ValueError(f"Dimensión desconocida: {dimension}. Use una de {DIMENSIONES}")
+        filas = np.flatnonzero(self._mascara(filtros, edad, anio_diagnostico))
+        estrato = np.zeros(len(filas), dtype=np.int64)
+        for dimension in columnas_estrato:
+            estrato = estrato * len(self.categorias[dimension]) + self.codigos[dimension][filas]
+        clave = estrato * len(self.tiempos) + self.indice_tiempo[filas] if por_tiempo else estrato
+        claves, inverso = np.unique(clave, return_inverse=True)
+        salidas = np.bincount(inverso, weights=self.salidas[filas], minlength=len(claves)).astype(np.int64)
+        eventos = np.bincount(inverso, weights=self.eventos[filas], minlength=len(claves)).astype(np.int64)
+        return claves, salidas, eventos
+
+    def _etiquetas(self, columnas_estrato: list, estratos):
+        """
+        Decodifica los estratos (códigos combinados de `_sumar`) en columnas con las etiquetas de cada dimensión.
+        """
+        etiquetas = {}
+        for dimension in reversed(columnas_estrato):
+            estratos, codigos = np.divmod(estratos, len(self.categorias[dimension]))
+            etiquetas[dimension] = self.categorias[dimension].take(codigos)
+        return pd.DataFrame({dimension: etiquetas[dimension] for dimension in columnas_estrato})
+
+    def curvas(self, columnas_estrato=(), alpha: float = 0.05, edad=None, anio_diagnostico=None, **filtros):
+        """
+        Curvas de Kaplan-Meier por estrato de `columnas_estrato` (cualquier subconjunto de DIMENSIONES)
+        para las celdas que cumplen los filtros, p. ej. curvas(['SEXO'], TUMOR_GRUPO='Mama', edad=(50, 69)).
+
+        Devuelve la misma tabla larga que kaplan_meier_por_estrato sobre los pacientes de esas celdas.
+        """
+        columnas_estrato = list(columnas_estrato)
+        claves, salidas, eventos = self._sumar(columnas_estrato, filtros, edad, anio_diagnostico, por_tiempo=True)
+        if len(claves) == 0:
+            return pd.DataFrame(columns=columnas_estrato + COLUMNAS_CURVA)
+        estratos, indice_tiempo = np.divmod(claves, len(self.tiempos))
+        resultado = kaplan_meier_desde_conteos(estratos, self.tiempos[indice_tiempo], salidas, eventos, alpha)
+
+        curvas = pd.DataFrame({columna: resultado[columna] for columna in COLUMNAS_CURVA})
+        if columnas_estrato:
+            curvas = pd.concat([self._etiquetas(columnas_estrato, resultado['estrato']), curvas], axis=1)
+        return curvas
+
+    def curva(self, alpha: float = 0.05, edad=None, anio_diagnostico=None, **filtros):
+        """
+        Una sola curva de Kaplan-Meier para las celdas que cumplen los filtros, p. ej.
+        curva(TUMOR_GRUPO='Mama', REGCOM=2201, SEXO=2, edad=(50, 69)).
+        """
+        return self.curvas([], alpha, edad, anio_diagnostico, **filtros)
+
+    def casos(self, columnas_estrato=(), edad=None, anio_diagnostico=None, **filtros):
+        """
+        Casos y muertes por estrato de `columnas_estrato` para las celdas que cumplen los filtros.
+        """
+        columnas_estrato = list(columnas_estrato)
+        claves, salidas, eventos = self._sumar(columnas_estrato, filtros, edad, anio_diagnostico, por_tiempo=False)
+        tabla = pd.DataFrame({'casos': salidas, 'eventos': eventos})
+        if columnas_estrato:
+            tabla = pd.concat([self._etiquetas(columnas_estrato, claves), tabla], axis=1)
+        return tabla
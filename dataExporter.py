@@ -0,0 +1,171 @@
+import os
+
+import pandas as pd
+
+from cohortSchema import rut_como_texto
+
+# Extensiones reconocidas por formato; la compresión del CSV se deduce de la extensión (.csv.gz, .csv.zst, ...)
+EXTENSIONES = {
+    '.xlsx': 'excel',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.csv': 'csv',
+}
+COMPRESIONES_CSV = ('.gz', '.bz2', '.xz', '.zst', '.zip')
+
+# Máximo de filas de datos por hoja de Excel (1.048.576 filas menos el encabezado)
+MAXIMO_FILAS_EXCEL = 2 ** 20 - 1
+TAMANO_BLOQUE = 100_000
+
+
+def formato_de(ruta: str, formato: str = None):
+    """
+    Formato de exportación ('excel', 'parquet' o 'csv'): el indicado o el que corresponde a la extensión.
+    """
+    if formato is not None:
+        if formato not in set(EXTENSIONES.values()):
+            raise ValueError(f"Formato no soportado: {formato}. Use uno de {sorted(set(EXTENSIONES.values()))}")
+        return formato
+    base, extension = os.path.splitext(ruta.lower())
+    if extension in COMPRESIONES_CSV:
+        base, extension = os.path.splitext(base)
+        if extension != '.csv':
+            raise ValueError(f"Solo los CSV pueden comprimirse: {ruta}")
+    if extension not in EXTENSIONES:
+        raise ValueError(f"No se reconoce el formato de {ruta}. Use una de las extensiones {sorted(EXTENSIONES)}")
+    return EXTENSIONES[extension]
+
+
+def _bloques(df: pd.DataFrame, tamano_bloque: int):
+    for inicio in range(0, len(df), tamano_bloque):
+        yield df.iloc[inicio:inicio + tamano_bloque]
+
+
+def _filas_excel(bloque: pd.DataFrame):
+    """
+    Filas de un bloque como tuplas de valores de Python que openpyxl sabe escribir; los faltantes
+    (NaN, NaT, pd.NA) quedan como celdas vacías.
+    """
+    valores = bloque.astype(object)
+    return valores.where(bloque.notna(), None).itertuples(index=False, name=None)
+
+
+def escribir_excel(tablas: dict, ruta: str, tamano_bloque: int = TAMANO_BLOQUE):
+    """
+    Escribe una hoja por tabla en modo de solo escritura: cada fila se pasa al archivo al agregarla, por
+    lo que la memoria no depende del tamaño del libro. Las tablas de más de 1.048.575 filas continúan en
+    hojas '<nombre>_2', '<nombre>_3', ...
+    """
+    from openpyxl import Workbook
+
+    libro = Workbook(write_only=True)
+    for nombre, df in tablas.items():
+        hojas = max(1, -(-len(df) // MAXIMO_FILAS_EXCEL))
+        for parte in range(hojas):
+            titulo = str(nombre)[:31] if parte == 0 else f"{str(nombre)[:27]}_{parte + 1}"
+            hoja = libro.create_sheet(titulo)
+            hoja.append([str(columna) for columna in df.columns])
+            tramo = df.iloc[parte * MAXIMO_FILAS_EXCEL:(parte + 1) * MAXIMO_FILAS_EXCEL]
+            for bloque in _bloques(tramo, tamano_bloque):
+                for fila in _filas_excel(bloque):
+                    hoja.append(fila)
+    libro.save(ruta)
+
+
+def escribir_parquet(df: pd.DataFrame, ruta: str, tamano_bloque: int = TAMANO_BLOQUE):
+    """
+    Escribe un Parquet por bloques (un row group por bloque), sin convertir el DataFrame completo a Arrow.
+    Conserva los tipos de la cohorte (fechas, categóricas y enteros nullable).
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    esquema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(ruta, esquema) as escritor:
+        for bloque in _bloques(df, tamano_bloque):
+            escritor.write_table(pa.Table.from_pandas(bloque, schema=esquema, preserve_index=False))
+        if df.empty:
+            escritor.write_table(pa.Table.from_pandas(df, schema=esquema, preserve_index=False))
+
+
+def escribir_csv(df: pd.DataFrame, ruta: str, tamano_bloque: int = TAMANO_BLOQUE):
+    """
+    Escribe un CSV por bloques; la compresión se deduce de la extensión (p. ej. '.csv.gz').
+    """
+    df.to_csv(ruta, index=False, chunksize=tamano_bloque, compression='infer')
+
+
+def _ruta_tabla(ruta: str, nombre: str):
+    """
+    Ruta de una tabla cuando un formato de una sola tabla recibe varias: 'salida.csv.gz' -> 'salida_<nombre>.csv.gz'.
+    """
+    directorio, archivo = os.path.split(ruta)
+    base, extension = archivo.split('.', 1) if '.' in archivo else (archivo, '')
+    return os.path.join(directorio, f"{base}_{nombre}.{extension}" if extension else f"{base}_{nombre}")
+
+
+def exportar(datos, ruta: str, formato: str = None, tamano_bloque: int = TAMANO_BLOQUE):
+    """
+    Exporta un DataFrame, o un diccionario {nombre: DataFrame}, en el formato indicado o el que
+    corresponde a la extensión de `ruta` (.xlsx, .parquet, .csv, .csv.gz, ...). Devuelve las rutas escritas.
+
+    En Excel cada tabla del diccionario va en su propia hoja; en Parquet y CSV, en su propio archivo
+    ('salida_<nombre>.parquet'). Los datos se escriben por bloques de `tamano_bloque` filas. Los RUT/RUN
+    del esquema de la cohorte se escriben como texto 'NNNNNNNN-D' (ver cohortSchema.rut_como_texto).
+    """
+    formato = formato_de(ruta, formato)
+    if isinstance(datos, dict):
+        datos = {nombre: rut_como_texto(df) for nombre, df in datos.items()}
+    else:
+        datos = rut_como_texto(datos)
+    tablas = datos if isinstance(datos, dict) else {'Datos': datos}
+    directorio = os.path.dirname(ruta)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+
+    if formato == 'excel':
+        escribir_excel(tablas, ruta, tamano_bloque)
+        return [ruta]
+
+    escribir = escribir_parquet if formato == 'parquet' else escribir_csv
+    if not isinstance(datos, dict):
+        escribir(datos, ruta, tamano_bloque)
+        return [ruta]
+    rutas = []
+    for nombre, df in tablas.items():
+        rutas.append(_ruta_tabla(ruta, nombre))
+        escribir(df, rutas[-1], tamano_bloque)
+    return rutas
+
+
+def _hojas_tabla(nombres: list):
+    """
+    Hojas de la primera tabla de un libro: su hoja y las continuaciones '<nombre>_2', '<nombre>_3', ...
+    que escribe `escribir_excel` cuando la tabla no cabe en una hoja.
+    """
+    hojas = nombres[:1]
+    for nombre in nombres[1:]:
+        if nombre != f"{hojas[0][:27]}_{len(hojas) + 1}":
+            break
+        hojas.append(nombre)
+    return hojas
+
+
+def leer_tabla(ruta: str, formato: str = None, **opciones):
+    """
+    Lee una tabla exportada con `exportar`, según el formato de la extensión. `opciones` se pasan al
+    lector de pandas (p. ej. dtype en Excel y CSV).
+
+    En Excel, sin `sheet_name`, se lee la primera tabla del libro junto con sus hojas de continuación.
+    """
+    formato = formato_de(ruta, formato)
+    if formato == 'excel':
+        if 'sheet_name' in opciones:
+            return pd.read_excel(ruta, **opciones)
+        with pd.ExcelFile(ruta) as libro:
+            partes = [pd.read_excel(libro, sheet_name=hoja, **opciones) for hoja in _hojas_tabla(libro.sheet_names)]
+        return partes[0] if len(partes) == 1 else pd.concat(partes, ignore_index=True)
+    if formato == 'parquet':
+        opciones.pop('dtype', None)
+        return pd.read_parquet(ruta, **opciones)
+    return pd.read_csv(ruta, **opciones)
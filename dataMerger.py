@@ -1,66 +1,313 @@
+import numpy as np
 import pandas as pd
-from datetime import datetime
+
+from cohortLoader import cargar_cohorte
+from cohortSchema import aplicar_esquema
+from dataExporter import exportar, leer_tabla
+from instrumentacion import activar, imprimir_resumen, informar, instrumentar, medir, registrar
+from rutUtils import normalizar_rut
+
+# Modos de vinculación de cruzar_datos: solo por RUT, o además probabilística para los no encontrados
+VINCULACIONES = ('exacta', 'probabilistica')
+
+# Fin del seguimiento por defecto: último día del último año de defunciones disponible
+FECHA_FIN_SEGUIMIENTO = '2019-12-31'
+
+# Columnas que deja cruzar_datos y que actualizar_seguimiento modifica
+COLUMNAS_SEGUIMIENTO = ['RUN', 'FECHA_DEF', 'DIAG1', 'VM', 'FECCON', 'CAUSA']
+
+# Columnas de la defunción que se copian a cada paciente vinculado; el dígito verificador y el texto original
+# del RUN solo si las defunciones los traen
+COLUMNAS_DEFUNCION = ['RUN', 'CODRUN', 'RUN_ORIGINAL', 'FECHA_DEF', 'DIAG1']
 
 
 class DataMerger:
     def __init__(self, archivo_cancer: str, archivo_defunciones: str):
-        # Cargar datos de los archivos Excel
-        self.cancer_data = pd.read_excel(archivo_cancer, dtype={'RUT': str})
-        self.defunciones_data = pd.read_csv(archivo_defunciones, dtype={'RUN': str})
+        # Cargar la cohorte (desde la caché columnar si el Excel no cambió) y las defunciones, ambas
+        # con el esquema compacto de la cohorte
+        self.cancer_data = cargar_cohorte(archivo_cancer)
+        # Las defunciones pueden venir en cualquier formato de exportación (.csv, .csv.gz, .parquet, .xlsx)
+        self.defunciones_data = aplicar_esquema(leer_tabla(archivo_defunciones, dtype={'RUN': str}),
+                                                etiqueta='Defunciones')
+        self.resumen_cruce = {}
+
+    @classmethod
+    def desde_datos(cls, cancer_data: pd.DataFrame, defunciones_data: pd.DataFrame):
+        """
+        Crea el procesador a partir de la cohorte y las defunciones ya cargadas (p. ej. desde el pipeline).
+        """
+        procesador = cls.__new__(cls)
+        procesador.cancer_data = aplicar_esquema(cancer_data, reportar=False)
+        procesador.defunciones_data = aplicar_esquema(defunciones_data, etiqueta='Defunciones')
+        procesador.resumen_cruce = {}
+        return procesador
+
+    def preparar_defunciones(self):
+        """
+        Construye la fecha de defunción (FECHA_DEF) desde DIA_DEF, MES_DEF y ANO_DEF y normaliza el RUN.
 
-    def cruzar_datos(self):
+        Devuelve el RUN normalizado de cada defunción, las filas que se usan en el cruce (una por RUN: si
+        un RUN aparece más de una vez, la de fecha más temprana) y la cantidad de registros descartados.
+        """
+        self.defunciones_data['FECHA_DEF'] = pd.to_datetime(pd.DataFrame({
+            'year': pd.to_numeric(self.defunciones_data['ANO_DEF'], errors='coerce'),
+            'month': pd.to_numeric(self.defunciones_data['MES_DEF'], errors='coerce'),
+            'day': pd.to_numeric(self.defunciones_data['DIA_DEF'], errors='coerce'),
+        }), errors='coerce')
+        informar("Fechas de defunción unida correctamente")
+        clave_defuncion = normalizar_rut(self.defunciones_data['RUN'])
+
+        # Una defunción por RUN: se ordena por (RUN, fecha) y se conserva la primera
+        with medir('DataMerger.deduplicar_defunciones', filas_entrada=len(clave_defuncion)) as medicion:
+            fechas = self.defunciones_data['FECHA_DEF'].to_numpy()
+            validas = np.flatnonzero(clave_defuncion >= 0)
+            orden = validas[np.lexsort((fechas[validas], clave_defuncion[validas]))]  # NaT queda al final
+            claves_ordenadas = clave_defuncion[orden]
+            primera = np.ones(len(orden), dtype=bool)
+            primera[1:] = claves_ordenadas[1:] != claves_ordenadas[:-1]
+            filas_defuncion = orden[primera]
+            duplicadas = len(orden) - len(filas_defuncion)
+            medicion.filas_salida = len(filas_defuncion)
+            if duplicadas:
+                informar(f"RUN duplicados en defunciones: se descartaron {duplicadas} registros (se usa la fecha más temprana)")
+        return clave_defuncion, filas_defuncion, duplicadas
+
+    def columnas_defuncion(self):
+        """
+        Columnas de las defunciones que se copian a los pacientes vinculados (COLUMNAS_DEFUNCION presentes).
+        """
+        return [columna for columna in COLUMNAS_DEFUNCION if columna in self.defunciones_data.columns]
+
+    @instrumentar(filas='cancer_data')
+    def cruzar_datos(self, fecha_fin_seguimiento: str = FECHA_FIN_SEGUIMIENTO, vinculacion: str = 'exacta',
+                     ruta_revision: str = None, procesos: int = None):
         """
         Realiza el cruce de datos entre el archivo de cáncer y el archivo de defunciones.
+
+        El RUT y el RUN se normalizan a enteros y se busca cada paciente en un índice hash de las
+        defunciones. Si un RUN aparece más de una vez se usa la defunción con la fecha más temprana,
+        de modo que cada paciente conserva una sola fila. Los pacientes sin defunción quedan vivos y
+        censurados en `fecha_fin_seguimiento`.
+
+        Con `vinculacion='probabilistica'`, los pacientes y las defunciones que no se cruzaron por RUT
+        se vinculan después con pesos de Fellegi-Sunter (ver vincular_no_encontrados); la columna
+        VINCULACION indica cómo se vinculó cada fila y los pares dudosos se exportan a `ruta_revision`.
         """
-        # Unir las columnas DIA_DEF, MES_DEF, ANO_DEF en un solo campo de fecha en defunciones
-        self.defunciones_data['FECHA_DEF'] = pd.to_datetime(
-            self.defunciones_data['ANO_DEF'].astype(str) + '-' +
-            self.defunciones_data['MES_DEF'].astype(str).str.zfill(2) + '-' +
-            self.defunciones_data['DIA_DEF'].astype(str).str.zfill(2),
-            errors='coerce'
-        )
-        print("Fechas de defunción unida correctamente")
-
-        # Realizar un merge entre los datos de cáncer y defunciones usando RUT y RUN
-        merged_data = pd.merge(
-            self.cancer_data,
-            self.defunciones_data[['RUN', 'FECHA_DEF', 'DIAG1']],
-            left_on='RUT',
-            right_on='RUN',
-            how='left'
-        )
-        print("Merge finalizado")
+        if vinculacion not in VINCULACIONES:
+            raise ValueError(f"Vinculación desconocida: {vinculacion}. Opciones: {VINCULACIONES}")
+
+        # Normalizar RUT/RUN una sola vez y quedarse con una defunción por RUN
+        clave_cancer = normalizar_rut(self.cancer_data['RUT'])
+        clave_defuncion, filas_defuncion, duplicadas = self.preparar_defunciones()
+
+        # Índice hash de las defunciones y búsqueda de cada paciente
+        indice = pd.Index(clave_defuncion[filas_defuncion])
+        posiciones = indice.get_indexer(clave_cancer)
+        encontrado = posiciones >= 0
+        filas = np.where(encontrado, filas_defuncion[posiciones], 0)
+        exactos = encontrado.copy()
+
+        revision = 0
+        if vinculacion == 'probabilistica':
+            encontrado, filas, revision = self.vincular_no_encontrados(clave_cancer, clave_defuncion, encontrado,
+                                                                       filas, filas_defuncion, ruta_revision, procesos)
+
+        merged_data = self.cancer_data.copy()
+        for columna in self.columnas_defuncion():
+            # take sobre el arreglo de pandas conserva el tipo compacto (Int32, categórica, datetime)
+            valores = self.defunciones_data[columna].array.take(filas)
+            merged_data[columna] = pd.Series(valores, index=merged_data.index).where(encontrado)
+        if vinculacion == 'probabilistica':
+            metodo = np.where(exactos, 'exacta', np.where(encontrado, 'probabilistica', None))
+            merged_data['VINCULACION'] = pd.Categorical(metodo, categories=['exacta', 'probabilistica'])
+        informar("Merge finalizado")
 
         # Actualizar el estado vital (VM) y la fecha de contacto (FECCON)
-        merged_data['VM'] = merged_data['FECHA_DEF'].apply(lambda x: 2 if pd.notnull(x) else 1)
-        merged_data['FECCON'] = merged_data['FECHA_DEF'].dt.strftime('%Y-%m-%d')
-        merged_data['FECCON'] = merged_data['FECCON'].fillna('2019-12-31')
-        print("Estado vital y fecha contacto actualizada")
+        fecha_def = merged_data['FECHA_DEF'].to_numpy(dtype='datetime64[ns]')
+        fallecido = ~np.isnat(fecha_def)
+        merged_data['VM'] = np.where(fallecido, 2, 1).astype(np.int8)
+        merged_data['FECCON'] = np.where(fallecido, fecha_def, np.datetime64(fecha_fin_seguimiento, 'ns'))
+        informar("Estado vital y fecha contacto actualizada")
+
+        # Actualizar la causa de muerte (CAUSA): 1 = cáncer (DIAG1 empieza con 'C'), 2 = otra causa
+        cancer = merged_data['DIAG1'].astype('string').str.startswith('C', na=False).to_numpy(dtype=bool)
+        merged_data['CAUSA'] = pd.arrays.IntegerArray(np.where(cancer, 1, 2).astype(np.int8), ~fallecido)
+        informar("Causa de muerte actualizada")
 
-        # Actualizar la causa de muerte (CAUSA)
-        def determinar_causa(diag1, vm):
-            if vm == 1:  # Vivo
-                return None
-            elif isinstance(diag1, str) and diag1.startswith('C'):
-                return 1  # Cáncer
-            else:
-                return 2  # Otra causa
+        # Resumen de la vinculación
+        total = len(merged_data)
+        vinculados = int(encontrado.sum())
+        self.resumen_cruce = {
+            'pacientes': total,
+            'vinculados': vinculados,
+            'tasa_vinculacion': vinculados / total if total else 0.0,
+            'rut_invalidos': int((clave_cancer < 0).sum()),
+            'run_duplicados': duplicadas,
+        }
+        if vinculacion == 'probabilistica':
+            self.resumen_cruce['vinculados_probabilisticos'] = int((encontrado & ~exactos).sum())
+            self.resumen_cruce['pares_revision'] = revision
+        informar(f"Pacientes vinculados con defunciones: {vinculados} de {total} "
+                 f"({100 * self.resumen_cruce['tasa_vinculacion']:.1f}%)")
+        registrar('DataMerger.vinculacion', filas_entrada=total, filas_salida=total, **self.resumen_cruce)
 
-        merged_data['CAUSA'] = merged_data.apply(lambda row: determinar_causa(row['DIAG1'], row['VM']), axis=1)
-        print("Causa de muerte actualizada")
+        # Guardar el resultado en self.cancer_data actualizado (eliminando categorías sin uso)
+        self.cancer_data = aplicar_esquema(merged_data, reportar=False)
 
-        # Guardar el resultado en self.cancer_data actualizado
-        self.cancer_data = merged_data
+    @instrumentar(filas='cancer_data')
+    def actualizar_seguimiento(self, fecha_fin_seguimiento: str = None):
+        """
+        Extiende el seguimiento de una cohorte ya cruzada con un nuevo año de defunciones (las defunciones
+        del procesador son solo las del año nuevo), sin repetir el cruce con los años anteriores.
+
+        Solo se buscan los pacientes aún censurados (VM distinto de 2). Los que aparecen en las defunciones
+        nuevas pasan a fallecidos con su RUN, FECHA_DEF, DIAG1, VM, FECCON y CAUSA; los demás se censuran en
+        `fecha_fin_seguimiento` (por defecto, el 31 de diciembre del último año de las defunciones). Las filas
+        se modifican en su lugar y la cohorte conserva su orden e índice.
+
+        Devuelve las filas modificadas tal como estaban antes de la actualización, para recalcular solo los
+        resultados que dependen de ellas.
+        """
+        faltantes = [columna for columna in COLUMNAS_SEGUIMIENTO if columna not in self.cancer_data.columns]
+        if faltantes:
+            raise ValueError(f"La cohorte no tiene las columnas del cruce {faltantes}: use cruzar_datos primero")
+
+        clave_defuncion, filas_defuncion, duplicadas = self.preparar_defunciones()
+        if fecha_fin_seguimiento is None:
+            anio = pd.to_numeric(self.defunciones_data['ANO_DEF'], errors='coerce').max()
+            if pd.isna(anio):
+                raise ValueError("Las defunciones no tienen años válidos: indique fecha_fin_seguimiento")
+            fecha_fin_seguimiento = f"{int(anio)}-12-31"
+        fecha_fin = np.datetime64(fecha_fin_seguimiento, 'ns')
+
+        datos = self.cancer_data
+        censurados = np.flatnonzero(datos['VM'].to_numpy(dtype=np.float64, na_value=np.nan) != 2)
+        fecha_anterior = datos['FECCON'].iloc[censurados].max()
+        if pd.notna(fecha_anterior) and fecha_fin < fecha_anterior:
+            raise ValueError(f"El nuevo fin del seguimiento ({fecha_fin_seguimiento}) es anterior al actual "
+                             f"({fecha_anterior:%Y-%m-%d})")
+        anteriores = datos.iloc[censurados].copy()
 
-    def exportar_resultado(self, nombre_archivo: str):
+        # Buscar solo a los censurados en el índice de las defunciones nuevas
+        posiciones = pd.Index(clave_defuncion[filas_defuncion]).get_indexer(normalizar_rut(anteriores['RUT']))
+        encontrado = posiciones >= 0
+        vinculados = censurados[encontrado]
+        filas = filas_defuncion[posiciones[encontrado]]
+
+        for columna in self.columnas_defuncion():
+            valores = self.defunciones_data[columna].array.take(filas)
+            if columna not in datos.columns:
+                datos[columna] = pd.Series(pd.NA, index=datos.index, dtype=self.defunciones_data[columna].dtype)
+            if isinstance(datos[columna].dtype, pd.CategoricalDtype):
+                nuevas = pd.Index(valores.dropna().unique()).difference(datos[columna].cat.categories)
+                datos[columna] = datos[columna].cat.add_categories(nuevas)
+                valores = np.asarray(valores, dtype=object)
+            datos.iloc[vinculados, datos.columns.get_loc(columna)] = valores
+
+        fecha_def = datos['FECHA_DEF'].to_numpy(dtype='datetime64[ns]')[vinculados]
+        cancer = datos['DIAG1'].iloc[vinculados].astype('string').str.startswith('C', na=False).to_numpy(dtype=bool)
+        datos.iloc[censurados, datos.columns.get_loc('FECCON')] = fecha_fin
+        datos.iloc[vinculados, datos.columns.get_loc('FECCON')] = fecha_def
+        datos.iloc[vinculados, datos.columns.get_loc('VM')] = 2
+        datos.iloc[vinculados, datos.columns.get_loc('CAUSA')] = np.where(cancer, 1, 2).astype(np.int8)
+        informar(f"Seguimiento extendido hasta {fecha_fin_seguimiento}: {len(vinculados)} de {len(censurados)} "
+                 f"pacientes censurados vinculados con las defunciones nuevas")
+
+        self.resumen_cruce = {
+            'pacientes': len(datos),
+            'censurados': len(censurados),
+            'vinculados': len(vinculados),
+            'tasa_vinculacion': len(vinculados) / len(censurados) if len(censurados) else 0.0,
+            'run_duplicados': duplicadas,
+            'fecha_fin_seguimiento': fecha_fin_seguimiento,
+        }
+        registrar('DataMerger.vinculacion_seguimiento', filas_entrada=len(censurados), filas_salida=len(vinculados),
+                  **self.resumen_cruce)
+        return anteriores
+
+    def vincular_no_encontrados(self, clave_cancer, clave_defuncion, encontrado, filas, filas_defuncion,
+                                ruta_revision: str = None, procesos: int = None):
         """
-        Exporta el DataFrame actualizado a un archivo Excel (.xlsx).
+        Vincula probabilísticamente (vinculacionProbabilistica.vincular) los pacientes sin defunción por
+        RUT exacto con las defunciones que no se usaron: las de RUN único no vinculado y las de RUN vacío
+        o inválido. Cada paciente (un RUT, con todas sus filas) se representa por su primer diagnóstico.
+
+        Devuelve `encontrado` y `filas` con los pares aceptados agregados y la cantidad de pares para
+        revisión, que se exportan a `ruta_revision` si se indica.
+        """
+        from vinculacionProbabilistica import vincular
+
+        # Pacientes sin vincular: una unidad por RUT válido y una por fila sin RUT
+        pendientes = np.flatnonzero(~encontrado)
+        unidades = np.where(clave_cancer[pendientes] >= 0, clave_cancer[pendientes], -2 - pendientes)
+        fechas = self.cancer_data['FECDIAG'].to_numpy(dtype='datetime64[ns]')[pendientes]
+        orden = np.lexsort((fechas, unidades))  # NaT queda al final de cada unidad
+        _, primeras = np.unique(unidades[orden], return_index=True)
+        representantes = pendientes[orden[primeras]]
+
+        # Defunciones disponibles: con fecha y no usadas por el cruce exacto
+        disponible = np.zeros(len(clave_defuncion), dtype=bool)
+        disponible[filas_defuncion] = True
+        disponible[clave_defuncion < 0] = True
+        disponible[filas[encontrado]] = False
+        disponible &= self.defunciones_data['FECHA_DEF'].notna().to_numpy()
+        candidatas = np.flatnonzero(disponible)
+
+        with medir('DataMerger.vinculacion_probabilistica', filas_entrada=len(representantes)) as medicion:
+            pares = vincular(self.cancer_data.iloc[representantes], self.defunciones_data.iloc[candidatas],
+                             procesos=procesos)
+            aceptados = pares[pares['decision'] == 'aceptado']
+            medicion.filas_salida = len(aceptados)
+
+        # Cada par aceptado vincula todas las filas del paciente
+        unidades_aceptadas = pd.Index(unidades[orden[primeras]][aceptados['fila_registro'].to_numpy()])
+        posiciones = unidades_aceptadas.get_indexer(unidades)
+        vinculado = posiciones >= 0
+        filas = filas.copy()
+        encontrado = encontrado.copy()
+        filas[pendientes[vinculado]] = candidatas[aceptados['fila_defuncion'].to_numpy()[posiciones[vinculado]]]
+        encontrado[pendientes[vinculado]] = True
+        informar(f"Vinculación probabilística: {len(aceptados)} pacientes vinculados, "
+                 f"{int((pares['decision'] == 'revision').sum())} pares para revisión")
+
+        revision = pares[pares['decision'] == 'revision']
+        if ruta_revision and len(revision):
+            self.exportar_revision(revision, representantes, candidatas, ruta_revision)
+        return encontrado, filas, len(revision)
+
+    def exportar_revision(self, pares: pd.DataFrame, representantes, candidatas, ruta_revision: str):
+        """
+        Exporta los pares dudosos con los datos de ambos lados, el peso y el nivel de cada campo, para que
+        se revisen a mano.
+        """
+        paciente = self.cancer_data.iloc[representantes[pares['fila_registro'].to_numpy()]]
+        defuncion = self.defunciones_data.iloc[candidatas[pares['fila_defuncion'].to_numpy()]]
+        columnas_paciente = [c for c in ['RUT', 'NOCASO', 'SEXO', 'FECNAC', 'REGCOM', 'FECDIAG', 'TOP']
+                             if c in paciente.columns]
+        columnas_defuncion = [c for c in ['RUN', 'SEXO', 'EDAD', 'COMUNA', 'FECHA_DEF', 'DIAG1']
+                              if c in defuncion.columns]
+        revision = pd.concat([
+            paciente[columnas_paciente].reset_index(drop=True),
+            defuncion[columnas_defuncion].rename(columns={'SEXO': 'SEXO_DEF', 'EDAD': 'EDAD_DEF',
+                                                          'COMUNA': 'COMUNA_DEF'}).reset_index(drop=True),
+            pares.drop(columns=['fila_registro', 'fila_defuncion', 'decision']).reset_index(drop=True),
+        ], axis=1)
+        exportar(revision, ruta_revision)
+        informar(f"Pares para revisión exportados a {ruta_revision}")
+
+    @instrumentar(filas='cancer_data')
+    def exportar_resultado(self, nombre_archivo: str, formato: str = None):
+        """
+        Exporta el DataFrame actualizado. El formato se deduce de la extensión (.xlsx, .parquet, .csv,
+        .csv.gz) o se indica con `formato`; los datos se escriben por bloques, sin armar el libro
+        completo en memoria. Los indicadores nullable (CAUSA) se escriben como enteros, el RUT y el RUN
+        como texto 'NNNNNNNN-D' y los faltantes como celdas vacías.
         """
         try:
-            self.cancer_data.to_excel(nombre_archivo, index=False)
-            print(f"Datos exportados exitosamente a {nombre_archivo}")
+            exportar(self.cancer_data, nombre_archivo, formato)
+            informar(f"Datos exportados exitosamente a {nombre_archivo}")
         except Exception as e:
-            print(f"Error al exportar a Excel: {e}")
+            informar(f"Error al exportar a {nombre_archivo}: {e}")
 
     def obtener_datos(self):
         """
@@ -78,6 +325,9 @@ if __name__ == "__main__":
     # Crear una instancia de la clase y procesar los datos
     procesador = DataMerger(archivo_cancer, archivo_defunciones)
 
+    # Registrar tiempo, memoria y filas de cada paso (JSON-lines y tabla resumen al final)
+    activar(ruta_jsonl='data/instrumentacion.jsonl')
+
     # Realizar el cruce de datos y actualizar los campos
     procesador.cruzar_datos()
 
@@ -86,3 +336,4 @@ if __name__ == "__main__":
 
     # Mostrar algunos registros del DataFrame actualizado
     print(procesador.obtener_datos().head())
+    imprimir_resumen()
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+_DIAS_POR_MES = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+
+def decodificar_yyyymmdd(valores):
+    """
+    Decodifica fechas yyyymmdd (enteros, flotantes o texto numérico) a un arreglo datetime64[ns].
+
+    La conversión es aritmética (año = v // 10000, mes = v // 100 % 100, día = v % 100), sin
+    parsear texto. Las fechas imposibles (mes 13, 30 de febrero, etc.) y el texto no numérico quedan
+    como NaT. Devuelve el arreglo de fechas y la cantidad de valores presentes (no faltantes ni texto
+    vacío) que fueron rechazados.
+    """
+    serie = pd.Series(valores)
+    numeros = pd.to_numeric(serie, errors='coerce').to_numpy(dtype=np.float64)
+    presentes = serie.notna().to_numpy()
+    if serie.dtype == object:
+        presentes &= (serie.astype(str).str.strip() != '').to_numpy()
+
+    validos = presentes & ~np.isnan(numeros) & (numeros == np.floor(numeros))
+    enteros = np.where(validos, numeros, 0).astype(np.int64)
+    anio = enteros // 10000
+    mes = enteros // 100 % 100
+    dia = enteros % 100
+
+    # Rango representable en datetime64[ns]
+    validos &= (anio >= 1678) & (anio <= 2261) & (mes >= 1) & (mes <= 12) & (dia >= 1)
+    bisiesto = (anio % 4 == 0) & ((anio % 100 != 0) | (anio % 400 == 0))
+    dias_mes = _DIAS_POR_MES[np.clip(mes, 1, 12) - 1] + ((mes == 2) & bisiesto)
+    validos &= dia <= dias_mes
+
+    meses = np.where(validos, (anio - 1970) * 12 + (mes - 1), 0).astype('datetime64[M]')
+    fechas = (meses.astype('datetime64[D]') + np.where(validos, dia - 1, 0)).astype('datetime64[ns]')
+    fechas[~validos] = np.datetime64('NaT')
+
+    return fechas, int((presentes & ~validos).sum())
+
+
+def convertir_yyyymmdd(serie: pd.Series):
+    """
+    Convierte una columna yyyymmdd a datetime (si aún no lo es) conservando el índice.
+    Devuelve la serie convertida y la cantidad de fechas rechazadas.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie, 0
+    fechas, rechazos = decodificar_yyyymmdd(serie)
+    return pd.Series(fechas, index=serie.index, name=serie.name), rechazos
+
+
+def edad_cumplida(fecha_nacimiento, fecha_referencia):
+    """
+    Calcula la edad en años cumplidos a la fecha de referencia, con operaciones sobre arreglos.
+
+    Se resta un año si en la fecha de referencia aún no se cumple el aniversario (mes y día).
+    Devuelve enteros, o flotantes con NaN si alguna de las fechas falta.
+    """
+    nacimiento = np.asarray(fecha_nacimiento, dtype='datetime64[D]')
+    referencia = np.asarray(fecha_referencia, dtype='datetime64[D]')
+
+    def componentes(fechas):
+        meses = fechas.astype('datetime64[M]')
+        anio = fechas.astype('datetime64[Y]').astype(np.int64) + 1970
+        mes = meses.astype(np.int64) % 12 + 1
+        dia = (fechas - meses.astype('datetime64[D]')).astype(np.int64) + 1
+        return anio, mes * 100 + dia
+
+    anio_nac, mesdia_nac = componentes(nacimiento)
+    anio_ref, mesdia_ref = componentes(referencia)
+    edad = anio_ref - anio_nac - (mesdia_ref < mesdia_nac)
+
+    faltantes = np.isnat(nacimiento) | np.isnat(referencia)
+    if faltantes.any():
+        return np.where(faltantes, np.nan, edad.astype(np.float64))
+    return edad
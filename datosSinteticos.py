@@ -0,0 +1,324 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from dataExporter import exportar
+from dateUtils import decodificar_yyyymmdd, edad_cumplida
+from instrumentacion import informar
+from rutUtils import digito_verificador
+
+# Comunas de la Región de Antofagasta y su peso aproximado en la población
+COMUNAS = {
+    2101: 0.58,  # Antofagasta
+    2102: 0.02,  # Mejillones
+    2103: 0.004,  # Sierra Gorda
+    2104: 0.02,  # Taltal
+    2201: 0.27,  # Calama
+    2202: 0.001,  # Ollagüe
+    2203: 0.017,  # San Pedro de Atacama
+    2301: 0.04,  # Tocopilla
+    2302: 0.008,  # María Elena
+}
+
+# Topografías CIE-O (sin la letra 'C'): peso en hombres, peso en mujeres, tasa anual de muerte
+TOPOGRAFIAS = {
+    339: (0.005, 0.002, 0.70),  # tráquea
+    341: (0.020, 0.010, 0.70),  # pulmón, lóbulo superior
+    349: (0.080, 0.040, 0.70),  # pulmón
+    619: (0.220, 0.000, 0.08),  # próstata
+    160: (0.010, 0.005, 0.55),  # estómago, cardias
+    169: (0.070, 0.035, 0.55),  # estómago
+    187: (0.020, 0.020, 0.20),  # colon sigmoides
+    189: (0.040, 0.040, 0.20),  # colon
+    209: (0.020, 0.015, 0.22),  # recto
+    504: (0.000, 0.040, 0.07),  # mama, cuadrante superior externo
+    509: (0.002, 0.250, 0.07),  # mama
+    239: (0.015, 0.040, 0.75),  # vesícula biliar
+    530: (0.000, 0.030, 0.10),  # endocérvix
+    539: (0.000, 0.020, 0.10),  # cuello uterino
+    220: (0.020, 0.010, 0.90),  # hígado
+    679: (0.050, 0.020, 0.20),  # vejiga
+    649: (0.030, 0.015, 0.15),  # riñón
+    739: (0.020, 0.060, 0.02),  # tiroides
+    445: (0.100, 0.080, 0.01),  # piel
+    259: (0.020, 0.020, 0.90),  # páncreas
+    421: (0.030, 0.025, 0.30),  # médula ósea
+    809: (0.030, 0.030, 0.60),  # sitio primario desconocido
+}
+
+# Causas de muerte distintas de cáncer (CIE-10) en las defunciones del DEIS
+CAUSAS_NO_CANCER = ['I219', 'I64', 'J189', 'E149', 'K746', 'X599', 'I509', 'J449']
+
+# Cuerpos de RUT: una biyección i -> (MULTIPLICADOR * i) mod 2^25 desordena los identificadores sin repetirlos
+RUT_MINIMO = 1_000_000
+RUT_MODULO = 2 ** 25
+RUT_MULTIPLICADOR = 7_919_993
+
+COLUMNAS_DEIS = ['RUN', 'SEXO', 'EDAD', 'COMUNA', 'DIA_DEF', 'MES_DEF', 'ANO_DEF', 'DIAG1']
+
+
+def cuerpo_rut(indices):
+    """
+    Cuerpo de RUT único para cada índice de persona (hasta 2^25 personas).
+    """
+    return RUT_MINIMO + (np.asarray(indices, dtype=np.int64) * RUT_MULTIPLICADOR) % RUT_MODULO
+
+
+def _a_yyyymmdd(fechas):
+    """
+    Fechas datetime64 a enteros yyyymmdd, el formato de las fechas del registro.
+    """
+    fechas = pd.DatetimeIndex(fechas)
+    return (fechas.year * 10000 + fechas.month * 100 + fechas.day).to_numpy(dtype=np.int64)
+
+
+def generar_bloque_registro(inicio: int, filas: int, semilla, anio_inicio: int = 2011, anio_fin: int = 2019,
+                            fecha_cierre: str = '2019-12-31'):
+    """
+    Genera un bloque de filas del registro de cáncer con el formato de rpcdata (fechas yyyymmdd).
+
+    `inicio` es el índice de la primera fila, para que TUMOURID, NOCASO y los RUT no se repitan entre
+    bloques. Cerca del 5% de las filas son un segundo primario de un paciente anterior del bloque, con
+    su mismo RUT, sexo y fecha de nacimiento. Devuelve el bloque y la fecha de defunción de cada fila
+    (NaT si el paciente sigue vivo al cierre).
+    """
+    rng = np.random.default_rng(semilla)
+
+    # Paciente de cada fila: los segundos primarios apuntan a una fila anterior hasta llegar a un primario
+    paciente = np.arange(filas)
+    segundo = rng.random(filas) < 0.05
+    segundo[0] = False
+    paciente[segundo] = (rng.random(segundo.sum()) * np.flatnonzero(segundo)).astype(np.int64)
+    while (paciente[paciente] != paciente).any():
+        paciente = paciente[paciente]
+
+    sexo = rng.choice([1, 2], size=filas, p=[0.48, 0.52])[paciente]
+    edad = np.clip(rng.normal(64, 14, size=filas), 15, 99)
+
+    # Topografía según el sexo, con la tasa de muerte de cada topografía
+    codigos = np.array(list(TOPOGRAFIAS))
+    pesos = np.array(list(TOPOGRAFIAS.values()))
+    top = np.empty(filas, dtype=np.int64)
+    for s, columna in ((1, 0), (2, 1)):
+        filas_sexo = np.flatnonzero(sexo == s)
+        top[filas_sexo] = rng.choice(codigos, size=len(filas_sexo), p=pesos[:, columna] / pesos[:, columna].sum())
+    tasa = pd.Series(pesos[:, 2], index=codigos).reindex(top).to_numpy()
+
+    # Diagnóstico uniforme en los años del registro y sobrevida exponencial con más riesgo a mayor edad
+    desde = np.datetime64(f'{anio_inicio}-01-01', 'D')
+    hasta = np.datetime64(f'{anio_fin + 1}-01-01', 'D')
+    fecdiag = desde + rng.integers(0, (hasta - desde).astype(np.int64), size=filas).astype('timedelta64[D]')
+    fecnac = fecdiag - np.round(edad * 365.25).astype('timedelta64[D]')
+    sobrevida = rng.exponential(1 / (tasa * np.exp(0.02 * (edad - 64)))) * 365.25
+    defuncion = fecdiag + np.round(sobrevida).astype('timedelta64[D]')
+
+    # Los segundos primarios heredan nacimiento y muerte del paciente y se diagnostican antes de la muerte
+    fecnac, defuncion = fecnac[paciente], defuncion[paciente]
+    limite = np.minimum(defuncion, hasta - np.timedelta64(1, 'D'))
+    margen = (limite - fecdiag[paciente]).astype(np.int64)
+    fecdiag = np.where(segundo, fecdiag[paciente] + (rng.random(filas) * margen).astype('timedelta64[D]'), fecdiag)
+
+    # El registro solo conoce parte de las muertes antes del cierre; el resto lo aporta el DEIS
+    cierre = np.datetime64(fecha_cierre, 'D')
+    muerto = defuncion <= cierre
+    conocido = muerto & (rng.random(filas) < 0.5)
+    contacto = fecdiag + (rng.random(filas) * (cierre - fecdiag).astype(np.int64)).astype('timedelta64[D]')
+    feccon = np.where(conocido, defuncion, contacto)
+
+    rut = cuerpo_rut(inicio + paciente)
+    bloque = pd.DataFrame({
+        'REGCOM': rng.choice(list(COMUNAS), size=filas, p=np.array(list(COMUNAS.values())) / sum(COMUNAS.values())),
+        'FECDIAG': _a_yyyymmdd(fecdiag),
+        'TOP': top,
+        'MORF': np.where(np.isin(top, [504, 509]), 8500,
+                         rng.choice([8140, 8070, 8000, 8010], size=filas, p=[0.55, 0.25, 0.1, 0.1])),
+        'COMP': rng.choice([3, 2, 1], size=filas, p=[0.95, 0.04, 0.01]),
+        'BASE': rng.choice([7, 5, 6, 2, 1, 4], size=filas, p=[0.80, 0.05, 0.05, 0.04, 0.03, 0.03]),
+        'C10': np.char.add('C', top.astype(str)),
+        'CODPRI': np.where(segundo, 2, 1),
+        'PMSEC': segundo.astype(np.int64),
+        'PMTOT': np.where(segundo, 2, 1),
+        'GRA': rng.choice([9, 1, 2, 3], size=filas, p=[0.6, 0.15, 0.15, 0.1]),
+        'EXT': rng.choice([9, 1, 2, 3, 4], size=filas, p=[0.4, 0.2, 0.2, 0.1, 0.1]),
+        'LAT': rng.choice([0, 1, 2, 9], size=filas, p=[0.7, 0.12, 0.12, 0.06]),
+        'TUMOURID': inicio + np.arange(filas),
+        'NOCASO': inicio + paciente,
+        # Una pequeña fracción de RUT vacíos, como en el registro real
+        'RUT': np.where(rng.random(filas) < 0.002, 0, rut),
+        'CODRUT': digito_verificador(rut),
+        'SEXO': sexo,
+        'FECNAC': _a_yyyymmdd(fecnac),
+        'FECCON': _a_yyyymmdd(feccon),
+        'VM': np.where(conocido, 2, 1),
+        'CAUSA': np.where(conocido, np.where(rng.random(filas) < 0.8, 1.0, 2.0), np.nan),
+    })
+
+    # Algunas fechas mal digitadas (30 de febrero), que el procesador convierte a NaT
+    mal_digitadas = rng.random(filas) < 0.001
+    bloque.loc[mal_digitadas, 'FECDIAG'] = bloque.loc[mal_digitadas, 'FECDIAG'] // 10000 * 10000 + 230
+    return bloque, np.where(muerto, defuncion, np.datetime64('NaT'))
+
+
+def formatear_run(cuerpos, rng):
+    """
+    Escribe los RUN con los formatos mezclados del DEIS: '12.345.678-5', '12345678-5' y solo el cuerpo.
+    """
+    cuerpos = pd.Series(np.asarray(cuerpos, dtype=np.int64))
+    dv = pd.Series(digito_verificador(cuerpos.to_numpy()))
+    con_puntos = ((cuerpos // 1_000_000).astype(str) + '.' + ((cuerpos // 1000) % 1000).astype(str).str.zfill(3)
+                  + '.' + (cuerpos % 1000).astype(str).str.zfill(3) + '-' + dv)
+    con_guion = cuerpos.astype(str) + '-' + dv
+    formato = rng.random(len(cuerpos))
+    return np.where(formato < 0.5, con_puntos, np.where(formato < 0.9, con_guion, cuerpos.astype(str)))
+
+
+def digitar_con_errores(cuerpos, rng, sustitucion: float = 0.01, transposicion: float = 0.005):
+    """
+    Introduce errores de digitación en una fracción de los cuerpos de RUT: un dígito cambiado
+    (`sustitucion`) o dos dígitos vecinos intercambiados (`transposicion`). El primer dígito no cambia.
+    """
+    cuerpos = np.asarray(cuerpos, dtype=np.int64).copy()
+    cifras = np.floor(np.log10(np.maximum(cuerpos, 1))).astype(np.int64) + 1
+    error = rng.random(len(cuerpos))
+
+    cambiar = np.flatnonzero(error < sustitucion)
+    potencia = 10 ** (rng.random(len(cambiar)) * (cifras[cambiar] - 1)).astype(np.int64)
+    digito = cuerpos[cambiar] // potencia % 10
+    cuerpos[cambiar] += ((digito + rng.integers(1, 10, len(cambiar))) % 10 - digito) * potencia
+
+    intercambiar = np.flatnonzero((error >= sustitucion) & (error < sustitucion + transposicion))
+    potencia = 10 ** (rng.random(len(intercambiar)) * (cifras[intercambiar] - 2)).astype(np.int64)
+    bajo, alto = cuerpos[intercambiar] // potencia % 10, cuerpos[intercambiar] // (10 * potencia) % 10
+    cuerpos[intercambiar] += (alto - bajo) * potencia + (bajo - alto) * 10 * potencia
+    return cuerpos
+
+
+def generar_defunciones(cuerpos, fechas, diagnosticos, semilla, anio_inicio: int = 2011, anio_fin: int = 2019,
+                        sexos=None, edades=None, comunas=None):
+    """
+    Arma los registros de defunción del DEIS a partir de los cuerpos de RUN, las fechas de muerte y los
+    códigos CIE-10 de la causa básica, y opcionalmente el sexo, la edad y la comuna (al azar si no se
+    indican). Agrega un 0,5% de RUN repetidos (con una fecha posterior), un 0,3% de RUN vacíos, un 1,5%
+    de RUN mal digitados y un 0,5% con el dígito verificador pegado al cuerpo, sin guion. Devuelve un
+    diccionario {año: DataFrame} con las columnas de los archivos del DEIS.
+    """
+    rng = np.random.default_rng(semilla)
+    fechas = pd.DatetimeIndex(fechas)
+    cantidad = len(cuerpos)
+    sexos = rng.choice([1, 2], size=cantidad) if sexos is None else np.asarray(sexos)
+    edades = rng.integers(0, 100, size=cantidad) if edades is None else np.asarray(edades)
+    comunas = rng.choice(list(COMUNAS), size=cantidad) if comunas is None else np.asarray(comunas)
+
+    # RUN repetidos con una fecha posterior: el cruce debe quedarse con la más temprana
+    repetidos = np.flatnonzero(rng.random(cantidad) < 0.005)
+    cuerpos = np.concatenate([cuerpos, cuerpos[repetidos]])
+    fechas = fechas.append(fechas[repetidos] + pd.to_timedelta(rng.integers(1, 60, len(repetidos)), unit='D'))
+    diagnosticos = np.concatenate([diagnosticos, diagnosticos[repetidos]])
+    sexos, edades, comunas = (np.concatenate([v, v[repetidos]]) for v in (sexos, edades, comunas))
+
+    run = formatear_run(digitar_con_errores(cuerpos, rng), rng)
+    pegado = (rng.random(len(run)) < 0.005) & (np.char.find(run.astype(str), '-') >= 0)
+    run = np.where(pegado, np.char.replace(np.char.replace(run.astype(str), '.', ''), '-', ''), run)
+    run = np.where(rng.random(len(run)) < 0.003, '', run)
+    defunciones = pd.DataFrame({
+        'RUN': run,
+        'SEXO': sexos,
+        'EDAD': edades,
+        'COMUNA': comunas,
+        'DIA_DEF': fechas.day,
+        'MES_DEF': fechas.month,
+        'ANO_DEF': fechas.year,
+        'DIAG1': diagnosticos,
+    })
+    defunciones = defunciones.iloc[rng.permutation(len(defunciones))]
+    return {anio: defunciones[defunciones['ANO_DEF'] == anio].reset_index(drop=True)
+            for anio in range(anio_inicio, anio_fin + 1)}
+
+
+def escribir_datos_sinteticos(directorio: str, filas: int, semilla: int = 20241112, anio_inicio: int = 2011,
+                              anio_fin: int = 2019, fecha_cierre: str = '2019-12-31', razon_poblacion: float = 1.0,
+                              tamano_bloque: int = 1_000_000):
+    """
+    Escribe un registro sintético (`directorio/rpcdata_sintetico.csv`) de `filas` tumores y los archivos
+    de defunciones del DEIS por año (`directorio/defunciones/def_<año>.xlsx`).
+
+    El registro se genera y se escribe por bloques, por lo que la memoria no crece con `filas`. Las
+    defunciones incluyen a los pacientes del registro que mueren antes de `fecha_cierre` (con la causa
+    de su cáncer en el 80% de los casos) y `razon_poblacion` veces esa cantidad de muertes de personas
+    que no están en el registro. Devuelve un resumen con las rutas y las cantidades generadas.
+    """
+    inicio_total = time.perf_counter()
+    directorio_defunciones = os.path.join(directorio, 'defunciones')
+    os.makedirs(directorio_defunciones, exist_ok=True)
+    ruta_registro = os.path.join(directorio, 'rpcdata_sintetico.csv')
+
+    bloques = range(0, filas, tamano_bloque)
+    semillas = np.random.SeedSequence(semilla).spawn(len(bloques) + 2)
+    muertes = []
+    for i, inicio in enumerate(bloques):
+        bloque, defuncion = generar_bloque_registro(inicio, min(tamano_bloque, filas - inicio), semillas[i],
+                                                    anio_inicio, anio_fin, fecha_cierre)
+        bloque.to_csv(ruta_registro, index=False, mode='w' if i == 0 else 'a', header=i == 0)
+
+        # Una defunción por paciente (los segundos primarios comparten RUT y fecha)
+        muerto = ~np.isnat(defuncion) & ~bloque['NOCASO'].duplicated().to_numpy()
+        muertes.append(pd.DataFrame({'cuerpo': cuerpo_rut(bloque['NOCASO'].to_numpy()[muerto]),
+                                     'fecha': defuncion[muerto], 'top': bloque['TOP'].to_numpy()[muerto],
+                                     'sexo': bloque['SEXO'].to_numpy()[muerto],
+                                     'nacimiento': bloque['FECNAC'].to_numpy()[muerto],
+                                     'comuna': bloque['REGCOM'].to_numpy()[muerto]}))
+        informar(f"Registro sintético: {min(inicio + tamano_bloque, filas)} de {filas} filas")
+
+    muertes = pd.concat(muertes, ignore_index=True)
+    rng = np.random.default_rng(semillas[-2])
+    no_cancer = rng.choice(CAUSAS_NO_CANCER, size=len(muertes))
+    diagnosticos = np.where(rng.random(len(muertes)) < 0.8, np.char.add('C', muertes['top'].to_numpy().astype(str)),
+                            no_cancer)
+
+    # Muertes de la población general, con RUN que no están en el registro
+    poblacion = int(round(len(muertes) * razon_poblacion))
+    desde = np.datetime64(f'{anio_inicio}-01-01', 'D')
+    dias = (np.datetime64(fecha_cierre, 'D') - desde).astype(np.int64) + 1
+    fechas_poblacion = desde + rng.integers(0, dias, size=poblacion).astype('timedelta64[D]')
+    causas_poblacion = np.where(rng.random(poblacion) < 0.25,
+                                np.char.add('C', rng.choice(list(TOPOGRAFIAS), size=poblacion).astype(str)),
+                                rng.choice(CAUSAS_NO_CANCER, size=poblacion))
+
+    # Los pacientes del registro mueren con su sexo, su edad y la comuna del registro en el 85% de los casos
+    nacimiento, _ = decodificar_yyyymmdd(muertes['nacimiento'])
+    edades = edad_cumplida(nacimiento, muertes['fecha'].to_numpy(dtype='datetime64[D]'))
+    comunas = np.where(rng.random(len(muertes)) < 0.85, muertes['comuna'].to_numpy(),
+                       rng.choice(list(COMUNAS), size=len(muertes)))
+
+    anio_cierre = pd.Timestamp(fecha_cierre).year
+    por_anio = generar_defunciones(np.concatenate([muertes['cuerpo'].to_numpy(), cuerpo_rut(filas + np.arange(poblacion))]),
+                                   np.concatenate([muertes['fecha'].to_numpy(dtype='datetime64[D]'), fechas_poblacion]),
+                                   np.concatenate([diagnosticos, causas_poblacion]), semillas[-1], anio_inicio, anio_cierre,
+                                   sexos=np.concatenate([muertes['sexo'].to_numpy(), rng.choice([1, 2], size=poblacion)]),
+                                   edades=np.concatenate([edades, rng.integers(0, 100, size=poblacion)]),
+                                   comunas=np.concatenate([comunas, rng.choice(list(COMUNAS), size=poblacion)]))
+    rutas_defunciones = []
+    for anio, defunciones in por_anio.items():
+        ruta = os.path.join(directorio_defunciones, f'def_{anio}.xlsx')
+        exportar(defunciones, ruta)
+        rutas_defunciones.append(ruta)
+        informar(f"Defunciones sintéticas {anio}: {len(defunciones)} registros")
+
+    resumen = {
+        'ruta_registro': ruta_registro,
+        'directorio_defunciones': directorio_defunciones,
+        'filas': filas,
+        'defunciones_registro': len(muertes),
+        'defunciones_poblacion': poblacion,
+        'defunciones_por_anio': {anio: len(df) for anio, df in por_anio.items()},
+        'segundos': time.perf_counter() - inicio_total,
+    }
+    informar(f"Datos sintéticos escritos en {directorio} en {resumen['segundos']:.1f} s")
+    return resumen
+
+
+# Ejemplo de uso
+if __name__ == "__main__":
+    escribir_datos_sinteticos('data/sintetico/10000', 10_000)
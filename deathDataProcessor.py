@@ -1,63 +1,137 @@
 import pandas as pd
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from glob import glob
 
+from columnarCache import ColumnarCache
+from dataExporter import exportar
+from instrumentacion import activar, imprimir_resumen, informar, instrumentar, registrar
+
+COLUMNAS_DEFUNCIONES = ['RUN', 'DIA_DEF', 'MES_DEF', 'ANO_DEF', 'DIAG1']
+# Columnas que se leen si el archivo las trae; las usa la vinculación probabilística (vinculacionProbabilistica)
+COLUMNAS_OPCIONALES = ['SEXO', 'EDAD', 'EDAD_TIPO', 'EDAD_CANT', 'COMUNA']
+
+
+def leer_archivo_defunciones(archivo: str, columnas: list = None, opcionales: list = None):
+    """
+    Lee las columnas necesarias de un archivo Excel de defunciones, y las opcionales que estén
+    presentes, y devuelve el DataFrame junto con el tiempo de lectura en segundos.
+    """
+    inicio = time.perf_counter()
+    columnas = columnas or COLUMNAS_DEFUNCIONES
+    leer = set(columnas) | set(COLUMNAS_OPCIONALES if opcionales is None else opcionales)
+    df = pd.read_excel(archivo, usecols=lambda columna: columna in leer, dtype=str)
+    faltantes = [columna for columna in columnas if columna not in df.columns]
+    if faltantes:
+        raise ValueError(f"Faltan las columnas {faltantes} en {archivo}")
+    return df, time.perf_counter() - inicio
+
 
 class DefuncionesProcessor:
-    def __init__(self, directorio: str):
+    def __init__(self, directorio: str, directorio_cache: str = None, procesos: int = None):
         """
         Inicializa la clase con el directorio donde están los archivos Excel.
+
+        Los archivos ya leídos se guardan en una caché columnar (por defecto en `directorio/.cache`)
+        y solo se vuelven a leer si cambian. Los archivos nuevos se leen en paralelo con hasta
+        `procesos` procesos.
         """
         self.directorio = directorio
+        self.directorio_cache = directorio_cache or os.path.join(directorio, '.cache')
+        self.procesos = procesos or os.cpu_count() or 1
+        self.columnas = COLUMNAS_DEFUNCIONES
+        self.opcionales = COLUMNAS_OPCIONALES
         self.data_combined = pd.DataFrame()
 
+    @instrumentar(filas='data_combined')
     def cargar_y_combinar_archivos(self):
         """
         Carga todos los archivos Excel (.xlsx) del directorio y combina las columnas relevantes en un solo DataFrame.
+
+        Los archivos sin cambios desde la última ejecución se toman de la caché; el resto se lee en paralelo.
         """
-        # Obtener todos los archivos Excel en el directorio
-        archivos = glob(os.path.join(self.directorio, '*.xlsx'))
+        inicio_total = time.perf_counter()
+
+        # Obtener todos los archivos Excel en el directorio (en orden, para que la combinación sea reproducible)
+        archivos = sorted(glob(os.path.join(self.directorio, '*.xlsx')))
 
         # Verificar si hay archivos disponibles
         if not archivos:
-            print("No se encontraron archivos Excel en el directorio especificado.")
+            informar("No se encontraron archivos Excel en el directorio especificado.")
             return
 
-        lista_dataframes = []
+        cache = ColumnarCache(self.directorio_cache)
+        version = ','.join(self.columnas + self.opcionales)
+        dataframes = {}
+        pendientes = []
+        total = len(archivos)
 
-        # Cargar cada archivo y seleccionar las columnas necesarias
+        # Tomar de la caché los archivos que no cambiaron
         for archivo in archivos:
-            print(f"Cargando archivo: {archivo}")
-            try:
-                # Leer el archivo Excel y seleccionar las columnas necesarias
-                df = pd.read_excel(archivo, usecols=['RUN', 'DIA_DEF', 'MES_DEF', 'ANO_DEF', 'DIAG1'], dtype=str)
-                lista_dataframes.append(df)
-            except Exception as e:
-                print(f"Error al cargar {archivo}: {e}")
-
-        # Unir todos los DataFrames en uno solo
-        self.data_combined = pd.concat(lista_dataframes, ignore_index=True)
-        print("Archivos combinados exitosamente.")
+            inicio = time.perf_counter()
+            df = cache.leer(archivo, version)
+            if df is None:
+                pendientes.append(archivo)
+                continue
+            dataframes[archivo] = df
+            segundos = time.perf_counter() - inicio
+            registrar('DefuncionesProcessor.leer_archivo', segundos, filas_salida=len(df),
+                      archivo=os.path.basename(archivo), cache=True)
+            informar(f"[{len(dataframes)}/{total}] {os.path.basename(archivo)}: {len(df)} filas desde caché "
+                     f"({segundos:.2f} s)")
+
+        # Leer en paralelo los archivos nuevos o modificados
+        if pendientes:
+            procesos = min(self.procesos, len(pendientes))
+            with ProcessPoolExecutor(max_workers=procesos) as pool:
+                futuros = {pool.submit(leer_archivo_defunciones, archivo, self.columnas, self.opcionales): archivo
+                           for archivo in pendientes}
+                for futuro in as_completed(futuros):
+                    archivo = futuros[futuro]
+                    try:
+                        df, segundos = futuro.result()
+                    except Exception as e:
+                        informar(f"Error al cargar {archivo}: {e}")
+                        continue
+                    cache.guardar(archivo, df, version)
+                    dataframes[archivo] = df
+                    # La lectura ocurre en otro proceso: se registra el tiempo que midió el trabajador
+                    registrar('DefuncionesProcessor.leer_archivo', segundos, filas_salida=len(df),
+                              archivo=os.path.basename(archivo), cache=False)
+                    informar(f"[{len(dataframes)}/{total}] {os.path.basename(archivo)}: {len(df)} filas leídas "
+                             f"({segundos:.2f} s)")
+
+        if not dataframes:
+            informar("No se pudo cargar ningún archivo de defunciones.")
+            return
 
+        # Unir todos los DataFrames en uno solo, en el orden de los archivos
+        self.data_combined = pd.concat([dataframes[a] for a in archivos if a in dataframes], ignore_index=True)
+        informar(f"Archivos combinados exitosamente: {len(self.data_combined)} filas de {len(dataframes)} archivos "
+                 f"({total - len(pendientes)} desde caché) en {time.perf_counter() - inicio_total:.2f} s.")
+
+    @instrumentar(filas='data_combined')
     def exportar_a_excel(self, nombre_archivo: str):
         """
-        Exporta el DataFrame combinado a un archivo Excel (.xlsx).
+        Exporta el DataFrame combinado a un archivo Excel (.xlsx), escrito fila a fila en modo de solo escritura.
         """
         try:
-            self.data_combined.to_excel(nombre_archivo, index=False)
-            print(f"Datos exportados exitosamente a {nombre_archivo}")
+            exportar(self.data_combined, nombre_archivo, 'excel')
+            informar(f"Datos exportados exitosamente a {nombre_archivo}")
         except Exception as e:
-            print(f"Error al exportar a Excel: {e}")
+            informar(f"Error al exportar a Excel: {e}")
 
+    @instrumentar(filas='data_combined')
     def exportar_a_csv(self, nombre_archivo: str):
         """
-        Exporta el DataFrame combinado a un archivo CSV (.csv).
+        Exporta el DataFrame combinado a un archivo CSV, comprimido si la extensión lo indica (.csv.gz).
         """
         try:
-            self.data_combined.to_csv(nombre_archivo, index=False)
-            print(f"Datos exportados exitosamente a {nombre_archivo}")
+            exportar(self.data_combined, nombre_archivo, 'csv')
+            informar(f"Datos exportados exitosamente a {nombre_archivo}")
         except Exception as e:
-            print(f"Error al exportar a CSV: {e}")
+            informar(f"Error al exportar a CSV: {e}")
 
     def obtener_datos(self):
         """
@@ -74,6 +148,9 @@ if __name__ == "__main__":
     # Crear una instancia de la clase y procesar los archivos
     procesador = DefuncionesProcessor(directorio)
 
+    # Registrar tiempo, memoria y filas de cada paso (JSON-lines y tabla resumen al final)
+    activar(ruta_jsonl='data/instrumentacion.jsonl')
+
     # 1. Cargar y combinar los archivos
     procesador.cargar_y_combinar_archivos()
 
@@ -82,3 +159,4 @@ if __name__ == "__main__":
 
     # Mostrar algunos registros del DataFrame combinado
     print(procesador.obtener_datos().head())
+    imprimir_resumen()
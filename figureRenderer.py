@@ -0,0 +1,89 @@
+import multiprocessing
+import os
+
+from kaplanMeierEstratos import graficar_curva
+
+
+def serie_curva(curva, label: str):
+    """
+    Extrae de la tabla de Kaplan-Meier solo los arreglos necesarios para graficar una curva,
+    para que cada tarea enviada a los procesos sea pequeña.
+    """
+    return {
+        'label': label,
+        'tiempo': curva['tiempo'].to_numpy(),
+        'sobrevida': curva['sobrevida'].to_numpy(),
+        'ic_inferior': curva['ic_inferior'].to_numpy(),
+        'ic_superior': curva['ic_superior'].to_numpy(),
+    }
+
+
+def nueva_figura(archivo: str, titulo: str, titulo_leyenda: str = None, xticks=None):
+    """
+    Crea la especificación de una figura de sobrevida. Las curvas se agregan a la lista 'series'.
+    """
+    return {
+        'archivo': archivo,
+        'titulo': titulo,
+        'titulo_leyenda': titulo_leyenda,
+        'xticks': list(xticks) if xticks is not None else None,
+        'series': [],
+    }
+
+
+def _inicializar_trabajador():
+    """
+    Fija el backend no interactivo Agg en cada proceso antes de dibujar.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def renderizar_figura(figura: dict):
+    """
+    Dibuja y guarda una figura. Usa un objeto Figure independiente de pyplot, de modo que
+    no queda ninguna figura retenida en memoria después de guardar el archivo.
+    """
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    for serie in figura['series']:
+        graficar_curva(serie, label=serie['label'], ax=ax)
+
+    ax.set_title(figura['titulo'])
+    ax.set_xlabel('Tiempo (años)')
+    ax.set_ylabel('Probabilidad de sobrevida')
+    ax.grid(True)
+    if figura['xticks'] is not None:
+        ax.set_xticks(figura['xticks'])
+    if figura['series']:
+        ax.legend(title=figura['titulo_leyenda'])
+
+    fig.savefig(figura['archivo'])
+    return figura['archivo']
+
+
+def renderizar_figuras(figuras: list, procesos: int = None, max_tareas_por_proceso: int = 25):
+    """
+    Renderiza un lote de figuras en un pool de procesos con backend Agg.
+
+    Cada proceso se reemplaza después de `max_tareas_por_proceso` figuras para acotar la memoria
+    que acumula matplotlib. Con `procesos=1` las figuras se renderizan en el proceso actual.
+    Devuelve las rutas de los archivos generados, en el mismo orden de `figuras`.
+    """
+    for figura in figuras:
+        os.makedirs(os.path.dirname(figura['archivo']) or '.', exist_ok=True)
+
+    if procesos is None:
+        procesos = os.cpu_count() or 1
+    procesos = min(procesos, len(figuras))
+
+    if procesos <= 1:
+        return [renderizar_figura(figura) for figura in figuras]
+
+    # Procesos 'spawn' (sin heredar el estado de matplotlib del proceso principal) que se reciclan
+    # cada `max_tareas_por_proceso` figuras
+    contexto = multiprocessing.get_context('spawn')
+    with contexto.Pool(procesos, initializer=_inicializar_trabajador, maxtasksperchild=max_tareas_por_proceso) as pool:
+        return pool.map(renderizar_figura, figuras, chunksize=1)
@@ -0,0 +1,248 @@
+import functools
+import json
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+
+def memoria_proc(campo: str):
+    """
+    Lee un campo de memoria (VmRSS, VmHWM) de /proc/self/status en MB; None fuera de Linux.
+    """
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for linea in f:
+                if linea.startswith(campo + ':'):
+                    return int(linea.split()[1]) / 2 ** 10
+    except OSError:
+        pass
+    return None
+
+
+def reiniciar_pico():
+    """
+    Reinicia el máximo de memoria residente del proceso (VmHWM), para medir solo lo que sigue.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w', encoding='ascii') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def pico_rss_mb():
+    """
+    Memoria residente máxima del proceso en MB. En Linux se usa VmHWM, porque ru_maxrss se hereda del
+    proceso padre a través de exec; en otros sistemas, ru_maxrss (en bytes en macOS).
+    """
+    pico = memoria_proc('VmHWM')
+    if pico is not None:
+        return pico
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / 2 ** 20 if sys.platform == 'darwin' else pico / 2 ** 10
+
+
+class _Estado:
+    def __init__(self):
+        """
+        Estado global de la instrumentación: si está activa, los registros de la ejecución, el archivo
+        JSON-lines (opcional) y la pila de pasos abiertos.
+        """
+        self.activa = False
+        self.mostrar_mensajes = True
+        self.memoria = True
+        self.ruta_jsonl = None
+        self.registros = []
+        self.pila = []
+
+
+_ESTADO = _Estado()
+
+
+def activar(ruta_jsonl: str = None, memoria: bool = True, mostrar_mensajes: bool = True):
+    """
+    Activa la instrumentación. Cada paso medido se agrega a los registros de la ejecución y, si se indica
+    `ruta_jsonl`, se escribe como una línea JSON en ese archivo al terminar. Con `memoria=False` no se
+    mide el pico de memoria (lo más costoso de medir); con `mostrar_mensajes=False` los mensajes de
+    avance solo quedan en los registros.
+    """
+    _ESTADO.activa = True
+    _ESTADO.memoria = memoria
+    _ESTADO.mostrar_mensajes = mostrar_mensajes
+    _ESTADO.ruta_jsonl = ruta_jsonl
+    _ESTADO.registros = []
+    _ESTADO.pila = []
+
+
+def desactivar():
+    """
+    Desactiva la instrumentación; los registros ya tomados se conservan hasta la próxima activación.
+    """
+    _ESTADO.activa = False
+    _ESTADO.mostrar_mensajes = True
+    _ESTADO.pila = []
+
+
+def esta_activa():
+    return _ESTADO.activa
+
+
+def informar(mensaje: str):
+    """
+    Mensaje de avance de un paso. Se imprime como siempre y, con la instrumentación activa, queda además
+    asociado al paso en curso.
+    """
+    if _ESTADO.activa:
+        if _ESTADO.pila:
+            _ESTADO.pila[-1].mensajes.append(mensaje)
+        if not _ESTADO.mostrar_mensajes:
+            return
+    print(mensaje)
+
+
+def registrar(paso: str, segundos: float = None, filas_entrada: int = None, filas_salida: int = None, **extra):
+    """
+    Agrega un registro ya medido (p. ej. la lectura de un archivo en otro proceso). No hace nada si la
+    instrumentación está desactivada.
+    """
+    if not _ESTADO.activa:
+        return
+    registro = {'paso': paso, 'nivel': len(_ESTADO.pila), 'inicio': datetime.now().isoformat(timespec='milliseconds'),
+                'segundos': segundos, 'cpu_segundos': None, 'pico_rss_mb': None,
+                'filas_entrada': filas_entrada, 'filas_salida': filas_salida,
+                'filas_descartadas': _descartadas(filas_entrada, filas_salida), **extra}
+    _guardar(registro)
+
+
+def _descartadas(filas_entrada, filas_salida):
+    # Un paso que agrega filas (p. ej. una carga) no descarta ninguna
+    if filas_entrada is None or filas_salida is None:
+        return None
+    return max(filas_entrada - filas_salida, 0)
+
+
+def _guardar(registro: dict):
+    _ESTADO.registros.append(registro)
+    if _ESTADO.ruta_jsonl:
+        with open(_ESTADO.ruta_jsonl, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(registro, ensure_ascii=False, default=str) + '\n')
+
+
+class Medicion:
+    def __init__(self, paso: str, filas_entrada: int = None, **extra):
+        """
+        Paso en medición: tiempo, CPU, pico de memoria y filas de entrada y salida. Se usa con `medir`.
+        """
+        self.paso = paso
+        self.filas_entrada = filas_entrada
+        self.filas_salida = None
+        self.extra = extra
+        self.mensajes = []
+
+    def __enter__(self):
+        self.activa = _ESTADO.activa
+        if not self.activa:
+            return self
+        self.pico_interno = 0.0
+        if _ESTADO.memoria:
+            # El pico acumulado hasta aquí pertenece al paso que contiene a este
+            if _ESTADO.pila:
+                _ESTADO.pila[-1].pico_interno = max(_ESTADO.pila[-1].pico_interno, pico_rss_mb() or 0.0)
+            reiniciar_pico()
+        self.nivel = len(_ESTADO.pila)
+        _ESTADO.pila.append(self)
+        self.inicio_fecha = datetime.now()
+        self.inicio = time.perf_counter()
+        self.inicio_cpu = time.process_time()
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        if not self.activa:
+            return False
+        segundos = time.perf_counter() - self.inicio
+        cpu = time.process_time() - self.inicio_cpu
+        pico = max(pico_rss_mb() or 0.0, self.pico_interno) if _ESTADO.memoria else None
+        if _ESTADO.pila and _ESTADO.pila[-1] is self:
+            _ESTADO.pila.pop()
+        if pico is not None and _ESTADO.pila:
+            _ESTADO.pila[-1].pico_interno = max(_ESTADO.pila[-1].pico_interno, pico)
+
+        registro = {'paso': self.paso, 'nivel': self.nivel, 'inicio': self.inicio_fecha.isoformat(timespec='milliseconds'),
+                    'segundos': segundos, 'cpu_segundos': cpu, 'pico_rss_mb': pico,
+                    'filas_entrada': self.filas_entrada, 'filas_salida': self.filas_salida,
+                    'filas_descartadas': _descartadas(self.filas_entrada, self.filas_salida), **self.extra}
+        if self.mensajes:
+            registro['mensajes'] = self.mensajes
+        if tipo is not None:
+            registro['error'] = repr(valor)
+        _guardar(registro)
+        return False
+
+
+def medir(paso: str, filas_entrada: int = None, **extra):
+    """
+    Mide un bloque de código como un paso: tiempo, CPU, pico de memoria y filas de entrada y salida.
+
+        with medir('DataMerger.deduplicar_defunciones', filas_entrada=len(df)) as m:
+            ...
+            m.filas_salida = len(resultado)
+
+    Con la instrumentación desactivada solo se comprueba una bandera. Los pasos pueden anidarse; el
+    pico de memoria de un paso incluye el de los pasos internos.
+    """
+    return Medicion(paso, filas_entrada, **extra)
+
+
+def _contar_filas(objeto, atributo: str):
+    datos = getattr(objeto, atributo, None)
+    return len(datos) if datos is not None else None
+
+
+def instrumentar(paso: str = None, filas: str = None):
+    """
+    Decorador que mide un método como un paso (ver `medir`). `filas` es el atributo con el DataFrame
+    del objeto (p. ej. 'data'); sus filas antes y después de la llamada son las filas de entrada y salida.
+    Con la instrumentación desactivada se llama al método directamente.
+    """
+    def decorador(funcion):
+        nombre = paso or funcion.__qualname__
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if not _ESTADO.activa:
+                return funcion(*args, **kwargs)
+            objeto = args[0] if args else None
+            with medir(nombre, _contar_filas(objeto, filas) if filas else None) as medicion:
+                resultado = funcion(*args, **kwargs)
+                if filas:
+                    medicion.filas_salida = _contar_filas(objeto, filas)
+            return resultado
+        return envoltura
+    return decorador
+
+
+def resumen():
+    """
+    Tabla con los registros de la ejecución, en el orden en que terminaron los pasos.
+    """
+    columnas = ['paso', 'nivel', 'segundos', 'cpu_segundos', 'pico_rss_mb', 'filas_entrada', 'filas_salida',
+                'filas_descartadas']
+    return pd.DataFrame(_ESTADO.registros).reindex(columns=columnas)
+
+
+def imprimir_resumen():
+    """
+    Imprime la tabla resumen de los pasos medidos, con los pasos internos sangrados.
+    """
+    tabla = resumen()
+    if tabla.empty:
+        print("No hay pasos instrumentados.")
+        return
+    tabla['paso'] = ['  ' * int(nivel) + paso for paso, nivel in zip(tabla['paso'], tabla['nivel'])]
+    print(tabla.drop(columns='nivel').to_string(index=False, float_format=lambda x: f'{x:.3f}'))
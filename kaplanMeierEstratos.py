@@ -0,0 +1,305 @@
+import numpy as np
+import pandas as pd
+from statistics import NormalDist
+
+COLUMNAS_CURVA = ['tiempo', 'en_riesgo', 'eventos', 'censurados', 'sobrevida',
+                  'varianza_greenwood', 'ic_inferior', 'ic_superior']
+
+
+def _cumsum_agrupada(valores, inicio_estrato, id_estrato):
+    """
+    Suma acumulada que se reinicia al comienzo de cada estrato (arreglo ordenado por estrato).
+    """
+    acumulado = np.cumsum(valores)
+    previo = (acumulado - valores)[inicio_estrato]
+    return acumulado - previo[id_estrato]
+
+
+def kaplan_meier_agrupado(codigos, tiempos, eventos, alpha: float = 0.05):
+    """
+    Calcula Kaplan-Meier para todos los estratos a la vez.
+
+    Recibe arreglos con el código de estrato (entero), el tiempo y el indicador de evento de cada
+    paciente. Ordena una sola vez por (estrato, tiempo) y obtiene en riesgo, eventos, sobrevida,
+    varianza de Greenwood e intervalo de confianza (Greenwood exponencial, como lifelines) con
+    sumas acumuladas por estrato. Devuelve un diccionario de arreglos alineados, con una fila por
+    (estrato, tiempo distinto) y una fila inicial en t=0 por estrato.
+    """
+    codigos = np.asarray(codigos, dtype=np.int64)
+    tiempos = np.asarray(tiempos, dtype=np.float64)
+    eventos = np.asarray(eventos, dtype=np.int64)
+
+    orden = np.lexsort((tiempos, codigos))
+    c = codigos[orden]
+    t = tiempos[orden]
+    e = eventos[orden]
+
+    # Inicio de cada par (estrato, tiempo) distinto
+    nuevo = np.ones(len(c), dtype=bool)
+    nuevo[1:] = (c[1:] != c[:-1]) | (t[1:] != t[:-1])
+    inicios = np.flatnonzero(nuevo)
+    estrato = c[inicios]
+    tiempo = t[inicios]
+    salidas = np.diff(np.append(inicios, len(c)))
+    muertes = np.add.reduceat(e, inicios) if len(inicios) else np.zeros(0, dtype=np.int64)
+    return kaplan_meier_desde_conteos(estrato, tiempo, salidas, muertes, alpha)
+
+
+def kaplan_meier_desde_conteos(estrato, tiempo, salidas, muertes, alpha: float = 0.05):
+    """
+    Calcula Kaplan-Meier para todos los estratos a partir de conteos ya agregados: una fila por
+    (estrato, tiempo distinto), ordenadas por estrato y tiempo, con las salidas (muertes más
+    censurados) y las muertes en ese tiempo. Devuelve lo mismo que `kaplan_meier_agrupado`.
+    """
+    estrato = np.asarray(estrato, dtype=np.int64)
+    tiempo = np.asarray(tiempo, dtype=np.float64)
+    salidas = np.asarray(salidas, dtype=np.int64)
+    muertes = np.asarray(muertes, dtype=np.int64)
+
+    # Inicio de cada estrato dentro de las filas (estrato, tiempo)
+    nuevo_estrato = np.ones(len(estrato), dtype=bool)
+    nuevo_estrato[1:] = estrato[1:] != estrato[:-1]
+    inicio_estrato = np.flatnonzero(nuevo_estrato)
+    id_estrato = np.cumsum(nuevo_estrato) - 1
+
+    # En riesgo = total del estrato menos los que salieron en tiempos anteriores
+    total_estrato = np.add.reduceat(salidas, inicio_estrato) if len(inicio_estrato) else salidas
+    en_riesgo = total_estrato[id_estrato] - (_cumsum_agrupada(salidas, inicio_estrato, id_estrato) - salidas)
+
+    # Producto acumulado de (1 - d/n) como suma de logaritmos; un factor 0 deja la curva en 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sin_sobrevivientes = en_riesgo == muertes
+        log_factor = np.where(sin_sobrevivientes, 0.0, np.log(en_riesgo - muertes) - np.log(en_riesgo))
+        log_sobrevida = _cumsum_agrupada(log_factor, inicio_estrato, id_estrato)
+        anulada = _cumsum_agrupada(sin_sobrevivientes.astype(np.int64), inicio_estrato, id_estrato) > 0
+        sobrevida = np.where(anulada, 0.0, np.exp(log_sobrevida))
+
+        termino = np.where(sin_sobrevivientes, 0.0, muertes / (en_riesgo * (en_riesgo - muertes).astype(np.float64)))
+        varianza = _cumsum_agrupada(termino, inicio_estrato, id_estrato)
+
+    # Fila en t=0 para los estratos cuyo primer tiempo es posterior a 0 (igual que lifelines)
+    agregar = tiempo[inicio_estrato] > 0
+    posiciones = inicio_estrato[agregar]
+    estrato = np.insert(estrato, posiciones, estrato[posiciones])
+    tiempo = np.insert(tiempo, posiciones, 0.0)
+    en_riesgo = np.insert(en_riesgo, posiciones, total_estrato[agregar])
+    muertes = np.insert(muertes, posiciones, 0)
+    salidas = np.insert(salidas, posiciones, 0)
+    sobrevida = np.insert(sobrevida, posiciones, 1.0)
+    varianza = np.insert(varianza, posiciones, 0.0)
+
+    ic_inferior, ic_superior = intervalo_greenwood_exponencial(sobrevida, varianza, alpha)
+
+    return {
+        'estrato': estrato,
+        'tiempo': tiempo,
+        'en_riesgo': en_riesgo,
+        'eventos': muertes,
+        'censurados': salidas - muertes,
+        'sobrevida': sobrevida,
+        'varianza_greenwood': varianza,
+        'ic_inferior': ic_inferior,
+        'ic_superior': ic_superior,
+    }
+
+
+def intervalo_greenwood_exponencial(sobrevida, varianza, alpha: float = 0.05):
+    """
+    Intervalo de confianza log(-log) de Greenwood, con la misma convención de lifelines
+    (1.0 donde el intervalo no está definido).
+    """
+    z = NormalDist().inv_cdf(1 - alpha / 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        v = np.log(sobrevida)
+        inferior = np.exp(-np.exp(np.log(-v) - z * np.sqrt(varianza) / v))
+        superior = np.exp(-np.exp(np.log(-v) + z * np.sqrt(varianza) / v))
+    return np.nan_to_num(inferior, nan=1.0), np.nan_to_num(superior, nan=1.0)
+
+
+def kaplan_meier_por_estrato(df: pd.DataFrame, columnas_estrato: list, duracion: str = 'tiempo_sobrevida_anios',
+                             evento: str = 'evento', alpha: float = 0.05):
+    """
+    Calcula las curvas de Kaplan-Meier de todos los estratos definidos por `columnas_estrato`
+    en una sola pasada. Con una lista vacía calcula una única curva para todo el DataFrame.
+
+    Devuelve una tabla larga con las columnas de estrato seguidas de COLUMNAS_CURVA.
+    """
+    valido = df[duracion].notna().to_numpy()
+    if columnas_estrato:
+        codigos = df.groupby(columnas_estrato, observed=True, sort=True).ngroup().to_numpy()
+        valido &= codigos >= 0
+    else:
+        codigos = np.zeros(len(df), dtype=np.int64)
+
+    posiciones = np.flatnonzero(valido)
+    if len(posiciones) == 0:
+        return pd.DataFrame(columns=list(columnas_estrato) + COLUMNAS_CURVA)
+
+    resultado = kaplan_meier_agrupado(codigos[posiciones], df[duracion].to_numpy()[posiciones],
+                                      df[evento].to_numpy()[posiciones], alpha)
+
+    curvas = pd.DataFrame({columna: resultado[columna] for columna in COLUMNAS_CURVA})
+    if columnas_estrato:
+        # Etiquetas del estrato tomadas de la primera fila de cada código
+        codigos_validos = codigos[posiciones]
+        codigos_unicos, primera = np.unique(codigos_validos, return_index=True)
+        etiquetas = df[columnas_estrato].iloc[posiciones[primera]].reset_index(drop=True)
+        indice = np.searchsorted(codigos_unicos, resultado['estrato'])
+        etiquetas = etiquetas.iloc[indice].reset_index(drop=True)
+        curvas = pd.concat([etiquetas, curvas], axis=1)
+    return curvas
+
+
+def tabla_en_riesgo(curva: pd.DataFrame, tiempos):
+    """
+    Tabla de pacientes en riesgo de una curva de Kaplan-Meier (como add_at_risk_counts de lifelines): en
+    cada tiempo pedido, los pacientes aún en observación (tiempo >= t) y las muertes y censuras
+    acumuladas hasta t inclusive.
+    """
+    tiempos = np.asarray(tiempos, dtype=np.float64)
+    tiempo = curva['tiempo'].to_numpy(dtype=np.float64)
+    if len(tiempo) == 0:
+        ceros = np.zeros(len(tiempos), dtype=np.int64)
+        return pd.DataFrame({'tiempo': tiempos, 'en_riesgo': ceros, 'censurados': ceros, 'eventos': ceros})
+
+    siguiente = np.searchsorted(tiempo, tiempos, side='left')
+    en_riesgo_curva = curva['en_riesgo'].to_numpy()
+    en_riesgo = np.where(siguiente < len(tiempo), en_riesgo_curva[np.minimum(siguiente, len(tiempo) - 1)], 0)
+    anterior = np.searchsorted(tiempo, tiempos, side='right') - 1
+    acumulados = {}
+    for columna in ['censurados', 'eventos']:
+        suma = np.cumsum(curva[columna].to_numpy(dtype=np.int64))
+        acumulados[columna] = np.where(anterior >= 0, suma[np.maximum(anterior, 0)], 0)
+    return pd.DataFrame({'tiempo': tiempos, 'en_riesgo': en_riesgo.astype(np.int64), **acumulados})
+
+
+def incidencia_acumulada_agrupada(codigos, tiempos, causas, causas_interes=(1, 2)):
+    """
+    Calcula la incidencia acumulada de Aalen-Johansen de cada causa para todos los estratos a la vez.
+
+    `causas` tiene 0 para los censurados y el código de la causa para las muertes (una muerte con
+    una causa fuera de `causas_interes` cuenta para la sobrevida global pero no para ninguna
+    incidencia). Igual que en `kaplan_meier_agrupado`, se ordena una sola vez por (estrato, tiempo) y
+    todo se obtiene con sumas acumuladas por estrato: F_c(t) = suma de S(t-) * d_c / n, donde S es
+    la sobrevida global (todas las causas). Devuelve un diccionario de arreglos alineados, con una
+    fila por (estrato, tiempo distinto) y una fila inicial en t=0 por estrato.
+    """
+    codigos = np.asarray(codigos, dtype=np.int64)
+    tiempos = np.asarray(tiempos, dtype=np.float64)
+    causas = np.asarray(causas, dtype=np.int64)
+
+    orden = np.lexsort((tiempos, codigos))
+    c = codigos[orden]
+    t = tiempos[orden]
+    causa = causas[orden]
+
+    nuevo = np.ones(len(c), dtype=bool)
+    nuevo[1:] = (c[1:] != c[:-1]) | (t[1:] != t[:-1])
+    inicios = np.flatnonzero(nuevo)
+    estrato = c[inicios]
+    tiempo = t[inicios]
+    salidas = np.diff(np.append(inicios, len(c)))
+    muertes = np.add.reduceat((causa > 0).astype(np.int64), inicios) if len(inicios) else np.zeros(0, dtype=np.int64)
+
+    nuevo_estrato = np.ones(len(estrato), dtype=bool)
+    nuevo_estrato[1:] = estrato[1:] != estrato[:-1]
+    inicio_estrato = np.flatnonzero(nuevo_estrato)
+    id_estrato = np.cumsum(nuevo_estrato) - 1
+
+    total_estrato = np.add.reduceat(salidas, inicio_estrato) if len(inicio_estrato) else salidas
+    en_riesgo = total_estrato[id_estrato] - (_cumsum_agrupada(salidas, inicio_estrato, id_estrato) - salidas)
+
+    # Sobrevida global justo antes de cada tiempo, S(t-), como suma de logaritmos de los factores previos
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sin_sobrevivientes = en_riesgo == muertes
+        log_factor = np.where(sin_sobrevivientes, 0.0, np.log(en_riesgo - muertes) - np.log(en_riesgo))
+        log_previa = _cumsum_agrupada(log_factor, inicio_estrato, id_estrato) - log_factor
+        anulada_previa = (_cumsum_agrupada(sin_sobrevivientes.astype(np.int64), inicio_estrato, id_estrato)
+                          - sin_sobrevivientes) > 0
+        sobrevida_previa = np.where(anulada_previa, 0.0, np.exp(log_previa))
+        sobrevida = np.where(sin_sobrevivientes | anulada_previa, 0.0, np.exp(log_previa + log_factor))
+
+    incidencias = {}
+    for causa_interes in causas_interes:
+        muertes_causa = np.add.reduceat((causa == causa_interes).astype(np.int64), inicios) if len(inicios) \
+            else np.zeros(0, dtype=np.int64)
+        incremento = sobrevida_previa * muertes_causa / en_riesgo
+        incidencias[f'incidencia_causa_{causa_interes}'] = _cumsum_agrupada(incremento, inicio_estrato, id_estrato)
+
+    # Fila en t=0 para los estratos cuyo primer tiempo es posterior a 0
+    agregar = tiempo[inicio_estrato] > 0
+    posiciones = inicio_estrato[agregar]
+    resultado = {
+        'estrato': np.insert(estrato, posiciones, estrato[posiciones]),
+        'tiempo': np.insert(tiempo, posiciones, 0.0),
+        'en_riesgo': np.insert(en_riesgo, posiciones, total_estrato[agregar]),
+        'eventos': np.insert(muertes, posiciones, 0),
+        'censurados': np.insert(salidas - muertes, posiciones, 0),
+        'sobrevida': np.insert(sobrevida, posiciones, 1.0),
+    }
+    for columna, valores in incidencias.items():
+        resultado[columna] = np.insert(valores, posiciones, 0.0)
+    return resultado
+
+
+def codificar_causas(df: pd.DataFrame, evento: str = 'evento', columna_causa: str = 'CAUSA'):
+    """
+    Código de causa de cada paciente para riesgos competitivos: 0 si está censurado y CAUSA
+    (1 = cáncer, 2 = otra causa) si murió. Una muerte sin causa registrada queda como -1.
+    """
+    murio = df[evento].to_numpy() == 1
+    causa = pd.to_numeric(df[columna_causa], errors='coerce').to_numpy(dtype=np.float64)
+    return np.where(murio, np.where(np.isnan(causa), -1, causa), 0).astype(np.int64)
+
+
+def incidencia_acumulada_por_estrato(df: pd.DataFrame, columnas_estrato: list, causas_interes=(1, 2),
+                                     duracion: str = 'tiempo_sobrevida_anios', evento: str = 'evento',
+                                     columna_causa: str = 'CAUSA'):
+    """
+    Calcula las curvas de incidencia acumulada (Aalen-Johansen) por causa de muerte de todos los
+    estratos definidos por `columnas_estrato` en una sola pasada, a partir de VM (evento) y CAUSA.
+
+    Devuelve una tabla larga con las columnas de estrato, el tiempo, los conteos, la sobrevida global
+    y una columna 'incidencia_causa_<c>' por cada causa de interés.
+    """
+    columnas = ['tiempo', 'en_riesgo', 'eventos', 'censurados', 'sobrevida'] + \
+        [f'incidencia_causa_{c}' for c in causas_interes]
+    valido = df[duracion].notna().to_numpy()
+    if columnas_estrato:
+        codigos = df.groupby(columnas_estrato, observed=True, sort=True).ngroup().to_numpy()
+        valido &= codigos >= 0
+    else:
+        codigos = np.zeros(len(df), dtype=np.int64)
+
+    posiciones = np.flatnonzero(valido)
+    if len(posiciones) == 0:
+        return pd.DataFrame(columns=list(columnas_estrato) + columnas)
+
+    causas = codificar_causas(df, evento, columna_causa)
+    resultado = incidencia_acumulada_agrupada(codigos[posiciones], df[duracion].to_numpy()[posiciones],
+                                              causas[posiciones], causas_interes)
+
+    curvas = pd.DataFrame({columna: resultado[columna] for columna in columnas})
+    if columnas_estrato:
+        # Etiquetas del estrato tomadas de la primera fila de cada código
+        codigos_unicos, primera = np.unique(codigos[posiciones], return_index=True)
+        etiquetas = df[columnas_estrato].iloc[posiciones[primera]].reset_index(drop=True)
+        indice = np.searchsorted(codigos_unicos, resultado['estrato'])
+        etiquetas = etiquetas.iloc[indice].reset_index(drop=True)
+        curvas = pd.concat([etiquetas, curvas], axis=1)
+    return curvas
+
+
+def graficar_curva(curva: pd.DataFrame, label: str, ax=None):
+    """
+    Grafica una curva de la tabla de Kaplan-Meier (escalones e intervalo de confianza sombreado),
+    con el mismo estilo que KaplanMeierFitter.plot.
+    """
+    import matplotlib.pyplot as plt
+
+    if ax is None:
+        ax = plt.gca()
+    linea, = ax.plot(curva['tiempo'], curva['sobrevida'], drawstyle='steps-post', label=label)
+    ax.fill_between(curva['tiempo'], curva['ic_inferior'], curva['ic_superior'], step='post',
+                    alpha=0.3, color=linea.get_color(), linewidth=0)
+    return ax
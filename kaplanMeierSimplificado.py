@@ -1,165 +1,293 @@
 import pandas as pd
-from lifelines import KaplanMeierFitter
-import matplotlib.pyplot as plt
 import os
 
-# Diccionario que agrupa los tumores según los códigos CIEO (sin la letra 'C')
-tumor_grupos = {
-    "Tráquea, bronquio pulmón": ['33.9', '340', '341', '342', '343', '348', '349'],
-    "Próstata": ['619'],
-    "Estómago": ['160', '161', '162', '163', '164', '165', '166', '168', '169'],
-    "Colon": ['180', '181', '182', '183', '184', '185', '186', '187', '188', '189'],
-    "Recto": ['209'],
-    "Mama": ['500', '501', '502', '503', '504', '505', '506', '508', '509'],
-    "Vesícula biliar": ['239'],
-    "Cuello uterino": ['530', '531', '538', '539'],
-    "Hígado": ['220', '221', '222', '223', '224', '227', '229']
-}
+from almacenResultados import AlmacenResultados
+from cohortLoader import cargar_cohorte
+from dateUtils import edad_cumplida
+from figureRenderer import nueva_figura, serie_curva, renderizar_figuras
+from instrumentacion import informar
+from kaplanMeierEstratos import kaplan_meier_por_estrato, incidencia_acumulada_por_estrato
+from pruebasLogRank import PONDERACIONES, pruebas_por_unidad
+from tumorGroups import TUMOR_GRUPOS, TablaTopografia
 
 # Ruta para cargar los datos y guardar las imágenes
 ruta_datos = 'data/datos_ajustados.xlsx'
 ruta_imagenes = 'data/images/'
 
-# Crear el directorio para guardar las imágenes si no existe
-os.makedirs(ruta_imagenes, exist_ok=True)
+# Directorio de las curvas ya calculadas, reutilizadas mientras no cambien los datos de su estrato
+ruta_resultados = 'data/.cache/resultados'
 
-# Cargar el archivo de datos ajustados
-df = pd.read_excel(ruta_datos, dtype={'RUT': str})
+# Filtrar para las comunas específicas que quieres analizar
+comunas_seleccionadas = ['2201']
+
+
+# ============================
+# Preparación de los datos
+# ============================
+
+def preparar_datos(ruta_datos):
+    """
+    Carga la cohorte y prepara las variables de sobrevida (tiempo en años y evento).
+    """
+    # Cargar los datos ajustados (las fechas ya vienen como datetime desde el cargador de la cohorte)
+    return preparar_cohorte(cargar_cohorte(ruta_datos))
 
-# Convertir las fechas a formato datetime
-df['FECDIAG'] = pd.to_datetime(df['FECDIAG'], errors='coerce')
-df['FECCON'] = pd.to_datetime(df['FECCON'], errors='coerce')
-df['FECNAC'] = pd.to_datetime(df['FECNAC'], errors='coerce')
 
-# Calcular la edad al momento del diagnóstico
-df['edad_diagnostico'] = (df['FECDIAG'] - df['FECNAC']).dt.days // 365.25
+def preparar_cohorte(df):
+    """
+    Prepara las variables de sobrevida de una cohorte ya cargada: edad, tiempo en años y evento.
+    """
+    df = df.copy()
 
-# Filtrar los datos para pacientes mayores de 14 años
-df = df[df['edad_diagnostico'] >= 15]
+    # Calcular la edad al momento del diagnóstico (años cumplidos)
+    df['edad_diagnostico'] = edad_cumplida(df['FECNAC'], df['FECDIAG'])
 
-# Calcular el tiempo de sobrevida en años
-df['tiempo_sobrevida_anios'] = (df['FECCON'] - df['FECDIAG']).dt.days / 365.25
+    # Filtrar los datos para pacientes mayores de 14 años
+    df = df[df['edad_diagnostico'] >= 15]
 
-# Filtrar los datos que sean válidos para el análisis (sin valores NaN)
-df = df.dropna(subset=['tiempo_sobrevida_anios'])
+    # Calcular el tiempo de sobrevida en años
+    df['tiempo_sobrevida_anios'] = (df['FECCON'] - df['FECDIAG']).dt.days / 365.25
 
-# Crear la columna 'evento' basado en el estado vital
-df['evento'] = df['VM'].apply(lambda x: 1 if x == 2 else 0)
+    # Filtrar los datos que sean válidos para el análisis (sin valores NaN)
+    df = df.dropna(subset=['tiempo_sobrevida_anios'])
 
-# Filtrar para las comunas específicas que quieres analizar
-comunas_seleccionadas = ['2201']
+    # Crear la columna 'evento' basado en el estado vital (VM puede ser Int8 con faltantes: no es evento)
+    df['evento'] = (df['VM'] == 2).fillna(False).astype(int)
+
+    # Conservar solo los casos de los grupos de tumor analizados (TUMOR_GRUPO se asigna al cargar la cohorte)
+    return TablaTopografia().seleccionar(df, list(TUMOR_GRUPOS))
 
 
 # ============================
-# Funciones de Análisis
+# Cálculo de las curvas
 # ============================
 
-def calcular_sobrevida_global(df, tumor_nombre, cieo_codigos):
+def _por_estrato(funcion, df, columnas_estrato, columnas_datos, almacen):
     """
-    Calcula la sobrevida global sin estratificación.
+    Calcula `funcion` por estrato, reutilizando los estratos guardados en `almacen` si se indica.
     """
-    kmf = KaplanMeierFitter()
+    if almacen is None:
+        return funcion(df, columnas_estrato)
+    return almacen.por_estrato(funcion, df, columnas_estrato, columnas_datos)
 
-    df_tumor = df[df['TOP'].astype(str).isin(cieo_codigos)]
-    if df_tumor.empty:
-        return
 
-    kmf.fit(durations=df_tumor['tiempo_sobrevida_anios'], event_observed=df_tumor['evento'], label=f'{tumor_nombre}')
-    plt.figure(figsize=(10, 6))
-    kmf.plot()
-    plt.title(f'Sobrevida Global - {tumor_nombre}')
-    plt.xlabel('Tiempo (años)')
-    plt.ylabel('Probabilidad de sobrevida')
-    plt.grid(True)
-    plt.savefig(f'{ruta_imagenes}global_{tumor_nombre}.png')
-    plt.close()
+def calcular_curvas(df, comunas_seleccionadas=None, almacen: AlmacenResultados = None):
+    """
+    Calcula en una sola pasada por estratificación las curvas de todos los grupos de tumor:
+    global, por comuna, por sexo y por comuna y sexo.
+
+    Sin `comunas_seleccionadas` se calculan las curvas de todas las comunas; como cada estrato se
+    estima por separado, las figuras pueden elegir después cualquier subconjunto de comunas.
+    Con un `almacen` solo se estiman los estratos cuyos datos no tienen ya una curva guardada.
+    """
+    df_comunas = df
+    if comunas_seleccionadas is not None:
+        df_comunas = df[df['REGCOM'].astype(str).isin(comunas_seleccionadas)]
+    columnas_datos = ['tiempo_sobrevida_anios', 'evento']
+    return {
+        'global': _por_estrato(kaplan_meier_por_estrato, df, ['TUMOR_GRUPO'], columnas_datos, almacen),
+        'comuna': _por_estrato(kaplan_meier_por_estrato, df_comunas, ['TUMOR_GRUPO', 'REGCOM'], columnas_datos,
+                               almacen),
+        'sexo': _por_estrato(kaplan_meier_por_estrato, df, ['TUMOR_GRUPO', 'SEXO'], columnas_datos, almacen),
+        'comuna_sexo': _por_estrato(kaplan_meier_por_estrato, df_comunas, ['TUMOR_GRUPO', 'REGCOM', 'SEXO'],
+                                    columnas_datos, almacen),
+    }
+
+
+def calcular_incidencias(df, comunas_seleccionadas=None, almacen: AlmacenResultados = None):
+    """
+    Calcula la incidencia acumulada por causa de muerte (Aalen-Johansen, 1 = cáncer, 2 = otra causa)
+    con las mismas estratificaciones que las curvas de Kaplan-Meier.
+    """
+    df_comunas = df
+    if comunas_seleccionadas is not None:
+        df_comunas = df[df['REGCOM'].astype(str).isin(comunas_seleccionadas)]
+    columnas_datos = ['tiempo_sobrevida_anios', 'evento', 'CAUSA']
+    return {
+        'global': _por_estrato(incidencia_acumulada_por_estrato, df, ['TUMOR_GRUPO'], columnas_datos, almacen),
+        'comuna': _por_estrato(incidencia_acumulada_por_estrato, df_comunas, ['TUMOR_GRUPO', 'REGCOM'],
+                               columnas_datos, almacen),
+        'sexo': _por_estrato(incidencia_acumulada_por_estrato, df, ['TUMOR_GRUPO', 'SEXO'], columnas_datos,
+                             almacen),
+        'comuna_sexo': _por_estrato(incidencia_acumulada_por_estrato, df_comunas, ['TUMOR_GRUPO', 'REGCOM', 'SEXO'],
+                                    columnas_datos, almacen),
+    }
+
+
+def calcular_pruebas(df, comunas_seleccionadas, ponderaciones=PONDERACIONES):
+    """
+    Prueba si difieren las curvas que se comparan en las figuras (log-rank, Wilcoxon y Tarone-Ware; con
+    PRUEBA_GRAY en `ponderaciones`, también Gray para la incidencia acumulada de muerte por cáncer, que
+    requiere CAUSA), por grupo de tumor: entre comunas, entre sexos, entre comuna y sexo, y entre comunas
+    estratificando por sexo. Devuelve el resumen de las pruebas y los observados/esperados por grupo.
+    """
+    df_comunas = df[df['REGCOM'].astype(str).isin(comunas_seleccionadas)]
+    comparaciones = {
+        'comuna': (df_comunas, ['REGCOM'], None),
+        'sexo': (df, ['SEXO'], None),
+        'comuna_sexo': (df_comunas, ['REGCOM', 'SEXO'], None),
+        'comuna_ajustada_por_sexo': (df_comunas, ['REGCOM'], ['SEXO']),
+    }
+
+    resumenes, detalles = [], []
+    for nombre, (datos, columnas_grupo, columnas_ajuste) in comparaciones.items():
+        resumen, detalle = pruebas_por_unidad(datos, columnas_grupo, columnas_ajuste=columnas_ajuste,
+                                              ponderaciones=ponderaciones)
+        resumen.insert(0, 'comparacion', nombre)
+        detalle.insert(0, 'comparacion', nombre)
+        resumenes.append(resumen)
+        detalles.append(detalle)
+    return _unir(resumenes), _unir(detalles)
+
+
+def _unir(tablas):
+    """
+    Concatena las tablas no vacías; si todas lo están, devuelve la primera (vacía, con sus columnas).
+    """
+    con_filas = [tabla for tabla in tablas if len(tabla)]
+    return pd.concat(con_filas, ignore_index=True) if con_filas else tablas[0]
 
 
-def calcular_sobrevida_por_comuna(df, tumor_nombre, cieo_codigos, comunas_seleccionadas):
+def exportar_pruebas(resumen, detalle, directorio=ruta_imagenes):
     """
-    Calcula la sobrevida por comunas sin estratificación.
+    Guarda las tablas de las pruebas junto a las imágenes y devuelve las rutas de los archivos.
     """
-    kmf = KaplanMeierFitter()
+    os.makedirs(directorio, exist_ok=True)
+    rutas = [f'{directorio}pruebas_logrank.csv', f'{directorio}pruebas_logrank_grupos.csv']
+    resumen.to_csv(rutas[0], index=False)
+    detalle.to_csv(rutas[1], index=False)
+    informar(f"Resultados de las pruebas exportados a {rutas[0]}")
+    return rutas
 
-    plt.figure(figsize=(10, 6))
+
+# ============================
+# Funciones de Análisis
+# ============================
+
+def calcular_sobrevida_global(curvas, tumor_nombre, directorio=ruta_imagenes):
+    """
+    Prepara la figura de sobrevida global sin estratificación.
+    """
+    curva = curvas[curvas['TUMOR_GRUPO'] == tumor_nombre]
+    if curva.empty:
+        return None
+
+    figura = nueva_figura(f'{directorio}global_{tumor_nombre}.png', f'Sobrevida Global - {tumor_nombre}')
+    figura['series'].append(serie_curva(curva, label=f'{tumor_nombre}'))
+    return figura
+
+
+def calcular_sobrevida_por_comuna(curvas, tumor_nombre, comunas_seleccionadas, directorio=ruta_imagenes):
+    """
+    Prepara la figura de sobrevida por comunas sin estratificación.
+    """
+    curvas_tumor = curvas[curvas['TUMOR_GRUPO'] == tumor_nombre]
+
+    figura = nueva_figura(f'{directorio}comuna_{tumor_nombre}.png', f'Sobrevida por Comuna - {tumor_nombre}',
+                          titulo_leyenda='Comuna')
     for comuna in comunas_seleccionadas:
-        df_comuna = df[(df['TOP'].astype(str).isin(cieo_codigos)) & (df['REGCOM'].astype(str) == comuna)]
-        if df_comuna.empty:
+        curva = curvas_tumor[curvas_tumor['REGCOM'].astype(str) == comuna]
+        if curva.empty:
             continue
 
-        kmf.fit(durations=df_comuna['tiempo_sobrevida_anios'], event_observed=df_comuna['evento'],
-                label=f'Comuna {comuna}')
-        kmf.plot()
+        figura['series'].append(serie_curva(curva, label=f'Comuna {comuna}'))
+    return figura
 
-    plt.title(f'Sobrevida por Comuna - {tumor_nombre}')
-    plt.xlabel('Tiempo (años)')
-    plt.ylabel('Probabilidad de sobrevida')
-    plt.grid(True)
-    plt.legend(title='Comuna')
-    plt.savefig(f'{ruta_imagenes}comuna_{tumor_nombre}.png')
-    plt.close()
 
-
-def calcular_sobrevida_por_sexo(df, tumor_nombre, cieo_codigos):
+def calcular_sobrevida_por_sexo(curvas, tumor_nombre, directorio=ruta_imagenes):
     """
-    Calcula la sobrevida global estratificada por sexo.
+    Prepara la figura de sobrevida global estratificada por sexo.
     """
-    kmf = KaplanMeierFitter()
     sexos = {1: "Masculino", 2: "Femenino"}
+    curvas_tumor = curvas[curvas['TUMOR_GRUPO'] == tumor_nombre]
 
-    plt.figure(figsize=(10, 6))
+    figura = nueva_figura(f'{directorio}sexo_global_{tumor_nombre}.png',
+                          f'Sobrevida Global por Sexo - {tumor_nombre}', titulo_leyenda='Sexo')
     for sexo, label in sexos.items():
-        df_sexo = df[(df['TOP'].astype(str).isin(cieo_codigos)) & (df['SEXO'] == sexo)]
-        if df_sexo.empty:
+        curva = curvas_tumor[curvas_tumor['SEXO'] == sexo]
+        if curva.empty:
             continue
 
-        kmf.fit(durations=df_sexo['tiempo_sobrevida_anios'], event_observed=df_sexo['evento'], label=label)
-        kmf.plot()
-
-    plt.title(f'Sobrevida Global por Sexo - {tumor_nombre}')
-    plt.xlabel('Tiempo (años)')
-    plt.ylabel('Probabilidad de sobrevida')
-    plt.grid(True)
-    plt.legend(title='Sexo')
-    plt.savefig(f'{ruta_imagenes}sexo_global_{tumor_nombre}.png')
-    plt.close()
+        figura['series'].append(serie_curva(curva, label=label))
+    return figura
 
 
-def calcular_sobrevida_por_comuna_y_sexo(df, tumor_nombre, cieo_codigos, comunas_seleccionadas):
+def calcular_sobrevida_por_comuna_y_sexo(curvas, tumor_nombre, comunas_seleccionadas, directorio=ruta_imagenes):
     """
-    Calcula la sobrevida por comuna y sexo.
+    Prepara la figura de sobrevida por comuna y sexo.
     """
-    kmf = KaplanMeierFitter()
     sexos = {1: "Masculino", 2: "Femenino"}
+    curvas_tumor = curvas[curvas['TUMOR_GRUPO'] == tumor_nombre]
 
-    plt.figure(figsize=(10, 6))
+    figura = nueva_figura(f'{directorio}comuna_sexo_{tumor_nombre}.png',
+                          f'Sobrevida por Comuna y Sexo - {tumor_nombre}', titulo_leyenda='Comuna y Sexo')
     for comuna in comunas_seleccionadas:
         for sexo, label in sexos.items():
-            df_comuna_sexo = df[(df['TOP'].astype(str).isin(cieo_codigos)) &
-                                (df['REGCOM'].astype(str) == comuna) &
-                                (df['SEXO'] == sexo)]
-            if df_comuna_sexo.empty:
+            curva = curvas_tumor[(curvas_tumor['REGCOM'].astype(str) == comuna) &
+                                 (curvas_tumor['SEXO'] == sexo)]
+            if curva.empty:
                 continue
 
-            kmf.fit(durations=df_comuna_sexo['tiempo_sobrevida_anios'], event_observed=df_comuna_sexo['evento'],
-                    label=f'Comuna {comuna} - {label}')
-            kmf.plot()
+            figura['series'].append(serie_curva(curva, label=f'Comuna {comuna} - {label}'))
+    return figura
+
+
+def calcular_sobrevida_por_cortes(cubo, nombre, titulo, cortes: dict, directorio=ruta_imagenes, titulo_leyenda=None):
+    """
+    Prepara una figura con una curva por corte del cubo de sobrevida: `cortes` es {etiqueta: filtros},
+    p. ej. {'Mujeres 50-69': {'TUMOR_GRUPO': 'Mama', 'SEXO': 2, 'edad': (50, 69)}}. Sirve para cualquier
+    combinación de estratos sin escribir otra función ni volver a filtrar la cohorte.
+    """
+    figura = nueva_figura(f'{directorio}{nombre}.png', titulo, titulo_leyenda=titulo_leyenda)
+    for etiqueta, filtros in cortes.items():
+        curva = cubo.curva(**filtros)
+        if curva.empty:
+            continue
+
+        figura['series'].append(serie_curva(curva, label=etiqueta))
+    return figura
+
+
+def preparar_figuras(curvas, comunas_seleccionadas, directorio=ruta_imagenes):
+    """
+    Prepara las cuatro figuras de cada grupo de tumor a partir de las curvas calculadas.
+    """
+    figuras = []
+    for tumor_nombre in TUMOR_GRUPOS:
+        figuras += [
+            calcular_sobrevida_global(curvas['global'], tumor_nombre, directorio),
+            calcular_sobrevida_por_comuna(curvas['comuna'], tumor_nombre, comunas_seleccionadas, directorio),
+            calcular_sobrevida_por_sexo(curvas['sexo'], tumor_nombre, directorio),
+            calcular_sobrevida_por_comuna_y_sexo(curvas['comuna_sexo'], tumor_nombre, comunas_seleccionadas,
+                                                 directorio),
+        ]
+    return [figura for figura in figuras if figura is not None]
+
+
+def analizar(ruta_datos=ruta_datos, comunas_seleccionadas=comunas_seleccionadas, directorio=ruta_imagenes,
+             almacen: AlmacenResultados = None):
+    """
+    Análisis completo: curvas de todas las estratificaciones, sus figuras (backend Agg) y las pruebas de
+    comparación, guardadas en `directorio`. Devuelve las rutas de las imágenes y de las pruebas.
+    """
+    # Crear el directorio para guardar las imágenes si no existe
+    os.makedirs(directorio, exist_ok=True)
+
+    df = preparar_datos(ruta_datos)
+    almacen = almacen if almacen is not None else AlmacenResultados(ruta_resultados)
+    curvas = calcular_curvas(df, comunas_seleccionadas, almacen=almacen)
+
+    # Las figuras se renderizan en paralelo (backend Agg) a partir de las curvas ya calculadas
+    figuras = preparar_figuras(curvas, comunas_seleccionadas, directorio)
+    archivos = renderizar_figuras(figuras)
 
-    plt.title(f'Sobrevida por Comuna y Sexo - {tumor_nombre}')
-    plt.xlabel('Tiempo (años)')
-    plt.ylabel('Probabilidad de sobrevida')
-    plt.grid(True)
-    plt.legend(title='Comuna y Sexo')
-    plt.savefig(f'{ruta_imagenes}comuna_sexo_{tumor_nombre}.png')
-    plt.close()
+    # Pruebas de comparación de las curvas graficadas, guardadas junto a las imágenes
+    return archivos + exportar_pruebas(*calcular_pruebas(df, comunas_seleccionadas), directorio=directorio)
 
 
 # ============================
 # Ejecución de Análisis
 # ============================
 
-for tumor_nombre, cieo_codigos in tumor_grupos.items():
-    calcular_sobrevida_global(df, tumor_nombre, cieo_codigos)
-    calcular_sobrevida_por_comuna(df, tumor_nombre, cieo_codigos, comunas_seleccionadas)
-    calcular_sobrevida_por_sexo(df, tumor_nombre, cieo_codigos)
-    calcular_sobrevida_por_comuna_y_sexo(df, tumor_nombre, cieo_codigos, comunas_seleccionadas)
+if __name__ == "__main__":
+    analizar()
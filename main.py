@@ -1,123 +1,119 @@
-import pandas as pd
-from lifelines import KaplanMeierFitter
-import matplotlib.pyplot as plt
 import os
 
-# Definir el diccionario para agrupar los tumores según los códigos CIEO (sin la letra 'C')
-tumor_grupos = {
-    "Tráquea, bronquio pulmón": ['33.9', '340', '341', '342', '343', '348', '349'],
-    "Próstata": ['619'],
-    "Estómago": ['160', '161', '162', '163', '164', '165', '166', '168', '169'],
-    "Colon": ['180', '181', '182', '183', '184', '185', '186', '187', '188', '189'],
-    "Recto": ['209'],
-    "Mama": ['500', '501', '502', '503', '504', '505', '506', '508', '509'],
-    "Vesícula biliar": ['239'],
-    "Cuello uterino": ['530', '531', '538', '539'],
-    "Hígado": ['220', '221', '222', '223', '224', '227', '229']
-}
+from almacenResultados import AlmacenResultados
+from cohortLoader import cargar_cohorte
+from figureRenderer import nueva_figura, serie_curva, renderizar_figuras
+from kaplanMeierEstratos import kaplan_meier_por_estrato
+from tumorGroups import TUMOR_GRUPOS, TablaTopografia
 
 # Ruta para cargar los datos y guardar las imágenes
 ruta_datos = 'data/datos_ajustados.xlsx'
 ruta_imagenes = 'data/images/'
 
-# Crear el directorio para guardar las imágenes si no existe
-os.makedirs(ruta_imagenes, exist_ok=True)
+# Directorio de las curvas ya calculadas, reutilizadas mientras no cambien los datos de su estrato
+ruta_resultados = 'data/.cache/resultados'
 
-# Cargar el archivo de datos ajustados
-df = pd.read_excel(ruta_datos, dtype={'RUT': str})
+# Filtrar para las comunas específicas que quieres analizar
+comunas_seleccionadas = ['2101', '2201']
 
-# Convertir las fechas a formato datetime
-df['FECDIAG'] = pd.to_datetime(df['FECDIAG'], errors='coerce')
-df['FECCON'] = pd.to_datetime(df['FECCON'], errors='coerce')
 
-# Calcular el tiempo de sobrevida en años
-df['tiempo_sobrevida_anios'] = (df['FECCON'] - df['FECDIAG']).dt.days / 365.25
+def preparar_datos(ruta_datos):
+    """
+    Carga la cohorte y prepara las variables de sobrevida (tiempo en años y evento).
+    """
+    # Cargar los datos ajustados (las fechas ya vienen como datetime desde el cargador de la cohorte)
+    df = cargar_cohorte(ruta_datos)
+
+    # Calcular el tiempo de sobrevida en años
+    df['tiempo_sobrevida_anios'] = (df['FECCON'] - df['FECDIAG']).dt.days / 365.25
 
-# Filtrar los datos que sean válidos para el análisis
-df = df.dropna(subset=['tiempo_sobrevida_anios', 'VM'])
+    # Filtrar los datos que sean válidos para el análisis
+    df = df.dropna(subset=['tiempo_sobrevida_anios', 'VM'])
 
-# Convertir la columna 'VM' a un formato binario (1 = muerto, 0 = censurado)
-df['evento'] = df['VM'].apply(lambda x: 1 if x == 2 else 0)
+    # Convertir la columna 'VM' a un formato binario (1 = muerto, 0 = censurado)
+    df['evento'] = df['VM'].apply(lambda x: 1 if x == 2 else 0)
 
-# Filtrar para las comunas específicas que quieres analizar
-comunas_seleccionadas = ['2101', '2201']
+    # Conservar solo los casos de los grupos de tumor analizados (TUMOR_GRUPO se asigna al cargar la cohorte)
+    return TablaTopografia().seleccionar(df, list(TUMOR_GRUPOS))
 
 
-def calcular_sobrevida_global(df, tumor_nombre, cieo_codigos):
+def calcular_sobrevida_global(curvas, tumor_nombre):
     """
-    Calcula la sobrevida utilizando Kaplan-Meier para un grupo de tumores específico (global).
+    Prepara la figura de la curva de Kaplan-Meier de un grupo de tumores específico (global).
     """
-    kmf = KaplanMeierFitter()
-
-    # Filtrar los datos para los tumores según sus códigos CIEO
-    df_tumor = df[df['TOP'].astype(str).isin(cieo_codigos)]
+    # Seleccionar la curva del grupo de tumores
+    curva = curvas[curvas['TUMOR_GRUPO'] == tumor_nombre]
 
-    if df_tumor.empty:
+    if curva.empty:
         print(f"No hay datos para el grupo de tumores: {tumor_nombre}")
-        return
+        return None
 
-    # Ajustar el modelo de Kaplan-Meier para el grupo
-    kmf.fit(durations=df_tumor['tiempo_sobrevida_anios'], event_observed=df_tumor['evento'], label=f'{tumor_nombre}')
+    # Figura de la curva de Kaplan-Meier global
+    figura = nueva_figura(f'{ruta_imagenes}kaplan_meier_global_{tumor_nombre}.png',
+                          f'Curva de Kaplan-Meier Global - {tumor_nombre}', xticks=range(0, 10))
+    figura['series'].append(serie_curva(curva, label=f'{tumor_nombre}'))
+    return figura
 
-    # Graficar la curva de Kaplan-Meier global
-    plt.figure(figsize=(10, 6))
-    kmf.plot()
-    plt.title(f'Curva de Kaplan-Meier Global - {tumor_nombre}')
-    plt.xlabel('Tiempo (años)')
-    plt.ylabel('Probabilidad de sobrevida')
-    plt.grid(True)
-    plt.xticks(range(0, 10))
-    plt.savefig(f'{ruta_imagenes}kaplan_meier_global_{tumor_nombre}.png')
-    # plt.show()
-    print(f"Curva de Kaplan-Meier Global para {tumor_nombre} generada.")
 
-
-def calcular_sobrevida_por_tumor_comuna(df, tumor_nombre, cieo_codigos, comunas_seleccionadas):
+def calcular_sobrevida_por_tumor_comuna(curvas, tumor_nombre, comunas_seleccionadas):
     """
-    Calcula la sobrevida utilizando Kaplan-Meier para un grupo de tumores específico,
+    Prepara la figura de las curvas de Kaplan-Meier de un grupo de tumores específico,
     comparando entre las comunas seleccionadas.
     """
-    kmf = KaplanMeierFitter()
+    curvas_tumor = curvas[curvas['TUMOR_GRUPO'] == tumor_nombre]
 
-    plt.figure(figsize=(10, 6))
+    figura = nueva_figura(f'{ruta_imagenes}kaplan_meier_comunas_{tumor_nombre}.png',
+                          f'Curva de Kaplan-Meier - {tumor_nombre} por Comuna',
+                          titulo_leyenda='Comuna', xticks=range(0, 10))
 
     for comuna in comunas_seleccionadas:
-        # Filtrar los datos para la comuna y los tumores según sus códigos
-        filtro = (df['TOP'].astype(str).isin(cieo_codigos)) & (df['REGCOM'].astype(str) == comuna)
-        df_comuna = df[filtro]
+        # Seleccionar la curva de la comuna
+        curva = curvas_tumor[curvas_tumor['REGCOM'].astype(str) == comuna]
 
-        if df_comuna.empty:
+        if curva.empty:
             print(f"No hay datos para el tumor '{tumor_nombre}' en la comuna {comuna}")
             continue
 
-        # Ajustar el modelo de Kaplan-Meier para la comuna
-        kmf.fit(durations=df_comuna['tiempo_sobrevida_anios'],
-                event_observed=df_comuna['evento'],
-                label=f'Comuna {comuna}')
+        figura['series'].append(serie_curva(curva, label=f'Comuna {comuna}'))
+
+    return figura
+
+
+def analizar(ruta_datos=ruta_datos, comunas_seleccionadas=comunas_seleccionadas):
+    """
+    Análisis completo: curvas globales y por comuna de cada grupo de tumor, graficadas en `ruta_imagenes`.
+    Devuelve las rutas de las imágenes generadas.
+    """
+    # Crear el directorio para guardar las imágenes si no existe
+    os.makedirs(ruta_imagenes, exist_ok=True)
+
+    df = preparar_datos(ruta_datos)
 
-        # Graficar la curva de Kaplan-Meier para la comuna
-        kmf.plot()
+    # Calcular todas las curvas en una pasada: global por tumor y por tumor y comuna; los estratos
+    # sin cambios desde la ejecución anterior se leen del almacén de resultados
+    almacen = AlmacenResultados(ruta_resultados)
+    columnas_datos = ['tiempo_sobrevida_anios', 'evento']
+    curvas_globales = almacen.por_estrato(kaplan_meier_por_estrato, df, ['TUMOR_GRUPO'], columnas_datos)
+    curvas_comunas = almacen.por_estrato(kaplan_meier_por_estrato,
+                                         df[df['REGCOM'].astype(str).isin(comunas_seleccionadas)],
+                                         ['TUMOR_GRUPO', 'REGCOM'], columnas_datos)
 
-    # Personalizar el gráfico
-    plt.title(f'Curva de Kaplan-Meier - {tumor_nombre} por Comuna')
-    plt.xlabel('Tiempo (años)')
-    plt.ylabel('Probabilidad de sobrevida')
-    plt.grid(True)
-    plt.xticks(range(0, 10))
-    plt.legend(title='Comuna')
-    plt.savefig(f'{ruta_imagenes}kaplan_meier_comunas_{tumor_nombre}.png')
-    # plt.show()
-    print(f"Curva de Kaplan-Meier por comuna para el tumor '{tumor_nombre}' generada.")
+    # Preparar las figuras globales y por comunas para cada grupo de tumores
+    figuras = []
+    for tumor_nombre in TUMOR_GRUPOS:
+        print(f"\nAnalizando el grupo de tumores: {tumor_nombre}")
 
+        # Análisis de sobrevida global
+        figuras.append(calcular_sobrevida_global(curvas_globales, tumor_nombre))
 
-# Generar curvas de Kaplan-Meier globales y por comunas para cada grupo de tumores
-for tumor_nombre, cieo_codigos in tumor_grupos.items():
-    print(f"\nAnalizando el grupo de tumores: {tumor_nombre}")
+        # Análisis de sobrevida por comunas
+        figuras.append(calcular_sobrevida_por_tumor_comuna(curvas_comunas, tumor_nombre, comunas_seleccionadas))
 
-    # Análisis de sobrevida global
-    calcular_sobrevida_global(df, tumor_nombre, cieo_codigos)
+    # Renderizar todas las figuras en paralelo (backend Agg, sin figuras retenidas en memoria)
+    archivos = renderizar_figuras([figura for figura in figuras if figura is not None])
+    print(f"{len(archivos)} curvas de Kaplan-Meier generadas en {ruta_imagenes}")
+    return archivos
 
-    # Análisis de sobrevida por comunas
-    calcular_sobrevida_por_tumor_comuna(df, tumor_nombre, cieo_codigos, comunas_seleccionadas)
-    ###
 
+if __name__ == "__main__":
+    analizar()
@@ -0,0 +1,302 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from instrumentacion import informar
+
+# Empates admitidos en la verosimilitud parcial
+EMPATES = ('efron', 'breslow')
+
+# Covariables del modelo de ajuste por edad, sexo y comuna; las categóricas se codifican con dummies
+COVARIABLES = ['edad_diagnostico', 'SEXO', 'REGCOM']
+CATEGORICAS = ['SEXO', 'REGCOM']
+
+# Cohorte ordenada por unidad; en los procesos se fija una sola vez al iniciarlos
+_TIEMPOS = None
+_EVENTOS = None
+_DISENO = None
+
+
+def _inicializar_trabajador(tiempos, eventos, diseno):
+    """
+    Fija en el proceso los arreglos de solo lectura de la cohorte, para no enviarlos en cada tarea.
+    """
+    global _TIEMPOS, _EVENTOS, _DISENO
+    _TIEMPOS = tiempos
+    _EVENTOS = eventos
+    _DISENO = diseno
+
+
+class _ConjuntosRiesgo:
+    def __init__(self, tiempos, eventos, X, empates: str = 'efron'):
+        """
+        Ordena los datos por tiempo y precalcula lo que no depende de los coeficientes: el tiempo
+        distinto de cada fila y un par (tiempo, l) por cada evento, con la fracción l/d de los eventos
+        empatados que Efron descuenta del conjunto en riesgo (cero con Breslow).
+        """
+        if empates not in EMPATES:
+            raise ValueError(f"Empates desconocidos: {empates}. Opciones: {EMPATES}")
+
+        orden = np.argsort(tiempos, kind='stable')
+        self.tiempos = tiempos[orden]
+        self.eventos = eventos[orden].astype(np.float64)
+        # Centrar las covariables no cambia los coeficientes y evita desbordes en exp(Xb)
+        self.X = X[orden] - X.mean(axis=0)
+
+        _, self.inicios, self.tiempo_fila = np.unique(self.tiempos, return_index=True, return_inverse=True)
+        self.m = len(self.inicios)
+        muertes = np.bincount(self.tiempo_fila, weights=self.eventos, minlength=self.m).astype(np.int64)
+
+        self.tiempo_par = np.repeat(np.arange(self.m), muertes)
+        primero = np.repeat(np.cumsum(muertes) - muertes, muertes)
+        l = np.arange(len(self.tiempo_par)) - primero
+        self.fraccion = l / muertes[self.tiempo_par] if empates == 'efron' else np.zeros(len(l))
+        self.inicio_pares = np.flatnonzero(muertes > 0)
+        self.muertes = muertes
+
+    def evaluar(self, beta):
+        """
+        Log-verosimilitud parcial, gradiente e información observada en `beta`, y los promedios
+        ponderados de las covariables en cada par (tiempo, l), a partir de sumas acumuladas de los
+        conjuntos en riesgo recorridos desde el último tiempo.
+        """
+        eta = self.X @ beta
+        eta -= eta.max()
+        w = np.exp(eta)
+        wX = w[:, None] * self.X
+
+        # Sumas sobre los que siguen en riesgo en cada tiempo distinto
+        riesgo0 = np.cumsum(np.bincount(self.tiempo_fila, weights=w, minlength=self.m)[::-1])[::-1]
+        riesgo1 = np.cumsum(np.add.reduceat(wX, self.inicios, axis=0)[::-1], axis=0)[::-1]
+        # Sumas sobre los que mueren en cada tiempo
+        empate0 = np.bincount(self.tiempo_fila, weights=w * self.eventos, minlength=self.m)
+        empate1 = np.add.reduceat(wX * self.eventos[:, None], self.inicios, axis=0)
+
+        j, c = self.tiempo_par, self.fraccion
+        denominador = riesgo0[j] - c * empate0[j]
+        promedio = (riesgo1[j] - c[:, None] * empate1[j]) / denominador[:, None]
+
+        log_verosimilitud = float(eta @ self.eventos - np.log(denominador).sum())
+        gradiente = self.eventos @ self.X - promedio.sum(axis=0)
+
+        # Σ_{j,l} (S2_j - c D2_j) / den se reescribe como X' diag(w (A - e B)) X, con A la suma de 1/den
+        # de los tiempos hasta el de cada fila y B la de c/den en el tiempo de cada evento
+        a = np.cumsum(np.bincount(j, weights=1 / denominador, minlength=self.m))
+        b = np.bincount(j, weights=c / denominador, minlength=self.m)
+        peso = w * (a[self.tiempo_fila] - self.eventos * b[self.tiempo_fila])
+        informacion = (self.X * peso[:, None]).T @ self.X - promedio.T @ promedio
+        return log_verosimilitud, gradiente, informacion, promedio
+
+
+def ajustar_cox(tiempos, eventos, X, empates: str = 'efron', max_iter: int = 50, tolerancia: float = 1e-9):
+    """
+    Ajusta un modelo de riesgos proporcionales de Cox por Newton-Raphson.
+
+    `X` es la matriz de covariables (pacientes x variables). Si un paso no mejora la log-verosimilitud
+    se reduce a la mitad. Devuelve un diccionario con los coeficientes, su matriz de covarianza, la
+    log-verosimilitud, las iteraciones, si convergió y los residuos de Schoenfeld de los eventos en el
+    orden de sus tiempos (con Efron, el promedio del riesgo se promedia sobre los eventos empatados).
+    """
+    tiempos = np.asarray(tiempos, dtype=np.float64)
+    eventos = np.asarray(eventos, dtype=np.float64)
+    X = np.asarray(X, dtype=np.float64)
+    conjuntos = _ConjuntosRiesgo(tiempos, eventos, X, empates)
+
+    beta = np.zeros(X.shape[1])
+    log_verosimilitud, gradiente, informacion, promedio = conjuntos.evaluar(beta)
+    log_verosimilitud_nula = log_verosimilitud
+    convergencia = False
+    for iteracion in range(1, max_iter + 1):
+        paso = np.linalg.lstsq(informacion, gradiente, rcond=None)[0]
+        while True:
+            candidato = conjuntos.evaluar(beta + paso)
+            if candidato[0] >= log_verosimilitud - 1e-12 or np.abs(paso).max() < tolerancia:
+                break
+            paso /= 2
+        beta = beta + paso
+        mejora = candidato[0] - log_verosimilitud
+        log_verosimilitud, gradiente, informacion, promedio = candidato
+        if np.abs(paso).max() < tolerancia or abs(mejora) < tolerancia:
+            convergencia = True
+            break
+
+    # Residuos de Schoenfeld: covariables de cada evento menos el promedio de su tiempo
+    promedio_tiempo = np.add.reduceat(promedio, np.searchsorted(conjuntos.tiempo_par, conjuntos.inicio_pares), axis=0)
+    promedio_tiempo /= conjuntos.muertes[conjuntos.inicio_pares][:, None]
+    filas_evento = np.flatnonzero(conjuntos.eventos == 1)
+    indice = np.searchsorted(conjuntos.inicio_pares, conjuntos.tiempo_fila[filas_evento])
+    schoenfeld = conjuntos.X[filas_evento] - promedio_tiempo[indice]
+
+    return {
+        'coeficientes': beta,
+        'varianza': np.linalg.pinv(informacion),
+        'log_verosimilitud': log_verosimilitud,
+        'log_verosimilitud_nula': log_verosimilitud_nula,
+        'iteraciones': iteracion,
+        'convergencia': convergencia,
+        'schoenfeld': schoenfeld,
+        'tiempos_evento': conjuntos.tiempos[filas_evento],
+    }
+
+
+def prueba_riesgos_proporcionales(ajuste: dict):
+    """
+    Prueba de riesgos proporcionales de Grambsch y Therneau para cada variable, con los residuos de
+    Schoenfeld escalados contra el rango del tiempo de los eventos (como `proportional_hazard_test` de
+    lifelines con time_transform='rank'). Devuelve (estadísticos chi2 con 1 gl, p-valores).
+    """
+    from scipy.stats import chi2
+
+    residuos = ajuste['schoenfeld']
+    d = len(residuos)
+    escalados = d * residuos @ ajuste['varianza']
+    rango = np.arange(1, d + 1) - (d + 1) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        estadistico = (rango @ escalados) ** 2 / (d * np.diag(ajuste['varianza']) * (rango ** 2).sum())
+    return estadistico, chi2.sf(estadistico, 1)
+
+
+def matriz_diseno(df: pd.DataFrame, covariables: list = None, categoricas: list = None):
+    """
+    Matriz de covariables con una columna por cada nivel de las variables categóricas (sin nivel de
+    referencia, que se elige por unidad al ajustar) y las numéricas tal cual.
+    Devuelve la matriz, el nombre de cada columna y la variable de origen de cada columna.
+    """
+    covariables = list(covariables if covariables is not None else COVARIABLES)
+    categoricas = [c for c in (categoricas if categoricas is not None else CATEGORICAS) if c in covariables]
+
+    bloques, nombres, origen = [], [], []
+    for columna in covariables:
+        if columna in categoricas:
+            serie = df[columna].astype('category')
+            codigos = serie.cat.codes.to_numpy()
+            niveles = serie.cat.categories
+            dummies = (codigos[:, None] == np.arange(len(niveles))[None, :]).astype(np.float64)
+            bloques.append(dummies)
+            nombres += [f'{columna}={nivel}' for nivel in niveles]
+            origen += [columna] * len(niveles)
+        else:
+            bloques.append(pd.to_numeric(df[columna], errors='coerce').to_numpy(dtype=np.float64)[:, None])
+            nombres.append(columna)
+            origen.append(columna)
+    return np.hstack(bloques), np.array(nombres), np.array(origen)
+
+
+def _columnas_unidad(diseno, origen, categoricas):
+    """
+    Columnas del diseño que entran al modelo de una unidad: por cada variable categórica se omiten los
+    niveles ausentes y el primer nivel presente (la referencia); se omiten las numéricas constantes.
+    """
+    presentes = diseno.any(axis=0)
+    constantes = np.ptp(diseno, axis=0) == 0
+    columnas = []
+    for variable in pd.unique(origen):
+        indices = np.flatnonzero(origen == variable)
+        if variable in categoricas:
+            columnas += list(indices[presentes[indices]][1:])
+        else:
+            columnas += [i for i in indices if not constantes[i]]
+    return np.array(columnas, dtype=np.int64)
+
+
+def _ajustar_tramo(inicio: int, fin: int, columnas, empates: str):
+    """
+    Ajusta el modelo de la unidad que ocupa las filas [inicio, fin) con las columnas indicadas.
+    """
+    return ajustar_cox(_TIEMPOS[inicio:fin], _EVENTOS[inicio:fin], _DISENO[inicio:fin][:, columnas], empates)
+
+
+def cox_por_unidad(df: pd.DataFrame, covariables: list = None, categoricas: list = None,
+                   columnas_unidad: list = None, empates: str = 'efron', alpha: float = 0.05,
+                   procesos: int = None, duracion: str = 'tiempo_sobrevida_anios', evento: str = 'evento'):
+    """
+    Ajusta un modelo de Cox por cada unidad de análisis (por defecto, cada grupo de tumor) con las
+    covariables indicadas (por defecto edad al diagnóstico, sexo y comuna).
+
+    La cohorte se ordena una sola vez por unidad y los modelos se reparten en un pool de `procesos`
+    procesos. Devuelve dos tablas: los coeficientes con su hazard ratio e intervalo de confianza, y la
+    prueba de riesgos proporcionales por variable con los residuos de Schoenfeld.
+    """
+    covariables = list(covariables if covariables is not None else COVARIABLES)
+    categoricas = [c for c in (categoricas if categoricas is not None else CATEGORICAS) if c in covariables]
+    columnas_unidad = list(columnas_unidad if columnas_unidad is not None else ['TUMOR_GRUPO'])
+
+    diseno, nombres, origen = matriz_diseno(df, covariables, categoricas)
+    valido = df[duracion].notna().to_numpy() & ~np.isnan(diseno).any(axis=1)
+    for columna in categoricas:
+        valido &= df[columna].notna().to_numpy()
+    if columnas_unidad:
+        codigos = df.groupby(columnas_unidad, observed=True, sort=True).ngroup().to_numpy()
+        valido &= codigos >= 0
+    else:
+        codigos = np.zeros(len(df), dtype=np.int64)
+
+    # Cohorte ordenada por unidad: cada unidad es un tramo contiguo de los arreglos compartidos
+    posiciones = np.flatnonzero(valido)
+    posiciones = posiciones[np.argsort(codigos[posiciones], kind='stable')]
+    tiempos = df[duracion].to_numpy(dtype=np.float64)[posiciones]
+    eventos = df[evento].to_numpy(dtype=np.float64)[posiciones]
+    diseno = diseno[posiciones]
+    _, inicios = np.unique(codigos[posiciones], return_index=True)
+    limites = np.append(inicios, len(posiciones))
+
+    tareas = []
+    for inicio, fin in zip(limites[:-1], limites[1:]):
+        columnas = _columnas_unidad(diseno[inicio:fin], origen, categoricas)
+        if len(columnas) and eventos[inicio:fin].sum() > 0:
+            tareas.append((int(inicio), int(fin), columnas))
+
+    if procesos is None:
+        procesos = os.cpu_count() or 1
+    procesos = min(procesos, len(tareas))
+
+    if procesos <= 1:
+        _inicializar_trabajador(tiempos, eventos, diseno)
+        ajustes = [_ajustar_tramo(inicio, fin, columnas, empates) for inicio, fin, columnas in tareas]
+    else:
+        with ProcessPoolExecutor(max_workers=procesos, initializer=_inicializar_trabajador,
+                                 initargs=(tiempos, eventos, diseno)) as pool:
+            futuros = [pool.submit(_ajustar_tramo, inicio, fin, columnas, empates)
+                       for inicio, fin, columnas in tareas]
+            ajustes = [futuro.result() for futuro in futuros]
+
+    z = NormalDist().inv_cdf(1 - alpha / 2)
+    coeficientes, diagnosticos = [], []
+    for (inicio, fin, columnas), ajuste in zip(tareas, ajustes):
+        etiqueta = df[columnas_unidad].iloc[posiciones[inicio]].to_dict() if columnas_unidad else {}
+        beta = ajuste['coeficientes']
+        error = np.sqrt(np.diag(ajuste['varianza']))
+        estadistico, p_valor = prueba_riesgos_proporcionales(ajuste)
+        # Con muy pocos eventos un coeficiente puede diverger y su intervalo desbordar a infinito
+        with np.errstate(over='ignore'):
+            hr_inferior, hr_superior = np.exp(beta - z * error), np.exp(beta + z * error)
+        for v, columna in enumerate(columnas):
+            coeficientes.append({**etiqueta, 'variable': nombres[columna], 'casos': fin - inicio,
+                                 'eventos': int(eventos[inicio:fin].sum()), 'coef': beta[v], 'error': error[v],
+                                 'hr': np.exp(beta[v]),
+                                 'hr_inferior': hr_inferior[v], 'hr_superior': hr_superior[v],
+                                 'p_valor': 2 * NormalDist().cdf(-abs(beta[v] / error[v])),
+                                 'convergencia': ajuste['convergencia']})
+            diagnosticos.append({**etiqueta, 'variable': nombres[columna], 'estadistico': estadistico[v],
+                                 'p_valor': p_valor[v]})
+
+    columnas_coeficientes = columnas_unidad + ['variable', 'casos', 'eventos', 'coef', 'error', 'hr', 'hr_inferior',
+                                               'hr_superior', 'p_valor', 'convergencia']
+    columnas_diagnosticos = columnas_unidad + ['variable', 'estadistico', 'p_valor']
+    return (pd.DataFrame(coeficientes, columns=columnas_coeficientes),
+            pd.DataFrame(diagnosticos, columns=columnas_diagnosticos))
+
+
+def exportar_cox(coeficientes: pd.DataFrame, diagnosticos: pd.DataFrame, directorio: str):
+    """
+    Guarda los coeficientes y la prueba de riesgos proporcionales y devuelve las rutas de los archivos.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    rutas = [f'{directorio}modelo_cox.csv', f'{directorio}modelo_cox_schoenfeld.csv']
+    coeficientes.to_csv(rutas[0], index=False)
+    diagnosticos.to_csv(rutas[1], index=False)
+    informar(f"Modelos de Cox exportados a {rutas[0]}")
+    return rutas
@@ -0,0 +1,392 @@
+import hashlib
+import json
+import os
+import time
+from glob import glob
+
+import pandas as pd
+
+from columnarCache import calcular_hash_archivo, escribir_manifiesto, leer_manifiesto
+from instrumentacion import informar, medir
+
+# Se incrementa cuando cambia el código de alguna etapa de forma que sus resultados anteriores ya no sirven
+VERSION_PIPELINE = '2'
+
+# Parámetros del análisis; cada etapa recibe solo los que usa, de modo que cambiar uno solo invalida
+# las etapas que dependen de él
+PARAMETROS = {
+    'ruta_registro': 'data/rpcdata_13082024.csv',
+    # Directorio solo con los Excel del DEIS, para que los archivos generados no cambien la huella
+    'directorio_defunciones': 'data/defunciones',
+    'variables': ['REGCOM', 'FECDIAG', 'TOP', 'MORF', 'COMP',
+                  'BASE', 'C10', 'CODPRI', 'PMSEC', 'PMTOT', 'GRA', 'EXT', 'LAT', 'TUMOURID', 'NOCASO',
+                  'RUT', 'CODRUT', 'SEXO', 'FECNAC', 'FECCON', 'VM', 'CAUSA'],
+    'cieo_codigos': [339, 340, 341, 342, 343, 348, 349, 619, 160, 161, 162, 163, 164, 165, 166, 168, 169,
+                     180, 181, 182, 183, 184, 185, 186, 187, 188, 189, 209, 500, 501, 502, 503, 504, 505,
+                     506, 508, 509, 239, 530, 531, 538, 539, 220, 221, 239],
+    'anio_inicio': 2011,
+    'anio_fin': 2019,
+    'fecha_fin_seguimiento': '2019-12-31',
+    # 'exacta' (solo por RUT) o 'probabilistica' (además Fellegi-Sunter para los no vinculados)
+    'vinculacion': 'exacta',
+    'ruta_revision_vinculacion': 'data/revision_vinculacion.xlsx',
+    'comunas': ['2201'],
+    'horizontes': [1, 3, 5],
+    'replicas_bootstrap': 1000,
+    'semilla': 20241112,
+    'ruta_horizontes': 'data/sobrevida_horizontes.xlsx',
+    # Tabla de vida poblacional en CSV (sexo, edad, anio, tasa); sin ella no se calcula la sobrevida neta
+    'ruta_tabla_vida': None,
+    'paso_sobrevida_neta': 'mensual',
+    'ruta_estadisticas': 'data/estadisticas_descriptivas.xlsx',
+    'ruta_imagenes': 'data/images/',
+    # Curvas por estrato ya calculadas: si cambia la cohorte solo se recalculan los estratos afectados
+    'directorio_resultados': 'data/.cache/resultados',
+    # Cubo de conteos de Kaplan-Meier (tumor x comuna x sexo x banda de edad x año de diagnóstico)
+    'ruta_cubo': 'data/cubo_sobrevida.feather',
+}
+
+
+class Etapa:
+    def __init__(self, nombre: str, funcion, dependencias: list = None, parametros: dict = None,
+                 archivos_entrada: list = None):
+        """
+        Define una etapa del pipeline.
+
+        `funcion(entradas, **parametros)` recibe un diccionario con el resultado de cada dependencia y
+        devuelve un diccionario de DataFrames (que se guardan en la caché) y, opcionalmente, la lista
+        'archivos' con los archivos que generó. `archivos_entrada` son los archivos que la etapa lee
+        directamente; su contenido forma parte de la huella de la etapa.
+        """
+        self.nombre = nombre
+        self.funcion = funcion
+        self.dependencias = dependencias or []
+        self.parametros = parametros or {}
+        self.archivos_entrada = archivos_entrada or []
+
+
+class Pipeline:
+    def __init__(self, directorio_cache: str = 'data/.cache/pipeline'):
+        """
+        Inicializa el pipeline. Los resultados de cada etapa se guardan como Feather en `directorio_cache`,
+        junto a un manifiesto con la huella (hash) con la que se calcularon.
+        """
+        self.directorio_cache = directorio_cache
+        self.ruta_manifiesto = os.path.join(directorio_cache, 'manifiesto.json')
+        os.makedirs(directorio_cache, exist_ok=True)
+        self.manifiesto = leer_manifiesto(self.ruta_manifiesto)
+        self.modificadas = set()
+        self.etapas = {}
+
+    def _escribir_manifiesto(self):
+        """
+        Escribe el manifiesto con las huellas y etapas que modificó esta ejecución (ver escribir_manifiesto).
+        """
+        self.manifiesto = escribir_manifiesto(self.ruta_manifiesto, self.manifiesto, self.modificadas)
+        self.modificadas.clear()
+
+    def agregar(self, etapa: Etapa):
+        """
+        Agrega una etapa. Sus dependencias deben haberse agregado antes, lo que garantiza un DAG.
+        """
+        faltantes = [d for d in etapa.dependencias if d not in self.etapas]
+        if faltantes:
+            raise ValueError(f"La etapa '{etapa.nombre}' depende de etapas no definidas: {faltantes}")
+        self.etapas[etapa.nombre] = etapa
+
+    def _hash_archivo(self, ruta: str):
+        """
+        Hash del contenido de un archivo de entrada. Mientras tamaño y mtime no cambien se reutiliza el
+        hash registrado en el manifiesto, sin volver a leer el archivo.
+        """
+        huellas = self.manifiesto.setdefault('archivos', {})
+        estado = os.stat(ruta)
+        clave = os.path.abspath(ruta)
+        huella = huellas.get(clave)
+        if huella is None or huella['tamano'] != estado.st_size or huella['mtime_ns'] != estado.st_mtime_ns:
+            huella = {'tamano': estado.st_size, 'mtime_ns': estado.st_mtime_ns,
+                      'sha256': calcular_hash_archivo(ruta)}
+            huellas[clave] = huella
+            self.modificadas.add(('archivos', clave))
+        return huella['sha256']
+
+    def huella(self, etapa: Etapa, huellas_dependencias: dict):
+        """
+        Huella de una etapa: hash de su nombre, parámetros, contenido de sus archivos de entrada y
+        huellas de sus dependencias.
+        """
+        contenido = {
+            'version': VERSION_PIPELINE,
+            'etapa': etapa.nombre,
+            'parametros': etapa.parametros,
+            'archivos': {ruta: self._hash_archivo(ruta) for ruta in sorted(etapa.archivos_entrada)},
+            'dependencias': {d: huellas_dependencias[d] for d in etapa.dependencias},
+        }
+        texto = json.dumps(contenido, sort_keys=True, default=str)
+        return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+    def _vigente(self, nombre: str, huella: str):
+        """
+        Indica si los resultados guardados de la etapa corresponden a la huella y siguen en disco.
+        """
+        entrada = self.manifiesto.get('etapas', {}).get(nombre)
+        if entrada is None or entrada['huella'] != huella:
+            return False
+        tablas = [os.path.join(self.directorio_cache, archivo) for archivo in entrada['tablas'].values()]
+        return all(os.path.exists(ruta) for ruta in tablas + entrada['archivos'])
+
+    def _leer_resultado(self, nombre: str):
+        """
+        Lee desde la caché las tablas de una etapa ya calculada.
+        """
+        entrada = self.manifiesto['etapas'][nombre]
+        return {tabla: pd.read_feather(os.path.join(self.directorio_cache, archivo))
+                for tabla, archivo in entrada['tablas'].items()}
+
+    def _guardar_resultado(self, nombre: str, huella: str, resultado: dict):
+        """
+        Guarda las tablas de una etapa como Feather y registra la huella en el manifiesto.
+        """
+        anterior = self.manifiesto.get('etapas', {}).get(nombre)
+        tablas = {}
+        for tabla, df in resultado.items():
+            if tabla == 'archivos':
+                continue
+            archivo = f"{nombre}-{tabla}-{huella[:16]}.feather"
+            df.reset_index(drop=True).to_feather(os.path.join(self.directorio_cache, archivo))
+            tablas[tabla] = archivo
+
+        # Eliminar los resultados de la huella anterior
+        if anterior is not None:
+            for archivo in set(anterior['tablas'].values()) - set(tablas.values()):
+                ruta = os.path.join(self.directorio_cache, archivo)
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+
+        self.manifiesto.setdefault('etapas', {})[nombre] = {
+            'huella': huella,
+            'tablas': tablas,
+            'archivos': list(resultado.get('archivos', [])),
+        }
+        self.modificadas.add(('etapas', nombre))
+        self._escribir_manifiesto()
+
+    def ejecutar(self, forzar: list = None):
+        """
+        Ejecuta las etapas en orden y devuelve sus resultados.
+
+        Una etapa se omite si su huella coincide con la del manifiesto; sus tablas solo se leen de la
+        caché si alguna etapa posterior las necesita. Las etapas de `forzar` se recalculan siempre.
+        """
+        forzar = set(forzar or [])
+        huellas = {}
+        resultados = {}
+
+        def resultado(nombre):
+            if nombre not in resultados:
+                resultados[nombre] = self._leer_resultado(nombre)
+            return resultados[nombre]
+
+        for nombre, etapa in self.etapas.items():
+            huellas[nombre] = self.huella(etapa, huellas)
+            if nombre not in forzar and self._vigente(nombre, huellas[nombre]):
+                informar(f"Etapa '{nombre}': sin cambios, se usa la caché")
+                continue
+
+            inicio = time.perf_counter()
+            informar(f"Etapa '{nombre}': ejecutando")
+            entradas = {d: resultado(d) for d in etapa.dependencias}
+            filas_entrada = (sum(len(df) for tablas in entradas.values() for t, df in tablas.items() if t != 'archivos')
+                             if entradas else None)
+            with medir(f'Pipeline.{nombre}', filas_entrada=filas_entrada) as medicion:
+                resultados[nombre] = etapa.funcion(entradas, **etapa.parametros) or {}
+                medicion.filas_salida = sum(len(df) for t, df in resultados[nombre].items() if t != 'archivos')
+            self._guardar_resultado(nombre, huellas[nombre], resultados[nombre])
+            informar(f"Etapa '{nombre}': terminada en {time.perf_counter() - inicio:.2f} s")
+
+        self._escribir_manifiesto()
+        return resultados
+
+
+# ============================
+# Etapas del análisis de sobrevida
+# ============================
+
+def etapa_registro(entradas, ruta_registro, variables, cieo_codigos, anio_inicio, anio_fin):
+    """
+    Selecciona y filtra los casos del registro de cáncer (ConcordDataProcessor).
+    """
+    from concordDataProcessor import procesar_registro
+    from tumorGroups import TablaTopografia
+
+    cohorte = procesar_registro(ruta_registro, variables, cieo_codigos, anio_inicio, anio_fin).obtener_datos()
+    cohorte['TUMOR_GRUPO'] = TablaTopografia().asignar_grupos(cohorte['TOP'])
+    return {'cohorte': cohorte}
+
+
+def etapa_defunciones(entradas, directorio_defunciones):
+    """
+    Combina los archivos de defunciones del DEIS (DefuncionesProcessor).
+    """
+    from deathDataProcessor import DefuncionesProcessor
+
+    procesador = DefuncionesProcessor(directorio_defunciones)
+    procesador.cargar_y_combinar_archivos()
+    return {'defunciones': procesador.obtener_datos()}
+
+
+def etapa_cruce(entradas, fecha_fin_seguimiento, vinculacion, ruta_revision_vinculacion):
+    """
+    Vincula la cohorte con las defunciones y actualiza el estado vital (DataMerger).
+    """
+    from dataMerger import DataMerger
+
+    procesador = DataMerger.desde_datos(entradas['registro']['cohorte'], entradas['defunciones']['defunciones'])
+    procesador.cruzar_datos(fecha_fin_seguimiento, vinculacion, ruta_revision_vinculacion)
+    archivos = [ruta_revision_vinculacion] if procesador.resumen_cruce.get('pares_revision') else []
+    return {'cohorte': procesador.obtener_datos(), 'archivos': archivos}
+
+
+def etapa_estadisticas(entradas, ruta_estadisticas):
+    """
+    Exporta las estadísticas descriptivas de la cohorte (DescriptiveStatistics).
+    """
+    from descriptiveStatistics import DescriptiveStatistics
+    from tumorGroups import TUMOR_GRUPOS
+
+    estadisticas = DescriptiveStatistics.desde_datos(entradas['registro']['cohorte'])
+    return {'archivos': estadisticas.exportar_a_excel(ruta_estadisticas, TUMOR_GRUPOS)}
+
+
+def etapa_curvas(entradas, directorio_resultados):
+    """
+    Calcula las curvas de Kaplan-Meier de todas las comunas; la selección de comunas se hace al graficar.
+    """
+    from almacenResultados import AlmacenResultados
+    from kaplanMeierSimplificado import preparar_cohorte, calcular_curvas
+
+    return calcular_curvas(preparar_cohorte(entradas['cruce']['cohorte']),
+                           almacen=AlmacenResultados(directorio_resultados))
+
+
+def etapa_incidencia(entradas, directorio_resultados):
+    """
+    Calcula la incidencia acumulada por causa de muerte (riesgos competitivos) de todas las comunas.
+    """
+    from almacenResultados import AlmacenResultados
+    from kaplanMeierSimplificado import preparar_cohorte, calcular_incidencias
+
+    return calcular_incidencias(preparar_cohorte(entradas['cruce']['cohorte']),
+                                almacen=AlmacenResultados(directorio_resultados))
+
+
+def etapa_cubo(entradas, ruta_cubo):
+    """
+    Construye el cubo de sobrevida con la estratificación más fina; los cortes más gruesos se consultan
+    después sumando sus conteos.
+    """
+    from cuboSobrevida import CuboSobrevida
+    from kaplanMeierSimplificado import preparar_cohorte
+
+    cubo = CuboSobrevida.desde_datos(preparar_cohorte(entradas['cruce']['cohorte']))
+    return {'archivos': [cubo.guardar(ruta_cubo)]}
+
+
+def etapa_sobrevida_neta(entradas, ruta_tabla_vida, paso_sobrevida_neta):
+    """
+    Calcula la sobrevida neta (Pohar-Perme) por grupo de tumor, comuna y sexo con la tabla de vida.
+    """
+    from bootstrapSobrevida import ESTRATIFICACIONES
+    from kaplanMeierSimplificado import preparar_cohorte
+    from sobrevidaNeta import TablaVida, sobrevida_neta_por_estrato
+
+    tabla = TablaVida.desde_csv(ruta_tabla_vida)
+    df = preparar_cohorte(entradas['cruce']['cohorte'])
+    return {nombre: sobrevida_neta_por_estrato(df, columnas, tabla, paso_sobrevida_neta)
+            for nombre, columnas in ESTRATIFICACIONES.items()}
+
+
+def etapa_bootstrap(entradas, horizontes, replicas_bootstrap, semilla, ruta_horizontes):
+    """
+    Calcula la sobrevida a 1, 3 y 5 años por grupo de tumor, comuna y sexo con intervalos bootstrap.
+    """
+    from bootstrapSobrevida import tablas_horizontes, exportar_horizontes
+    from kaplanMeierSimplificado import preparar_cohorte
+
+    tablas = tablas_horizontes(preparar_cohorte(entradas['cruce']['cohorte']), horizontes, replicas_bootstrap,
+                               semilla)
+    return dict(tablas, archivos=exportar_horizontes(tablas, ruta_horizontes))
+
+
+def etapa_cox(entradas, ruta_imagenes):
+    """
+    Ajusta un modelo de Cox por grupo de tumor con edad, sexo y comuna, y prueba riesgos proporcionales.
+    """
+    from kaplanMeierSimplificado import preparar_cohorte
+    from modeloCox import cox_por_unidad, exportar_cox
+
+    coeficientes, diagnosticos = cox_por_unidad(preparar_cohorte(entradas['cruce']['cohorte']))
+    return {'coeficientes': coeficientes, 'diagnosticos': diagnosticos,
+            'archivos': exportar_cox(coeficientes, diagnosticos, ruta_imagenes)}
+
+
+def etapa_graficos(entradas, comunas, ruta_imagenes):
+    """
+    Genera las figuras de sobrevida de las comunas seleccionadas y exporta junto a ellas las pruebas
+    log-rank, Wilcoxon y Tarone-Ware que comparan las curvas graficadas. Las pruebas dependen de las
+    comunas, por lo que se calculan aquí: así un cambio de comunas solo vuelve a ejecutar esta etapa.
+    """
+    from kaplanMeierSimplificado import preparar_cohorte, preparar_figuras, calcular_pruebas, exportar_pruebas
+    from figureRenderer import renderizar_figuras
+
+    resumen, detalle = calcular_pruebas(preparar_cohorte(entradas['cruce']['cohorte']), comunas)
+    figuras = preparar_figuras(entradas['curvas'], comunas, ruta_imagenes)
+    archivos = renderizar_figuras(figuras) + exportar_pruebas(resumen, detalle, ruta_imagenes)
+    return {'resumen': resumen, 'detalle': detalle, 'archivos': archivos}
+
+
+def construir_pipeline(parametros: dict = None, directorio_cache: str = 'data/.cache/pipeline'):
+    """
+    Construye el pipeline del análisis de sobrevida:
+    registro y defunciones -> cruce -> curvas -> gráficos (con las pruebas de comparación), cruce -> incidencia,
+    cubo, bootstrap y Cox, y registro -> estadísticas. Con una tabla de vida se agrega cruce -> sobrevida neta.
+    """
+    p = dict(PARAMETROS, **(parametros or {}))
+    archivos_defunciones = sorted(glob(os.path.join(p['directorio_defunciones'], '*.xlsx')))
+
+    pipeline = Pipeline(directorio_cache)
+    pipeline.agregar(Etapa('registro', etapa_registro,
+                           parametros={k: p[k] for k in ['ruta_registro', 'variables', 'cieo_codigos',
+                                                         'anio_inicio', 'anio_fin']},
+                           archivos_entrada=[p['ruta_registro']]))
+    pipeline.agregar(Etapa('defunciones', etapa_defunciones,
+                           parametros={'directorio_defunciones': p['directorio_defunciones']},
+                           archivos_entrada=archivos_defunciones))
+    pipeline.agregar(Etapa('cruce', etapa_cruce, dependencias=['registro', 'defunciones'],
+                           parametros={'fecha_fin_seguimiento': p['fecha_fin_seguimiento'],
+                                       'vinculacion': p['vinculacion'],
+                                       'ruta_revision_vinculacion': p['ruta_revision_vinculacion']}))
+    pipeline.agregar(Etapa('estadisticas', etapa_estadisticas, dependencias=['registro'],
+                           parametros={'ruta_estadisticas': p['ruta_estadisticas']}))
+    pipeline.agregar(Etapa('curvas', etapa_curvas, dependencias=['cruce'],
+                           parametros={'directorio_resultados': p['directorio_resultados']}))
+    pipeline.agregar(Etapa('incidencia', etapa_incidencia, dependencias=['cruce'],
+                           parametros={'directorio_resultados': p['directorio_resultados']}))
+    pipeline.agregar(Etapa('cubo', etapa_cubo, dependencias=['cruce'], parametros={'ruta_cubo': p['ruta_cubo']}))
+    if p['ruta_tabla_vida']:
+        pipeline.agregar(Etapa('sobrevida_neta', etapa_sobrevida_neta, dependencias=['cruce'],
+                               parametros={k: p[k] for k in ['ruta_tabla_vida', 'paso_sobrevida_neta']},
+                               archivos_entrada=[p['ruta_tabla_vida']]))
+    pipeline.agregar(Etapa('bootstrap', etapa_bootstrap, dependencias=['cruce'],
+                           parametros={k: p[k] for k in ['horizontes', 'replicas_bootstrap', 'semilla',
+                                                         'ruta_horizontes']}))
+    pipeline.agregar(Etapa('cox', etapa_cox, dependencias=['cruce'],
+                           parametros={'ruta_imagenes': p['ruta_imagenes']}))
+    pipeline.agregar(Etapa('graficos', etapa_graficos, dependencias=['curvas', 'cruce'],
+                           parametros={'comunas': p['comunas'], 'ruta_imagenes': p['ruta_imagenes']}))
+    return pipeline
+
+
+if __name__ == "__main__":
+    pipeline = construir_pipeline()
+    pipeline.ejecutar()
@@ -0,0 +1,284 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import glob
+
+import numpy as np
+import pandas as pd
+
+from instrumentacion import informar, medir, registrar
+from rutUtils import normalizar_rut
+
+# Número de cubetas en que se reparten las defunciones según su RUN; todas las defunciones de un mismo RUN
+# quedan en la misma cubeta, por lo que la deduplicación y el cruce exacto se resuelven dentro de ella
+CUBETAS_RUN = 64
+
+# Filas del CSV del registro leídas por bloque al particionarlo
+TAMANO_BLOQUE = 200_000
+
+# Región de los REGCOM inválidos o faltantes (su partición se procesa igual que las demás)
+REGION_DESCONOCIDA = 0
+
+
+def region_de(regcom: pd.Series):
+    """
+    Región de cada código REGCOM (comuna de 4 o 5 dígitos: región y comuna, p. ej. 2201 -> 2, 13101 -> 13).
+    """
+    codigos = pd.to_numeric(regcom, errors='coerce')
+    return (codigos // 1000).fillna(REGION_DESCONOCIDA).astype(np.int64).to_numpy()
+
+
+def inferir_tipos(df: pd.DataFrame):
+    """
+    Tipa como números las columnas de texto cuyos valores presentes son todos numéricos, como lo hace
+    pd.read_csv. Las particiones se guardan como texto para que el esquema no dependa de cada bloque.
+    """
+    for columna in df.columns:
+        numeros = pd.to_numeric(df[columna], errors='coerce')
+        if numeros.notna().sum() == df[columna].notna().sum():
+            df[columna] = numeros
+    return df
+
+
+class _Particiones:
+    """
+    Escritores de Parquet abiertos, uno por partición, con un esquema de texto común a todas.
+    """
+
+    def __init__(self, directorio: str, columnas: list, prefijo: str):
+        import pyarrow as pa
+
+        os.makedirs(directorio, exist_ok=True)
+        self.directorio = directorio
+        self.prefijo = prefijo
+        self.esquema = pa.schema([(columna, pa.string()) for columna in columnas])
+        self.escritores = {}
+        self.rutas = {}
+        self.filas = {}
+
+    def escribir(self, particion: int, df: pd.DataFrame):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if particion not in self.escritores:
+            ruta = os.path.join(self.directorio, f'{self.prefijo}_{particion:02d}.parquet')
+            self.escritores[particion] = pq.ParquetWriter(ruta, self.esquema)
+            self.rutas[particion] = ruta
+            self.filas[particion] = 0
+        tabla = pa.Table.from_pandas(df[self.esquema.names], schema=self.esquema, preserve_index=False)
+        self.escritores[particion].write_table(tabla)
+        self.filas[particion] += len(df)
+
+    def cerrar(self):
+        for escritor in self.escritores.values():
+            escritor.close()
+        return dict(sorted(self.rutas.items()))
+
+
+def particionar_registro(ruta_csv: str, directorio: str, variables: list = None,
+                         tamano_bloque: int = TAMANO_BLOQUE):
+    """
+    Reparte el CSV del registro en un Parquet por región ('region_<NN>.parquet' en `directorio`), leyéndolo
+    por bloques: la memoria depende del tamaño del bloque, no del archivo. Se conservan solo las columnas
+    de `variables` (por defecto las de concordDataProcessor.VARIABLES), como texto. Devuelve {región: ruta}.
+    """
+    from concordDataProcessor import VARIABLES
+
+    columnas = list(variables or VARIABLES)
+    particiones = _Particiones(directorio, columnas, 'region')
+    with medir('Particionado.registro') as medicion:
+        filas = 0
+        lector = pd.read_csv(ruta_csv, usecols=lambda c: c in set(columnas), dtype=str, chunksize=tamano_bloque)
+        for bloque in lector:
+            filas += len(bloque)
+            regiones = region_de(bloque['REGCOM'])
+            for region in np.unique(regiones):
+                particiones.escribir(int(region), bloque[regiones == region])
+        rutas = particiones.cerrar()
+        medicion.filas_entrada = medicion.filas_salida = filas
+    informar(f"Registro particionado: {filas} filas en {len(rutas)} regiones "
+             f"(la mayor con {max(particiones.filas.values(), default=0)} filas)")
+    return rutas
+
+
+def particionar_defunciones(directorio_defunciones: str, directorio: str, cubetas: int = CUBETAS_RUN):
+    """
+    Reparte los archivos de defunciones del DEIS en `cubetas` Parquet según el RUN normalizado
+    ('cubeta_<NN>.parquet'), leyendo un archivo a la vez. Cada fila lleva además la columna CLAVE (el RUN
+    normalizado) para que los trabajadores seleccionen las defunciones de sus pacientes sin volver a
+    normalizar. Las defunciones sin RUN válido no pueden cruzarse por RUT y se descartan.
+
+    Devuelve {cubeta: ruta} y el número de RUN duplicados (defunciones que el cruce descartará).
+    """
+    from deathDataProcessor import COLUMNAS_DEFUNCIONES, leer_archivo_defunciones
+
+    archivos = sorted(glob(os.path.join(directorio_defunciones, '*.xlsx')))
+    if not archivos:
+        raise FileNotFoundError(f"No se encontraron archivos Excel de defunciones en {directorio_defunciones}")
+
+    particiones = _Particiones(directorio, COLUMNAS_DEFUNCIONES + ['CLAVE'], 'cubeta')
+    with medir('Particionado.defunciones') as medicion:
+        filas = descartadas = 0
+        for archivo in archivos:
+            df, segundos = leer_archivo_defunciones(archivo, COLUMNAS_DEFUNCIONES, opcionales=[])
+            registrar('DefuncionesProcessor.leer_archivo', segundos, filas_salida=len(df),
+                      archivo=os.path.basename(archivo), cache=False)
+            claves = normalizar_rut(df['RUN'])
+            validas = claves >= 0
+            filas += len(df)
+            descartadas += int((~validas).sum())
+            df, claves = df[validas].assign(CLAVE=claves[validas].astype(str)), claves[validas]
+            cubeta = claves % cubetas
+            for numero in np.unique(cubeta):
+                particiones.escribir(int(numero), df[cubeta == numero])
+        rutas = particiones.cerrar()
+
+        # Un RUN repetido queda completo en una cubeta: basta contar las claves repetidas en cada una
+        duplicadas = 0
+        for ruta in rutas.values():
+            claves = pd.read_parquet(ruta, columns=['CLAVE'])['CLAVE']
+            duplicadas += int(claves.duplicated().sum())
+        medicion.filas_entrada, medicion.filas_salida = filas, filas - descartadas
+    informar(f"Defunciones particionadas: {filas - descartadas} de {filas} filas en {len(rutas)} cubetas "
+             f"({descartadas} sin RUN válido)")
+    return rutas, duplicadas
+
+
+def defunciones_de(claves, rutas_cubetas: dict, cubetas: int = CUBETAS_RUN):
+    """
+    Defunciones cuyos RUN normalizados están en `claves`, leyendo solo las cubetas que pueden contenerlos y,
+    de cada una, solo las filas de esas claves.
+    """
+    from deathDataProcessor import COLUMNAS_DEFUNCIONES
+
+    claves = np.unique(claves[claves >= 0])
+    texto = pd.Index(claves.astype(str))
+    partes = []
+    for numero in np.unique(claves % cubetas):
+        if int(numero) not in rutas_cubetas:
+            continue
+        cubeta = pd.read_parquet(rutas_cubetas[int(numero)])
+        partes.append(cubeta[cubeta['CLAVE'].isin(texto)])
+    if not partes:
+        return pd.DataFrame({columna: pd.Series(dtype=str) for columna in COLUMNAS_DEFUNCIONES})
+    return pd.concat(partes, ignore_index=True).drop(columns='CLAVE')
+
+
+def procesar_particion(ruta_region: str, rutas_cubetas: dict, directorio_salida: str,
+                       fecha_fin_seguimiento: str = '2019-12-31', anio_inicio: int = 2011, anio_fin: int = 2019,
+                       cubetas: int = CUBETAS_RUN):
+    """
+    Procesa una región de principio a fin: selección y filtros del registro, cruce exacto con las
+    defunciones de sus pacientes, cohorte vinculada (en `directorio_salida`) y resúmenes combinables:
+    conteos del cubo de sobrevida, tabla consolidada de casos y totales de la vinculación.
+
+    Solo la partición de la región y una cubeta de defunciones a la vez están en memoria.
+    """
+    from concordDataProcessor import procesar_registro
+    from cuboSobrevida import CuboSobrevida
+    from dataExporter import exportar
+    from dataMerger import DataMerger
+    from descriptiveStatistics import DescriptiveStatistics
+    from kaplanMeierSimplificado import preparar_cohorte
+    from tumorGroups import TUMOR_GRUPOS, TablaTopografia
+
+    inicio = time.perf_counter()
+    nombre = os.path.splitext(os.path.basename(ruta_region))[0]
+    registro = inferir_tipos(pd.read_parquet(ruta_region))
+    cohorte = procesar_registro(registro, anio_inicio=anio_inicio, anio_fin=anio_fin).obtener_datos()
+    cohorte['TUMOR_GRUPO'] = TablaTopografia().asignar_grupos(cohorte['TOP'])
+    del registro
+
+    defunciones = defunciones_de(normalizar_rut(cohorte['RUT']), rutas_cubetas, cubetas)
+    cruce = DataMerger.desde_datos(cohorte, defunciones)
+    cruce.cruzar_datos(fecha_fin_seguimiento)
+    cohorte = cruce.obtener_datos()
+    ruta = exportar(cohorte, os.path.join(directorio_salida, f'{nombre}.parquet'))[0]
+
+    estadisticas = DescriptiveStatistics.desde_datos(cohorte)
+    return {
+        'particion': nombre,
+        'ruta': ruta,
+        'conteos': CuboSobrevida.desde_datos(preparar_cohorte(cohorte)).conteos,
+        'consolidado': estadisticas.obtener_tabla_consolidada(TUMOR_GRUPOS),
+        'total': len(estadisticas.df),
+        'resumen_cruce': cruce.resumen_cruce,
+        'segundos': time.perf_counter() - inicio,
+    }
+
+
+def combinar_resultados(resultados: list, run_duplicados: int = 0):
+    """
+    Une los resúmenes de las particiones: el cubo suma los conteos de sus celdas, la tabla consolidada
+    suma los casos por (comuna, sexo, grupo de tumor) y la vinculación suma sus totales.
+    """
+    from cuboSobrevida import CuboSobrevida
+
+    claves = ['REGCOM', 'SEXO', 'TUMOR_GRUPO']
+    consolidado = pd.concat([r['consolidado'].astype({c: object for c in claves}) for r in resultados],
+                            ignore_index=True)
+    consolidado = consolidado.groupby(claves, sort=True)['Total Casos'].sum().reset_index()
+
+    resumen = {columna: sum(r['resumen_cruce'][columna] for r in resultados)
+               for columna in ['pacientes', 'vinculados', 'rut_invalidos']}
+    resumen['tasa_vinculacion'] = resumen['vinculados'] / resumen['pacientes'] if resumen['pacientes'] else 0.0
+    resumen['run_duplicados'] = run_duplicados
+
+    return {
+        'cubo': CuboSobrevida.combinar([r['conteos'] for r in resultados]),
+        'estadisticas': {'Total': pd.DataFrame({'Total de casos': [sum(r['total'] for r in resultados)]}),
+                         'Consolidado': consolidado},
+        'resumen_cruce': resumen,
+        'cohortes': [r['ruta'] for r in resultados],
+    }
+
+
+def procesar_particionado(ruta_registro: str, directorio_defunciones: str, directorio: str,
+                          fecha_fin_seguimiento: str = '2019-12-31', anio_inicio: int = 2011, anio_fin: int = 2019,
+                          procesos: int = None, cubetas: int = CUBETAS_RUN):
+    """
+    Ejecuta el análisis por regiones para registros que no caben en memoria:
+
+    1. Reparte el registro en un Parquet por región y las defunciones en cubetas por RUN (`directorio`).
+    2. Cada región se filtra, se cruza con sus defunciones y se resume en un proceso (ver procesar_particion);
+       con `procesos` <= 1 las regiones se procesan en serie.
+    3. Se combinan los resúmenes (ver combinar_resultados).
+
+    La memoria máxima queda acotada por la región más grande y no por el país. El cruce es solo exacto
+    (por RUT): la vinculación probabilística compara cada paciente con defunciones de todo el país.
+    """
+    procesos = procesos or os.cpu_count() or 1
+    rutas_regiones = particionar_registro(ruta_registro, os.path.join(directorio, 'registro'))
+    rutas_cubetas, duplicadas = particionar_defunciones(directorio_defunciones,
+                                                        os.path.join(directorio, 'defunciones'), cubetas)
+    directorio_salida = os.path.join(directorio, 'cohorte')
+    argumentos = (rutas_cubetas, directorio_salida, fecha_fin_seguimiento, anio_inicio, anio_fin, cubetas)
+
+    resultados = []
+    with medir('Particionado.procesar', filas_entrada=len(rutas_regiones)) as medicion:
+        if procesos <= 1 or len(rutas_regiones) <= 1:
+            for ruta in rutas_regiones.values():
+                resultados.append(procesar_particion(ruta, *argumentos))
+                informar(f"Partición {resultados[-1]['particion']}: {resultados[-1]['total']} casos "
+                         f"({resultados[-1]['segundos']:.2f} s)")
+        else:
+            with ProcessPoolExecutor(max_workers=min(procesos, len(rutas_regiones))) as pool:
+                futuros = [pool.submit(procesar_particion, ruta, *argumentos) for ruta in rutas_regiones.values()]
+                for futuro in as_completed(futuros):
+                    resultados.append(futuro.result())
+                    informar(f"Partición {resultados[-1]['particion']}: {resultados[-1]['total']} casos "
+                             f"({resultados[-1]['segundos']:.2f} s)")
+        resultados.sort(key=lambda r: r['particion'])
+        medicion.filas_salida = sum(r['total'] for r in resultados)
+
+    combinado = combinar_resultados(resultados, duplicadas)
+    informar(f"Procesamiento por regiones: {len(resultados)} particiones, "
+             f"{combinado['resumen_cruce']['pacientes']} pacientes")
+    return combinado
+
+
+# Ejemplo de uso:
+if __name__ == "__main__":
+    resultado = procesar_particionado('data/rpcdata_13082024.csv', 'data/defunciones', 'data/particiones')
+    resultado['cubo'].guardar('data/cubo_sobrevida.feather')
+    print(resultado['resumen_cruce'])
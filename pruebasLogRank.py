@@ -0,0 +1,218 @@
+import numpy as np
+import pandas as pd
+
+from kaplanMeierEstratos import codificar_causas
+
+# Ponderaciones de la familia log-rank, con la misma convención de lifelines:
+# log-rank w = 1, Wilcoxon (Gehan-Breslow) w = n(t), Tarone-Ware w = sqrt(n(t)).
+# La prueba de Gray ('gray') compara incidencias acumuladas de una causa y requiere la columna CAUSA.
+PONDERACIONES = ('logrank', 'wilcoxon', 'tarone-ware')
+PRUEBA_GRAY = 'gray'
+
+
+def _pesos(en_riesgo, ponderacion: str):
+    if ponderacion == 'logrank':
+        return np.ones_like(en_riesgo)
+    if ponderacion == 'wilcoxon':
+        return en_riesgo
+    if ponderacion == 'tarone-ware':
+        return np.sqrt(en_riesgo)
+    raise ValueError(f"Ponderación desconocida: {ponderacion}. Opciones: {PONDERACIONES}")
+
+
+def tablas_en_riesgo(ajuste, tiempos, eventos, grupos, k: int):
+    """
+    Cuenta eventos y en riesgo por grupo en cada tiempo distinto de cada estrato de ajuste.
+
+    Los arreglos deben venir ordenados por (ajuste, tiempo) y `grupos` con códigos 0..k-1. Devuelve
+    las matrices (tiempos distintos x k) de muertes y en riesgo, y la primera fila de cada estrato.
+    """
+    nuevo = np.ones(len(tiempos), dtype=bool)
+    nuevo[1:] = (ajuste[1:] != ajuste[:-1]) | (tiempos[1:] != tiempos[:-1])
+    fila = np.cumsum(nuevo) - 1
+    m = int(fila[-1]) + 1 if len(fila) else 0
+
+    celda = fila * k + grupos
+    salidas = np.bincount(celda, minlength=m * k).reshape(m, k)
+    muertes = np.bincount(celda, weights=eventos, minlength=m * k).reshape(m, k)
+
+    # En riesgo = total del estrato de ajuste menos los que salieron en tiempos anteriores
+    ajuste_fila = ajuste[nuevo]
+    nuevo_estrato = np.ones(m, dtype=bool)
+    nuevo_estrato[1:] = ajuste_fila[1:] != ajuste_fila[:-1]
+    inicio_estrato = np.flatnonzero(nuevo_estrato)
+    id_estrato = np.cumsum(nuevo_estrato) - 1
+
+    salidas_previas = np.cumsum(salidas, axis=0) - salidas
+    salidas_previas -= salidas_previas[inicio_estrato][id_estrato]
+    total_estrato = np.add.reduceat(salidas, inicio_estrato, axis=0)
+    en_riesgo = total_estrato[id_estrato] - salidas_previas
+    return muertes, en_riesgo, inicio_estrato
+
+
+def estadistico_k_muestras(muertes, en_riesgo, ponderacion: str = 'logrank'):
+    """
+    Observado menos esperado ponderado y su matriz de covarianza para k grupos, sumados sobre
+    todos los tiempos (y estratos de ajuste). Devuelve (O - E, varianza, chi2, grados de libertad).
+    """
+    d = muertes.sum(axis=1)
+    n = en_riesgo.sum(axis=1)
+    con_eventos = d > 0
+    muertes, en_riesgo, d, n = muertes[con_eventos], en_riesgo[con_eventos], d[con_eventos], n[con_eventos]
+
+    w = _pesos(n.astype(np.float64), ponderacion)
+    esperados = en_riesgo * (d / n)[:, None]
+    o_menos_e = (w[:, None] * (muertes - esperados)).sum(axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        c = np.where(n > 1, w ** 2 * d * (n - d) / ((n - 1) * n), 0.0)
+    varianza = np.diag((c[:, None] * en_riesgo).sum(axis=0)) - (en_riesgo * (c / n)[:, None]).T @ en_riesgo
+
+    # Se descarta un grupo porque las k diferencias suman cero
+    k = muertes.shape[1]
+    estadistico = float(o_menos_e[:-1] @ np.linalg.pinv(varianza[:-1, :-1]) @ o_menos_e[:-1])
+    return o_menos_e, varianza, estadistico, k - 1
+
+
+def estadistico_gray(muertes, muertes_causa, en_riesgo, inicio_estrato, rho: float = 0):
+    """
+    Prueba de Gray (1988) de igualdad de la incidencia acumulada de una causa entre k grupos, como crstm
+    del paquete cmprsk de R.
+
+    En cada grupo el conjunto en riesgo de la subdistribución es R(t) = n(t) (1 - F(t-)) / S(t-), con F
+    la incidencia acumulada de Aalen-Johansen de la causa y S la sobrevida global del grupo. El puntaje
+    compara las muertes por la causa de cada grupo con las esperadas según el riesgo de subdistribución
+    común, ponderadas por (1 - F0(t-))^rho (F0, la incidencia común). La varianza es la de Gray: el
+    puntaje se escribe como suma de integrales sobre las martingalas de la causa y de las causas
+    competitivas de cada grupo, porque R(t) depende de F y S estimadas; sus coeficientes (a y b) se
+    evalúan en las estimaciones. Con estratos de ajuste se suman puntajes y varianzas.
+    Devuelve (puntaje, varianza, chi2, grados de libertad).
+    """
+    m, k = en_riesgo.shape
+    puntaje = np.zeros(k)
+    varianza = np.zeros((k, k))
+    identidad = np.eye(k)
+    limites = np.append(inicio_estrato, m)
+    for inicio, fin in zip(limites[:-1], limites[1:]):
+        d, d1, n = muertes[inicio:fin], muertes_causa[inicio:fin], en_riesgo[inicio:fin]
+        d2 = d - d1
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sobrevida = np.cumprod(np.where(n > 0, 1 - d / n, 1.0), axis=0)
+            sobrevida_previa = np.vstack([np.ones((1, k)), sobrevida[:-1]])
+            incidencia = np.cumsum(sobrevida_previa * np.where(n > 0, d1 / n, 0.0), axis=0)
+            incidencia_previa = np.vstack([np.zeros((1, k)), incidencia[:-1]])
+            # h = n / S(t-) y R = h (1 - F(t-)); un grupo sin sobrevivientes no aporta
+            h = np.where(sobrevida_previa > 0, n / sobrevida_previa, 0.0)
+            riesgo = h * (1 - incidencia_previa)
+
+            # Incidencia común (para la ponderación) y riesgo de subdistribución común
+            total_causa = d1.sum(axis=1)
+            total_h = h.sum(axis=1)
+            total_riesgo = riesgo.sum(axis=1)
+            incidencia_comun = np.cumsum(np.where(total_h > 0, total_causa / total_h, 0.0))
+            peso = (1 - np.concatenate([[0.0], incidencia_comun[:-1]])) ** rho
+            riesgo_comun = np.where(total_riesgo > 0, total_causa / total_riesgo, 0.0)
+            proporcion = np.where(total_riesgo[:, None] > 0, riesgo / total_riesgo[:, None], 0.0)
+
+        puntaje += (peso[:, None] * (d1 - proporcion * total_causa[:, None])).sum(axis=0)
+
+        # diferencia[t, k, r] = w(t) (1{k = r} - R_k(t) / R(t)); c[t, k, r] acumula sus términos posteriores a t
+        diferencia = peso[:, None, None] * (identidad[None, :, :] - proporcion[:, :, None])
+        terminos = diferencia * (h * riesgo_comun[:, None])[:, None, :]
+        c = terminos[::-1].cumsum(axis=0)[::-1] - terminos
+        with np.errstate(divide='ignore', invalid='ignore'):
+            c_por_n = np.where(n[:, None, :] > 0, c / n[:, None, :], 0.0)
+        a = diferencia - (1 - incidencia - sobrevida_previa)[:, None, :] * c_por_n
+        b = -(1 - incidencia)[:, None, :] * c_por_n
+        varianza += np.einsum('tkr,tjr,tr->kj', a, a, d1) + np.einsum('tkr,tjr,tr->kj', b, b, d2)
+
+    estadistico = float(puntaje[:-1] @ np.linalg.pinv(varianza[:-1, :-1]) @ puntaje[:-1])
+    return puntaje, varianza, estadistico, k - 1
+
+
+def pruebas_por_unidad(df: pd.DataFrame, columnas_grupo: list, columnas_unidad: list = None,
+                       columnas_ajuste: list = None, ponderaciones=PONDERACIONES,
+                       duracion: str = 'tiempo_sobrevida_anios', evento: str = 'evento',
+                       columna_causa: str = 'CAUSA', causa_interes: int = 1):
+    """
+    Compara las curvas de los grupos definidos por `columnas_grupo` (k grupos, no solo pares) dentro
+    de cada unidad de análisis (por defecto, cada grupo de tumor), con las pruebas log-rank, Wilcoxon
+    y Tarone-Ware. Con `columnas_ajuste` la prueba se estratifica por esas variables. Si se incluye
+    PRUEBA_GRAY ('gray') en `ponderaciones`, se compara además la incidencia acumulada de
+    `causa_interes` con la prueba de Gray.
+
+    Los datos se ordenan una sola vez por (unidad, ajuste, tiempo); cada unidad es un tramo contiguo
+    del que se obtienen las tablas de eventos y en riesgo de todos sus grupos a la vez.
+    Devuelve dos tablas: el resumen por unidad y prueba, y los observados/esperados por grupo.
+    """
+    from scipy.stats import chi2
+
+    columnas_unidad = list(columnas_unidad if columnas_unidad is not None else ['TUMOR_GRUPO'])
+    columnas_ajuste = list(columnas_ajuste or [])
+
+    def codigos_de(columnas):
+        if not columnas:
+            return np.zeros(len(df), dtype=np.int64)
+        return df.groupby(columnas, observed=True, sort=True).ngroup().to_numpy()
+
+    unidad = codigos_de(columnas_unidad)
+    grupo = codigos_de(columnas_grupo)
+    ajuste = codigos_de(columnas_ajuste)
+    valido = df[duracion].notna().to_numpy() & (unidad >= 0) & (grupo >= 0) & (ajuste >= 0)
+
+    posiciones = np.flatnonzero(valido)
+    tiempos = df[duracion].to_numpy(dtype=np.float64)[posiciones]
+    orden = np.lexsort((tiempos, ajuste[posiciones], unidad[posiciones]))
+    posiciones = posiciones[orden]
+    tiempos = tiempos[orden]
+    eventos = df[evento].to_numpy(dtype=np.float64)[posiciones]
+    if PRUEBA_GRAY in ponderaciones:
+        eventos_causa = (codificar_causas(df, evento, columna_causa)[posiciones] == causa_interes).astype(np.float64)
+    unidad, grupo, ajuste = unidad[posiciones], grupo[posiciones], ajuste[posiciones]
+
+    # Etiqueta de cada grupo a partir de su primera fila
+    grupos_unicos, primera = np.unique(grupo, return_index=True)
+    etiquetas_grupo = (df[columnas_grupo].iloc[posiciones[primera]].astype(str)
+                       .agg('-'.join, axis=1).to_numpy())
+
+    resumen, detalle = [], []
+    unidades, inicios = np.unique(unidad, return_index=True)
+    limites = np.append(inicios, len(posiciones))
+    for u in range(len(unidades)):
+        tramo = slice(limites[u], limites[u + 1])
+        locales, grupo_local = np.unique(grupo[tramo], return_inverse=True)
+        if len(locales) < 2:
+            continue
+
+        etiqueta_unidad = df[columnas_unidad].iloc[posiciones[limites[u]]].to_dict() if columnas_unidad else {}
+        muertes, en_riesgo, inicio_estrato = tablas_en_riesgo(ajuste[tramo], tiempos[tramo], eventos[tramo],
+                                                              grupo_local, len(locales))
+        casos = np.bincount(grupo_local, minlength=len(locales))
+
+        for ponderacion in ponderaciones:
+            if ponderacion == PRUEBA_GRAY:
+                muertes_causa, _, _ = tablas_en_riesgo(ajuste[tramo], tiempos[tramo], eventos_causa[tramo],
+                                                       grupo_local, len(locales))
+                _, _, estadistico, gl = estadistico_gray(muertes, muertes_causa, en_riesgo, inicio_estrato)
+                eventos_prueba = muertes_causa.sum()
+            else:
+                _, _, estadistico, gl = estadistico_k_muestras(muertes, en_riesgo, ponderacion)
+                eventos_prueba = muertes.sum()
+            resumen.append({**etiqueta_unidad, 'prueba': ponderacion, 'grupos': len(locales),
+                            'casos': int(casos.sum()), 'eventos': int(eventos_prueba),
+                            'estadistico': estadistico, 'gl': gl, 'p_valor': float(chi2.sf(estadistico, gl))})
+
+        # Observados y esperados (log-rank) por grupo
+        d = muertes.sum(axis=1)
+        n = en_riesgo.sum(axis=1)
+        con_eventos = d > 0
+        esperados = (en_riesgo[con_eventos] * (d / n)[con_eventos][:, None]).sum(axis=0)
+        nombres = etiquetas_grupo[np.searchsorted(grupos_unicos, locales)]
+        for g in range(len(locales)):
+            detalle.append({**etiqueta_unidad, 'grupo': nombres[g], 'casos': int(casos[g]),
+                            'observados': float(muertes[:, g].sum()), 'esperados': float(esperados[g])})
+
+    columnas_resumen = columnas_unidad + ['prueba', 'grupos', 'casos', 'eventos', 'estadistico', 'gl', 'p_valor']
+    columnas_detalle = columnas_unidad + ['grupo', 'casos', 'observados', 'esperados']
+    return pd.DataFrame(resumen, columns=columnas_resumen), pd.DataFrame(detalle, columns=columnas_detalle)
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+# Dígitos verificadores posibles, en el orden del resto del módulo 11 (11 - suma % 11)
+DIGITOS = np.array(['0', '1', '2', '3', '4', '5', '6', '7', '8', '9', 'K', '0'])
+
+# Los cuerpos de RUT tienen a lo más 8 dígitos: sin guion, un número más largo lleva el dígito verificador pegado
+MAXIMO_DIGITOS_CUERPO = 8
+
+
+def digito_verificador(cuerpos):
+    """
+    Dígito verificador (módulo 11) de un arreglo de cuerpos de RUT, como texto ('0'-'9' o 'K').
+    """
+    cuerpos = np.asarray(cuerpos, dtype=np.int64).copy()
+    suma = np.zeros(len(cuerpos), dtype=np.int64)
+    factor = 2
+    while (cuerpos > 0).any():
+        suma += (cuerpos % 10) * factor
+        cuerpos //= 10
+        factor = 2 if factor == 7 else factor + 1
+    resto = 11 - suma % 11
+    return DIGITOS[resto]
+
+
+def descomponer_rut(serie: pd.Series):
+    """
+    Separa una serie de RUT/RUN en el entero del cuerpo y el dígito verificador.
+
+    Elimina puntos y espacios ('12.345.678-K' -> 12345678, 'K'). Sin guion, una 'K' final o un noveno
+    dígito que corresponde al cuerpo son el dígito verificador. Los cuerpos vacíos o inválidos quedan
+    como -1 y los dígitos que no vienen en el valor, como None. El trabajo de texto se hace solo sobre los
+    valores distintos.
+    """
+    if pd.api.types.is_integer_dtype(serie.dtype):
+        # RUT ya codificado como entero (incluido el Int32 nullable del esquema de la cohorte); 0 es un RUT vacío
+        valores = serie.to_numpy(dtype=np.int64, na_value=-1)
+        return np.where(valores > 0, valores, -1), np.full(len(valores), None, dtype=object)
+
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=True)
+    texto = pd.Series(unicos).astype(str).str.upper().str.replace(r'\s', '', regex=True)
+    # Valores numéricos leídos como flotantes (12345678.0) antes de quitar los puntos de miles
+    texto = texto.str.replace(r'\.0$', '', regex=True).str.replace('.', '', regex=False)
+
+    con_guion = texto.str.contains('-', regex=False)
+    partes = texto.str.split('-', n=1)
+    cuerpo = texto.where(~con_guion, partes.str[0])
+    digito = partes.str[1].where(con_guion)
+    # Sin guion, una 'K' final solo puede ser el dígito verificador
+    sin_guion_k = ~con_guion & cuerpo.str.endswith('K')
+    digito = digito.mask(sin_guion_k, 'K')
+    cuerpo = cuerpo.str.replace(r'K$', '', regex=True)
+    # Dígito verificador pegado al cuerpo ('123456785'): se acepta solo si corresponde al cuerpo
+    pegado = ~con_guion & ~sin_guion_k & cuerpo.str.fullmatch(rf'\d{{{MAXIMO_DIGITOS_CUERPO + 1}}}')
+    if pegado.any():
+        candidatos = cuerpo[pegado].str[:-1]
+        valido = digito_verificador(candidatos.astype(np.int64)) == cuerpo[pegado].str[-1].to_numpy()
+        pegado[pegado] = valido
+        digito = digito.mask(pegado, cuerpo.str[-1])
+        cuerpo = cuerpo.mask(pegado, cuerpo.str[:-1])
+
+    valores = pd.to_numeric(cuerpo, errors='coerce').to_numpy(dtype=np.float64)
+    valores = np.where(np.isfinite(valores) & (valores > 0), valores, -1).astype(np.int64)
+    digito = digito.where(digito.isin(DIGITOS) & (valores >= 0)).astype(object)
+    digito = digito.where(digito.notna(), None).to_numpy()
+    # El último elemento corresponde a los valores faltantes (código -1 de factorize)
+    return np.append(valores, -1)[codigos], np.append(digito, None)[codigos]
+
+
+def normalizar_rut(serie: pd.Series):
+    """
+    Normaliza una serie de RUT/RUN al número entero del cuerpo del RUT.
+
+    Elimina puntos, espacios, guion y dígito verificador ('12.345.678-K' -> 12345678). Los valores
+    vacíos o inválidos quedan como -1.
+    """
+    return descomponer_rut(serie)[0]
+
+
+def formatear_rut(cuerpos, digitos=None):
+    """
+    Escribe los RUT como texto 'NNNNNNNN-D'. Los dígitos que faltan (None) se calculan con el módulo 11;
+    los cuerpos vacíos o inválidos (-1) quedan como None.
+    """
+    cuerpos = np.asarray(cuerpos, dtype=np.int64)
+    calculados = digito_verificador(np.maximum(cuerpos, 0))
+    if digitos is not None:
+        digitos = pd.Series(digitos, dtype=object).astype(str).str.upper()
+        conocidos = digitos.isin(DIGITOS).to_numpy()
+        calculados = np.where(conocidos, digitos.to_numpy(), calculados)
+    texto = pd.Series(cuerpos).astype(str).to_numpy(dtype=object) + '-' + calculados
+    return np.where(cuerpos > 0, texto, None)
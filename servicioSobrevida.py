@@ -0,0 +1,312 @@
+import io
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from cuboSobrevida import DIMENSIONES, CuboSobrevida
+from figureRenderer import nueva_figura, renderizar_figura, serie_curva
+from instrumentacion import informar
+from kaplanMeierEstratos import COLUMNAS_CURVA, tabla_en_riesgo
+
+# Datos del servicio: el cubo ya construido por el pipeline o, si no existe, la cohorte desde la que se construye
+ruta_cubo = 'data/cubo_sobrevida.feather'
+ruta_datos = 'data/datos_ajustados.xlsx'
+
+# Solo se escucha en la máquina local
+HOST = '127.0.0.1'
+PUERTO = 8050
+
+# Capacidad de las cachés LRU (respuestas) y latencias recientes conservadas por ruta para /estado
+CURVAS_EN_CACHE = 512
+IMAGENES_EN_CACHE = 128
+LATENCIAS_POR_RUTA = 1000
+
+
+class CacheLRU:
+    def __init__(self, capacidad: int):
+        """
+        Caché LRU en memoria, segura para varios hilos, que cuenta aciertos y fallos.
+        """
+        self.capacidad = capacidad
+        self.entradas = OrderedDict()
+        self.aciertos = 0
+        self.fallos = 0
+        self._bloqueo = threading.Lock()
+
+    def obtener(self, clave, contar: bool = True):
+        with self._bloqueo:
+            if clave not in self.entradas:
+                self.fallos += contar
+                return None
+            self.entradas.move_to_end(clave)
+            self.aciertos += contar
+            return self.entradas[clave]
+
+    def guardar(self, clave, valor):
+        with self._bloqueo:
+            self.entradas[clave] = valor
+            self.entradas.move_to_end(clave)
+            while len(self.entradas) > self.capacidad:
+                self.entradas.popitem(last=False)
+
+    def resumen(self):
+        with self._bloqueo:
+            return {'entradas': len(self.entradas), 'capacidad': self.capacidad, 'aciertos': self.aciertos,
+                    'fallos': self.fallos}
+
+
+def _rango(texto: str, nombre: str):
+    """
+    Convierte '50-69' en (50, 69) y '70-' en (70, None).
+    """
+    try:
+        desde, _, hasta = texto.partition('-')
+        return int(desde), int(hasta) if hasta else None
+    except ValueError:
+        raise ValueError(f"Rango de {nombre} inválido: '{texto}' (use p. ej. 50-69 o 70-)") from None
+
+
+def _json(valor):
+    return json.dumps(valor, ensure_ascii=False, default=lambda v: v.item() if hasattr(v, 'item') else str(v))
+
+
+class ServicioSobrevida:
+    def __init__(self, cubo: CuboSobrevida, curvas_en_cache: int = CURVAS_EN_CACHE,
+                 imagenes_en_cache: int = IMAGENES_EN_CACHE):
+        """
+        Inicializa el servicio de consultas de sobrevida sobre un cubo ya cargado en memoria.
+
+        Las curvas calculadas y las imágenes renderizadas se guardan en cachés LRU, compartidas por los
+        hilos que atienden las solicitudes; el cubo es de solo lectura. matplotlib no garantiza dibujar en
+        varios hilos a la vez, por lo que el renderizado se serializa.
+        """
+        self.cubo = cubo
+        self.curvas = CacheLRU(curvas_en_cache)
+        self.imagenes = CacheLRU(imagenes_en_cache)
+        self.latencias = {}
+        self._bloqueo_latencias = threading.Lock()
+        self._bloqueo_graficos = threading.Lock()
+
+    @classmethod
+    def desde_cubo(cls, ruta: str):
+        """
+        Crea el servicio desde un cubo guardado por el pipeline.
+        """
+        return cls(CuboSobrevida.desde_archivo(ruta))
+
+    @classmethod
+    def desde_cohorte(cls, ruta: str):
+        """
+        Crea el servicio cargando y preparando la cohorte una sola vez y construyendo el cubo.
+        """
+        from kaplanMeierSimplificado import preparar_datos
+
+        return cls(CuboSobrevida.desde_datos(preparar_datos(ruta)))
+
+    def consulta(self, parametros: dict):
+        """
+        Interpreta los parámetros de una solicitud: una dimensión con uno o varios valores separados por
+        coma (TUMOR_GRUPO=Mama&REGCOM=2201,2101), 'por' con las dimensiones a estratificar, 'edad' y
+        'anio' como rangos (50-69, 70-) y 'alpha'. Devuelve la clave normalizada de la consulta.
+        """
+        filtros = []
+        for dimension in DIMENSIONES:
+            if dimension in parametros:
+                filtros.append((dimension, tuple(sorted(parametros[dimension].split(',')))))
+        desconocidos = set(parametros) - set(DIMENSIONES) - {'por', 'edad', 'anio', 'alpha', 'tiempos'}
+        if desconocidos:
+            raise ValueError(f"Parámetros desconocidos: {sorted(desconocidos)}")
+        por = tuple(parametros['por'].split(',')) if parametros.get('por') else ()
+        for dimension in por:
+            if dimension not in DIMENSIONES:
+                raise ValueError(f"Dimensión desconocida en 'por': {dimension}. Use una de {DIMENSIONES}")
+        edad = _rango(parametros['edad'], 'edad') if 'edad' in parametros else None
+        anio = _rango(parametros['anio'], 'años') if 'anio' in parametros else None
+        try:
+            alpha = float(parametros.get('alpha', 0.05))
+        except ValueError:
+            raise ValueError(f"alpha inválido: '{parametros['alpha']}'") from None
+        return por, tuple(filtros), edad, anio, alpha
+
+    def curvas_de(self, clave):
+        """
+        Curvas de una consulta normalizada, desde la caché o calculadas sumando los conteos del cubo.
+        """
+        curvas = self.curvas.obtener(clave)
+        if curvas is None:
+            por, filtros, edad, anio, alpha = clave
+            if anio is not None and anio[1] is None:
+                anio = (anio[0], np.inf)
+            curvas = self.cubo.curvas(list(por), alpha, edad=edad, anio_diagnostico=anio, **dict(filtros))
+            self.curvas.guardar(clave, curvas)
+        return curvas
+
+    def _estratos(self, clave):
+        """
+        Separa las curvas de una consulta por estrato: lista de ({dimensión: etiqueta}, curva).
+        """
+        por = list(clave[0])
+        curvas = self.curvas_de(clave)
+        if not por:
+            return [({}, curvas)]
+        # Con una lista de columnas, groupby entrega siempre una tupla de etiquetas por estrato
+        return [(dict(zip(por, etiqueta)), curva) for etiqueta, curva in curvas.groupby(por, sort=False, observed=True)]
+
+    def respuesta_curva(self, parametros: dict):
+        """
+        Curvas de Kaplan-Meier en JSON: una entrada por estrato con los arreglos de COLUMNAS_CURVA.
+        """
+        clave = self.consulta(parametros)
+        return {'consulta': parametros,
+                'curvas': [{'estrato': estrato, **{columna: curva[columna].tolist() for columna in COLUMNAS_CURVA}}
+                           for estrato, curva in self._estratos(clave)]}
+
+    def respuesta_en_riesgo(self, parametros: dict):
+        """
+        Tabla de pacientes en riesgo, muertes y censuras acumuladas en los tiempos pedidos ('tiempos=0,1,2';
+        por omisión, cada año hasta el último tiempo observado).
+        """
+        parametros = dict(parametros)
+        texto_tiempos = parametros.pop('tiempos', None)
+        clave = self.consulta(parametros)
+        estratos = self._estratos(clave)
+        if texto_tiempos:
+            try:
+                tiempos = [float(tiempo) for tiempo in texto_tiempos.split(',')]
+            except ValueError:
+                raise ValueError(f"Tiempos inválidos: '{texto_tiempos}'") from None
+        else:
+            maximo = max((curva['tiempo'].max() for _, curva in estratos if not curva.empty), default=0)
+            tiempos = np.arange(int(maximo) + 1)
+        return {'consulta': parametros,
+                'tablas': [{'estrato': estrato, **tabla_en_riesgo(curva, tiempos).to_dict(orient='list')}
+                           for estrato, curva in estratos]}
+
+    def imagen(self, parametros: dict):
+        """
+        Figura PNG de las curvas de la consulta (una serie por estrato), desde la caché o renderizada.
+        """
+        clave = self.consulta(parametros)
+        png = self.imagenes.obtener(clave)
+        if png is not None:
+            return png
+
+        por, filtros, edad, anio, _ = clave
+        partes = [f"{dimension}={','.join(valores)}" for dimension, valores in filtros]
+        for nombre, rango in [('edad', edad), ('diagnóstico', anio)]:
+            if rango is not None:
+                partes.append(f"{nombre} {rango[0]}+" if rango[1] is None else f"{nombre} {rango[0]}-{rango[1]}")
+        figura = nueva_figura(io.BytesIO(), 'Sobrevida' + (f" - {', '.join(partes)}" if partes else ''),
+                              titulo_leyenda=', '.join(por) or None)
+        for estrato, curva in self._estratos(clave):
+            if curva.empty:
+                continue
+
+            etiqueta = ', '.join(str(valor) for valor in estrato.values()) or 'Todos'
+            figura['series'].append(serie_curva(curva, label=etiqueta))
+        with self._bloqueo_graficos:
+            # Otro hilo pudo renderizar la misma figura mientras se esperaba el turno
+            png = self.imagenes.obtener(clave, contar=False)
+            if png is None:
+                png = renderizar_figura(figura).getvalue()
+                self.imagenes.guardar(clave, png)
+        return png
+
+    def dimensiones(self):
+        """
+        Valores disponibles de cada dimensión del cubo.
+        """
+        return {dimension: self.cubo.categorias[dimension].tolist() for dimension in DIMENSIONES}
+
+    def registrar_latencia(self, ruta: str, segundos: float):
+        with self._bloqueo_latencias:
+            latencias = self.latencias.setdefault(ruta, [])
+            latencias.append(segundos * 1000)
+            del latencias[:-LATENCIAS_POR_RUTA]
+
+    def estado(self):
+        """
+        Estado del servicio: cachés y latencias (ms) de las últimas solicitudes por ruta.
+        """
+        with self._bloqueo_latencias:
+            latencias = {ruta: {'solicitudes': len(valores),
+                                'p50_ms': round(float(np.percentile(valores, 50)), 2),
+                                'p95_ms': round(float(np.percentile(valores, 95)), 2),
+                                'max_ms': round(max(valores), 2)}
+                         for ruta, valores in self.latencias.items()}
+        return {'filas_cubo': len(self.cubo.conteos), 'cache_curvas': self.curvas.resumen(),
+                'cache_imagenes': self.imagenes.resumen(), 'latencias': latencias}
+
+
+class ManejadorSobrevida(BaseHTTPRequestHandler):
+    """
+    Atiende GET /curva, /en_riesgo, /imagen, /dimensiones y /estado con el servicio del servidor.
+    """
+    def do_GET(self):
+        inicio = time.perf_counter()
+        url = urlsplit(self.path)
+        parametros = {clave: valores[-1] for clave, valores in parse_qs(url.query).items()}
+        servicio = self.server.servicio
+        rutas = {
+            '/curva': lambda: servicio.respuesta_curva(parametros),
+            '/en_riesgo': lambda: servicio.respuesta_en_riesgo(parametros),
+            '/dimensiones': servicio.dimensiones,
+            '/estado': servicio.estado,
+        }
+        try:
+            if url.path == '/imagen':
+                codigo, tipo, cuerpo = 200, 'image/png', servicio.imagen(parametros)
+            elif url.path in rutas:
+                codigo, tipo, cuerpo = 200, 'application/json', _json(rutas[url.path]()).encode()
+            else:
+                error = {'error': f'Ruta desconocida: {url.path}'}
+                codigo, tipo, cuerpo = 404, 'application/json', _json(error).encode()
+        except ValueError as error:
+            codigo, tipo, cuerpo = 400, 'application/json', _json({'error': str(error)}).encode()
+        except Exception as error:
+            error = {'error': f'{type(error).__name__}: {error}'}
+            codigo, tipo, cuerpo = 500, 'application/json', _json(error).encode()
+
+        latencia = time.perf_counter() - inicio
+        self.send_response(codigo)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.send_header('Server-Timing', f'total;dur={latencia * 1000:.2f}')
+        self.end_headers()
+        self.wfile.write(cuerpo)
+        servicio.registrar_latencia(url.path, latencia)
+        informar(f"{self.command} {self.path} -> {codigo} en {latencia * 1000:.1f} ms")
+
+    def log_message(self, formato, *argumentos):
+        # Cada solicitud ya se informa con su latencia en do_GET
+        pass
+
+
+def crear_servidor(servicio: ServicioSobrevida, host: str = HOST, puerto: int = PUERTO):
+    """
+    Crea el servidor HTTP (un hilo por solicitud) que atiende las consultas con `servicio`.
+    """
+    servidor = ThreadingHTTPServer((host, puerto), ManejadorSobrevida)
+    servidor.daemon_threads = True
+    servidor.servicio = servicio
+    return servidor
+
+
+if __name__ == "__main__":
+    import matplotlib
+    matplotlib.use('Agg')
+
+    servicio = ServicioSobrevida.desde_cubo(ruta_cubo) if os.path.exists(ruta_cubo) else \
+        ServicioSobrevida.desde_cohorte(ruta_datos)
+    servidor = crear_servidor(servicio)
+    print(f"Servicio de sobrevida en http://{HOST}:{PUERTO} (curva, en_riesgo, imagen, dimensiones, estado)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        servidor.server_close()
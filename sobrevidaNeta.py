@@ -0,0 +1,190 @@
+import numpy as np
+import pandas as pd
+from statistics import NormalDist
+
+# Ancho del intervalo de la grilla de integración, en años
+PASOS = {
+    'diario': 1 / 365.25,
+    'mensual': 1 / 12,
+}
+
+# Celdas (pacientes x intervalos) que se procesan a la vez, para acotar la memoria
+CELDAS_POR_BLOQUE = 1_000_000
+
+
+class TablaVida:
+    def __init__(self, tabla: pd.DataFrame, columna_tasa: str = 'tasa', tipo: str = 'tasa'):
+        """
+        Carga una tabla de vida poblacional (sexo x edad x año calendario) en un arreglo denso de
+        tasas de mortalidad anuales, indexado por [sexo, edad, año - año mínimo].
+
+        `tabla` debe tener las columnas 'sexo', 'edad', 'anio' y `columna_tasa`. Con tipo='tasa' el
+        valor es la tasa (hazard) anual; con tipo='probabilidad' es la probabilidad de morir en el año
+        (qx) y se convierte a tasa con -log(1 - qx). Los años sin datos para una edad y sexo se
+        completan con el año disponible más cercano.
+        """
+        if tipo not in ('tasa', 'probabilidad'):
+            raise ValueError(f"Tipo de tabla desconocido: {tipo}. Opciones: 'tasa', 'probabilidad'")
+
+        sexo = tabla['sexo'].to_numpy(dtype=np.int64)
+        edad = tabla['edad'].to_numpy(dtype=np.int64)
+        anio = tabla['anio'].to_numpy(dtype=np.int64)
+        valor = tabla[columna_tasa].to_numpy(dtype=np.float64)
+        if tipo == 'probabilidad':
+            valor = -np.log1p(-valor)
+
+        self.anio_minimo = int(anio.min())
+        self.edad_maxima = int(edad.max())
+        arreglo = np.full((sexo.max() + 1, self.edad_maxima + 1, anio.max() - self.anio_minimo + 1), np.nan)
+        arreglo[sexo, edad, anio - self.anio_minimo] = valor
+
+        # Completar los años faltantes con el año más cercano (hacia adelante y luego hacia atrás)
+        completa = pd.DataFrame(arreglo.reshape(-1, arreglo.shape[2]).T).ffill().bfill()
+        self.tasas = completa.to_numpy().T.reshape(arreglo.shape)
+
+        presentes = np.unique(sexo)
+        if np.isnan(self.tasas[presentes]).any():
+            raise ValueError("La tabla de vida no tiene tasas para todas las edades de cada sexo")
+        self.sexos = presentes
+
+    @classmethod
+    def desde_csv(cls, ruta_csv: str, columna_tasa: str = 'tasa', tipo: str = 'tasa', **kwargs):
+        """
+        Lee la tabla de vida desde un CSV local con las columnas sexo, edad, anio y la tasa.
+        """
+        return cls(pd.read_csv(ruta_csv, **kwargs), columna_tasa, tipo)
+
+    def tasa(self, sexo, edad, anio):
+        """
+        Tasa anual de mortalidad para arreglos de sexo, edad y año (la edad y el año se truncan a
+        enteros y se limitan al rango de la tabla).
+        """
+        i_edad = np.clip(np.floor(edad).astype(np.int64), 0, self.edad_maxima)
+        i_anio = np.clip(np.floor(anio).astype(np.int64) - self.anio_minimo, 0, self.tasas.shape[2] - 1)
+        return self.tasas[sexo, i_edad, i_anio]
+
+
+def _acumular_bloque(tabla: TablaVida, grilla, paso, tiempos, eventos, edades, sexos, anios):
+    """
+    Sumas de Pohar-Perme de un bloque de pacientes en cada intervalo de la grilla.
+
+    Devuelve, por intervalo, la suma de Y/S*, de ∫ Y dΛ*/S*, de dN/S* y de dN/S*^2, y los en riesgo.
+    Y/S* se toma al inicio del intervalo (la aproximación de la grilla). La tasa esperada es constante
+    dentro del intervalo, así que ∫ dΛ*/S* se integra exactamente hasta la salida del paciente
+    (1/S*(inicio) * (exp(tasa * tiempo en el intervalo) - 1)), y cada evento se pondera con S* en el
+    momento del evento.
+    """
+    en_riesgo = grilla[None, :] <= tiempos[:, None]
+    tasas = tabla.tasa(sexos[:, None], edades[:, None] + grilla[None, :], anios[:, None] + grilla[None, :])
+    # Tiempo en riesgo en cada intervalo: el paso completo, salvo en el intervalo de la salida
+    exposicion = np.clip(tiempos[:, None] - grilla[None, :], 0.0, paso)
+    incremento = np.where(en_riesgo, tasas * exposicion, 0.0)
+    # Inversa de la sobrevida esperada al inicio de cada intervalo
+    inversa = np.where(en_riesgo, np.exp(np.cumsum(incremento, axis=1) - incremento), 0.0)
+
+    intervalo = np.minimum((tiempos // paso).astype(np.int64), len(grilla) - 1)
+    filas = np.arange(len(tiempos))
+    peso_evento = np.where(eventos == 1, inversa[filas, intervalo] * np.exp(incremento[filas, intervalo]), 0.0)
+
+    return (inversa.sum(axis=0),
+            (inversa * np.expm1(incremento)).sum(axis=0),
+            np.bincount(intervalo, weights=peso_evento, minlength=len(grilla)),
+            np.bincount(intervalo, weights=peso_evento ** 2, minlength=len(grilla)),
+            en_riesgo.sum(axis=0))
+
+
+def pohar_perme(tiempos, eventos, edades, sexos, anios, tabla: TablaVida, paso: str = 'mensual',
+                alpha: float = 0.05):
+    """
+    Estimador de Pohar-Perme de la sobrevida neta de un grupo de pacientes.
+
+    `tiempos` en años desde el diagnóstico, `edades` y `anios` son la edad exacta y el año calendario
+    (con decimales) al diagnóstico. El riesgo esperado de cada paciente se integra sobre una grilla
+    diaria o mensual con operaciones sobre arreglos (pacientes x intervalos), por bloques de pacientes.
+    Devuelve una tabla con el tiempo (fin de cada intervalo), en riesgo, eventos, sobrevida neta e
+    intervalo de confianza.
+    """
+    ancho = PASOS[paso]
+    tiempos = np.asarray(tiempos, dtype=np.float64)
+    eventos = np.asarray(eventos, dtype=np.int64)
+    edades = np.asarray(edades, dtype=np.float64)
+    sexos = np.asarray(sexos, dtype=np.int64)
+    anios = np.asarray(anios, dtype=np.float64)
+
+    intervalos = int(np.floor(tiempos.max() / ancho)) + 1 if len(tiempos) else 0
+    grilla = np.arange(intervalos) * ancho
+    sumas = [np.zeros(intervalos) for _ in range(5)]
+    tamano_bloque = max(1, CELDAS_POR_BLOQUE // max(intervalos, 1))
+    for inicio in range(0, len(tiempos), tamano_bloque):
+        bloque = slice(inicio, inicio + tamano_bloque)
+        parciales = _acumular_bloque(tabla, grilla, ancho, tiempos[bloque], eventos[bloque], edades[bloque],
+                                     sexos[bloque], anios[bloque])
+        for suma, parcial in zip(sumas, parciales):
+            suma += parcial
+    riesgo_ponderado, esperado_ponderado, eventos_ponderados, eventos_ponderados_2, en_riesgo = sumas
+
+    # dΛ_PP = (Σ dN/S* - Σ Y dΛ*/S*) / Σ Y/S*
+    with np.errstate(divide='ignore', invalid='ignore'):
+        incremento = np.where(riesgo_ponderado > 0, (eventos_ponderados - esperado_ponderado) / riesgo_ponderado, 0.0)
+        varianza = np.where(riesgo_ponderado > 0, eventos_ponderados_2 / riesgo_ponderado ** 2, 0.0)
+    riesgo_acumulado = np.cumsum(incremento)
+    varianza_acumulada = np.cumsum(varianza)
+
+    z = NormalDist().inv_cdf(1 - alpha / 2)
+    error = z * np.sqrt(varianza_acumulada)
+    intervalo = np.minimum((tiempos // ancho).astype(np.int64), max(intervalos - 1, 0))
+    return pd.DataFrame({
+        'tiempo': grilla + ancho,
+        'en_riesgo': en_riesgo.astype(np.int64),
+        'eventos': np.bincount(intervalo, weights=eventos, minlength=intervalos).astype(np.int64),
+        'sobrevida_neta': np.exp(-riesgo_acumulado),
+        'ic_inferior': np.exp(-(riesgo_acumulado + error)),
+        'ic_superior': np.exp(-(riesgo_acumulado - error)),
+    })
+
+
+def sobrevida_neta_por_estrato(df: pd.DataFrame, columnas_estrato: list, tabla: TablaVida, paso: str = 'mensual',
+                               alpha: float = 0.05, duracion: str = 'tiempo_sobrevida_anios',
+                               evento: str = 'evento'):
+    """
+    Calcula la sobrevida neta (Pohar-Perme) de todos los estratos definidos por `columnas_estrato`.
+
+    La edad exacta y el año calendario al diagnóstico se obtienen de FECNAC y FECDIAG, y el sexo de
+    SEXO (con la misma codificación que la tabla de vida). Devuelve una tabla larga con las columnas
+    de estrato seguidas de las columnas de `pohar_perme`.
+    """
+    fecdiag = df['FECDIAG']
+    edades = ((fecdiag - df['FECNAC']).dt.days / 365.25).to_numpy()
+    anios = (fecdiag.dt.year + (fecdiag.dt.dayofyear - 1) / 365.25).to_numpy()
+    sexos = pd.to_numeric(df['SEXO'].astype(object), errors='coerce').to_numpy()
+    tiempos = df[duracion].to_numpy(dtype=np.float64)
+    valido = ((tiempos >= 0) & ~np.isnan(edades) & ~np.isnan(anios) & np.isin(sexos, tabla.sexos))
+
+    if columnas_estrato:
+        codigos = df.groupby(columnas_estrato, observed=True, sort=True).ngroup().to_numpy()
+        valido &= codigos >= 0
+    else:
+        codigos = np.zeros(len(df), dtype=np.int64)
+
+    eventos = df[evento].to_numpy()
+
+    # Pacientes ordenados por estrato: cada estrato es un tramo contiguo
+    posiciones = np.flatnonzero(valido)
+    posiciones = posiciones[np.argsort(codigos[posiciones], kind='stable')]
+    _, inicios = np.unique(codigos[posiciones], return_index=True)
+    limites = np.append(inicios, len(posiciones))
+
+    curvas = []
+    for inicio, fin in zip(limites[:-1], limites[1:]):
+        filas = posiciones[inicio:fin]
+        curva = pohar_perme(tiempos[filas], eventos[filas], edades[filas], sexos[filas].astype(np.int64),
+                            anios[filas], tabla, paso, alpha)
+        if columnas_estrato:
+            etiquetas = df[columnas_estrato].iloc[[filas[0]] * len(curva)].reset_index(drop=True)
+            curva = pd.concat([etiquetas, curva], axis=1)
+        curvas.append(curva)
+
+    if not curvas:
+        return pd.DataFrame(columns=list(columnas_estrato) + ['tiempo', 'en_riesgo', 'eventos', 'sobrevida_neta',
+                                                             'ic_inferior', 'ic_superior'])
+    return pd.concat(curvas, ignore_index=True)
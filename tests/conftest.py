@@ -0,0 +1,93 @@
+import glob
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Los módulos del proyecto están en la raíz del repositorio
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tamaño del registro sintético de las pruebas: suficiente para tener varios estratos por grupo de tumor
+FILAS_SINTETICAS = 3000
+
+
+@pytest.fixture(scope='session')
+def directorio_sintetico(tmp_path_factory):
+    """
+    Registro y defunciones sintéticos (datosSinteticos) escritos una sola vez por sesión.
+    """
+    from datosSinteticos import escribir_datos_sinteticos
+
+    directorio = str(tmp_path_factory.mktemp('sintetico'))
+    escribir_datos_sinteticos(directorio, FILAS_SINTETICAS, semilla=20241112)
+    return directorio
+
+
+@pytest.fixture(scope='session')
+def registro(directorio_sintetico):
+    """
+    Cohorte del registro sintético sin vincular, con el grupo de tumor asignado.
+    """
+    from concordDataProcessor import procesar_registro
+    from tumorGroups import TablaTopografia
+
+    cohorte = procesar_registro(os.path.join(directorio_sintetico, 'rpcdata_sintetico.csv')).obtener_datos()
+    cohorte['TUMOR_GRUPO'] = TablaTopografia().asignar_grupos(cohorte['TOP'])
+    return cohorte
+
+
+@pytest.fixture(scope='session')
+def defunciones(directorio_sintetico):
+    """
+    Defunciones sintéticas por año ({anio: DataFrame}), leídas como los Excel del DEIS.
+    """
+    from deathDataProcessor import leer_archivo_defunciones
+
+    rutas = sorted(glob.glob(os.path.join(directorio_sintetico, 'defunciones', 'def_*.xlsx')))
+    return {int(os.path.basename(ruta)[4:8]): leer_archivo_defunciones(ruta)[0] for ruta in rutas}
+
+
+@pytest.fixture(scope='session')
+def vinculada(registro, defunciones):
+    """
+    Cohorte vinculada con todas las defunciones, tal como la exporta DataMerger.
+    """
+    from dataMerger import DataMerger
+
+    procesador = DataMerger.desde_datos(registro.copy(), pd.concat(defunciones.values(), ignore_index=True))
+    procesador.cruzar_datos('2019-12-31')
+    return procesador.obtener_datos()
+
+
+@pytest.fixture(scope='session')
+def cohorte(vinculada):
+    """
+    Cohorte vinculada preparada para el análisis de sobrevida.
+    """
+    from kaplanMeierSimplificado import preparar_cohorte
+
+    return preparar_cohorte(vinculada)
+
+
+def ordenar_curvas(curvas: pd.DataFrame, columnas_estrato: list):
+    """
+    Curvas ordenadas por estrato y tiempo, con las etiquetas como texto, para comparar tablas calculadas
+    por caminos distintos (el orden de los estratos y el tipo de las etiquetas pueden diferir).
+    """
+    curvas = curvas.astype({columna: str for columna in columnas_estrato})
+    return curvas.sort_values(list(columnas_estrato) + ['tiempo'], kind='stable').reset_index(drop=True)
+
+
+def comparar_curvas(obtenidas: pd.DataFrame, esperadas: pd.DataFrame, columnas_estrato: list):
+    """
+    Verifica que dos tablas largas de curvas tengan los mismos estratos, tiempos y valores.
+    """
+    obtenidas = ordenar_curvas(obtenidas, columnas_estrato)
+    esperadas = ordenar_curvas(esperadas, columnas_estrato)
+    assert obtenidas.shape == esperadas.shape
+    pd.testing.assert_frame_equal(obtenidas[columnas_estrato], esperadas[columnas_estrato])
+    numericas = [columna for columna in esperadas.columns if columna not in columnas_estrato]
+    np.testing.assert_allclose(obtenidas[numericas].to_numpy(dtype=np.float64),
+                               esperadas[numericas].to_numpy(dtype=np.float64), rtol=1e-9, atol=1e-12)
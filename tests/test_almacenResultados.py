@@ -0,0 +1,63 @@
+import pandas as pd
+
+from almacenResultados import AlmacenResultados
+from kaplanMeierSimplificado import calcular_curvas, calcular_incidencias
+
+
+def _comparar(obtenidas: dict, esperadas: dict):
+    assert obtenidas.keys() == esperadas.keys()
+    for nombre, tabla in esperadas.items():
+        pd.testing.assert_frame_equal(obtenidas[nombre], tabla, check_dtype=False, check_categorical=False)
+
+
+def test_curvas_del_almacen_iguales_a_la_llamada_directa(cohorte, tmp_path):
+    directas = calcular_curvas(cohorte)
+
+    almacen = AlmacenResultados(str(tmp_path))
+    _comparar(calcular_curvas(cohorte, almacen=almacen), directas)
+    calculados = almacen.estadisticas['calculados']
+    assert calculados > 0
+
+    # Una segunda instancia lee todos los estratos desde el disco, sin volver a estimarlos
+    almacen = AlmacenResultados(str(tmp_path))
+    _comparar(calcular_curvas(cohorte, almacen=almacen), directas)
+    assert almacen.estadisticas['calculados'] == 0
+    assert almacen.estadisticas['disco'] > 0
+
+
+def test_solo_se_recalculan_los_estratos_que_cambian(cohorte, tmp_path):
+    almacen = AlmacenResultados(str(tmp_path))
+    calcular_curvas(cohorte, almacen=almacen)
+
+    # Quitar un paciente cambia solo los estratos a los que pertenece (a lo más uno por estratificación)
+    modificada = cohorte.drop(index=cohorte.index[0])
+    almacen = AlmacenResultados(str(tmp_path))
+    _comparar(calcular_curvas(modificada, almacen=almacen), calcular_curvas(modificada))
+    assert 0 < almacen.estadisticas['calculados'] <= 4
+
+
+def test_incidencias_del_almacen_iguales_a_la_llamada_directa(cohorte, tmp_path):
+    directas = calcular_incidencias(cohorte)
+    _comparar(calcular_incidencias(cohorte, almacen=AlmacenResultados(str(tmp_path))), directas)
+    _comparar(calcular_incidencias(cohorte, almacen=AlmacenResultados(str(tmp_path))), directas)
+
+
+def test_dos_almacenes_en_el_mismo_directorio(cohorte, tmp_path):
+    # Dos instancias abiertas a la vez (p. ej. `cli.py km` y `plots`) no pisan las entradas de la otra
+    primero = AlmacenResultados(str(tmp_path))
+    segundo = AlmacenResultados(str(tmp_path))
+    calcular_curvas(cohorte, almacen=primero)
+    calcular_incidencias(cohorte, almacen=segundo)
+
+    tercero = AlmacenResultados(str(tmp_path))
+    calcular_curvas(cohorte, almacen=tercero)
+    calcular_incidencias(cohorte, almacen=tercero)
+    assert tercero.estadisticas['calculados'] == 0
+
+    # Ningún archivo queda sin entrada en el manifiesto
+    archivos = {entrada['archivo'] for entrada in tercero.manifiesto.values()}
+    assert {ruta.name for ruta in tmp_path.glob('*.feather')} == archivos
+
+    tercero.limpiar()
+    assert not list(tmp_path.glob('*.feather'))
+    assert AlmacenResultados(str(tmp_path)).manifiesto == {}
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import bootstrapSobrevida
+from bootstrapSobrevida import bootstrap_por_estrato
+from kaplanMeierEstratos import kaplan_meier_por_estrato
+
+HORIZONTES = (0.5, 1, 3, 5, 50)
+
+
+@pytest.fixture(scope='module')
+def referencia(cohorte):
+    return bootstrap_por_estrato(cohorte, ['TUMOR_GRUPO', 'SEXO'], HORIZONTES, replicas=60, semilla=17, procesos=1)
+
+
+def test_misma_semilla_mismo_resultado(cohorte, referencia):
+    repetido = bootstrap_por_estrato(cohorte, ['TUMOR_GRUPO', 'SEXO'], HORIZONTES, replicas=60, semilla=17,
+                                     procesos=1)
+    pd.testing.assert_frame_equal(repetido, referencia)
+    otra = bootstrap_por_estrato(cohorte, ['TUMOR_GRUPO', 'SEXO'], HORIZONTES, replicas=60, semilla=18, procesos=1)
+    assert not np.allclose(otra['ic_inferior'], referencia['ic_inferior'])
+
+
+def test_resultado_no_depende_de_procesos_ni_bloques(cohorte, referencia, monkeypatch):
+    pd.testing.assert_frame_equal(
+        bootstrap_por_estrato(cohorte, ['TUMOR_GRUPO', 'SEXO'], HORIZONTES, replicas=60, semilla=17, procesos=2),
+        referencia)
+    # Bloques de un solo grupo de réplicas: más tareas, las mismas réplicas
+    monkeypatch.setattr(bootstrapSobrevida, 'ELEMENTOS_POR_BLOQUE', 1)
+    pd.testing.assert_frame_equal(
+        bootstrap_por_estrato(cohorte, ['TUMOR_GRUPO', 'SEXO'], HORIZONTES, replicas=60, semilla=17, procesos=1),
+        referencia)
+
+
+def test_sobrevida_puntual_igual_a_kaplan_meier(cohorte, referencia):
+    curvas = kaplan_meier_por_estrato(cohorte, ['TUMOR_GRUPO', 'SEXO'])
+    for (grupo, sexo), curva in curvas.groupby(['TUMOR_GRUPO', 'SEXO'], observed=True):
+        fila = referencia[(referencia['TUMOR_GRUPO'] == grupo) & (referencia['SEXO'] == sexo)]
+        # Valor de la curva escalonada en cada horizonte (el último tiempo que no lo supera)
+        posiciones = np.searchsorted(curva['tiempo'].to_numpy(), HORIZONTES, side='right') - 1
+        np.testing.assert_allclose(fila['sobrevida'], curva['sobrevida'].to_numpy()[posiciones], rtol=1e-12)
+        assert (fila['casos'] == curva['en_riesgo'].max()).all()
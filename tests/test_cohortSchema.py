@@ -0,0 +1,42 @@
+import pandas as pd
+import pytest
+
+from cohortSchema import aplicar_esquema
+from dataExporter import exportar, leer_tabla
+
+
+def _ruts():
+    # Formatos del registro y del DEIS, un dígito verificador que no corresponde al cuerpo (se conserva tal
+    # cual), el 0 de los RUT vacíos del registro, texto sin RUT y un cuerpo que no cabe en Int32
+    return pd.DataFrame({
+        'RUN': ['12.345.678-5', '7654321-6', '1234567K', '11111111', '12345678-9', '0', 'SIN RUT',
+                '99999999999-1', None],
+        'DIAG1': ['C189'] * 9,
+    })
+
+
+def test_rut_conserva_digito_verificador_y_texto_invalido():
+    df = aplicar_esquema(_ruts(), reportar=False)
+    assert list(df.columns) == ['RUN', 'CODRUN', 'RUN_ORIGINAL', 'DIAG1']
+    assert df['RUN'].tolist() == [12345678, 7654321, 1234567, 11111111, 12345678, pd.NA, pd.NA, pd.NA, pd.NA]
+    assert df['CODRUN'].astype(object).where(df['CODRUN'].notna(), None).tolist() == \
+        ['5', '6', 'K', None, '9', None, None, None, None]
+    assert df['RUN_ORIGINAL'].where(df['RUN_ORIGINAL'].notna(), None).tolist() == \
+        [None] * 5 + ['0', 'SIN RUT', '99999999999-1', None]
+
+
+@pytest.mark.parametrize('extension', ['xlsx', 'parquet', 'csv.gz'])
+def test_rut_exportado_y_leido(tmp_path, extension):
+    esperado = aplicar_esquema(_ruts(), reportar=False)
+    ruta = str(tmp_path / f'defunciones.{extension}')
+    exportar(esperado, ruta)
+
+    # En el archivo el RUN va como 'NNNNNNNN-D' (el dígito que falta se calcula) y los inválidos como llegaron
+    escrito = leer_tabla(ruta, dtype={'RUN': str})
+    assert escrito['RUN'].where(escrito['RUN'].notna(), None).tolist() == \
+        ['12345678-5', '7654321-6', '1234567-K', '11111111-1', '12345678-9', '0', 'SIN RUT', '99999999999-1', None]
+
+    leido = aplicar_esquema(escrito.drop(columns='CODRUN'), reportar=False)
+    pd.testing.assert_frame_equal(leido.drop(columns='CODRUN'), esperado.drop(columns='CODRUN'))
+    # El dígito calculado al exportar también se conserva al volver a leer
+    assert leido['CODRUN'].astype(str).tolist() == ['5', '6', 'K', '1', '9'] + ['nan'] * 4
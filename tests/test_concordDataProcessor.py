@@ -0,0 +1,42 @@
+import os
+
+import pandas as pd
+import pytest
+
+from concordDataProcessor import VARIABLES, procesar_registro
+
+
+@pytest.fixture(scope='module')
+def ruta_registro(directorio_sintetico):
+    return os.path.join(directorio_sintetico, 'rpcdata_sintetico.csv')
+
+
+def _diferido(ruta: str, tamano_bloque: int, **opciones):
+    procesador = procesar_registro(ruta, **opciones)
+    procesador.tamano_bloque = tamano_bloque
+    return procesador.obtener_datos()
+
+
+@pytest.mark.parametrize('variables', [
+    VARIABLES,
+    # Sin columnas que solo se usan como salida; los filtros y ajustes siguen teniendo las suyas
+    ['RUT', 'SEXO', 'COMP', 'TOP', 'FECDIAG', 'FECNAC', 'FECCON'],
+    # Selección en otro orden que la del archivo
+    ['FECCON', 'FECNAC', 'FECDIAG', 'TOP', 'COMP', 'REGCOM'],
+])
+@pytest.mark.parametrize('tamano_bloque', [700, 200_000])
+def test_diferido_igual_al_inmediato(ruta_registro, variables, tamano_bloque):
+    inmediato = procesar_registro(pd.read_csv(ruta_registro), variables=variables).obtener_datos()
+    diferido = _diferido(ruta_registro, tamano_bloque, variables=variables)
+    assert len(diferido) > 0
+    pd.testing.assert_frame_equal(diferido, inmediato)
+
+
+def test_seleccion_sin_una_columna_que_usa_un_paso_posterior(ruta_registro):
+    # La lectura proyectada leería COMP para el filtro aunque la selección la descarte: el modo diferido
+    # debe fallar igual que el inmediato en lugar de devolver un resultado distinto
+    variables = [columna for columna in VARIABLES if columna != 'COMP']
+    with pytest.raises(KeyError):
+        procesar_registro(pd.read_csv(ruta_registro), variables=variables)
+    with pytest.raises(KeyError, match='COMP'):
+        procesar_registro(ruta_registro, variables=variables).obtener_datos()
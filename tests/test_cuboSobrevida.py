@@ -0,0 +1,37 @@
+import pytest
+
+from conftest import comparar_curvas
+from cuboSobrevida import CuboSobrevida, bandas_edad
+from kaplanMeierEstratos import kaplan_meier_por_estrato
+
+
+@pytest.fixture(scope='module')
+def cubo(cohorte):
+    return CuboSobrevida.desde_datos(cohorte)
+
+
+@pytest.mark.parametrize('columnas_estrato', [[], ['TUMOR_GRUPO'], ['TUMOR_GRUPO', 'SEXO'],
+                                              ['TUMOR_GRUPO', 'REGCOM', 'SEXO']])
+def test_curvas_iguales_a_kaplan_meier_por_estrato(cubo, cohorte, columnas_estrato):
+    comparar_curvas(cubo.curvas(columnas_estrato), kaplan_meier_por_estrato(cohorte, columnas_estrato),
+                    columnas_estrato)
+
+
+def test_curvas_con_filtros(cubo, cohorte):
+    grupo = cohorte['TUMOR_GRUPO'].value_counts().index[0]
+    seleccion = cohorte[(cohorte['TUMOR_GRUPO'] == grupo) & cohorte['edad_diagnostico'].between(50, 69)]
+    comparar_curvas(cubo.curvas(['SEXO'], TUMOR_GRUPO=grupo, edad=(50, 69)),
+                    kaplan_meier_por_estrato(seleccion, ['SEXO']), ['SEXO'])
+
+
+def test_curvas_por_banda_de_edad(cubo, cohorte):
+    datos = cohorte.assign(BANDA_EDAD=bandas_edad(cohorte['edad_diagnostico']))
+    comparar_curvas(cubo.curvas(['BANDA_EDAD']), kaplan_meier_por_estrato(datos, ['BANDA_EDAD']), ['BANDA_EDAD'])
+
+
+def test_combinar_igual_al_cubo_completo(cubo, cohorte):
+    mitad = len(cohorte) // 2
+    partes = [CuboSobrevida.desde_datos(cohorte.iloc[:mitad]), CuboSobrevida.desde_datos(cohorte.iloc[mitad:])]
+    combinado = CuboSobrevida.combinar(partes)
+    columnas_estrato = ['TUMOR_GRUPO', 'REGCOM']
+    comparar_curvas(combinado.curvas(columnas_estrato), cubo.curvas(columnas_estrato), columnas_estrato)
@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+
+import dataExporter
+from cohortLoader import leer_cohorte
+from cohortSchema import aplicar_esquema
+from dataExporter import exportar, leer_tabla
+
+
+@pytest.mark.parametrize('extension', ['xlsx', 'parquet', 'csv.gz'])
+def test_cohorte_exportada_y_leida_conserva_valores_y_tipos(vinculada, tmp_path, extension):
+    ruta = str(tmp_path / f'cohorte.{extension}')
+    assert exportar(vinculada, ruta) == [ruta]
+
+    leida = leer_cohorte(ruta)
+    esperada = aplicar_esquema(vinculada, reportar=False).reset_index(drop=True)
+    # TUMOR_GRUPO se vuelve a asignar al leer, con todas las categorías de la tabla de topografía
+    pd.testing.assert_frame_equal(leida.drop(columns='TUMOR_GRUPO'), esperada.drop(columns='TUMOR_GRUPO'))
+    pd.testing.assert_series_equal(leida['TUMOR_GRUPO'].astype(str), esperada['TUMOR_GRUPO'].astype(str))
+
+
+def test_tabla_repartida_en_varias_hojas(vinculada, tmp_path, monkeypatch):
+    # Con un máximo de 500 filas por hoja la cohorte ocupa varias hojas 'Datos', 'Datos_2', ...
+    monkeypatch.setattr(dataExporter, 'MAXIMO_FILAS_EXCEL', 500)
+    ruta = str(tmp_path / 'cohorte.xlsx')
+    exportar({'Datos': vinculada, 'Resumen': vinculada.head(3)}, ruta)
+
+    hojas = pd.ExcelFile(ruta).sheet_names
+    partes = -(-len(vinculada) // 500)
+    assert hojas == ['Datos'] + [f'Datos_{parte}' for parte in range(2, partes + 1)] + ['Resumen']
+
+    leida = leer_tabla(ruta, dtype={'RUT': str, 'RUN': str})
+    assert len(leida) == len(vinculada)
+    esperada = aplicar_esquema(vinculada, reportar=False).reset_index(drop=True)
+    pd.testing.assert_frame_equal(aplicar_esquema(leida, reportar=False).drop(columns='TUMOR_GRUPO'),
+                                  esperada.drop(columns='TUMOR_GRUPO'))
+    assert len(leer_tabla(ruta, sheet_name='Resumen')) == 3
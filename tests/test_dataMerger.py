@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import comparar_curvas
+from cuboSobrevida import CuboSobrevida
+from dataMerger import COLUMNAS_SEGUIMIENTO, DataMerger
+from kaplanMeierSimplificado import preparar_cohorte
+
+
+@pytest.fixture(scope='module')
+def cruces(registro, defunciones):
+    """
+    Cohorte cruzada con todas las defunciones y cohorte cruzada hasta el penúltimo año y extendida después
+    con el último año (actualizar_seguimiento), junto con las filas que cambiaron en la extensión.
+    """
+    ultimo = max(defunciones)
+    completo = DataMerger.desde_datos(registro.copy(), pd.concat(defunciones.values(), ignore_index=True))
+    completo.cruzar_datos(f'{ultimo}-12-31')
+
+    parcial = DataMerger.desde_datos(registro.copy(),
+                                     pd.concat([df for anio, df in defunciones.items() if anio < ultimo],
+                                               ignore_index=True))
+    parcial.cruzar_datos(f'{ultimo - 1}-12-31')
+    anterior = parcial.obtener_datos().copy()
+
+    incremental = DataMerger.desde_datos(parcial.obtener_datos(), defunciones[ultimo])
+    antes = incremental.actualizar_seguimiento()
+    return completo.obtener_datos(), incremental.obtener_datos(), anterior, antes
+
+
+def test_actualizar_seguimiento_igual_al_cruce_completo(cruces):
+    completo, incremental, _, antes = cruces
+    assert len(antes) > 0
+    pd.testing.assert_index_equal(incremental.index, completo.index)
+    for columna in COLUMNAS_SEGUIMIENTO:
+        pd.testing.assert_series_equal(incremental[columna].astype(str), completo[columna].astype(str))
+
+
+def test_actualizar_cubo_igual_al_cubo_completo(cruces):
+    completo, incremental, anterior, antes = cruces
+    cubo = CuboSobrevida.desde_datos(preparar_cohorte(anterior))
+    actualizado = cubo.actualizar(preparar_cohorte(antes), preparar_cohorte(incremental.loc[antes.index]))
+    esperado = CuboSobrevida.desde_datos(preparar_cohorte(completo))
+    for columnas_estrato in ([], ['TUMOR_GRUPO'], ['TUMOR_GRUPO', 'REGCOM', 'SEXO']):
+        comparar_curvas(actualizado.curvas(columnas_estrato), esperado.curvas(columnas_estrato), columnas_estrato)
+
+
+def test_actualizar_seguimiento_sin_cruce_previo(registro, defunciones):
+    with pytest.raises(ValueError):
+        DataMerger.desde_datos(registro.copy(), defunciones[max(defunciones)]).actualizar_seguimiento()
+
+
+def _cruce_con_merge(cancer: pd.DataFrame, defunciones: pd.DataFrame, fecha_fin: str):
+    """
+    Cruce de la versión anterior de cruzar_datos: merge de pandas por el texto de RUT y RUN, VM con apply
+    y CAUSA fila a fila.
+    """
+    defunciones = defunciones.copy()
+    defunciones['FECHA_DEF'] = pd.to_datetime(defunciones['ANO_DEF'].astype(str) + '-'
+                                              + defunciones['MES_DEF'].astype(str).str.zfill(2) + '-'
+                                              + defunciones['DIA_DEF'].astype(str).str.zfill(2), errors='coerce')
+    cruce = pd.merge(cancer, defunciones[['RUN', 'FECHA_DEF', 'DIAG1']], left_on='RUT', right_on='RUN', how='left')
+    cruce['VM'] = cruce['FECHA_DEF'].apply(lambda x: 2 if pd.notnull(x) else 1)
+    cruce['FECCON'] = cruce['FECHA_DEF'].dt.strftime('%Y-%m-%d').fillna(fecha_fin)
+    cruce['CAUSA'] = cruce.apply(lambda fila: None if fila['VM'] == 1 else
+                                 1 if isinstance(fila['DIAG1'], str) and fila['DIAG1'].startswith('C') else 2, axis=1)
+    return cruce
+
+
+def test_cruce_igual_al_merge_con_claves_unicas(registro):
+    # Defunciones con RUN únicos escritos igual que el RUT del registro: el índice hash debe dar el mismo
+    # resultado que el merge por texto
+    rng = np.random.default_rng(4)
+    cuerpos = registro['RUT'].dropna().unique().to_numpy(dtype=np.int64)
+    muertos = rng.choice(cuerpos, size=len(cuerpos) // 2, replace=False)
+    otros = np.arange(1, 200) * 7 + 40_000_000
+    run = np.concatenate([muertos, otros])
+    fechas = pd.Timestamp('2012-01-01') + pd.to_timedelta(rng.integers(0, 2900, len(run)), unit='D')
+    defunciones = pd.DataFrame({
+        'RUN': run.astype(str),
+        'DIA_DEF': fechas.day.astype(str), 'MES_DEF': fechas.month.astype(str), 'ANO_DEF': fechas.year.astype(str),
+        'DIAG1': rng.choice(['C189', 'C509', 'I219', 'J189'], size=len(run)),
+    })
+    cancer = registro.drop(columns=['CODRUT', 'RUT_ORIGINAL'], errors='ignore')
+    cancer = cancer.assign(RUT=cancer['RUT'].astype(object).where(cancer['RUT'].notna(), '0').astype(str))
+
+    esperado = _cruce_con_merge(cancer, defunciones, '2019-12-31')
+    procesador = DataMerger.desde_datos(cancer.copy(), defunciones.copy())
+    procesador.cruzar_datos('2019-12-31')
+    obtenido = procesador.obtener_datos()
+
+    assert len(obtenido) == len(esperado) == len(registro)
+    assert procesador.resumen_cruce['vinculados'] == int(esperado['RUN'].notna().sum())
+    assert procesador.resumen_cruce['run_duplicados'] == 0
+    np.testing.assert_array_equal(obtenido['RUN'].to_numpy(dtype=np.float64, na_value=np.nan),
+                                  pd.to_numeric(esperado['RUN']).to_numpy(dtype=np.float64))
+    np.testing.assert_array_equal(obtenido['FECHA_DEF'].to_numpy(), esperado['FECHA_DEF'].to_numpy())
+    assert obtenido['DIAG1'].astype(object).where(obtenido['DIAG1'].notna(), None).tolist() == \
+        esperado['DIAG1'].where(esperado['DIAG1'].notna(), None).tolist()
+    np.testing.assert_array_equal(obtenido['VM'].to_numpy(), esperado['VM'].to_numpy())
+    np.testing.assert_array_equal(obtenido['FECCON'].to_numpy(), pd.to_datetime(esperado['FECCON']).to_numpy())
+    np.testing.assert_array_equal(obtenido['CAUSA'].to_numpy(dtype=np.float64, na_value=np.nan),
+                                  esperado['CAUSA'].to_numpy(dtype=np.float64, na_value=np.nan))
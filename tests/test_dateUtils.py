@@ -0,0 +1,90 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dateUtils import convertir_yyyymmdd, decodificar_yyyymmdd, edad_cumplida
+
+
+@pytest.mark.parametrize('valor, esperada', [
+    (20200229, '2020-02-29'),
+    (20000229, '2000-02-29'),
+    (19000229, None),
+    (20190229, None),
+    (20190228, '2019-02-28'),
+    (20190431, None),
+    (20191231, '2019-12-31'),
+    (20191301, None),
+    (20190001, None),
+    (20190100, None),
+    (20190132, None),
+    (0, None),
+    (99999999, None),
+    (16770101, None),
+    ('20200229', '2020-02-29'),
+    (20200229.0, '2020-02-29'),
+    (20200229.5, None),
+    ('2020-02-29', None),
+])
+def test_decodificar_yyyymmdd(valor, esperada):
+    fechas, rechazos = decodificar_yyyymmdd([valor])
+    if esperada is None:
+        assert np.isnat(fechas[0])
+        assert rechazos == 1
+    else:
+        assert fechas[0] == np.datetime64(esperada, 'ns')
+        assert rechazos == 0
+
+
+def test_decodificar_igual_a_pandas():
+    # Todos los días de 1999 a 2001 más valores imposibles, contra el parseo de texto de pandas
+    valores = np.arange(19990000, 20020000)
+    fechas, rechazos = decodificar_yyyymmdd(valores)
+    esperadas = pd.to_datetime(pd.Series(valores).astype(str), format='%Y%m%d', errors='coerce')
+    np.testing.assert_array_equal(fechas, esperadas.to_numpy())
+    assert rechazos == int(esperadas.isna().sum())
+
+
+def test_faltantes_no_cuentan_como_rechazos():
+    serie = pd.Series([20200229, np.nan, None, 0, 20191301], index=[5, 6, 7, 8, 9], name='FECDIAG')
+    fechas, rechazos = convertir_yyyymmdd(serie)
+    # NaN y None son faltantes; 0 y el mes 13 son fechas rechazadas
+    assert rechazos == 2
+    assert fechas.index.tolist() == [5, 6, 7, 8, 9] and fechas.name == 'FECDIAG'
+    assert fechas.isna().tolist() == [False, True, True, True, True]
+
+    # En texto, el vacío es un faltante y lo no numérico, un rechazo
+    assert decodificar_yyyymmdd(pd.Series(['20200229', '', ' ', None, 'sin fecha']))[1] == 1
+    assert convertir_yyyymmdd(fechas) == (fechas, 0)
+
+
+def _edad(nacimiento: date, referencia: date):
+    return referencia.year - nacimiento.year - ((referencia.month, referencia.day) < (nacimiento.month, nacimiento.day))
+
+
+@pytest.mark.parametrize('nacimiento, referencia, edad', [
+    # Nacidos un 29 de febrero cumplen años el 1 de marzo en los años no bisiestos
+    ('2000-02-29', '2019-02-28', 18),
+    ('2000-02-29', '2019-03-01', 19),
+    ('2000-02-29', '2020-02-28', 19),
+    ('2000-02-29', '2020-02-29', 20),
+    ('1999-03-01', '2000-02-29', 0),
+    ('1950-12-31', '2019-12-30', 68),
+    ('1950-12-31', '2019-12-31', 69),
+])
+def test_edad_cumplida(nacimiento, referencia, edad):
+    assert edad_cumplida(np.array([nacimiento], dtype='datetime64[D]'),
+                         np.array([referencia], dtype='datetime64[D]')).tolist() == [edad]
+
+
+def test_edad_cumplida_en_arreglos():
+    rng = np.random.default_rng(1)
+    nacimientos = np.datetime64('1920-01-01') + rng.integers(0, 30000, 5000).astype('timedelta64[D]')
+    referencias = nacimientos + rng.integers(0, 36500, 5000).astype('timedelta64[D]')
+    esperadas = [_edad(n.item(), r.item()) for n, r in zip(nacimientos, referencias)]
+    assert edad_cumplida(nacimientos, referencias).tolist() == esperadas
+
+    nacimientos[:2] = np.datetime64('NaT')
+    edades = edad_cumplida(nacimientos, referencias)
+    assert np.isnan(edades[:2]).all() and edades[2:].tolist() == esperadas[2:]
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from kaplanMeierEstratos import incidencia_acumulada_por_estrato, kaplan_meier_por_estrato
+
+lifelines = pytest.importorskip('lifelines')
+
+
+def _datos(n: int = 400, decimales: int = None, semilla: int = 7):
+    """
+    Cohorte aleatoria con dos estratos, muertes por cáncer (CAUSA 1) u otra causa (CAUSA 2) y censura.
+    Con `decimales` los tiempos se redondean para tener empates.
+    """
+    rng = np.random.default_rng(semilla)
+    tiempos = rng.exponential(5, size=n)
+    if decimales is not None:
+        tiempos = np.round(tiempos, decimales) + 10 ** -decimales
+    evento = (rng.random(n) < 0.6).astype(int)
+    return pd.DataFrame({
+        'GRUPO': rng.choice(['A', 'B'], size=n),
+        'tiempo_sobrevida_anios': tiempos,
+        'evento': evento,
+        'CAUSA': pd.array(np.where(evento == 1, rng.choice([1, 2], size=n), pd.NA), dtype='Int8'),
+    })
+
+
+@pytest.mark.parametrize('decimales', [None, 1])
+def test_kaplan_meier_igual_a_lifelines(decimales):
+    df = _datos(decimales=decimales)
+    curvas = kaplan_meier_por_estrato(df, ['GRUPO'])
+
+    for grupo, datos in df.groupby('GRUPO'):
+        curva = curvas[curvas['GRUPO'] == grupo].set_index('tiempo')
+        ajuste = lifelines.KaplanMeierFitter().fit(datos['tiempo_sobrevida_anios'], datos['evento'])
+        tiempos = curva.index.to_numpy()
+
+        np.testing.assert_allclose(curva['sobrevida'], ajuste.survival_function_.loc[tiempos].iloc[:, 0], rtol=1e-12)
+        intervalo = ajuste.confidence_interval_.loc[tiempos]
+        np.testing.assert_allclose(curva['ic_inferior'], intervalo.iloc[:, 0], rtol=1e-9)
+        np.testing.assert_allclose(curva['ic_superior'], intervalo.iloc[:, 1], rtol=1e-9)
+
+        tabla = ajuste.event_table.loc[tiempos[tiempos > 0]]
+        observados = curva.loc[tiempos > 0]
+        np.testing.assert_array_equal(observados['en_riesgo'], tabla['at_risk'])
+        np.testing.assert_array_equal(observados['eventos'], tabla['observed'])
+        np.testing.assert_array_equal(observados['censurados'], tabla['censored'])
+
+
+def test_incidencia_acumulada_igual_a_lifelines():
+    # Sin empates: AalenJohansenFitter desempata los tiempos repetidos con ruido aleatorio
+    df = _datos()
+    curvas = incidencia_acumulada_por_estrato(df, ['GRUPO'])
+    causas = np.where(df['evento'] == 1, df['CAUSA'].fillna(0).astype(int), 0)
+
+    for grupo, datos in df.groupby('GRUPO'):
+        curva = curvas[curvas['GRUPO'] == grupo].set_index('tiempo')
+        for causa in (1, 2):
+            ajuste = lifelines.AalenJohansenFitter(calculate_variance=False).fit(
+                datos['tiempo_sobrevida_anios'], causas[datos.index], event_of_interest=causa)
+            esperada = ajuste.cumulative_density_.iloc[:, 0].reindex(curva.index, method='ffill').fillna(0.0)
+            np.testing.assert_allclose(curva[f'incidencia_causa_{causa}'], esperada, rtol=1e-9, atol=1e-12)
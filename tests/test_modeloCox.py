@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from modeloCox import ajustar_cox, cox_por_unidad, prueba_riesgos_proporcionales
+
+lifelines = pytest.importorskip('lifelines')
+lifelines_statistics = pytest.importorskip('lifelines.statistics')
+
+
+def _datos(n: int = 500, semilla: int = 15, empates: bool = True):
+    """
+    Cohorte aleatoria con edad, sexo y comuna, riesgos que dependen de las tres y tiempos redondeados
+    (con empates) o continuos.
+    """
+    rng = np.random.default_rng(semilla)
+    edad = rng.uniform(30, 85, n)
+    sexo = rng.choice([1, 2], size=n)
+    comuna = rng.choice([2101, 2201, 2301], size=n, p=[0.5, 0.3, 0.2])
+    riesgo = np.exp(0.03 * (edad - 60) + 0.4 * (sexo == 2) - 0.5 * (comuna == 2201) + 0.3 * (comuna == 2301))
+    tiempos = rng.exponential(5 / riesgo)
+    if empates:
+        tiempos = np.round(tiempos, 1) + 0.1
+    evento = (tiempos < rng.uniform(1, 12, n)).astype(int)
+    return pd.DataFrame({'TUMOR_GRUPO': 'Mama', 'edad_diagnostico': edad, 'SEXO': sexo, 'REGCOM': comuna,
+                         'tiempo_sobrevida_anios': tiempos, 'evento': evento})
+
+
+def _covariables(df: pd.DataFrame):
+    # Dummies con el primer nivel como referencia, igual que cox_por_unidad cuando están todos presentes
+    return pd.DataFrame({'edad_diagnostico': df['edad_diagnostico'], 'SEXO=2': (df['SEXO'] == 2).astype(float),
+                         'REGCOM=2201': (df['REGCOM'] == 2201).astype(float),
+                         'REGCOM=2301': (df['REGCOM'] == 2301).astype(float)})
+
+
+def _lifelines(df: pd.DataFrame):
+    datos = pd.concat([_covariables(df), df[['tiempo_sobrevida_anios', 'evento']]], axis=1)
+    # Con la precisión por defecto lifelines se detiene antes; se le pide converger como ajustar_cox
+    ajustado = lifelines.CoxPHFitter().fit(datos, 'tiempo_sobrevida_anios', 'evento',
+                                           fit_options={'precision': 1e-12})
+    return ajustado, datos
+
+
+def _log_verosimilitud_breslow(beta, tiempos, eventos, X):
+    # Verosimilitud parcial de Breslow escrita directamente: cada muerte contra todo su conjunto en riesgo
+    eta = X @ beta
+    return sum(eta[i] - np.log(np.exp(eta[tiempos >= tiempos[i]]).sum()) for i in np.flatnonzero(eventos == 1))
+
+
+def test_efron_igual_a_lifelines():
+    df = _datos()
+    X = _covariables(df).to_numpy()
+    ajuste = ajustar_cox(df['tiempo_sobrevida_anios'], df['evento'], X, 'efron')
+    esperado, _ = _lifelines(df)
+
+    assert ajuste['convergencia']
+    np.testing.assert_allclose(ajuste['coeficientes'], esperado.params_.to_numpy(), rtol=1e-6)
+    np.testing.assert_allclose(np.sqrt(np.diag(ajuste['varianza'])), esperado.standard_errors_.to_numpy(), rtol=1e-5)
+    assert ajuste['log_verosimilitud'] == pytest.approx(esperado.log_likelihood_, rel=1e-9)
+
+
+def test_breslow_sin_empates_igual_a_lifelines():
+    # Sin empates Breslow y Efron coinciden, y lifelines ajusta con Efron
+    df = _datos(empates=False)
+    X = _covariables(df).to_numpy()
+    ajuste = ajustar_cox(df['tiempo_sobrevida_anios'], df['evento'], X, 'breslow')
+    esperado, _ = _lifelines(df)
+
+    np.testing.assert_allclose(ajuste['coeficientes'], esperado.params_.to_numpy(), rtol=1e-6)
+    np.testing.assert_allclose(np.sqrt(np.diag(ajuste['varianza'])), esperado.standard_errors_.to_numpy(), rtol=1e-5)
+    assert ajuste['log_verosimilitud'] == pytest.approx(esperado.log_likelihood_, rel=1e-9)
+
+
+def test_breslow_con_empates():
+    from scipy.optimize import approx_fprime
+
+    df = _datos(n=200)
+    tiempos, eventos = df['tiempo_sobrevida_anios'].to_numpy(), df['evento'].to_numpy()
+    X = _covariables(df).to_numpy()
+    ajuste = ajustar_cox(tiempos, eventos, X, 'breslow')
+    efron = ajustar_cox(tiempos, eventos, X, 'efron')
+
+    # La log-verosimilitud es la de Breslow, y en el máximo su gradiente se anula
+    def funcion(beta):
+        return _log_verosimilitud_breslow(beta, tiempos, eventos, X - X.mean(axis=0))
+
+    assert ajuste['log_verosimilitud'] == pytest.approx(funcion(ajuste['coeficientes']), rel=1e-9)
+    # En el máximo el paso de Newton con el gradiente numérico es despreciable
+    gradiente = approx_fprime(ajuste['coeficientes'], funcion, 1e-6)
+    np.testing.assert_allclose(ajuste['varianza'] @ gradiente, 0, atol=1e-5)
+    # Los errores estándar salen de la hessiana numérica de la log-verosimilitud
+    hessiana = np.array([approx_fprime(ajuste['coeficientes'], lambda b, k=k: approx_fprime(b, funcion, 1e-5)[k],
+                                       1e-5) for k in range(X.shape[1])])
+    np.testing.assert_allclose(np.sqrt(np.diag(ajuste['varianza'])), np.sqrt(np.diag(np.linalg.inv(-hessiana))),
+                               rtol=1e-3)
+    # Con empates Breslow atenúa los coeficientes respecto de Efron
+    assert np.all(np.abs(ajuste['coeficientes']) < np.abs(efron['coeficientes']))
+
+
+def test_prueba_riesgos_proporcionales_igual_a_lifelines():
+    df = _datos()
+    ajuste = ajustar_cox(df['tiempo_sobrevida_anios'], df['evento'], _covariables(df).to_numpy(), 'efron')
+    estadistico, p_valor = prueba_riesgos_proporcionales(ajuste)
+
+    ajustado, datos = _lifelines(df)
+    esperado = lifelines_statistics.proportional_hazard_test(ajustado, datos, time_transform='rank')
+    # lifelines ordena el resumen por nombre de variable
+    esperado = esperado.summary.loc[ajustado.params_.index]
+    np.testing.assert_allclose(estadistico, esperado['test_statistic'].to_numpy(), rtol=1e-5)
+    np.testing.assert_allclose(p_valor, esperado['p'].to_numpy(), rtol=1e-4)
+
+
+def test_cox_por_unidad_con_una_categoria_ausente():
+    # En 'Pulmón' no hay pacientes de la comuna 2201, y su modelo no lleva esa columna; en 'Colon' falta la
+    # comuna 2101 y la referencia pasa a ser la 2201
+    mama = _datos(semilla=16)
+    pulmon = _datos(semilla=17)
+    pulmon = pulmon[pulmon['REGCOM'] != 2201].assign(TUMOR_GRUPO='Pulmón')
+    colon = _datos(semilla=18)
+    colon = colon[colon['REGCOM'] != 2101].assign(TUMOR_GRUPO='Colon')
+    df = pd.concat([pulmon, mama, colon], ignore_index=True)
+
+    coeficientes, diagnosticos = cox_por_unidad(df, procesos=1)
+    variables = coeficientes.groupby('TUMOR_GRUPO')['variable'].apply(list).to_dict()
+    assert variables == {'Colon': ['edad_diagnostico', 'SEXO=2', 'REGCOM=2301'],
+                         'Mama': ['edad_diagnostico', 'SEXO=2', 'REGCOM=2201', 'REGCOM=2301'],
+                         'Pulmón': ['edad_diagnostico', 'SEXO=2', 'REGCOM=2301']}
+    assert diagnosticos['variable'].tolist() == coeficientes['variable'].tolist()
+
+    # Cada unidad coincide con su ajuste por separado
+    for unidad, datos in (('Mama', mama), ('Pulmón', pulmon), ('Colon', colon)):
+        fila = coeficientes[coeficientes['TUMOR_GRUPO'] == unidad]
+        X = _covariables(datos)[fila['variable']].to_numpy()
+        ajuste = ajustar_cox(datos['tiempo_sobrevida_anios'], datos['evento'], X)
+        np.testing.assert_allclose(fila['coef'], ajuste['coeficientes'], rtol=1e-9)
+        assert fila['casos'].iloc[0] == len(datos) and fila['eventos'].iloc[0] == datos['evento'].sum()
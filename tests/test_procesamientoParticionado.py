@@ -0,0 +1,111 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import comparar_curvas
+from cuboSobrevida import DIMENSIONES
+from procesamientoParticionado import REGION_DESCONOCIDA, procesar_particionado, region_de
+
+pytest.importorskip('pyarrow')
+
+
+# Comunas del registro sintético (todas de la región 2) llevadas a otras regiones, para que el registro se
+# reparta en varias particiones; los REGCOM vacíos van a la partición de la región desconocida
+COMUNAS_REGIONES = {'2201': '13101', '2301': '5101', '2104': '', '2202': ''}
+
+
+@pytest.fixture(scope='module')
+def ruta_registro(directorio_sintetico, tmp_path_factory):
+    """
+    Registro sintético con las comunas repartidas en las regiones 2, 5, 13 y la desconocida.
+    """
+    registro = pd.read_csv(os.path.join(directorio_sintetico, 'rpcdata_sintetico.csv'), dtype=str,
+                           keep_default_na=False)
+    registro['REGCOM'] = registro['REGCOM'].replace(COMUNAS_REGIONES)
+    ruta = str(tmp_path_factory.mktemp('regiones') / 'rpcdata_regiones.csv')
+    registro.to_csv(ruta, index=False)
+    return ruta
+
+
+@pytest.fixture(scope='module', params=[1, 2], ids=['serie', 'procesos'])
+def particionado(request, ruta_registro, directorio_sintetico, tmp_path_factory):
+    """
+    Resultado combinado del registro procesado por regiones, en serie y con un pool de procesos.
+    """
+    directorio = str(tmp_path_factory.mktemp('particiones'))
+    return procesar_particionado(ruta_registro, os.path.join(directorio_sintetico, 'defunciones'), directorio,
+                                 procesos=request.param, cubetas=8)
+
+
+@pytest.fixture(scope='module')
+def completo(ruta_registro, defunciones):
+    """
+    Cruce, cubo y tabla consolidada de todo el registro en un solo proceso.
+    """
+    from concordDataProcessor import procesar_registro
+    from cuboSobrevida import CuboSobrevida
+    from dataMerger import DataMerger
+    from descriptiveStatistics import DescriptiveStatistics
+    from kaplanMeierSimplificado import preparar_cohorte
+    from tumorGroups import TUMOR_GRUPOS, TablaTopografia
+
+    registro = procesar_registro(ruta_registro).obtener_datos()
+    registro['TUMOR_GRUPO'] = TablaTopografia().asignar_grupos(registro['TOP'])
+    cruce = DataMerger.desde_datos(registro, pd.concat(defunciones.values(), ignore_index=True))
+    cruce.cruzar_datos('2019-12-31')
+    vinculada = cruce.obtener_datos()
+    return {
+        'vinculada': vinculada,
+        'cubo': CuboSobrevida.desde_datos(preparar_cohorte(vinculada)),
+        'consolidado': DescriptiveStatistics.desde_datos(vinculada).obtener_tabla_consolidada(TUMOR_GRUPOS),
+        'resumen_cruce': cruce.resumen_cruce,
+    }
+
+
+def _ordenar(df: pd.DataFrame, claves: list):
+    """
+    Tabla ordenada por sus claves escritas como texto. Las claves numéricas se pasan antes a flotante:
+    REGCOM es entero en las particiones sin valores faltantes y flotante en el registro completo.
+    """
+    df = df.copy()
+    for clave in claves:
+        numeros = pd.to_numeric(df[clave].astype(object), errors='coerce')
+        if numeros.notna().sum() == df[clave].notna().sum():
+            df[clave] = numeros.astype(np.float64)
+    df = df.astype({clave: str for clave in claves})
+    return df.sort_values(claves, kind='stable').reset_index(drop=True)[sorted(df.columns)]
+
+
+def test_cubo_igual_al_procesamiento_completo(particionado, completo):
+    claves = DIMENSIONES + ['tiempo']
+    pd.testing.assert_frame_equal(_ordenar(particionado['cubo'].conteos, claves),
+                                  _ordenar(completo['cubo'].conteos, claves), check_dtype=False)
+    columnas_estrato = ['TUMOR_GRUPO', 'SEXO']
+    comparar_curvas(particionado['cubo'].curvas(columnas_estrato), completo['cubo'].curvas(columnas_estrato),
+                    columnas_estrato)
+
+
+def test_consolidado_igual_al_procesamiento_completo(particionado, completo):
+    claves = ['REGCOM', 'SEXO', 'TUMOR_GRUPO']
+    pd.testing.assert_frame_equal(_ordenar(particionado['estadisticas']['Consolidado'], claves),
+                                  _ordenar(completo['consolidado'], claves), check_dtype=False)
+    assert particionado['estadisticas']['Total']['Total de casos'].iloc[0] == len(completo['vinculada'])
+
+
+def test_resumen_cruce_igual_al_procesamiento_completo(particionado, completo):
+    assert particionado['resumen_cruce'] == pytest.approx(completo['resumen_cruce'])
+
+
+def test_cohortes_por_region(particionado, completo):
+    # Cada región exporta su parte de la cohorte vinculada; juntas tienen los mismos pacientes y defunciones
+    cohortes = pd.concat([pd.read_parquet(ruta) for ruta in particionado['cohortes']], ignore_index=True)
+    vinculada = completo['vinculada']
+    assert len(particionado['cohortes']) == 4
+    assert len(cohortes) == len(vinculada)
+    assert np.unique(region_de(cohortes['REGCOM'])).tolist() == [REGION_DESCONOCIDA, 2, 5, 13]
+    for columna in ('VM', 'CAUSA'):
+        assert cohortes[columna].value_counts().sort_index().tolist() == \
+            vinculada[columna].value_counts().sort_index().tolist()
+    assert sorted(cohortes['FECHA_DEF'].dropna()) == sorted(vinculada['FECHA_DEF'].dropna())
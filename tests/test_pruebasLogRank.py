@@ -0,0 +1,191 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pruebasLogRank import (PONDERACIONES, PRUEBA_GRAY, estadistico_gray, estadistico_k_muestras, pruebas_por_unidad,
+                            tablas_en_riesgo)
+
+lifelines_statistics = pytest.importorskip('lifelines.statistics')
+
+
+def _datos(n: int = 600, semilla: int = 11):
+    """
+    Cohorte aleatoria con cuatro grupos de riesgo distinto, dos estratos de ajuste y tiempos con empates.
+    El grupo 'D' no tiene eventos.
+    """
+    rng = np.random.default_rng(semilla)
+    grupo = rng.choice(['A', 'B', 'C', 'D'], size=n, p=[0.35, 0.3, 0.25, 0.1])
+    escala = pd.Series(grupo).map({'A': 4.0, 'B': 3.0, 'C': 6.0, 'D': 5.0}).to_numpy()
+    tiempos = np.round(rng.exponential(escala), 1) + 0.1
+    evento = ((rng.random(n) < 0.7) & (grupo != 'D')).astype(int)
+    return pd.DataFrame({'TUMOR_GRUPO': 'Mama', 'GRUPO': grupo, 'SEXO': rng.choice([1, 2], size=n),
+                         'tiempo_sobrevida_anios': tiempos, 'evento': evento})
+
+
+def _estadistico(resumen: pd.DataFrame, prueba: str):
+    return float(resumen.loc[resumen['prueba'] == prueba, 'estadistico'].iloc[0])
+
+
+@pytest.mark.parametrize('ponderacion', PONDERACIONES)
+def test_k_grupos_igual_a_lifelines(ponderacion):
+    df = _datos()
+    resumen, _ = pruebas_por_unidad(df, ['GRUPO'])
+    esperado = lifelines_statistics.multivariate_logrank_test(
+        df['tiempo_sobrevida_anios'], df['GRUPO'], df['evento'],
+        weightings=None if ponderacion == 'logrank' else ponderacion)
+
+    fila = resumen[resumen['prueba'] == ponderacion].iloc[0]
+    assert fila['grupos'] == 4 and fila['gl'] == 3
+    assert fila['estadistico'] == pytest.approx(esperado.test_statistic, rel=1e-9)
+    assert fila['p_valor'] == pytest.approx(esperado.p_value, rel=1e-6)
+
+
+def test_grupo_sin_eventos_igual_a_lifelines():
+    df = _datos()
+    df = df[df['GRUPO'].isin(['A', 'D'])]
+    resumen, detalle = pruebas_por_unidad(df, ['GRUPO'])
+    esperado = lifelines_statistics.multivariate_logrank_test(df['tiempo_sobrevida_anios'], df['GRUPO'],
+                                                              df['evento'])
+    assert _estadistico(resumen, 'logrank') == pytest.approx(esperado.test_statistic, rel=1e-9)
+    assert detalle.loc[detalle['grupo'] == 'D', 'observados'].iloc[0] == 0
+
+
+@pytest.mark.parametrize('ponderacion', PONDERACIONES)
+def test_ajuste_suma_los_estratos(ponderacion):
+    df = _datos()
+    resumen, _ = pruebas_por_unidad(df, ['GRUPO'], columnas_ajuste=['SEXO'])
+
+    # Cada estrato coincide con lifelines; la prueba ajustada suma sus O - E y sus covarianzas
+    o_menos_e, varianza = 0, 0
+    for _, estrato in df.groupby('SEXO'):
+        estrato = estrato.sort_values('tiempo_sobrevida_anios', kind='stable')
+        grupos = pd.factorize(estrato['GRUPO'], sort=True)[0]
+        muertes, en_riesgo, _ = tablas_en_riesgo(np.zeros(len(estrato), dtype=np.int64),
+                                                 estrato['tiempo_sobrevida_anios'].to_numpy(),
+                                                 estrato['evento'].to_numpy(dtype=np.float64), grupos, 4)
+        parcial = estadistico_k_muestras(muertes, en_riesgo, ponderacion)
+        esperado = lifelines_statistics.multivariate_logrank_test(
+            estrato['tiempo_sobrevida_anios'], estrato['GRUPO'], estrato['evento'],
+            weightings=None if ponderacion == 'logrank' else ponderacion)
+        assert parcial[2] == pytest.approx(esperado.test_statistic, rel=1e-9)
+        o_menos_e, varianza = o_menos_e + parcial[0], varianza + parcial[1]
+
+    ajustado = float(o_menos_e[:-1] @ np.linalg.inv(varianza[:-1, :-1]) @ o_menos_e[:-1])
+    assert _estadistico(resumen, ponderacion) == pytest.approx(ajustado, rel=1e-9)
+
+
+def _gray(tiempos, causas, grupos, k: int, rho: float = 0):
+    """
+    Prueba de Gray sobre arreglos sin ordenar (causa 0 = censurado, 1 = de interés, 2 = competitiva).
+    """
+    orden = np.argsort(tiempos, kind='stable')
+    tiempos, causas, grupos = tiempos[orden], causas[orden], grupos[orden]
+    ajuste = np.zeros(len(tiempos), dtype=np.int64)
+    muertes, en_riesgo, inicio = tablas_en_riesgo(ajuste, tiempos, (causas > 0).astype(np.float64), grupos, k)
+    muertes_causa, _, _ = tablas_en_riesgo(ajuste, tiempos, (causas == 1).astype(np.float64), grupos, k)
+    return estadistico_gray(muertes, muertes_causa, en_riesgo, inicio, rho)
+
+
+def test_gray_sin_censura_previa_es_log_rank_sobre_la_subdistribucion():
+    # Sin censura antes del cierre, R(t) es el número de pacientes que no murieron por la causa, y la prueba
+    # de Gray es un log-rank sobre T* (la muerte por otra causa queda censurada en el cierre). El puntaje
+    # coincide exactamente; la varianza de Gray y la hipergeométrica convergen a lo mismo.
+    rng = np.random.default_rng(3)
+    n, k, cierre = 20000, 3, 1.0
+    grupos = rng.integers(0, k, size=n)
+    tiempos = rng.exponential(1.0, size=n)
+    causas = np.where(tiempos <= cierre, rng.choice([1, 2], size=n, p=[0.4, 0.6]), 0)
+    tiempos = np.minimum(tiempos, cierre)
+    puntaje, varianza, _, gl = _gray(tiempos, causas, grupos, k)
+
+    subdistribucion = np.where(causas == 1, tiempos, cierre)
+    orden = np.argsort(subdistribucion, kind='stable')
+    muertes, en_riesgo, _ = tablas_en_riesgo(np.zeros(n, dtype=np.int64), subdistribucion[orden],
+                                             (causas[orden] == 1).astype(np.float64), grupos[orden], k)
+    o_menos_e, varianza_log_rank, _, _ = estadistico_k_muestras(muertes, en_riesgo)
+
+    assert gl == k - 1
+    np.testing.assert_allclose(puntaje, o_menos_e, rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(varianza, varianza_log_rank, rtol=0.02)
+
+
+def test_gray_varianza_del_desarrollo_lineal():
+    # La varianza de Gray es la del desarrollo lineal del puntaje en los incrementos de los riesgos acumulados
+    # por causa de cada grupo (Var dL = d / n^2). Se compara con ese desarrollo calculado por diferencias
+    # finitas, con grupos de riesgos competitivos y censuras distintas, donde la varianza hipergeométrica
+    # sobre los conjuntos en riesgo de la subdistribución se aleja en 1-2%.
+    rng = np.random.default_rng(2)
+    n, k = 1500, 3
+    grupos = rng.integers(0, k, size=n)
+    causas = rng.choice([1, 2], size=n, p=[0.35, 0.65])
+    tiempos = rng.exponential(np.where(causas == 1, 1.0, np.array([0.4, 1.0, 2.5])[grupos]))
+    censura = np.minimum(rng.exponential(np.array([1.0, 2.0, 4.0])[grupos]), 1.2)
+    causas = np.where(tiempos <= censura, causas, 0)
+    tiempos = np.minimum(tiempos, censura)
+
+    orden = np.argsort(tiempos, kind='stable')
+    tiempos, causas, grupos = tiempos[orden], causas[orden], grupos[orden]
+    ajuste = np.zeros(n, dtype=np.int64)
+    muertes, en_riesgo, inicio = tablas_en_riesgo(ajuste, tiempos, (causas > 0).astype(np.float64), grupos, k)
+    muertes_causa, _, _ = tablas_en_riesgo(ajuste, tiempos, (causas == 1).astype(np.float64), grupos, k)
+    puntaje, varianza, _, _ = estadistico_gray(muertes, muertes_causa, en_riesgo, inicio)
+
+    en_riesgo = en_riesgo.astype(np.float64)
+    divisor = np.where(en_riesgo > 0, en_riesgo, 1.0)
+    riesgos = [muertes_causa / divisor, (muertes - muertes_causa) / divisor]
+
+    def puntaje_de(riesgo_causa, riesgo_otras):
+        sobrevida = np.cumprod(1 - riesgo_causa - riesgo_otras, axis=0)
+        sobrevida_previa = np.vstack([np.ones((1, k)), sobrevida[:-1]])
+        incidencia = np.cumsum(sobrevida_previa * riesgo_causa, axis=0)
+        incidencia_previa = np.vstack([np.zeros((1, k)), incidencia[:-1]])
+        riesgo = en_riesgo * (1 - incidencia_previa) / np.where(sobrevida_previa > 0, sobrevida_previa, 1.0)
+        d_causa = en_riesgo * riesgo_causa
+        esperado = riesgo * (d_causa.sum(axis=1) / riesgo.sum(axis=1))[:, None]
+        return (d_causa - esperado).sum(axis=0)
+
+    base = puntaje_de(*riesgos)
+    np.testing.assert_allclose(base, puntaje, rtol=1e-9)
+    esperada = np.zeros((k, k))
+    paso = 1e-7
+    for causa, conteos in enumerate([muertes_causa, muertes - muertes_causa]):
+        for fila, grupo in zip(*np.nonzero(conteos)):
+            perturbados = [riesgo.copy() for riesgo in riesgos]
+            perturbados[causa][fila, grupo] += paso
+            gradiente = (puntaje_de(*perturbados) - base) / paso
+            esperada += np.outer(gradiente, gradiente) * conteos[fila, grupo] / en_riesgo[fila, grupo] ** 2
+    np.testing.assert_allclose(varianza, esperada, rtol=0.003)
+
+
+@pytest.mark.parametrize('rho', [0, 1])
+def test_gray_nivel_bajo_la_hipotesis_nula(rho):
+    # Tres grupos pequeños con la misma incidencia, muchas muertes por otras causas, censura distinta por
+    # grupo y empates: el estadístico debe seguir una chi2 con 2 grados de libertad
+    from scipy.stats import chi2
+
+    rng = np.random.default_rng(5)
+    estadisticos = []
+    for _ in range(400):
+        grupos = np.repeat(np.arange(3), 40)
+        tiempos = rng.exponential(1.0, size=len(grupos))
+        causas = rng.choice([1, 2], size=len(grupos), p=[0.3, 0.7])
+        censura = rng.exponential(np.array([0.7, 1.5, 3.0])[grupos])
+        causas = np.where(tiempos <= censura, causas, 0)
+        tiempos = np.round(np.minimum(tiempos, censura), 2) + 0.01
+        estadisticos.append(_gray(tiempos, causas, grupos, 3, rho)[2])
+
+    estadisticos = np.array(estadisticos)
+    assert 1.7 < estadisticos.mean() < 2.3
+    assert 0.02 < (chi2.sf(estadisticos, 2) < 0.05).mean() < 0.09
+
+
+def test_gray_fuera_de_las_pruebas_por_defecto(cohorte):
+    from kaplanMeierSimplificado import calcular_pruebas
+
+    comunas = cohorte['REGCOM'].astype(str).value_counts().index[:2].tolist()
+    resumen, _ = calcular_pruebas(cohorte, comunas)
+    assert PRUEBA_GRAY not in set(resumen['prueba'])
+
+    resumen, _ = calcular_pruebas(cohorte, comunas, ponderaciones=PONDERACIONES + (PRUEBA_GRAY,))
+    gray = resumen[resumen['prueba'] == PRUEBA_GRAY]
+    assert len(gray) > 0 and gray['p_valor'].between(0, 1).all()
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from rutUtils import descomponer_rut, digito_verificador, formatear_rut, normalizar_rut
+
+
+@pytest.mark.parametrize('valor, cuerpo, digito', [
+    ('12.345.678-5', 12345678, '5'),
+    ('12345678-5', 12345678, '5'),
+    (' 12 345 678 - 5 ', 12345678, '5'),
+    ('8.919.993-K', 8919993, 'K'),
+    ('8919993-k', 8919993, 'K'),
+    ('8919993K', 8919993, 'K'),
+    ('12345678', 12345678, None),
+    # Leído como flotante desde Excel
+    ('12345678.0', 12345678, None),
+    # Dígito verificador pegado al cuerpo: solo se separa si el número tiene más de 8 dígitos y el
+    # dígito corresponde; con 8 dígitos no se distingue de un cuerpo
+    ('123456785', 12345678, '5'),
+    ('123456785.0', 12345678, '5'),
+    ('123456784', 123456784, None),
+    ('89199937', 89199937, None),
+    ('', -1, None),
+    ('0', -1, None),
+    ('SIN RUT', -1, None),
+    (None, -1, None),
+])
+def test_normalizar_rut(valor, cuerpo, digito):
+    serie = pd.Series([valor, '1000000-9'], dtype=object)
+    cuerpos, digitos = descomponer_rut(serie)
+    assert cuerpos.tolist() == [cuerpo, 1000000]
+    assert digitos.tolist() == [digito, '9']
+    assert normalizar_rut(serie).tolist() == [cuerpo, 1000000]
+
+
+def test_normalizar_rut_entero():
+    serie = pd.Series(pd.array([12345678, 0, None], dtype='Int32'))
+    assert normalizar_rut(serie).tolist() == [12345678, -1, -1]
+    assert normalizar_rut(pd.Series([12345678, 0])).tolist() == [12345678, -1]
+
+
+def test_digito_verificador_y_formato():
+    assert digito_verificador([12345678, 8919993, 1000000, 11111111]).tolist() == ['5', 'K', '9', '1']
+    assert formatear_rut(np.array([12345678, 12345678, -1]), [None, '4', None]).tolist() == \
+        ['12345678-5', '12345678-4', None]
@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dateUtils import edad_cumplida
+from vinculacionProbabilistica import (UMBRAL_ACEPTACION, UMBRAL_REVISION, asignar_uno_a_uno, comparar,
+                                       estimar_pesos, preparar_defunciones, preparar_registro, sumar_pesos,
+                                       vincular)
+
+
+def _cambiar_digito(cuerpo: int, posicion: int):
+    texto = str(cuerpo)
+    return int(texto[:posicion] + str((int(texto[posicion]) + 3) % 10) + texto[posicion + 1:])
+
+
+def _transponer(cuerpo: int):
+    texto = str(cuerpo)
+    posicion = next(k for k in range(2, len(texto) - 1) if texto[k] != texto[k + 1])
+    return int(texto[:posicion] + texto[posicion + 1] + texto[posicion] + texto[posicion + 2:])
+
+
+def _defuncion(paciente: pd.Series, run: str, dias: int = 400):
+    """
+    Defunción de un paciente del registro: mismo sexo, comuna y sitio del cáncer, y la edad que corresponde a
+    su fecha de nacimiento.
+    """
+    fecha = paciente['FECDIAG'] + pd.Timedelta(days=dias)
+    return {'RUN': run, 'SEXO': str(paciente['SEXO']),
+            'EDAD': str(int(edad_cumplida(paciente['FECNAC'], fecha))), 'COMUNA': str(paciente['REGCOM']),
+            'FECHA_DEF': fecha, 'DIAG1': f"C{int(paciente['TOP']):03d}"}
+
+
+@pytest.fixture(scope='module')
+def casos(registro):
+    """
+    Registro sintético y defunciones armadas a partir de cuatro de sus pacientes (RUN con un dígito
+    cambiado, con dos dígitos vecinos intercambiados, y un RUN de otra persona con los demás datos
+    iguales), más defunciones de la población general. Devuelve el registro, las defunciones y la fila de
+    cada paciente.
+    """
+    unicos = registro[~registro['RUT'].duplicated(keep=False) & registro['RUT'].notna()
+                      & registro['SEXO'].isin([1, 2]) & registro['FECNAC'].notna() & registro['FECDIAG'].notna()]
+    pacientes = unicos.index[[0, 1, 2]]
+    filas = [registro.index.get_loc(indice) for indice in pacientes]
+    cuerpos = [int(registro.loc[indice, 'RUT']) for indice in pacientes]
+
+    especificas = [
+        _defuncion(registro.loc[pacientes[0]], f"{_cambiar_digito(cuerpos[0], 3)}-1"),
+        _defuncion(registro.loc[pacientes[1]], f"{_transponer(cuerpos[1])}-1"),
+        # RUN de otra persona (fuera del registro) con sexo, nacimiento, comuna y sitio del paciente 2
+        _defuncion(registro.loc[pacientes[2]], '45123789-1'),
+    ]
+    rng = np.random.default_rng(8)
+    n = 300
+    fechas = pd.Timestamp('2012-01-01') + pd.to_timedelta(rng.integers(0, 2900, n), unit='D')
+    generales = pd.DataFrame({
+        'RUN': (40_000_000 + rng.choice(5_000_000, n, replace=False)).astype(str),
+        'SEXO': rng.choice(['1', '2'], n), 'EDAD': rng.integers(30, 95, n).astype(str),
+        'COMUNA': rng.choice(['2101', '2201', '2301'], n), 'FECHA_DEF': fechas,
+        'DIAG1': rng.choice(['I219', 'J189', 'C349', 'C509', 'C169'], n),
+    })
+    defunciones = pd.concat([pd.DataFrame(especificas), generales], ignore_index=True)
+    return registro, defunciones, filas
+
+
+def test_run_con_un_error_se_acepta(casos):
+    registro, defunciones, filas = casos
+    pares = vincular(registro, defunciones, procesos=1)
+    for defuncion, nivel in ((0, 'un_digito'), (1, 'transposicion')):
+        par = pares[pares['fila_defuncion'] == defuncion]
+        assert len(par) == 1
+        assert par['fila_registro'].iloc[0] == filas[defuncion]
+        assert par['nivel_run'].iloc[0] == nivel
+        assert par['peso'].iloc[0] > UMBRAL_ACEPTACION
+        assert par['decision'].iloc[0] == 'aceptado'
+
+
+def test_run_distinto_queda_bajo_el_umbral_de_revision(casos):
+    registro, defunciones, filas = casos
+    pares = vincular(registro, defunciones, procesos=1)
+    assert not (pares['fila_defuncion'] == 2).any()
+
+    # Con sexo, edad, comuna y sitio iguales, un RUN distinto no llega a revisión
+    datos_registro, datos_defunciones = preparar_registro(registro), preparar_defunciones(defunciones)
+    niveles = comparar(datos_registro, datos_defunciones, np.array([filas[2]]), np.array([2]))
+    assert {campo: int(nivel[0]) for campo, nivel in niveles.items()} == \
+        {'run': 0, 'sexo': 1, 'edad': 2, 'comuna': 1, 'causa': 1}
+    peso = sumar_pesos(niveles, estimar_pesos(datos_registro, datos_defunciones))[0]
+    assert peso < UMBRAL_REVISION
+
+
+def test_vinculacion_uno_a_uno(casos):
+    # Una segunda defunción del paciente 0 (con el RUN exacto) compite con la del dígito cambiado: el
+    # paciente queda con la de mayor peso y la otra defunción sin vincular
+    registro, defunciones, filas = casos
+    paciente = registro.iloc[filas[0]]
+    exacta = pd.DataFrame([_defuncion(paciente, f"{int(paciente['RUT'])}-1", dias=500)])
+    defunciones = pd.concat([defunciones, exacta], ignore_index=True)
+    pares = vincular(registro, defunciones, procesos=1)
+
+    assert pares['fila_registro'].is_unique and pares['fila_defuncion'].is_unique
+    del_paciente = pares[pares['fila_registro'] == filas[0]]
+    assert del_paciente['fila_defuncion'].tolist() == [len(defunciones) - 1]
+    assert del_paciente['nivel_run'].tolist() == ['igual']
+
+
+def test_asignar_uno_a_uno_prefiere_los_mayores_pesos():
+    i = np.array([0, 0, 1, 1, 2])
+    j = np.array([0, 1, 0, 1, 1])
+    peso = np.array([10.0, 9.0, 8.0, 2.0, 5.0])
+    elegidos = asignar_uno_a_uno(i, j, peso)
+    # (0, 0) es la mejor opción de ambos lados; después (2, 1) le gana a (1, 1)
+    assert elegidos.tolist() == [0, 4]
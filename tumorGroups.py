@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+# Diccionario que agrupa los tumores según los códigos CIEO (sin la letra 'C')
+TUMOR_GRUPOS = {
+    "Tráquea, bronquio pulmón": ['33.9', '340', '341', '342', '343', '348', '349'],
+    "Próstata": ['619'],
+    "Estómago": ['160', '161', '162', '163', '164', '165', '166', '168', '169'],
+    "Colon": ['180', '181', '182', '183', '184', '185', '186', '187', '188', '189'],
+    "Recto": ['209'],
+    "Mama": ['500', '501', '502', '503', '504', '505', '506', '508', '509'],
+    "Vesícula biliar": ['239'],
+    "Cuello uterino": ['530', '531', '538', '539'],
+    "Hígado": ['220', '221', '222', '223', '224', '227', '229']
+}
+
+GRUPO_OTRO = "Otro"
+
+
+def normalizar_codigo_top(codigo):
+    """
+    Convierte un código de topografía CIE-O a su forma entera de tres dígitos (C33.9 -> 339).
+
+    Acepta enteros (339), flotantes leídos desde Excel (339.0 o 33.9) y textos ('339', '33.9',
+    'C33.9'). Devuelve -1 si el código no es válido.
+    """
+    if codigo is None or (isinstance(codigo, float) and np.isnan(codigo)):
+        return -1
+
+    if isinstance(codigo, (int, np.integer)):
+        valor = int(codigo)
+    elif isinstance(codigo, (float, np.floating)):
+        # 339.0 es un entero leído como flotante; 33.9 es la notación con punto decimal
+        valor = int(codigo) if float(codigo).is_integer() else int(round(float(codigo) * 10))
+    else:
+        texto = str(codigo).strip().upper().lstrip('C')
+        try:
+            if '.' in texto:
+                entera, decimal = texto.split('.', 1)
+                if len(entera) == 3 and decimal.strip('0') == '':
+                    valor = int(entera)
+                else:
+                    valor = int(entera) * 10 + int(decimal[:1] or 0)
+            else:
+                valor = int(texto)
+        except ValueError:
+            return -1
+
+    return valor if 0 <= valor <= 999 else -1
+
+
+class TablaTopografia:
+    def __init__(self, tumor_grupos: dict = None):
+        """
+        Compila el diccionario de grupos de tumor en una tabla indexada por código TOP
+        (0-999), de modo que la búsqueda del grupo de un código es O(1).
+        """
+        if tumor_grupos is None:
+            tumor_grupos = TUMOR_GRUPOS
+        self.grupos = list(tumor_grupos) + [GRUPO_OTRO]
+        self.codigo_otro = len(self.grupos) - 1
+
+        self.tabla = np.full(1000, self.codigo_otro, dtype=np.int16)
+        # Se recorre en orden inverso para que, si un código aparece en dos grupos, gane el primero
+        for indice in range(len(tumor_grupos) - 1, -1, -1):
+            for codigo in tumor_grupos[self.grupos[indice]]:
+                normalizado = normalizar_codigo_top(codigo)
+                if normalizado >= 0:
+                    self.tabla[normalizado] = indice
+
+    def grupo_de(self, codigo_top):
+        """
+        Devuelve el nombre del grupo de tumor de un código TOP.
+        """
+        normalizado = normalizar_codigo_top(codigo_top)
+        if normalizado < 0:
+            return GRUPO_OTRO
+        return self.grupos[self.tabla[normalizado]]
+
+    def asignar_grupos(self, serie_top: pd.Series):
+        """
+        Devuelve la columna categórica de grupo de tumor para una serie de códigos TOP.
+
+        Solo se normalizan los valores distintos de la serie; cada fila se resuelve con una
+        indexación en la tabla compilada.
+        """
+        codigos, unicos = pd.factorize(serie_top, use_na_sentinel=True)
+        grupos_unicos = [self.tabla[c] if c >= 0 else self.codigo_otro for c in map(normalizar_codigo_top, unicos)]
+        # El último elemento corresponde a los valores faltantes (código -1 de factorize)
+        grupos_unicos = np.array(grupos_unicos + [self.codigo_otro], dtype=np.int16)
+        grupos = grupos_unicos[codigos]
+        return pd.Series(pd.Categorical.from_codes(grupos, categories=self.grupos), index=serie_top.index)
+
+    def indices_por_grupo(self, df: pd.DataFrame, columna: str = 'TUMOR_GRUPO'):
+        """
+        Devuelve un diccionario {grupo: posiciones de fila} calculado con un único ordenamiento.
+        """
+        categorias = df[columna].cat.categories
+        codigos = df[columna].cat.codes.to_numpy()
+        orden = np.argsort(codigos, kind='stable')
+        limites = np.searchsorted(codigos[orden], np.arange(len(categorias) + 1))
+        return {nombre: orden[limites[i]:limites[i + 1]] for i, nombre in enumerate(categorias)}
+
+    def seleccionar(self, df: pd.DataFrame, grupos: list, columna: str = 'TUMOR_GRUPO'):
+        """
+        Devuelve las filas de los grupos indicados, conservando el orden original. Los grupos sin casos
+        (p. ej. categorías eliminadas al compactar la cohorte) no aportan filas.
+        """
+        indices = self.indices_por_grupo(df, columna)
+        sin_casos = np.empty(0, dtype=np.intp)
+        posiciones = np.sort(np.concatenate([indices.get(nombre, sin_casos) for nombre in grupos]))
+        return df.iloc[posiciones]
@@ -0,0 +1,421 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from dateUtils import edad_cumplida
+from rutUtils import normalizar_rut
+
+# Niveles de comparación de cada campo, del desacuerdo al acuerdo total. En el RUN se distinguen los
+# errores más comunes: dos dígitos vecinos intercambiados, un dígito distinto y el dígito verificador
+# pegado al cuerpo sin guion ('123456785' en vez de '12345678-5')
+NIVELES = {
+    'run': ('distinto', 'transposicion', 'un_digito', 'verificador', 'igual'),
+    'sexo': ('distinto', 'igual'),
+    'edad': ('distinta', 'un_anio', 'igual'),
+    'comuna': ('distinta', 'igual'),
+    'causa': ('distinta', 'igual'),
+}
+
+# Probabilidad m de cada nivel: la de observarlo en un par que sí es la misma persona
+PROBABILIDADES_M = {
+    'run': (0.02, 0.01, 0.03, 0.02, 0.92),
+    'sexo': (0.02, 0.98),
+    'edad': (0.03, 0.12, 0.85),
+    'comuna': (0.25, 0.75),
+    'causa': (0.35, 0.65),
+}
+
+# Probabilidad u de los niveles del RUN para dos cuerpos de 8 dígitos al azar. La de los demás campos se
+# estima con la frecuencia de sus valores en los datos
+PROBABILIDADES_U_RUN = (1.0, 7e-8, 7.2e-7, 1e-8, 1e-8)
+
+# Umbrales sobre el peso total del par (suma de log2(m/u) de cada campo). Sexo, edad, comuna y causa suman
+# a lo más unos 12 a 14 puntos, por lo que aceptar exige además un RUN igual o casi igual (15 a 26 puntos);
+# con un RUN distinto el par no pasa de unos 8,6 puntos y no llega a revisión
+UMBRAL_ACEPTACION = 17.0
+UMBRAL_REVISION = 9.0
+
+# Pasadas de bloqueo: solo se comparan los pares que coinciden en la clave de al menos una pasada. Con los
+# 4 primeros dígitos del RUN, los restantes y los extremos (sin los dígitos 4 y 5), un dígito cambiado, dos
+# vecinos intercambiados o el verificador pegado dejan intacta al menos una clave, así que ningún par
+# aceptable queda fuera; la pasada por sexo, año de nacimiento y sitio del cáncer agrega para revisión los
+# pares sin RUN o con más de un error
+PASADAS = ('sexo_nacimiento_sitio', 'prefijo_run', 'sufijo_run', 'extremos_run')
+
+# Sitio de las causas de muerte que no son cáncer (no coincide con ningún sitio CIE-O, 00 a 80)
+OTRA_CAUSA = 100
+
+# Pares comparados por tarea, para acotar la memoria de cada proceso
+PARES_POR_TAREA = 500_000
+
+# Datos de la vinculación; en los procesos se fijan una sola vez al iniciarlos
+_REGISTRO = None
+_DEFUNCIONES = None
+_BLOQUES = None
+_PESOS = None
+
+
+def _inicializar_trabajador(registro, defunciones, bloques, pesos):
+    """
+    Fija en el proceso los arreglos de solo lectura de la vinculación, para no enviarlos en cada tarea.
+    """
+    global _REGISTRO, _DEFUNCIONES, _BLOQUES, _PESOS
+    _REGISTRO = registro
+    _DEFUNCIONES = defunciones
+    _BLOQUES = bloques
+    _PESOS = pesos
+
+
+def _enteros(df: pd.DataFrame, columna: str):
+    """
+    Columna como arreglo int64 con -1 en los faltantes (o toda en -1 si la columna no existe).
+    """
+    if columna not in df.columns:
+        return np.full(len(df), -1, dtype=np.int64)
+    serie = df[columna]
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        serie = serie.astype(object)
+    return pd.to_numeric(serie, errors='coerce').fillna(-1).to_numpy(dtype=np.int64)
+
+
+def _fechas(df: pd.DataFrame, columna: str):
+    if columna not in df.columns:
+        return np.full(len(df), np.datetime64('NaT'), dtype='datetime64[D]')
+    return pd.to_datetime(df[columna], errors='coerce').to_numpy(dtype='datetime64[D]')
+
+
+def _sitio(df: pd.DataFrame, columna: str, letra: str = ''):
+    """
+    Sitio de 2 dígitos de un código topográfico (TOP 341 -> 34) o de una causa CIE-10 ('C349' -> 34).
+    Las causas que no empiezan con `letra` (p. ej. muertes no oncológicas) quedan como OTRA_CAUSA y los
+    faltantes como -1.
+    """
+    if columna not in df.columns:
+        return np.full(len(df), -1, dtype=np.int64)
+    texto = df[columna].astype('string').str.strip().str.upper()
+    sitio = pd.Series(-1, index=df.index, dtype=np.int64)
+    if letra:
+        otra_causa = texto.notna() & ~texto.str.startswith(letra, na=False)
+        sitio[otra_causa] = OTRA_CAUSA
+        texto = texto.where(texto.str.startswith(letra, na=False)).str[len(letra):]
+    digitos = texto.str.replace(r'\D', '', regex=True)
+    # En CIE-10 el sitio son los 2 dígitos tras la letra; en CIE-O, los 2 primeros de 3 (TOP 80 = C08.0)
+    digitos = digitos.str[:2] if letra else digitos.str.zfill(3).str[:2]
+    numeros = pd.to_numeric(digitos, errors='coerce')
+    return np.where(numeros.notna(), numeros.fillna(-1), sitio).astype(np.int64)
+
+
+def _edad_defuncion(defunciones: pd.DataFrame):
+    """
+    Edad al morir en años. Los archivos del DEIS traen EDAD, o EDAD_TIPO (1 = años, 2 = meses, 3 = días,
+    4 = horas) y EDAD_CANT.
+    """
+    if 'EDAD' in defunciones.columns:
+        return _enteros(defunciones, 'EDAD')
+    tipo, cantidad = _enteros(defunciones, 'EDAD_TIPO'), _enteros(defunciones, 'EDAD_CANT')
+    return np.where(tipo == 1, cantidad, np.where(np.isin(tipo, [2, 3, 4]) & (cantidad >= 0), 0, -1))
+
+
+def preparar_registro(registro: pd.DataFrame):
+    """
+    Arreglos de comparación de los pacientes del registro (RUT, SEXO, FECNAC, REGCOM, FECDIAG, TOP).
+    """
+    fecha_nacimiento = _fechas(registro, 'FECNAC')
+    anio_nacimiento = fecha_nacimiento.astype('datetime64[Y]').astype(np.int64) + 1970
+    return {
+        'run': normalizar_rut(registro['RUT']) if 'RUT' in registro.columns else np.full(len(registro), -1),
+        'sexo': _enteros(registro, 'SEXO'),
+        'fecha_nacimiento': fecha_nacimiento,
+        'anio_nacimiento': np.where(np.isnat(fecha_nacimiento), -1, anio_nacimiento),
+        'comuna': _enteros(registro, 'REGCOM'),
+        'fecha_diagnostico': _fechas(registro, 'FECDIAG'),
+        'sitio': _sitio(registro, 'TOP'),
+    }
+
+
+def preparar_defunciones(defunciones: pd.DataFrame):
+    """
+    Arreglos de comparación de las defunciones (RUN, SEXO, EDAD, COMUNA, FECHA_DEF, DIAG1).
+    """
+    fecha = _fechas(defunciones, 'FECHA_DEF')
+    edad = _edad_defuncion(defunciones)
+    anio = fecha.astype('datetime64[Y]').astype(np.int64) + 1970
+    return {
+        'run': normalizar_rut(defunciones['RUN']) if 'RUN' in defunciones.columns else np.full(len(defunciones), -1),
+        'sexo': _enteros(defunciones, 'SEXO'),
+        'edad': edad,
+        # Con la edad en años cumplidos, el nacimiento fue en el año de la muerte menos la edad o el anterior
+        'anio_nacimiento': np.where(np.isnat(fecha) | (edad < 0), -1, anio - edad),
+        'comuna': _enteros(defunciones, 'COMUNA'),
+        'fecha': fecha,
+        'sitio': _sitio(defunciones, 'DIAG1', letra='C'),
+    }
+
+
+def _cifras(valores):
+    """
+    Cantidad de dígitos de cada cuerpo de RUT (0 si falta).
+    """
+    cifras = np.zeros(len(valores), dtype=np.int64)
+    restantes = np.maximum(valores, 0)
+    while (restantes > 0).any():
+        cifras += restantes > 0
+        restantes = restantes // 10
+    return cifras
+
+
+def _claves(datos: dict, pasada: str, desplazamiento: int = 0):
+    """
+    Clave de bloqueo de cada registro en una pasada (-1 si no se puede calcular). En las defunciones la
+    pasada por año de nacimiento se hace con el año estimado y con el anterior (`desplazamiento`).
+    """
+    run = datos['run']
+    if pasada == 'sexo_nacimiento_sitio':
+        anio = np.where(datos['anio_nacimiento'] >= 0, datos['anio_nacimiento'] - desplazamiento, -1)
+        valida = (datos['sexo'] >= 0) & (anio >= 0) & (datos['sitio'] >= 0)
+        return np.where(valida, (datos['sexo'] * 10_000 + anio) * 1000 + datos['sitio'], -1)
+    cifras = _cifras(run)
+    resto = np.maximum(cifras - 4, 0)
+    if pasada == 'prefijo_run':
+        return np.where(cifras >= 6, run // 10 ** resto, -1)
+    if pasada == 'sufijo_run':
+        return np.where(cifras >= 6, cifras * 10 ** 10 + run % 10 ** resto, -1)
+    if pasada == 'extremos_run':
+        primeros = run // 10 ** np.maximum(cifras - 3, 0)
+        ultimos = run % 10 ** np.maximum(cifras - 5, 0)
+        return np.where(cifras >= 6, (cifras * 1000 + primeros) * 10 ** 10 + ultimos, -1)
+    raise ValueError(f"Pasada de bloqueo desconocida: {pasada}. Opciones: {PASADAS}")
+
+
+def _bloque(registro: dict, defunciones: dict, pasada: str):
+    """
+    Índice de bloqueo de una pasada: las filas del registro con clave y sus claves, y las claves de las
+    defunciones ordenadas con la fila de cada una.
+    """
+    claves_registro = _claves(registro, pasada)
+    filas_registro = np.flatnonzero(claves_registro >= 0)
+    desplazamientos = (0, 1) if pasada == 'sexo_nacimiento_sitio' else (0,)
+    claves_defuncion = np.concatenate([_claves(defunciones, pasada, d) for d in desplazamientos])
+    filas_defuncion = np.tile(np.arange(len(defunciones['run'])), len(desplazamientos))
+    validas = claves_defuncion >= 0
+    claves_defuncion, filas_defuncion = claves_defuncion[validas], filas_defuncion[validas]
+    orden = np.argsort(claves_defuncion, kind='stable')
+    return filas_registro, claves_registro[filas_registro], claves_defuncion[orden], filas_defuncion[orden]
+
+
+def _pares(claves_izquierda, claves_derecha_ordenadas, filas_derecha):
+    """
+    Todos los pares con la misma clave: para cada clave de la izquierda, el tramo de claves iguales de la
+    derecha (ordenada). Devuelve la posición en la izquierda y la fila de la derecha de cada par.
+    """
+    inicio = np.searchsorted(claves_derecha_ordenadas, claves_izquierda, 'left')
+    cantidad = np.searchsorted(claves_derecha_ordenadas, claves_izquierda, 'right') - inicio
+    izquierda = np.repeat(np.arange(len(claves_izquierda)), cantidad)
+    desplazamiento = np.arange(cantidad.sum()) - np.repeat(np.cumsum(cantidad) - cantidad, cantidad)
+    return izquierda, filas_derecha[np.repeat(inicio, cantidad) + desplazamiento]
+
+
+def _nivel_run(a, b):
+    """
+    Nivel de comparación del RUN de cada par (índice en NIVELES['run'], -1 si falta alguno).
+    """
+    faltante = (a < 0) | (b < 0)
+    verificador = (b // 10 == a) | (a // 10 == b)
+    mismo_largo = _cifras(a) == _cifras(b)
+
+    # Dígito por dígito: cantidad de posiciones distintas y si hay dos vecinas intercambiadas
+    distintas = np.zeros(len(a), dtype=np.int64)
+    intercambio = np.zeros(len(a), dtype=bool)
+    resto_a, resto_b = np.maximum(a, 0), np.maximum(b, 0)
+    digito_a, digito_b = resto_a % 10, resto_b % 10
+    while (resto_a > 0).any() or (resto_b > 0).any():
+        resto_a, resto_b = resto_a // 10, resto_b // 10
+        siguiente_a, siguiente_b = resto_a % 10, resto_b % 10
+        distintas += digito_a != digito_b
+        intercambio |= (digito_a != digito_b) & (digito_a == siguiente_b) & (siguiente_a == digito_b)
+        digito_a, digito_b = siguiente_a, siguiente_b
+
+    return np.select([faltante, a == b, verificador, mismo_largo & (distintas == 1),
+                      mismo_largo & (distintas == 2) & intercambio], [-1, 4, 3, 2, 1], 0)
+
+
+def comparar(registro: dict, defunciones: dict, i, j):
+    """
+    Nivel de comparación de cada campo para los pares (fila i del registro, fila j de las defunciones).
+    Devuelve un diccionario campo -> arreglo de niveles (índices en NIVELES; -1 si el dato falta).
+    """
+    def igualdad(a, b):
+        return np.where((a < 0) | (b < 0), -1, (a == b).astype(np.int64))
+
+    sexo_registro, sexo_defuncion = registro['sexo'][i], defunciones['sexo'][j]
+    edad = edad_cumplida(registro['fecha_nacimiento'][i], defunciones['fecha'][j])
+    edad_defuncion = defunciones['edad'][j]
+    diferencia = np.abs(np.nan_to_num(np.asarray(edad, dtype=np.float64), nan=-1000) - edad_defuncion)
+    return {
+        'run': _nivel_run(registro['run'][i], defunciones['run'][j]),
+        # Solo 1 (hombre) y 2 (mujer) se comparan; 9 es sexo indeterminado
+        'sexo': igualdad(np.where(np.isin(sexo_registro, [1, 2]), sexo_registro, -1),
+                         np.where(np.isin(sexo_defuncion, [1, 2]), sexo_defuncion, -1)),
+        'edad': np.where(np.isnan(np.asarray(edad, dtype=np.float64)) | (edad_defuncion < 0), -1,
+                         np.select([diferencia == 0, diferencia == 1], [2, 1], 0)),
+        'comuna': igualdad(registro['comuna'][i], defunciones['comuna'][j]),
+        'causa': igualdad(registro['sitio'][i], defunciones['sitio'][j]),
+    }
+
+
+def sumar_pesos(niveles: dict, pesos: dict):
+    """
+    Peso total de cada par: la suma de los pesos de sus niveles (0 para los campos faltantes).
+    """
+    total = np.zeros(len(next(iter(niveles.values()))), dtype=np.float64)
+    for campo, nivel in niveles.items():
+        total += np.where(nivel >= 0, pesos[campo][np.maximum(nivel, 0)], 0.0)
+    return total
+
+
+def _u_igualdad(a, b):
+    """
+    Probabilidad de que dos valores tomados al azar (uno de cada lado) coincidan.
+    """
+    p = pd.Series(a[a >= 0]).value_counts(normalize=True)
+    q = pd.Series(b[b >= 0]).value_counts(normalize=True)
+    return float((p * q.reindex(p.index, fill_value=0)).sum())
+
+
+def estimar_pesos(registro: dict, defunciones: dict):
+    """
+    Peso log2(m/u) de cada nivel de cada campo. Las probabilidades u se estiman con la frecuencia de los
+    valores de los dos lados (para la edad, con la de los años de nacimiento).
+    """
+    u = {'run': np.array(PROBABILIDADES_U_RUN)}
+    for campo in ('sexo', 'comuna'):
+        igual = _u_igualdad(registro[campo], defunciones[campo])
+        u[campo] = np.array([1 - igual, igual])
+    igual = _u_igualdad(registro['sitio'], defunciones['sitio'])
+    u['causa'] = np.array([1 - igual, igual])
+    nacimiento = registro['anio_nacimiento']
+    igual = _u_igualdad(nacimiento, defunciones['anio_nacimiento'])
+    vecino = (_u_igualdad(nacimiento + 1, defunciones['anio_nacimiento'])
+              + _u_igualdad(nacimiento - 1, defunciones['anio_nacimiento']))
+    u['edad'] = np.array([1 - igual - vecino, vecino, igual])
+
+    return {campo: np.log2(np.array(PROBABILIDADES_M[campo]) / np.clip(u[campo], 1e-12, 1.0))
+            for campo in NIVELES}
+
+
+def _puntuar_tramo(pasada: int, inicio: int, fin: int, ventana_dias: int, umbral: float):
+    """
+    Compara los pares de un tramo de filas del registro en una pasada de bloqueo y devuelve los que
+    superan `umbral` como (fila del registro, fila de la defunción, peso).
+    """
+    filas_registro, claves_registro, claves_defuncion, filas_defuncion = _BLOQUES[pasada]
+    izquierda, j = _pares(claves_registro[inicio:fin], claves_defuncion, filas_defuncion)
+    i = filas_registro[inicio:fin][izquierda]
+
+    # La muerte no puede ser anterior al diagnóstico (con `ventana_dias` de tolerancia)
+    diagnostico = _REGISTRO['fecha_diagnostico'][i]
+    posible = np.isnat(diagnostico) | (_DEFUNCIONES['fecha'][j] >= diagnostico - np.timedelta64(ventana_dias, 'D'))
+    i, j = i[posible], j[posible]
+
+    peso = sumar_pesos(comparar(_REGISTRO, _DEFUNCIONES, i, j), _PESOS)
+    conservar = peso >= umbral
+    return i[conservar], j[conservar], peso[conservar]
+
+
+def _tareas(bloques: list):
+    """
+    Reparte cada pasada en tramos de filas del registro con a lo más PARES_POR_TAREA pares (salvo una fila
+    que por sí sola tenga más).
+    """
+    tareas = []
+    for pasada, (_, claves_registro, claves_defuncion, _) in enumerate(bloques):
+        cantidad = (np.searchsorted(claves_defuncion, claves_registro, 'right')
+                    - np.searchsorted(claves_defuncion, claves_registro, 'left'))
+        acumulado = np.cumsum(cantidad)
+        inicio = 0
+        while inicio < len(claves_registro):
+            base = acumulado[inicio - 1] if inicio else 0
+            fin = max(int(np.searchsorted(acumulado, base + PARES_POR_TAREA, 'right')), inicio + 1)
+            if acumulado[fin - 1] > base:
+                tareas.append((pasada, inicio, fin))
+            inicio = fin
+    return tareas
+
+
+def asignar_uno_a_uno(i, j, peso):
+    """
+    Deja a lo más un par por fila del registro y por defunción, prefiriendo los de mayor peso: en cada
+    ronda se eligen los pares que son la mejor opción de ambos lados y se descartan sus competidores.
+    Devuelve las posiciones de los pares elegidos.
+    """
+    orden = np.lexsort((j, i, -peso))
+    i, j = i[orden], j[orden]
+    elegidos = []
+    activos = np.ones(len(orden), dtype=bool)
+    while activos.any():
+        posiciones = np.flatnonzero(activos)
+        _, mejor_i = np.unique(i[posiciones], return_index=True)
+        _, mejor_j = np.unique(j[posiciones], return_index=True)
+        mutuos = np.intersect1d(posiciones[mejor_i], posiciones[mejor_j])
+        elegidos.append(mutuos)
+        activos &= ~np.isin(i, i[mutuos]) & ~np.isin(j, j[mutuos])
+    return np.sort(orden[np.concatenate(elegidos)]) if elegidos else np.array([], dtype=np.int64)
+
+
+def vincular(registro: pd.DataFrame, defunciones: pd.DataFrame, umbral_aceptacion: float = UMBRAL_ACEPTACION,
+             umbral_revision: float = UMBRAL_REVISION, ventana_dias: int = 30, procesos: int = None):
+    """
+    Vinculación probabilística (Fellegi-Sunter) de pacientes del registro con defunciones, pensada para
+    los que no se vincularon por RUT exacto.
+
+    Se comparan solo los pares de los bloques de PASADAS y cuya muerte no es anterior al diagnóstico;
+    las pasadas se reparten en tramos que se evalúan en un pool de `procesos` procesos. Cada par recibe
+    la suma de los pesos log2(m/u) de sus niveles de comparación. Entre los pares con peso de al menos
+    `umbral_revision` se deja uno por paciente y por defunción (los de mayor peso).
+
+    Devuelve una tabla con la posición de cada par en `registro` y en `defunciones`, su peso, el nivel de
+    cada campo y la decisión: 'aceptado' (peso >= umbral_aceptacion) o 'revision'.
+    """
+    columnas = ['fila_registro', 'fila_defuncion', 'peso'] + [f'nivel_{campo}' for campo in NIVELES] + ['decision']
+    datos_registro, datos_defunciones = preparar_registro(registro), preparar_defunciones(defunciones)
+    if not len(registro) or not len(defunciones):
+        return pd.DataFrame(columns=columnas)
+
+    pesos = estimar_pesos(datos_registro, datos_defunciones)
+    bloques = [_bloque(datos_registro, datos_defunciones, pasada) for pasada in PASADAS]
+    tareas = _tareas(bloques)
+
+    if procesos is None:
+        procesos = os.cpu_count() or 1
+    procesos = min(procesos, len(tareas))
+
+    if procesos <= 1:
+        _inicializar_trabajador(datos_registro, datos_defunciones, bloques, pesos)
+        resultados = [_puntuar_tramo(pasada, inicio, fin, ventana_dias, umbral_revision)
+                      for pasada, inicio, fin in tareas]
+    else:
+        with ProcessPoolExecutor(max_workers=procesos, initializer=_inicializar_trabajador,
+                                 initargs=(datos_registro, datos_defunciones, bloques, pesos)) as pool:
+            futuros = [pool.submit(_puntuar_tramo, pasada, inicio, fin, ventana_dias, umbral_revision)
+                       for pasada, inicio, fin in tareas]
+            resultados = [futuro.result() for futuro in futuros]
+    if not resultados:
+        return pd.DataFrame(columns=columnas)
+
+    # Un mismo par puede aparecer en varias pasadas
+    i = np.concatenate([r[0] for r in resultados])
+    j = np.concatenate([r[1] for r in resultados])
+    _, unicos = np.unique(i * len(defunciones) + j, return_index=True)
+    i, j = i[unicos], j[unicos]
+    niveles = comparar(datos_registro, datos_defunciones, i, j)
+    peso = sumar_pesos(niveles, pesos)
+
+    elegidos = asignar_uno_a_uno(i, j, peso)
+    # El nivel -1 (dato faltante) toma el último nombre, 'faltante'
+    pares = pd.DataFrame({'fila_registro': i[elegidos], 'fila_defuncion': j[elegidos], 'peso': peso[elegidos],
+                          **{f'nivel_{campo}': np.asarray(NIVELES[campo] + ('faltante',))[nivel[elegidos]]
+                             for campo, nivel in niveles.items()}})
+    pares['decision'] = np.where(pares['peso'] >= umbral_aceptacion, 'aceptado', 'revision')
+    return pares.sort_values('peso', ascending=False, ignore_index=True)[columnas]